@@ -8,6 +8,7 @@ from ..models import Company
 from ..main import db
 from ..utils.json_handler import JSONFieldHandler
 from ..services.file_upload_service import FileUploadService
+from ..services.image_staging import image_staging_service
 
 company_bp = Blueprint('company', __name__)
 
@@ -144,6 +145,10 @@ def create_company():
         if not signature_path and data.get('signature'):
             signature_path = data.get('signature')
         
+        # 提取时暂存的商标图片在公司保存时才转存到正式目录
+        if data.get('trade_marks'):
+            data['trade_marks'] = image_staging_service.promote(data['trade_marks'])
+        
         # 处理JSON字段
         try:
             trade_names_json = JSONFieldHandler.process_trade_names(data)
@@ -214,6 +219,10 @@ def update_company(company_id):
         if 'country' in data:
             company.country = data['country']
         
+        # 提取时暂存的商标图片在公司保存时才转存到正式目录
+        if data.get('trade_marks'):
+            data['trade_marks'] = image_staging_service.promote(data['trade_marks'])
+        
         # 处理JSON字段
         try:
             if 'trade_names' in data:
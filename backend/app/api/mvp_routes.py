@@ -1,15 +1,36 @@
-from flask import Blueprint, request, jsonify, current_app, send_file
+from flask import Blueprint, request, jsonify, current_app, send_file, Response, g
 from werkzeug.utils import secure_filename
 import os
 import json
+from functools import wraps
+import queue
+import threading
 import uuid
 import zipfile
 import tempfile
 from datetime import datetime, date
 from ..models import FormData
 from ..services.document_extract import document_extraction_service
-from ..services.system_config import system_config
+from ..services.document_extract.regex_guard import delegate_rules
+from ..services.document_extract.batch_extraction import BatchExtractionRunner, BatchInputError
 from ..services.file_upload_service import FileUploadService
+from ..services.form_data_service import upsert_form_data
+from ..services.pipeline_service import run_document_pipeline, PipelineError
+from ..services.job_manager import job_manager
+from ..services.admission_control import admission_controller, AdmissionRejected
+from ..services.request_coalescing import request_coalescer, IdempotencyConflict, EXECUTED, COALESCED, REPLAYED
+from ..services.generation_output import OutputJob, published_path
+from ..services.retention import retention_manager, touch_last_used
+from ..services.upload_gc import upload_gc
+from ..services.chunked_upload import chunked_upload_manager, ChunkedUploadError
+from ..services.thumbnail_service import thumbnail_service
+from ..services.file_serving import send_stored_file, IMMUTABLE, REVALIDATE
+from ..services.cancellation import (
+    generation_token, cancel_scope, current_token, OperationCancelled, TIMED_OUT, CANCELLED
+)
+from ..services.batch_generation import BatchGenerationRunner, BatchGenerationError
+from ..services.speculative_generation import speculative_generation_service
+from ..services.system_params_refresh import system_params_refresher, interactive_activity
 
 from ..services.generators import (
     generate_cert_document, create_cert_sample_data,
@@ -18,11 +39,16 @@ from ..services.generators import (
     generate_tr_document, create_tr_sample_data,
     generate_tm_document, create_tm_sample_data,
 )
-from ..services.generators.if_generator import IfGenerator
-from ..services.generators.rcs_generator import RcsGenerator
-from ..services.generators.other_generator import OtherGenerator
-from ..services.generators.tr_generator import TrGenerator
-from ..services.generators.tm_generator import TmGenerator
+from ..services.generation_service import (
+    DocumentGeneratorFactory,
+    build_filename as _build_filename,
+    make_safe_approval_no as _make_safe_approval_no,
+    prepare_generation_data as _prepare_generation_data,
+    generate_single_document as _generate_single_document,
+    generate_bundle,
+    package_bundle,
+    generation_data_hash,
+)
 from ..main import db
 from sqlalchemy.orm import sessionmaker
 from ..models.base import Base
@@ -33,266 +59,115 @@ ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx'}
 # 允许的图片扩展名（用于公司图片/签名/商标）
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# 不计入交互请求的接口（后台刷新的状态查询与控制）
+NON_INTERACTIVE_ENDPOINTS = {
+    'mvp.system_params_refresh_status',
+    'mvp.system_params_refresh_start',
+    'mvp.system_params_refresh_pause',
+    'mvp.retention_status',
+    'mvp.retention_sweep',
+    'mvp.upload_gc_status',
+    'mvp.upload_gc_sweep',
+}
 
-def allowed_image_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_IMAGE_EXTENSIONS
 
+@mvp_bp.before_app_request
+def _start_background_sweepers():
+    """首个请求时启动生成文件清理与上传图片回收（只在提供 Web 服务的进程中运行，命令行与渲染进程不启动）"""
+    app = current_app._get_current_object()
+    retention_manager.start(app)
+    upload_gc.start(app)
 
-# 统一的文件命名构建器：根据文档类型走不同分支
-def _build_filename(doc_type: str,
-                    doc_name: str,
-                    safe_approval_no: str,
-                    generation_data: dict,
-                    output_format: str) -> str:
-    """根据 doc_type 构建文件名。默认回落到 {doc_name}-{safe_approval_no}.{ext}
-    后续可按需在各 case 中使用 generation_data 的字段自定义命名。
-    """
-    ext = '.pdf' if output_format == 'pdf' else '.docx'
-    # 默认基础名
-    base = f"{doc_name}_{safe_approval_no}"
-
-    # 使用 Python 3.10+ 的结构化匹配模拟 switch/case
-    match (doc_type or '').lower():
-        case 'if':
-            if output_format == 'docx':
-                wt = (generation_data.get('windscreen_thick') or '').strip()
-                ilt = (generation_data.get('interlayer_type') or '').strip()
-                suffix = safe_approval_no[-2:] if safe_approval_no else ''
-                parts = [p for p in [wt, ilt, f"ext.{suffix}"] if p]
-                filename_stem = ' '.join(parts) if parts else base
-            else:
-                filename_stem = base
-        case 'cert':
-            filename_stem = base
-        case 'rcs':
-            filename_stem = f"Review Control Sheet V7 {safe_approval_no}"
-        case 'other':
-            if output_format == 'docx':
-                filename_stem = f"Statement for application for EC and UNECE Type-approval v2.00 {safe_approval_no}"
-            else:
-                filename_stem = base
-        case 'tr':
-            if output_format == 'docx':
-                filename_stem = generation_data.get('report_no') or base
-            else:
-                filename_stem = base
-        case 'tm':
-            rep = (generation_data.get('report_no') or '').strip()
-            parts = [p for p in rep.split('-') if p]
-            if len(parts) >= 2:
-                tail = '-'.join(parts[-2:])
-                filename_stem = f"TM-{tail}"
-            else:
-                filename_stem = base
-        case _:
-            filename_stem = base
 
-    return f"{filename_stem}{ext}"
+@mvp_bp.before_request
+def _track_interactive_request():
+    """记录进行中的交互请求，后台批量任务据此让路"""
+    if request.endpoint not in NON_INTERACTIVE_ENDPOINTS:
+        g.interactive_request = True
+        interactive_activity.begin()
 
-def _make_safe_approval_no(form_data_obj, fallback: str = "TEST") -> str:
-    """Return a filesystem-safe approval_no string for filenames."""
-    import re
-    if form_data_obj and getattr(form_data_obj, 'approval_no', None):
-        approval_no = form_data_obj.approval_no or fallback
-    else:
-        approval_no = fallback
-    safe = re.sub(r'[^a-zA-Z0-9]', '-', approval_no)
-    safe = re.sub(r'-+', '-', safe).strip('-')
-    return safe or fallback
-
-# 在文件开头添加新的辅助函数
-class DocumentGeneratorFactory:
-    """文档生成器工厂类"""
-    
-    def __init__(self):
-        self.generators = {
-            'if': {
-                'type': 'if',
-                'name': 'IF',
-                'generator': IfGenerator(),
-                'template': None,
-                'use_class': True
-            },
-            'cert': {
-                'type': 'cert',
-                'name': 'CERT',
-                'generator': generate_cert_document,
-                'template': None,
-                'use_class': False
-            },
-            'rcs': {
-                'type': 'rcs',
-                'name': 'RCS',
-                'generator': RcsGenerator(),
-                'template': None,
-                'use_class': True
-            },
-            'other': {
-                'type': 'other',
-                'name': 'OTHER',
-                'generator': OtherGenerator(),
-                'template': None,
-                'use_class': True
-            },
-            'tr': {
-                'type': 'tr',
-                'name': 'TR',
-                'generator': TrGenerator(),
-                'template': None,
-                'use_class': True
-            },
-            'tm': {
-                'type': 'tm',
-                'name': 'TM',
-                'generator': TmGenerator(),
-                'template': None,
-                'use_class': True
-            },
-        }
-    
-    def get_all_document_types(self):
-        """获取所有文档类型配置"""
-        return list(self.generators.values())
-    
-    def get_generator(self, doc_type):
-        """获取指定类型的生成器配置"""
-        return self.generators.get(doc_type)
-    
-    # 移除 IF 特殊处理器，统一走类式生成器通道
-
-def _prepare_generation_data(form_data):
-    """准备文档生成所需的数据（以表单数据为准，不覆盖）"""
-    # 获取公司信息（简洁方式：使用 to_dict 统一解析字段）
-    company_contraction = ''
-    company_equipment = []
-    signature_name = ''
-    place = ''
-    email_address = ''
-    country = ''
-    if form_data.company_id:
-        from ..models.company import Company
-        company = Company.query.get(form_data.company_id)
-        if company:
-            c = company.to_dict()
-            company_contraction = c.get('company_contraction', '') or ''
-            company_equipment = c.get('equipment', []) or []
-            signature_name = c.get('signature_name', '') or ''
-            place = c.get('place', '') or ''
-            email_address = c.get('email_address', '') or ''
-            country = c.get('country', '') or ''
-    
-    return {
-        # 基本信息字段
-        "approval_no": form_data.approval_no,
-        "information_folder_no": form_data.information_folder_no,
-        "safety_class": form_data.safety_class,
-        "pane_desc": form_data.pane_desc,
-        "glass_layers": form_data.glass_layers,
-        "interlayer_layers": form_data.interlayer_layers,
-        "windscreen_thick": form_data.windscreen_thick,
-        "interlayer_thick": form_data.interlayer_thick,
-        "glass_treatment": form_data.glass_treatment,
-        "interlayer_type": form_data.interlayer_type,
-        "coating_type": form_data.coating_type,
-        "coating_thick": form_data.coating_thick,
-        "material_nature": form_data.material_nature,
-        "coating_color": form_data.coating_color,
-        # 新增字段 - 玻璃颜色和夹层相关
-        "glass_color_choice": form_data.glass_color_choice,
-        "interlayer_total": form_data.interlayer_total,
-        "interlayer_partial": form_data.interlayer_partial,
-        "interlayer_colourless": form_data.interlayer_colourless,
-        # 新增字段 - 导体和不透明相关
-        "conductors_choice": form_data.conductors_choice,
-        "opaque_obscure_choice": form_data.opaque_obscure_choice,
-        "remarks": form_data.remarks,
-        # 报告号
-        "report_no": form_data.report_no,
-        # 新增日期字段
-        "approval_date": form_data.approval_date,
-        "test_date": form_data.test_date,
-        "report_date": form_data.report_date,
-        # 法规更新日期（直接从系统配置读取为已格式化字符串）
-        "regulation_update_date": system_config.get_regulation_update_date(),
-        # 公司信息（从Company表获取最新信息）
-        "company_id": form_data.company_id,
-        "company_name": form_data.company_name or '',
-        "company_address": form_data.company_address or '',
-        "company_contraction": company_contraction,  # 从Company表获取公司简称
-        "signature_name": signature_name,  # 公司签名人名称
-        "place": place,  # 公司位置
-        "email_address": email_address,  # 联系邮箱
-        "country": country,  # 国家/地区
-        "trade_names": form_data.trade_names or '',
-        "trade_marks": form_data.trade_marks or [],
-        "vehicles": form_data.vehicles or [],
-        # 新增：玻璃类型
-        "glass_type": getattr(form_data, 'glass_type', ''),
-        # 设备信息（从Company表获取最新信息）
-        "equipment": company_equipment,  # 使用从Company表获取的最新设备信息
-        # 系统参数 - 版本号（字符串）
-        "version_1": getattr(form_data, 'version_1', '4'),
-        "version_2": getattr(form_data, 'version_2', '8'),
-        "version_3": getattr(form_data, 'version_3', '12'),
-        "version_4": getattr(form_data, 'version_4', '01'),
-        # 系统参数 - 实验室环境参数
-        "temperature": getattr(form_data, 'temperature', '22°C'),
-        "ambient_pressure": getattr(form_data, 'ambient_pressure', '1020 mbar'),
-        "relative_humidity": getattr(form_data, 'relative_humidity', '50 %')
-    }
 
-def _generate_single_document(doc_info, generation_data, output_dir, safe_approval_no, output_format):
-    """生成单个文档"""
-    doc_type = doc_info.get('type', 'unknown')
-    doc_name = doc_info['name']
-    generator = doc_info['generator']
-    template_name = doc_info['template']
-    use_class = doc_info['use_class']
-    # 统一逻辑：不再使用 special_handler
-    
+@mvp_bp.teardown_request
+def _finish_interactive_request(_exc=None):
+    if g.pop('interactive_request', False):
+        interactive_activity.end()
+
+
+def _admission_rejected_response(error: AdmissionRejected):
+    """准入被拒：429 + Retry-After + 排队信息"""
+    response = jsonify({
+        "success": False,
+        "error": str(error),
+        "error_code": "server_busy",
+        "data": error.to_dict()
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def _admission_controlled(pool):
+    """接口装饰器：在全局并发名额内执行（超出上限时排队，队列已满或排队超时返回 429）"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                token = admission_controller.acquire(pool) if admission_controller.enabled() else None
+            except AdmissionRejected as e:
+                return _admission_rejected_response(e)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                if token:
+                    admission_controller.release(pool, token)
+        return wrapper
+    return decorator
+
+
+def _acquire_for_stream(pool):
+    """流式接口在开始响应前获取名额，返回 (释放函数, 被拒时的响应)；名额由后台任务结束时释放"""
+    if not admission_controller.enabled():
+        return (lambda: None), None
     try:
-        # 统一处理所有文档类型 - 使用命名策略函数
-        filename = _build_filename(doc_type, doc_name, safe_approval_no, generation_data, output_format)
-        file_path = os.path.join(output_dir, filename)
-
-        if use_class:
-            # 使用生成器类（IF/TR/TM等均支持）
-            result = generator.generate_document(generation_data, file_path, output_format)
-            if result.get('success'):
-                return {
-                    "success": True,
-                    "filename": filename,
-                    "file_path": file_path,
-                    "download_url": f"/api/mvp/download/{filename}"
-                }
-            else:
-                return result
-        else:
-            # 使用生成器函数（CERT/OTHER/RCS等函数式保持兼容）
-            result = generator(generation_data, file_path, output_format)
-            if result.get('success'):
-                return {
-                    "success": True,
-                    "filename": filename,
-                    "file_path": file_path,
-                    "download_url": f"/api/mvp/download/{filename}"
-                }
-            else:
-                return result
-            
-            # 处理生成器返回的结果已经在上面处理了，这里不需要额外处理
-                
-    except Exception as e:
-        print(f"生成异常: {str(e)}")
-        import traceback
-        print(f"错误堆栈: {traceback.format_exc()}")
-        return {"success": False, "error": f"生成失败: {str(e)}"}
+        token = admission_controller.acquire(pool)
+    except AdmissionRejected as e:
+        return None, _admission_rejected_response(e)
+    return (lambda: admission_controller.release(pool, token)), None
+
+
+# 生成被中止（超过截止时间 / 客户端断开）时的状态码：这类结果不合并给其它请求，也不按幂等键保留
+_CANCELLED_STATUSES = (504, 499)
 
 
+def _cancelled_status(reason):
+    return 504 if reason == TIMED_OUT else 499
+
+
+def _request_generation_token(data):
+    """按请求创建生成截止时间令牌：timeout_seconds 可选，不超过 GENERATION_DEADLINE_SECONDS"""
+    timeout = data.get('timeout_seconds')
+    try:
+        timeout = float(timeout) if timeout not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError("timeout_seconds 必须是数字")
+    if timeout is not None and timeout <= 0:
+        raise ValueError("timeout_seconds 必须大于0")
+    return generation_token(timeout)
+
+
+def _cancelled_response(error: OperationCancelled):
+    return jsonify({"success": False, "error": f"生成已中止：{str(error)}", "error_code": error.reason}), \
+        _cancelled_status(error.reason)
+
+
+def allowed_file(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def allowed_image_file(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_IMAGE_EXTENSIONS
+
 
 @mvp_bp.route('/save-form-data', methods=['POST'])
 def save_form_data():
@@ -303,154 +178,18 @@ def save_form_data():
         session_id = data.get('session_id')
         form_data = data.get('form_data', {})
         
-        # 如果session_id为空，自动生成一个正式的session_id
-        if not session_id:
-            import uuid
-            import time
-            # 生成格式：session_时间戳_随机UUID
-            timestamp = int(time.time())
-            random_uuid = uuid.uuid4().hex[:8]
-            session_id = f"session_{timestamp}_{random_uuid}"
-            print(f"🆔 自动生成session_id: {session_id}")
-        
-        # 使用FormData.query查询
-        existing_form = FormData.query.filter_by(session_id=session_id).first()
-        
-        if existing_form:
-            # 更新现有记录
-            print("📝 更新现有记录")
-            for key, value in form_data.items():
-                # 禁止客户端覆盖创建/更新时间等受控字段
-                if key in ['created_at', 'updated_at']:
-                    continue
-                if hasattr(existing_form, key):
-                    # 特殊处理日期字段
-                    if key in ['approval_date', 'test_date', 'report_date']:
-                        if isinstance(value, str) and value:
-                            try:
-                                value = datetime.strptime(value, '%Y-%m-%d').date()
-                            except ValueError:
-                                continue  # 跳过无效日期
-                        elif not value:
-                            continue  # 跳过空值，保持原有值
-                    setattr(existing_form, key, value)
-            
-            # 更新系统参数
-            version_params = system_config.get_version_params()
-            lab_params = system_config.get_laboratory_params()
-            regulation_date = system_config.get_regulation_update_date()
-            
-            existing_form.version_1 = version_params.get('version_1', '4')
-            existing_form.version_2 = version_params.get('version_2', '8')
-            existing_form.version_3 = version_params.get('version_3', '12')
-            existing_form.version_4 = version_params.get('version_4', '01')
-            
-            existing_form.temperature = lab_params.get('temperature', '22°C')
-            existing_form.ambient_pressure = lab_params.get('ambient_pressure', '1020 mbar')
-            existing_form.relative_humidity = lab_params.get('relative_humidity', '50 %')
-            # 写入法规更新日期（不从前端收集）
-            try:
-                if regulation_date:
-                    existing_form.regulation_update_date = datetime.strptime(regulation_date, '%Y-%m-%d').date()
-            except Exception:
-                pass
-            
-            existing_form.updated_at = datetime.utcnow()
-        else:
-            # 创建新记录
-            print("📝 创建新记录")
-            # 处理日期字段
-            approval_date = form_data.get('approval_date')
-            test_date = form_data.get('test_date')
-            report_date = form_data.get('report_date')
-            
-            # 如果前端传递的是字符串，转换为date对象
-            if isinstance(approval_date, str) and approval_date:
-                try:
-                    approval_date = datetime.strptime(approval_date, '%Y-%m-%d').date()
-                except ValueError:
-                    approval_date = None
-            else:
-                approval_date = None
-                
-            if isinstance(test_date, str) and test_date:
-                try:
-                    test_date = datetime.strptime(test_date, '%Y-%m-%d').date()
-                except ValueError:
-                    test_date = None
-            else:
-                test_date = None
-                
-            if isinstance(report_date, str) and report_date:
-                try:
-                    report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
-                except ValueError:
-                    report_date = None
-            else:
-                report_date = None
-            
-            # 获取系统参数
-            version_params = system_config.get_version_params()
-            lab_params = system_config.get_laboratory_params()
-            regulation_date = system_config.get_regulation_update_date()
-            
-            new_form = FormData(
-                session_id=session_id,
-                # IF_Template.docx 相关字段
-                approval_no=form_data.get('approval_no', ''),
-                information_folder_no=form_data.get('information_folder_no', ''),
-                safety_class=form_data.get('safety_class', ''),
-                pane_desc=form_data.get('pane_desc', ''),
-                glass_layers=form_data.get('glass_layers', ''),
-                interlayer_layers=form_data.get('interlayer_layers', ''),
-                windscreen_thick=form_data.get('windscreen_thick', ''),
-                interlayer_thick=form_data.get('interlayer_thick', ''),
-                glass_treatment=form_data.get('glass_treatment', ''),
-                interlayer_type=form_data.get('interlayer_type', ''),
-                coating_type=form_data.get('coating_type', ''),
-                coating_thick=form_data.get('coating_thick', ''),
-                material_nature=form_data.get('material_nature', ''),
-                coating_color=form_data.get('coating_color', ''),
-                # 新增字段 - 玻璃颜色和夹层相关
-                glass_color_choice=form_data.get('glass_color_choice', 'tinted_struck'),
-                interlayer_total=form_data.get('interlayer_total', False),
-                interlayer_partial=form_data.get('interlayer_partial', False),
-                interlayer_colourless=form_data.get('interlayer_colourless', False),
-                # 新增字段 - 导体和不透明相关
-                conductors_choice=form_data.get('conductors_choice', 'yes_struck'),
-                opaque_obscure_choice=form_data.get('opaque_obscure_choice', 'yes_struck'),
-                remarks=form_data.get('remarks', ''),
-                report_no=form_data.get('report_no', ''),
-                company_id=form_data.get('company_id'),
-                company_name=form_data.get('company_name', ''),
-                company_address=form_data.get('company_address', ''),
-                trade_names=form_data.get('trade_names', ''),
-                trade_marks=form_data.get('trade_marks', []),
-                equipment=form_data.get('equipment', []),
-                vehicles=form_data.get('vehicles', []),
-                # 新增日期字段
-                approval_date=approval_date,
-                test_date=test_date,
-                report_date=report_date,
-                # 系统参数 - 版本号（字符串）
-                version_1=version_params.get('version_1', '4'),
-                version_2=version_params.get('version_2', '8'),
-                version_3=version_params.get('version_3', '12'),
-                version_4=version_params.get('version_4', '01'),
-                # 系统参数 - 实验室环境参数
-                temperature=lab_params.get('temperature', '22°C'),
-                ambient_pressure=lab_params.get('ambient_pressure', '1020 mbar'),
-                relative_humidity=lab_params.get('relative_humidity', '50 %'),
-                # 法规更新日期（从系统参数写入）
-                regulation_update_date=  regulation_date or "12 June 2025",
-                # 玻璃类型（来自前端，若没填则为空字符串）
-                glass_type=form_data.get('glass_type', '')
-            )
-            db.session.add(new_form)
+        form_record, session_id = upsert_form_data(session_id, form_data)
         
         db.session.commit()
         print("✅ 数据保存成功")
         
+        # 可选：后台预生成文档包（失败不影响保存结果）
+        pregenerating = []
+        try:
+            pregenerating = speculative_generation_service.schedule(current_app._get_current_object(), form_record)
+        except Exception as e:
+            current_app.logger.warning(f"预生成排队失败: {str(e)}")
+        
         return jsonify({
             "success": True,
             "message": "表单数据保存成功",
@@ -458,6 +197,7 @@ def save_form_data():
                 "saved_at": datetime.utcnow().isoformat(),
                 "version": "1.0",
                 "session_id": session_id,  # 返回session_id，包括新生成的正式ID
+                "pregenerating": pregenerating
             }
         })
         
@@ -524,9 +264,187 @@ def get_form_data(session_id):
 
 
 
+def _prepare_session_generation(session_id):
+    """加载会话表单并准备生成数据，返回 (生成数据, 安全的批准号)；表单不存在时返回 None"""
+    form_data = FormData.query.filter_by(session_id=session_id).first()
+    if not form_data:
+        return None
+    return _prepare_generation_data(form_data), _make_safe_approval_no(form_data)
+
+
+def _generate_documents_for_session(session_id, output_format, on_event=None, prepared=None):
+    """生成会话的全部文档并打包为ZIP，返回 (响应体, HTTP状态码)
+
+    on_event: 可选，进度回调（上下文准备完成、每个文档完成、ZIP就绪），供流式接口推送
+    prepared: 可选，调用方已准备好的 (生成数据, 安全的批准号)（计算合并键时已准备，不再重复查询）
+    """
+    prepared = prepared or _prepare_session_generation(session_id)
+    if not prepared:
+        return {"error": "未找到表单数据"}, 404
+    generation_data, safe_approval_no = prepared
+    
+    # 在独立的临时目录中生成，完成后整体发布（并发生成同一批准号不会互相覆盖，下载不会读到未写完的文件）
+    with OutputJob(os.path.join(current_app.config['UPLOAD_FOLDER'], 'generated_files')) as job:
+        return _generate_documents_in_job(job, session_id, generation_data, safe_approval_no, output_format, on_event)
+
+
+def _generate_documents_in_job(job, session_id, generation_data, safe_approval_no, output_format, on_event=None):
+    """在 OutputJob 的临时目录中生成并打包，成功后发布"""
+    output_dir = job.scratch_dir
+    
+    # 生成所有类型的文档
+    all_document_types = DocumentGeneratorFactory().get_all_document_types()
+    if on_event:
+        on_event({"type": "stage", "stage": "context_prepared", "total": len(all_document_types)})
+    # 保存后已预生成且数据未变时直接使用预生成结果
+    generated_files = speculative_generation_service.take(session_id, generation_data, output_format, output_dir)
+    if generated_files:
+        failed_documents = []
+        if on_event:
+            for index, item in enumerate(generated_files, start=1):
+                on_event({"type": "document", "success": True, "stage": "pregenerated",
+                          "doc_type": item['type'], "index": index, "total": len(generated_files),
+                          "filename": item['filename'], "elapsed_ms": item['elapsed_ms']})
+    else:
+        generated_files, failed_documents = generate_bundle(
+            generation_data, output_dir, safe_approval_no, output_format, on_event=on_event
+        )
+    
+    # 超过截止时间或被取消：不打包不完整的文档包，逐个文档返回结果（已完成的文档仍可下载）
+    token = current_token()
+    if token is not None and token.cancelled:
+        if generated_files:
+            job.publish(generated_files)
+        return {
+            "success": False,
+            "error": f"生成已中止：{token.message}",
+            "error_code": token.reason,
+            "data": {
+                "generated_files": generated_files,
+                "failed_documents": failed_documents,
+                "total_requested": len(all_document_types),
+                "total_success": len(generated_files),
+                "total_failed": len(failed_documents)
+            }
+        }, _cancelled_status(token.reason)
+    
+    # 返回生成结果
+    if generated_files:
+        # 创建ZIP文件
+        zip_filename = f"documents_{safe_approval_no}_{output_format}.zip"
+        
+        try:
+            package_bundle(generated_files, job.path(zip_filename))
+            job.publish(generated_files)
+            # 更新按批准号命名的最新文档包（旧的下载地址、系统参数刷新使用）
+            job.publish_alias(zip_filename)
+            zip_path = job.path(zip_filename)
+            if on_event:
+                on_event({"type": "stage", "stage": "zip_ready", "filename": zip_filename,
+                          "download_url": job.download_url(zip_filename)})
+            
+            return {
+                "success": True,
+                "message": f"成功生成 {len(generated_files)} 个文档并打包为ZIP",
+                "data": {
+                    "filename": zip_filename,
+                    "file_path": zip_path,
+                    "download_url": job.download_url(zip_filename),
+                    "generated_files": generated_files,
+                    "failed_documents": failed_documents,
+                    "total_requested": len(all_document_types),
+                    "total_success": len(generated_files),
+                    "total_failed": len(failed_documents)
+                }
+            }, 200
+        except Exception as zip_error:
+            print(f"❌ 创建ZIP文件失败: {str(zip_error)}")
+            # 不发布不完整的ZIP，已生成的文档仍可单独下载
+            if not job.published:
+                if os.path.exists(job.path(zip_filename)):
+                    os.remove(job.path(zip_filename))
+                job.publish(generated_files)
+            return {
+                "success": False,
+                "error": f"创建ZIP文件失败: {str(zip_error)}",
+                "data": {
+                    "generated_files": generated_files,
+                    "failed_documents": failed_documents,
+                    "total_requested": len(all_document_types),
+                    "total_success": len(generated_files),
+                    "total_failed": len(failed_documents)
+                }
+            }, 500
+    else:
+        return {
+            "success": False,
+            "error": "所有文档生成失败",
+            "data": {
+                "failed_documents": failed_documents,
+                "total_requested": len(all_document_types),
+                "total_failed": len(failed_documents)
+            }
+        }, 500
+
+
+def _generation_coalesce_key(session_id, output_format, generation_data):
+    """自动合并键：会话 + 生成数据哈希 + 输出格式"""
+    data_hash = generation_data_hash(generation_data, output_format)
+    return f"generate:{session_id}:{output_format}:{data_hash}"
+
+
+def _get_idempotency_key():
+    """读取 Idempotency-Key 请求头；格式不合法时抛出 ValueError"""
+    key = (request.headers.get('Idempotency-Key') or '').strip()
+    if key and (len(key) > 255 or not key.isprintable()):
+        raise ValueError("Idempotency-Key 格式不正确（最长255个可打印字符）")
+    return key or None
+
+
+def _generate_documents_deduplicated(session_id, output_format, coalesce_key, idempotency_key=None,
+                                     on_event=None, on_attach=None, slot_held=False, prepared=None):
+    """生成文档包：相同的进行中请求合并为一次渲染，相同幂等键重放结果；返回 (响应体, 状态码, 来源)
+
+    slot_held: 调用方已占用生成名额；否则只在真正执行渲染时占用（合并到已有请求的不占用）
+    prepared: 计算合并键时已准备的 (生成数据, 安全的批准号)，渲染时直接使用
+    """
+    def render():
+        if slot_held:
+            return list(_generate_documents_for_session(session_id, output_format, on_event, prepared))
+        with admission_controller.slot('generation'):
+            return list(_generate_documents_for_session(session_id, output_format, on_event, prepared))
+
+    # 只保留非服务端错误的结果：失败后重试（或仍在等待的相同请求）会重新执行
+    def keep(result):
+        return result[1] < 500 and result[1] not in _CANCELLED_STATUSES
+
+    def coalesced():
+        grace = float(current_app.config.get('GENERATION_COALESCE_GRACE_SECONDS', 5))
+        (body, status), outcome = request_coalescer.run(
+            coalesce_key, render, grace, on_attach=on_attach, keep_result=keep
+        )
+        return [body, status, outcome]
+
+    if not idempotency_key:
+        return tuple(coalesced())
+    (body, status, outcome), key_outcome = request_coalescer.run(
+        f"idempotency:{idempotency_key}", coalesced,
+        float(current_app.config.get('IDEMPOTENCY_KEY_TTL', 24 * 3600)),
+        fingerprint=f"generate-documents:{session_id}:{output_format}",
+        on_attach=on_attach, keep_result=keep
+    )
+    return body, status, (outcome if key_outcome == EXECUTED else key_outcome)
+
+
 @mvp_bp.route('/generate-documents', methods=['POST'])
 def generate_all_documents():
-    """生成所有类型的文档"""
+    """生成所有类型的文档
+    
+    可选请求头 Idempotency-Key：同一个键重复提交时返回第一次的结果（响应头 Idempotent-Replayed: true）。
+    相同会话、相同数据、相同格式的请求正在执行时，重复的请求等待并共享其结果（响应头 X-Request-Coalesced: true）。
+    可选 timeout_seconds：本次请求的截止时间（不超过 GENERATION_DEADLINE_SECONDS）；到期后剩余文档不再生成、
+    终止进行中的 PDF 转换，返回 504，failed_documents 中逐个标记 outcome（timed_out）。
+    """
     try:
         data = request.get_json()
         session_id = data.get('session_id')
@@ -534,95 +452,34 @@ def generate_all_documents():
         
         if not session_id:
             return jsonify({"error": "缺少会话ID"}), 400
+        try:
+            idempotency_key = _get_idempotency_key()
+            token = _request_generation_token(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # 获取表单数据
-        form_data = FormData.query.filter_by(session_id=session_id).first()
-        if not form_data:
+        prepared = _prepare_session_generation(session_id)
+        if not prepared:
             return jsonify({"error": "未找到表单数据"}), 404
-        
-        # 准备生成数据
-        generation_data = _prepare_generation_data(form_data)
-        
-        # 处理Approval_No生成文件名
-        safe_approval_no = _make_safe_approval_no(form_data)
-        
-        # 确保输出目录存在
-        output_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'generated_files')
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 使用工厂类获取所有文档类型配置
-        factory = DocumentGeneratorFactory()
-        all_document_types = factory.get_all_document_types()
-        
-        # 生成所有类型的文档
-        generated_files = []
-        failed_documents = []
-        
-        for doc_info in all_document_types:
-            result = _generate_single_document(
-                doc_info, generation_data, output_dir, safe_approval_no, output_format
-            )
-            
-            if result['success']:
-                generated_files.append({
-                    "type": doc_info['name'],
-                    "filename": result['filename'],
-                    "file_path": result['file_path'],
-                    "download_url": result['download_url']
-                })
-            else:
-                failed_documents.append({"type": doc_info['name'], "error": result['error']})
-        
-        # 返回生成结果
-        if generated_files:
-            # 创建ZIP文件
-            zip_filename = f"documents_{safe_approval_no}_{output_format}.zip"
-            zip_path = os.path.join(output_dir, zip_filename)
-            
-            try:
-                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for file_info in generated_files:
-                        if os.path.exists(file_info['file_path']):
-                            # 在ZIP中使用原始文件名
-                            zipf.write(file_info['file_path'], file_info['filename'])
-                
-                return jsonify({
-                    "success": True,
-                    "message": f"成功生成 {len(generated_files)} 个文档并打包为ZIP",
-                    "data": {
-                        "filename": zip_filename,
-                        "file_path": zip_path,
-                        "download_url": f"/api/mvp/download/{zip_filename}",
-                        "generated_files": generated_files,
-                        "failed_documents": failed_documents,
-                        "total_requested": len(all_document_types),
-                        "total_success": len(generated_files),
-                        "total_failed": len(failed_documents)
-                    }
-                })
-            except Exception as zip_error:
-                print(f"❌ 创建ZIP文件失败: {str(zip_error)}")
-                return jsonify({
-                    "success": False,
-                    "error": f"创建ZIP文件失败: {str(zip_error)}",
-                    "data": {
-                        "generated_files": generated_files,
-                        "failed_documents": failed_documents,
-                        "total_requested": len(all_document_types),
-                        "total_success": len(generated_files),
-                        "total_failed": len(failed_documents)
-                    }
-                }), 500
-        else:
-            return jsonify({
-                "success": False,
-                "error": "所有文档生成失败",
-                "data": {
-                    "failed_documents": failed_documents,
-                    "total_requested": len(all_document_types),
-                    "total_failed": len(failed_documents)
-                }
-            }), 500
+        coalesce_key = _generation_coalesce_key(session_id, output_format, prepared[0])
+        try:
+            with cancel_scope(token):
+                body, status, outcome = _generate_documents_deduplicated(
+                    session_id, output_format, coalesce_key, idempotency_key, prepared=prepared
+                )
+        except AdmissionRejected as e:
+            return _admission_rejected_response(e)
+        except IdempotencyConflict as e:
+            return jsonify({"error": str(e)}), 422
+        except OperationCancelled as e:
+            return _cancelled_response(e)
+        response = jsonify(body)
+        response.status_code = status
+        if outcome == REPLAYED:
+            response.headers['Idempotent-Replayed'] = 'true'
+        elif outcome == COALESCED:
+            response.headers['X-Request-Coalesced'] = 'true'
+        return response
         
     except Exception as e:
         print(f"❌ 生成所有文档失败: {str(e)}")
@@ -630,8 +487,308 @@ def generate_all_documents():
         print(f"错误堆栈: {traceback.format_exc()}")
         return jsonify({"error": f"生成所有文档失败: {str(e)}"}), 500
 
+
+@mvp_bp.route('/generate-documents/stream', methods=['POST'])
+def generate_all_documents_stream():
+    """生成所有类型的文档，并以流的形式推送进度
+    
+    请求参数与 /generate-documents 相同；另可通过 format（查询参数或JSON字段）选择 sse（默认）或 jsonl。
+    
+    依次推送：
+    - {"type": "stage", "stage": "context_prepared", "total"}
+    - 每个文档 {"type": "document_started", "doc_type", "index", "total"} 与
+      {"type": "document", "doc_type", "index", "total", "success", "stage": rendered/converted, "elapsed_ms"}
+    - {"type": "stage", "stage": "zip_ready", "filename", "download_url"}
+    - 最后 {"type": "result", "status", ...与 /generate-documents 相同的响应体}
+    
+    Idempotency-Key 与重复请求合并同 /generate-documents；合并到已有请求或重放时推送
+    {"type": "stage", "stage": "coalesced" / "replayed"}，之后直接推送结果。
+    截止时间（timeout_seconds）同 /generate-documents；客户端断开连接时取消剩余文档并终止进行中的 PDF 转换。
+    """
+    data = request.get_json(silent=True) or {}
+    session_id = data.get('session_id')
+    output_format = data.get('output_format', 'docx')
+    stream_format = _resolve_stream_format(data.get('format'), default='sse')
+    if not stream_format:
+        return jsonify({"error": "不支持的输出格式，仅支持: jsonl, sse"}), 400
+    if not session_id:
+        return jsonify({"error": "缺少会话ID"}), 400
+    try:
+        idempotency_key = _get_idempotency_key()
+        token = _request_generation_token(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    prepared = _prepare_session_generation(session_id)
+    if not prepared:
+        return jsonify({"error": "未找到表单数据"}), 404
+    coalesce_key = _generation_coalesce_key(session_id, output_format, prepared[0])
+
+    # 相同请求正在执行时直接合并，不占用名额；合并前执行者已结束而转为自己执行时在执行前再排队获取名额
+    slot_held = not (request_coalescer.in_flight(coalesce_key) or
+                     (idempotency_key and request_coalescer.in_flight(f"idempotency:{idempotency_key}")))
+    if not slot_held:
+        release = lambda: None
+    else:
+        release, rejected = _acquire_for_stream('generation')
+        if rejected:
+            return rejected
+
+    def work(emit):
+        try:
+            with cancel_scope(token):
+                body, status, _ = _generate_documents_deduplicated(
+                    session_id, output_format, coalesce_key, idempotency_key, on_event=emit,
+                    on_attach=lambda outcome: emit({"type": "stage", "stage": outcome}), slot_held=slot_held,
+                    prepared=prepared
+                )
+        except IdempotencyConflict as e:
+            body, status = {"error": str(e)}, 422
+        except AdmissionRejected as e:
+            # 合并的执行者已结束、转为自己执行时排队被拒
+            body, status = {"success": False, "error": str(e), "error_code": "server_busy",
+                            "data": e.to_dict()}, 429
+        except OperationCancelled as e:
+            body, status = {"success": False, "error": f"生成已中止：{str(e)}", "error_code": e.reason}, \
+                _cancelled_status(e.reason)
+        return {"type": "result", "status": status, **body}
+
+    return _stream_background_events(work, stream_format, error_prefix="生成所有文档失败", cleanup=release,
+                                      cancel_token=token)
+
+@mvp_bp.route('/generate-documents/batch', methods=['POST'])
+def generate_documents_batch():
+    """多会话批量生成，打包为一个ZIP（每个会话一个文件夹，根目录附 manifest.json）
+    
+    请求参数（JSON）：
+    - session_ids: 会话ID列表；或按条件选择：
+    - company_id / updated_since / updated_until: 按公司、更新日期（YYYY-MM-DD，含当天）选择有效会话
+    - output_format: 可选，docx（默认）或 pdf
+    - doc_types: 可选，只生成这些文档类型（列表或逗号分隔字符串）
+    - async: 可选，为 true 时作为后台任务执行，立即返回 202 与任务ID
+    """
+    data = request.get_json(silent=True) or {}
+    output_format = (data.get('output_format') or 'docx').lower()
+    if output_format not in ('docx', 'pdf'):
+        return jsonify({
+            "success": False,
+            "error": f"不支持的输出格式: {output_format}，仅支持: docx, pdf"
+        }), 400
+
+    factory = DocumentGeneratorFactory()
+    doc_types = data.get('doc_types') or []
+    if isinstance(doc_types, str):
+        doc_types = doc_types.split(',')
+    doc_types = [str(t).strip().lower() for t in doc_types if str(t).strip()]
+    unknown = [t for t in doc_types if not factory.get_generator(t)]
+    if unknown:
+        return jsonify({
+            "success": False,
+            "error": f"未知的文档类型: {', '.join(unknown)}"
+        }), 400
+
+    session_ids = data.get('session_ids') or []
+    if not isinstance(session_ids, list):
+        return jsonify({
+            "success": False,
+            "error": "session_ids 必须是列表"
+        }), 400
+    try:
+        session_ids = BatchGenerationRunner.select_sessions(
+            session_ids, data.get('company_id'), data.get('updated_since'), data.get('updated_until')
+        )
+    except BatchGenerationError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+
+    runner = BatchGenerationRunner()
+    output_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'generated_files')
+    if data.get('async') in (True, 'true', '1', 1):
+        def batch_job(job):
+            # 每个会话渲染时各自占用生成名额
+            job.set_stage('render')
+            result = runner.run(session_ids, output_format, doc_types or None, output_dir,
+                                on_progress=lambda done, total: job.set_stage(f"render {done}/{total}"))
+            result.pop('file_path', None)
+            if not result['filename']:
+                job.result = result
+                raise RuntimeError("所有文档生成失败")
+            return result
+
+        job = job_manager.submit(current_app._get_current_object(), 'batch_generation', batch_job)
+        return jsonify({
+            "success": True,
+            "message": "任务已提交",
+            "data": {
+                "job_id": job.id,
+                "status": job.status,
+                "total_sessions": len(session_ids),
+                "status_url": f"/api/mvp/jobs/{job.id}"
+            }
+        }), 202
+
+    try:
+        # 排队已满时直接拒绝；渲染时每个会话各自排队占用生成名额
+        admission_controller.check('generation')
+        result = runner.run(session_ids, output_format, doc_types or None, output_dir)
+    except AdmissionRejected as e:
+        return _admission_rejected_response(e)
+    except Exception as e:
+        current_app.logger.error(f"批量生成失败: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"批量生成失败: {str(e)}"
+        }), 500
+    result.pop('file_path', None)
+    manifest = result['manifest']
+    if not result['filename']:
+        return jsonify({
+            "success": False,
+            "error": "所有文档生成失败",
+            "data": result
+        }), 500
+    return jsonify({
+        "success": True,
+        "message": f"{manifest['succeeded_sessions']}/{manifest['total_sessions']} 个会话生成成功，"
+                   f"共 {manifest['total_documents']} 个文档",
+        "data": result
+    })
+
 # ===================== 上传文件接口（整合到 /mvp 下） =====================
 
+# 可生成缩略图的目录（uploads 下的相对路径前缀）与图片类型
+THUMBNAIL_PREFIXES = ('company/', 'blobs/', 'scratch/marks/')
+THUMBNAIL_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tif', 'tiff', 'webp', 'emf', 'wmf'}
+
+
+@mvp_bp.route('/thumbnails/<int:size>/<path:filename>', methods=['GET'])
+def image_thumbnail(size, filename):
+    """图片缩略图：filename 为 /uploads/ 之后的路径，size 为最长边像素（按 THUMBNAIL_SIZES 向上取档）
+
+    首次请求时生成并缓存；响应带 ETag 与长期缓存头（按内容寻址的图片为 immutable）。
+    """
+    if size <= 0 or size > 4096:
+        return jsonify({"success": False, "error": "无效的尺寸"}), 400
+    parts = filename.replace('\\', '/').split('/')
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if any(part.startswith('.') or part == '' for part in parts) or ext not in THUMBNAIL_EXTENSIONS \
+            or not filename.startswith(THUMBNAIL_PREFIXES):
+        return jsonify({"success": False, "error": "不支持的图片路径"}), 400
+
+    source_path = FileUploadService.public_url_to_local_path(f"/uploads/{filename}")
+    if source_path and not os.path.isfile(source_path):
+        # 回收时隔离的图片仍被访问：立即恢复
+        upload_gc.restore(filename)
+    if not source_path or not os.path.isfile(source_path):
+        return jsonify({"success": False, "error": f"文件不存在: {filename}"}), 404
+
+    path, etag = thumbnail_service.get(source_path, size)
+    response = send_file(path, conditional=True, etag=etag)
+    max_age = int(current_app.config.get('THUMBNAIL_MAX_AGE', 7 * 24 * 3600))
+    if thumbnail_service.is_content_addressed(source_path):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    return response
+
+
+def _request_upload_id():
+    """请求中的分块上传ID（表单字段、JSON 或查询参数 upload_id），没有时返回 None"""
+    upload_id = request.form.get('upload_id') or request.args.get('upload_id')
+    if not upload_id and request.is_json:
+        upload_id = (request.get_json(silent=True) or {}).get('upload_id')
+    upload_id = str(upload_id or '').strip()
+    return upload_id or None
+
+
+def _chunked_upload_error(error: ChunkedUploadError):
+    response = jsonify({
+        "success": False,
+        "error": str(error),
+        "error_code": error.error_code,
+        "data": error.details or None
+    })
+    if 'offset' in error.details:
+        response.headers['Upload-Offset'] = str(error.details['offset'])
+    return response, error.status
+
+
+def _chunked_upload_response(status: dict, http_status: int = 200):
+    response = jsonify({"success": True, "data": status})
+    response.headers['Upload-Offset'] = str(status['offset'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response, http_status
+
+
+@mvp_bp.route('/chunked-uploads', methods=['POST'])
+def create_chunked_upload():
+    """创建分块上传（大文件可续传）
+
+    请求体（JSON）：
+    - filename: 文件名（决定类型校验）
+    - size: 总字节数（不超过 CHUNKED_UPLOAD_MAX_BYTES）
+    - purpose: document（文档提取，默认）或 image（公司图片）
+    - sha256: 可选，整体 SHA-256（十六进制），完成时校验
+    返回 upload_id、建议的块大小 chunk_size 与当前偏移量 offset
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        status = chunked_upload_manager.create(data.get('filename'), data.get('size'),
+                                               data.get('purpose') or 'document', data.get('sha256'))
+    except ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+    return _chunked_upload_response(status, 201)
+
+
+@mvp_bp.route('/chunked-uploads/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """分块上传状态：offset 为服务器已接收的字节数，续传从这里开始"""
+    try:
+        return _chunked_upload_response(chunked_upload_manager.status(upload_id))
+    except ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+
+
+@mvp_bp.route('/chunked-uploads/<upload_id>', methods=['PUT', 'PATCH'])
+def write_chunked_upload(upload_id):
+    """写入一块：请求体为原始字节（application/octet-stream）
+
+    请求头：
+    - Upload-Offset: 本块的起始位置，必须等于已接收的字节数（不一致时返回 409 与正确的偏移量）
+    - X-Chunk-SHA256: 可选，本块的 SHA-256（十六进制），不匹配时本块作废并返回 422
+    """
+    try:
+        status = chunked_upload_manager.write_chunk(
+            upload_id,
+            request.headers.get('Upload-Offset', request.args.get('offset')),
+            request.stream,
+            request.content_length,
+            request.headers.get('X-Chunk-SHA256')
+        )
+    except ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+    return _chunked_upload_response(status)
+
+
+@mvp_bp.route('/chunked-uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """完成分块上传：核对大小与整体 SHA-256，之后可将 upload_id 交给 /document-extract 或 /upload-file"""
+    try:
+        return _chunked_upload_response(chunked_upload_manager.complete(upload_id))
+    except ChunkedUploadError as e:
+        return _chunked_upload_error(e)
+
+
+@mvp_bp.route('/chunked-uploads/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    """放弃分块上传并删除已接收的数据"""
+    if not chunked_upload_manager.abort(upload_id):
+        return _chunked_upload_error(
+            ChunkedUploadError(f"上传不存在或已过期: {upload_id}", 404, 'upload_not_found'))
+    return jsonify({"success": True})
+
+
 @mvp_bp.route('/upload-file', methods=['POST'])
 def upload_file():
     """通用文件上传接口
@@ -640,15 +797,17 @@ def upload_file():
     - category: 文件分类，目前支持 'company'
     - subcategory: 子分类，'marks' | 'picture' | 'signature'
     - file: 表单文件字段名
+    - upload_id: 可选，代替 file，使用已完成的分块上传（用途为 image，见 /chunked-uploads）
     返回可通过 GET /uploads/<path> 直接访问的 URL
     """
     try:
+        upload_id = _request_upload_id()
         # 校验文件
-        if 'file' not in request.files:
+        if not upload_id and 'file' not in request.files:
             return jsonify({"success": False, "error": "未找到上传的文件字段(file)"}), 400
 
-        file = request.files['file']
-        if file.filename == '':
+        file = request.files.get('file')
+        if not upload_id and file.filename == '':
             return jsonify({"success": False, "error": "未选择文件"}), 400
 
         # 读取分类参数
@@ -663,7 +822,10 @@ def upload_file():
             return jsonify({"success": False, "error": "无效的子分类"}), 400
 
         # 使用文件上传服务
-        upload_result = FileUploadService.upload_company_file(file, subcategory)
+        if upload_id:
+            upload_result = FileUploadService.upload_chunked_company_file(upload_id, subcategory)
+        else:
+            upload_result = FileUploadService.upload_company_file(file, subcategory)
 
         return jsonify({
             "success": True,
@@ -671,7 +833,7 @@ def upload_file():
             "data": {
                 "url": upload_result['public_url'],
                 "filename": upload_result['filename'],
-                "original_name": file.filename,
+                "original_name": upload_result.get('original_name') or file.filename,
                 "category": category,
                 "subcategory": subcategory,
                 "size": upload_result['file_size'],
@@ -679,12 +841,15 @@ def upload_file():
             }
         })
 
+    except ChunkedUploadError as e:
+        return _chunked_upload_error(e)
     except ValueError as e:
         return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": f"上传失败: {str(e)}"}), 500
 
 @mvp_bp.route('/generate-if', methods=['POST'])
+@_admission_controlled('generation')
 def generate_if():
     """生成IF文档"""
     try:
@@ -705,6 +870,7 @@ def generate_if():
 # ========== 新增：多类型测试文档生成接口 ==========
 
 @mvp_bp.route('/generate-cert', methods=['POST'])
+@_admission_controlled('generation')
 def generate_cert():
     """生成CERT文档"""
     try:
@@ -725,6 +891,7 @@ def generate_cert():
 
 
 @mvp_bp.route('/generate-other', methods=['POST'])
+@_admission_controlled('generation')
 def generate_other():
     """生成OTHER文档"""
     try:
@@ -745,6 +912,7 @@ def generate_other():
 
 
 @mvp_bp.route('/generate-tr', methods=['POST'])
+@_admission_controlled('generation')
 def generate_tr():
     try:
         data = request.get_json(silent=True) or {}
@@ -758,6 +926,7 @@ def generate_tr():
 
 
 @mvp_bp.route('/generate-review-control-sheet', methods=['POST'])
+@_admission_controlled('generation')
 def generate_review_control_sheet():
     try:
         data = request.get_json(silent=True) or {}
@@ -779,9 +948,9 @@ def generate_review_control_sheet():
             # 使用示例数据
             rcs_data = create_rcs_sample_data()
         
-        # 生成输出路径
-        output_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'generated_files')
-        os.makedirs(output_dir, exist_ok=True)
+        # 生成输出路径（独立的临时目录，成功后发布）
+        job = OutputJob(os.path.join(current_app.config['UPLOAD_FOLDER'], 'generated_files'))
+        output_dir = job.scratch_dir
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         file_ext = '.pdf' if format_type == 'pdf' else '.docx'
         approval_no = form_data.approval_no if form_data else 'RCS-2024-001'
@@ -791,13 +960,16 @@ def generate_review_control_sheet():
         output_path = os.path.join(output_dir, filename)
         
         # 生成RCS审查控制表
-        result = generate_rcs_document(rcs_data, output_path, format_type)
+        with job:
+            result = generate_rcs_document(rcs_data, output_path, format_type)
+            if result["success"]:
+                job.publish()
         
         if result["success"]:
             payload = {
                 "filename": filename,
-                "file_path": output_path,
-                "download_url": f"/api/mvp/download/{filename}"
+                "file_path": job.path(filename),
+                "download_url": job.download_url(filename)
             }
             return jsonify({"success": True, "message": "RCS审查控制表生成成功", "data": payload})
         else:
@@ -810,6 +982,7 @@ def generate_review_control_sheet():
 
 
 @mvp_bp.route('/generate-tm', methods=['POST'])
+@_admission_controlled('generation')
 def generate_tm():
     try:
         data = request.get_json(silent=True) or {}
@@ -840,10 +1013,6 @@ def _generate_single_document_by_type(doc_type, session_id, output_format='docx'
         # 处理Approval_No生成文件名
         safe_approval_no = _make_safe_approval_no(form_data)
         
-        # 确保输出目录存在
-        output_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'generated_files')
-        os.makedirs(output_dir, exist_ok=True)
-        
         # 使用工厂类获取文档配置
         factory = DocumentGeneratorFactory()
         doc_config = factory.get_generator(doc_type)
@@ -851,11 +1020,22 @@ def _generate_single_document_by_type(doc_type, session_id, output_format='docx'
         if not doc_config:
             return jsonify({"error": f"{doc_type.upper()}文档生成器配置不存在"}), 500
         
-        # 生成文档
-        result = _generate_single_document(
-            doc_config, generation_data, output_dir, safe_approval_no, output_format
-        )
+        # 生成文档（截止时间同 /generate-documents）：在独立的临时目录中生成，成功后发布
+        try:
+            token = _request_generation_token(request.get_json(silent=True) or {})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        with OutputJob(os.path.join(current_app.config['UPLOAD_FOLDER'], 'generated_files')) as job, \
+                cancel_scope(token):
+            result = _generate_single_document(
+                doc_config, generation_data, job.scratch_dir, safe_approval_no, output_format
+            )
+            if result['success']:
+                job.publish([result])
         
+        if not result['success'] and token.cancelled:
+            return jsonify({"success": False, "error": f"生成已中止：{token.message}",
+                            "error_code": token.reason}), _cancelled_status(token.reason)
         if result['success']:
             return jsonify({
                 "success": True,
@@ -875,9 +1055,23 @@ def _generate_single_document_by_type(doc_type, session_id, output_format='docx'
         print(f"错误堆栈: {traceback.format_exc()}")
         return jsonify({"error": f"生成{doc_type.upper()}文档失败: {str(e)}"}), 500
 
+@mvp_bp.route('/download/<job_id>/<filename>', methods=['GET'])
+def download_published_document(job_id, filename):
+    """下载某次生成发布的文档（只有完整生成并发布后的文件可见，发布后内容不再变化，可长期缓存）"""
+    file_path = published_path(job_id, filename, os.path.join(current_app.config['UPLOAD_FOLDER'], 'generated_files'))
+    if not file_path:
+        return jsonify({"error": "无效的文件名"}), 400
+    if not os.path.isfile(file_path):
+        return jsonify({"error": "文件不存在"}), 404
+    # 记录最近下载时间（保留策略按此做 LRU；不修改文件，ETag 保持不变）
+    touch_last_used(file_path)
+    return send_stored_file(file_path, IMMUTABLE, as_attachment=True, download_name=filename,
+                            mimetype='application/octet-stream')
+
+
 @mvp_bp.route('/download/<filename>', methods=['GET'])
 def download_generated_document(filename):
-    """下载生成的文档"""
+    """下载生成的文档（按文件名：文档包别名与旧的下载地址，别名以原子替换方式更新）"""
     try:
         # 安全检查：防止路径遍历攻击
         if '..' in filename or '/' in filename or '\\' in filename:
@@ -886,17 +1080,20 @@ def download_generated_document(filename):
         # 构建文件路径
         file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'generated_files', filename)
         
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
+        # 检查文件是否存在（发布过程中的临时文件不可下载）
+        if filename.startswith('.') or not os.path.exists(file_path):
             return jsonify({"error": "文件不存在"}), 404
         
         # 检查文件是否为普通文件
         if not os.path.isfile(file_path):
             return jsonify({"error": "无效的文件"}), 400
         
-        # 使用 send_file 发送文件
-        return send_file(
+        # 发送文件（记录最近下载时间，保留策略按此做 LRU）；别名会被原子替换，
+        # 每次重新验证，断点续传时 If-Range 携带的 ETag 不匹配则返回完整的新文件
+        touch_last_used(file_path)
+        return send_stored_file(
             file_path,
+            REVALIDATE,
             as_attachment=True,
             download_name=filename,
             mimetype='application/octet-stream'
@@ -906,79 +1103,646 @@ def download_generated_document(filename):
         print(f"❌ 下载文件失败: {str(e)}")
         return jsonify({"error": f"下载失败: {str(e)}"}), 500
         
+def _remove_cleaned_copy(processed_path):
+    """删除预处理在文档旁生成的 .clean.docx"""
+    try:
+        if processed_path and processed_path.endswith('.docx'):
+            base = os.path.splitext(processed_path)[0]
+            cleaned = f"{base}.clean.docx"
+            if os.path.exists(cleaned):
+                os.remove(cleaned)
+    except Exception:
+        pass
+
+
+def _extraction_response_body(extraction_result):
+    """提取结果 -> (响应体, HTTP状态码)"""
+    if extraction_result["success"]:
+        return {
+            "success": True,
+            "message": "使用RULES方式提取成功",
+            "data": extraction_result["data"],
+            "extraction_mode": extraction_result.get("mode", "rules"),
+            "cache_hit": extraction_result.get("cache_hit", False),
+            "classification": extraction_result.get("classification", {}),
+            "rule_timings_ms": extraction_result.get("rule_timings_ms", {})
+        }, 200
+    elif extraction_result.get("error_code") == "unsupported_document":
+        # 分类器未能识别文档类型：不执行任何策略的完整规则集
+        return {
+            "success": False,
+            "error": extraction_result.get("error"),
+            "error_code": "unsupported_document",
+            "classification": extraction_result.get("classification", {}),
+            "extraction_mode": "rules"
+        }, 422
+    elif extraction_result.get("error_code") == "extraction_timeout":
+        # 规则执行超出时间预算：文档无法在限定时间内处理
+        return {
+            "success": False,
+            "error": extraction_result.get("error"),
+            "error_code": "extraction_timeout",
+            "extraction_mode": "rules"
+        }, 422
+    else:
+        return {
+            "success": False,
+            "error": extraction_result.get("error", "提取失败"),
+            "extraction_mode": "rules"
+        }, 500
+
+
+# ===================== 流式响应（JSONL / SSE） =====================
+
+def _resolve_stream_format(value=None, default='jsonl'):
+    """解析流式输出格式：参数优先，其次请求头 Accept: text/event-stream；不支持的格式返回None"""
+    stream_format = (value or request.form.get('format') or request.args.get('format') or '').lower()
+    if not stream_format:
+        stream_format = 'sse' if 'text/event-stream' in request.headers.get('Accept', '') else default
+    return stream_format if stream_format in ('jsonl', 'sse') else None
+
+
+def _format_stream_event(event, stream_format):
+    line = json.dumps(event, ensure_ascii=False, default=str)
+    if stream_format == 'sse':
+        return f"event: {event.get('type', 'message')}\ndata: {line}\n\n"
+    return line + "\n"
+
+
+def _stream_response(events, stream_format):
+    mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    # 关闭 nginx 缓冲，逐条推送给客户端
+    return Response(events, mimetype=mimetype, headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+class _RequestThreadCall:
+    """后台线程转交给请求线程执行的调用（见 _stream_background_events）"""
+
+    def __init__(self, func):
+        self.func = func
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self._claimed = False
+        self._lock = threading.Lock()
+
+    def claim(self) -> bool:
+        """认领执行（请求线程与后台线程只有一方执行）"""
+        with self._lock:
+            if self._claimed:
+                return False
+            self._claimed = True
+            return True
+
+    def run(self):
+        try:
+            self.result = self.func()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+
+def _stream_background_events(work, stream_format, error_prefix, cleanup=None, cancel_token=None):
+    """在后台线程（应用上下文内）执行 work(emit)，将其回调的进度事件与最终返回的事件流式推送
+
+    长时间没有事件（如 PDF 转换）时发送心跳，避免代理断开连接。
+    cancel_token: 可选，客户端在结果推送前断开时取消该令牌（后台任务据此中止）；不传时后台任务继续完成。
+    请求线程是主线程（gunicorn sync worker）时，提取规则转交请求线程执行，SIGALRM 硬超时
+    （EXTRACTION_TIME_BUDGET）与 /document-extract 一样生效；否则只在规则之间检查预算。
+    """
+    app = current_app._get_current_object()
+    heartbeat_seconds = float(current_app.config.get('STREAM_HEARTBEAT_SECONDS', 15))
+    events = queue.Queue()
+    closed = threading.Event()
+    delegate = threading.current_thread() is threading.main_thread()
+
+    def run_in_request_thread(func):
+        call = _RequestThreadCall(func)
+        events.put(call)
+        waited = 0.0
+        while not call.done.wait(0.5):
+            waited += 0.5
+            # 客户端已断开或请求线程迟迟未处理：在当前线程执行（只有规则间检查）
+            if (closed.is_set() or waited >= heartbeat_seconds) and call.claim():
+                call.run()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def run():
+        try:
+            with app.app_context():
+                if delegate:
+                    with delegate_rules(run_in_request_thread):
+                        events.put(work(events.put))
+                else:
+                    events.put(work(events.put))
+        except Exception as e:
+            app.logger.error(f"{error_prefix}: {str(e)}")
+            events.put({"type": "error", "error": f"{error_prefix}: {str(e)}"})
+        finally:
+            if cleanup:
+                cleanup()
+            events.put(None)
+
+    threading.Thread(target=run, name='stream-worker', daemon=True).start()
+
+    def generate():
+        finished = False
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=heartbeat_seconds)
+                except queue.Empty:
+                    yield ": keep-alive\n\n" if stream_format == 'sse' else _format_stream_event({"type": "heartbeat"}, stream_format)
+                    continue
+                if isinstance(event, _RequestThreadCall):
+                    if event.claim():
+                        with app.app_context():
+                            event.run()
+                    continue
+                if event is None:
+                    finished = True
+                    break
+                yield _format_stream_event(event, stream_format)
+        finally:
+            closed.set()
+            # 客户端断开时服务器关闭生成器
+            if not finished and cancel_token is not None:
+                cancel_token.cancel(CANCELLED, "客户端已断开")
+
+    return _stream_response(generate(), stream_format)
+
+
 @mvp_bp.route('/document-extract', methods=['POST'])
+@_admission_controlled('extraction')
 def document_extract():
     """文档信息提取（仅规则引擎）
     
     请求参数：
     - file: 上传的文档文件
+    - upload_id: 可选，代替 file，使用已完成的分块上传（用途为 document，见 /chunked-uploads）
+    - bypass_cache: 可选，为 true 时跳过提取缓存强制重新提取（也可用查询参数 ?bypass_cache=true）
     """
     try:
-        # 检查是否有文件上传
-        if 'file' not in request.files:
-            return jsonify({
-                "success": False,
-                "error": "未找到上传的文件"
-            }), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({
-                "success": False,
-                "error": "未选择文件"
-            }), 400
-        
-        # 检查文件类型
-        allowed_extensions = {'.doc', '.docx', '.pdf'}
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in allowed_extensions:
-            return jsonify({
-                "success": False,
-                "error": f"不支持的文件类型: {file_ext}，仅支持: {', '.join(allowed_extensions)}"
-            }), 400
+        upload_id = _request_upload_id()
+        # 检查是否有文件上传（分块上传的文件类型在创建时已校验）
+        if not upload_id:
+            if 'file' not in request.files:
+                return jsonify({
+                    "success": False,
+                    "error": "未找到上传的文件"
+                }), 400
+            
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({
+                    "success": False,
+                    "error": "未选择文件"
+                }), 400
+            
+            # 检查文件类型
+            allowed_extensions = {'.doc', '.docx', '.pdf'}
+            file_ext = os.path.splitext(file.filename)[1].lower()
+            if file_ext not in allowed_extensions:
+                return jsonify({
+                    "success": False,
+                    "error": f"不支持的文件类型: {file_ext}，仅支持: {', '.join(allowed_extensions)}"
+                }), 400
         
-        # 使用文件上传服务保存到临时目录
+        # 使用文件上传服务保存到临时目录（分块上传直接移动组装好的文件）
         temp_file_path = None
         try:
-            upload_result = FileUploadService.upload_document_file(file, temp_dir=True)
+            if upload_id:
+                upload_result = FileUploadService.upload_chunked_document(upload_id, temp_dir=True)
+            else:
+                upload_result = FileUploadService.upload_document_file(file, temp_dir=True)
             temp_file_path = upload_result['file_path']
             
             # 调用提取服务，指定提取方式
             processed_path = temp_file_path
-            extraction_result = document_extraction_service.extract_from_document(temp_file_path)
+            bypass_cache = (request.form.get('bypass_cache') or request.args.get('bypass_cache') or '').lower() in ('1', 'true', 'yes')
+            extraction_result = document_extraction_service.extract_from_document(
+                temp_file_path, use_cache=not bypass_cache
+            )
             
             # 如果预处理生成了 .clean.docx，提取结束后尝试清理
-            try:
-                if processed_path and processed_path.endswith('.docx'):
-                    base = os.path.splitext(processed_path)[0]
-                    cleaned = f"{base}.clean.docx"
-                    if os.path.exists(cleaned):
-                        os.remove(cleaned)
-            except Exception:
-                pass
+            _remove_cleaned_copy(processed_path)
             
-            if extraction_result["success"]:
-                return jsonify({
-                    "success": True,
-                    "message": "使用RULES方式提取成功",
-                    "data": extraction_result["data"],
-                    "extraction_mode": extraction_result.get("mode", "rules")
-                })
-            else:
-                return jsonify({
-                    "success": False,
-                    "error": extraction_result.get("error", "提取失败"),
-                    "extraction_mode": "rules"
-                }), 500
+            body, status = _extraction_response_body(extraction_result)
+            return jsonify(body), status
                 
         finally:
             # 清理临时文件（仅当已成功创建时）
             if temp_file_path:
                 FileUploadService.cleanup_temp_file(temp_file_path)
                 
+    except ChunkedUploadError as e:
+        return _chunked_upload_error(e)
     except Exception as e:
         current_app.logger.error(f"提取失败: {str(e)}")
         return jsonify({
             "success": False,
             "error": f"提取失败: {str(e)}"
         }), 500
+
+
+@mvp_bp.route('/document-extract/batch', methods=['POST'])
+def document_extract_batch():
+    """批量文档信息提取（多文件或ZIP），按完成顺序流式返回各文件结果
+    
+    请求参数：
+    - files: 多个上传文件（.doc/.docx/.pdf，或包含这些文件的 .zip）
+    - format: 可选，jsonl（默认，每行一个JSON）或 sse（server-sent events）；
+      请求头 Accept: text/event-stream 时默认为 sse
+    - bypass_cache: 可选，为 true 时跳过提取缓存
+    
+    每个文件产出一条 {"type": "result", "index", "filename", "success", ...}，
+    最后产出一条 {"type": "summary", "total", "succeeded", "failed", "elapsed_ms"}。
+    """
+    files = request.files.getlist('files') + request.files.getlist('file')
+    if not files:
+        return jsonify({
+            "success": False,
+            "error": "未找到上传的文件"
+        }), 400
+
+    output_format = _resolve_stream_format(default='jsonl')
+    if not output_format:
+        return jsonify({
+            "success": False,
+            "error": "不支持的输出格式，仅支持: jsonl, sse"
+        }), 400
+    bypass_cache = (request.form.get('bypass_cache') or request.args.get('bypass_cache') or '').lower() in ('1', 'true', 'yes')
+
+    # 各文档在提取时逐个排队占用名额；提取队列已满时直接拒绝整批
+    try:
+        admission_controller.check('extraction')
+    except AdmissionRejected as e:
+        return _admission_rejected_response(e)
+
+    # 输入须在开始流式响应之前全部落盘（响应开始后请求体不再可读）
+    runner = BatchExtractionRunner(document_extraction_service)
+    workspace = runner.create_workspace()
+    try:
+        items = runner.collect_inputs(files, workspace)
+    except BatchInputError as e:
+        runner.cleanup_workspace(workspace)
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        runner.cleanup_workspace(workspace)
+        current_app.logger.error(f"批量提取输入处理失败: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"批量提取失败: {str(e)}"
+        }), 500
+
+    app = current_app._get_current_object()
+
+    def generate():
+        try:
+            for result in runner.run(app, items, use_cache=not bypass_cache):
+                yield _format_stream_event(result, output_format)
+        finally:
+            runner.cleanup_workspace(workspace)
+
+    return _stream_response(generate(), output_format)
+
+
+@mvp_bp.route('/document-extract/stream', methods=['POST'])
+def document_extract_stream():
+    """文档信息提取，并以流的形式推送进度
+    
+    请求参数与 /document-extract 相同（含 upload_id）；另可通过 format 选择 sse（默认）或 jsonl。
+    
+    依次推送 {"type": "stage", "stage": uploaded / cache_hit / classified / preprocessed / extracted, "elapsed_ms"}，
+    最后推送 {"type": "result", "status", ...与 /document-extract 相同的响应体}。
+    提取在后台线程中进行，规则转交请求线程执行以便 EXTRACTION_TIME_BUDGET 的 SIGALRM 硬超时生效；
+    请求线程不是主线程（多线程 worker、开发服务器）时只在规则之间检查预算，回溯严重的单条正则无法中断。
+    """
+    upload_id = _request_upload_id()
+    file = request.files.get('file')
+    if not upload_id and (not file or not file.filename):
+        return jsonify({
+            "success": False,
+            "error": "未找到上传的文件"
+        }), 400
+
+    # 分块上传的文件类型在创建时已校验
+    allowed_extensions = {'.doc', '.docx', '.pdf'}
+    file_ext = os.path.splitext(file.filename)[1].lower() if not upload_id else None
+    if file_ext is not None and file_ext not in allowed_extensions:
+        return jsonify({
+            "success": False,
+            "error": f"不支持的文件类型: {file_ext}，仅支持: {', '.join(allowed_extensions)}"
+        }), 400
+
+    stream_format = _resolve_stream_format(default='sse')
+    if not stream_format:
+        return jsonify({
+            "success": False,
+            "error": "不支持的输出格式，仅支持: jsonl, sse"
+        }), 400
+    bypass_cache = (request.form.get('bypass_cache') or request.args.get('bypass_cache') or '').lower() in ('1', 'true', 'yes')
+
+    release, rejected = _acquire_for_stream('extraction')
+    if rejected:
+        return rejected
+
+    # 文件须在开始流式响应之前落盘；后台任务启动前的任何异常都要释放名额（释放可重复调用）
+    temp_file_path = None
+    try:
+        if upload_id:
+            upload_result = FileUploadService.upload_chunked_document(upload_id, temp_dir=True)
+        else:
+            upload_result = FileUploadService.upload_document_file(file, temp_dir=True)
+        temp_file_path = upload_result['file_path']
+        original_name = upload_result.get('original_name') or file.filename
+
+        def work(emit):
+            emit({"type": "stage", "stage": "uploaded", "filename": original_name})
+            extraction_result = document_extraction_service.extract_from_document(
+                temp_file_path, use_cache=not bypass_cache, on_event=emit
+            )
+            body, status = _extraction_response_body(extraction_result)
+            return {"type": "result", "status": status, **body}
+
+        def cleanup():
+            _remove_cleaned_copy(temp_file_path)
+            FileUploadService.cleanup_temp_file(temp_file_path)
+            release()
+
+        return _stream_background_events(work, stream_format, error_prefix="提取失败", cleanup=cleanup)
+    except BaseException as e:
+        release()
+        if temp_file_path:
+            FileUploadService.cleanup_temp_file(temp_file_path)
+        if isinstance(e, ChunkedUploadError):
+            return _chunked_upload_error(e)
+        if isinstance(e, ValueError):
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        if isinstance(e, Exception):
+            current_app.logger.error(f"提取失败: {str(e)}")
+            return jsonify({
+                "success": False,
+                "error": f"提取失败: {str(e)}"
+            }), 500
+        raise
+
+
+# ===================== 一站式流水线与后台任务 =====================
+
+def _pipeline_error_payload(error: PipelineError) -> dict:
+    return {
+        "success": False,
+        "error": str(error),
+        "error_code": error.error_code,
+        "stage": error.stage,
+        "data": error.details
+    }
+
+
+@mvp_bp.route('/pipeline', methods=['POST'])
+def document_pipeline():
+    """一站式：上传申请书 → 提取 → 保存表单 → 生成文档，返回各阶段耗时
+    
+    请求参数（multipart/form-data）：
+    - file: 申请书文档（.doc/.docx/.pdf）
+    - session_id: 可选，为空时新建会话
+    - overrides: 可选，JSON对象字符串，覆盖提取结果的表单字段（优先级最高）
+    - company_id / approval_date / test_date / report_date / report_no: 可选，常用覆盖字段（日期为 YYYY-MM-DD）
+    - output_format: 可选，docx（默认）或 pdf
+    - doc_types: 可选，只生成这些文档类型（逗号分隔，如 if,tr）
+    - bypass_cache: 可选，为 true 时跳过提取缓存
+    - async: 可选，为 true 时作为后台任务执行，立即返回 202 与任务ID（GET /jobs/<job_id> 查询）
+    """
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({
+            "success": False,
+            "error": "未找到上传的文件"
+        }), 400
+
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    if file_ext not in {'.doc', '.docx', '.pdf'}:
+        return jsonify({
+            "success": False,
+            "error": f"不支持的文件类型: {file_ext}，仅支持: .doc, .docx, .pdf"
+        }), 400
+
+    output_format = (request.form.get('output_format') or 'docx').lower()
+    if output_format not in ('docx', 'pdf'):
+        return jsonify({
+            "success": False,
+            "error": f"不支持的输出格式: {output_format}，仅支持: docx, pdf"
+        }), 400
+
+    factory = DocumentGeneratorFactory()
+    doc_types = [t.strip().lower() for t in (request.form.get('doc_types') or '').split(',') if t.strip()]
+    unknown = [t for t in doc_types if not factory.get_generator(t)]
+    if unknown:
+        return jsonify({
+            "success": False,
+            "error": f"未知的文档类型: {', '.join(unknown)}"
+        }), 400
+
+    try:
+        overrides = json.loads(request.form.get('overrides') or '{}')
+        if not isinstance(overrides, dict):
+            raise ValueError
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "overrides 必须是JSON对象"
+        }), 400
+    for key in ('company_id', 'approval_date', 'test_date', 'report_date', 'report_no'):
+        if request.form.get(key):
+            overrides[key] = request.form.get(key)
+    if overrides.get('company_id') is not None:
+        try:
+            overrides['company_id'] = int(overrides['company_id'])
+        except (TypeError, ValueError):
+            return jsonify({
+                "success": False,
+                "error": "company_id 必须是整数"
+            }), 400
+
+    session_id = request.form.get('session_id') or None
+    bypass_cache = (request.form.get('bypass_cache') or request.args.get('bypass_cache') or '').lower() in ('1', 'true', 'yes')
+    run_async = (request.form.get('async') or request.args.get('async') or '').lower() in ('1', 'true', 'yes')
+
+    try:
+        upload_result = FileUploadService.upload_document_file(file, temp_dir=True)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    temp_file_path = upload_result['file_path']
+    pipeline_kwargs = dict(
+        session_id=session_id,
+        overrides=overrides,
+        output_format=output_format,
+        doc_types=doc_types or None,
+        output_dir=os.path.join(current_app.config['UPLOAD_FOLDER'], 'generated_files'),
+        use_cache=not bypass_cache
+    )
+
+    if run_async:
+        def pipeline_job(job):
+            try:
+                return run_document_pipeline(temp_file_path, on_stage=job.set_stage, admission_queue=False,
+                                             **pipeline_kwargs)
+            except PipelineError as e:
+                job.result = _pipeline_error_payload(e)
+                raise
+            finally:
+                FileUploadService.cleanup_temp_file(temp_file_path)
+
+        job = job_manager.submit(current_app._get_current_object(), 'pipeline', pipeline_job)
+        return jsonify({
+            "success": True,
+            "message": "任务已提交",
+            "data": {
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/api/mvp/jobs/{job.id}"
+            }
+        }), 202
+
+    try:
+        result = run_document_pipeline(temp_file_path, **pipeline_kwargs)
+        return jsonify({
+            "success": True,
+            "message": f"成功生成 {result['total_success']} 个文档并打包为ZIP",
+            "data": result
+        })
+    except PipelineError as e:
+        if isinstance(e.__cause__, AdmissionRejected):
+            response = _admission_rejected_response(e.__cause__)
+            response.set_data(json.dumps(_pipeline_error_payload(e), ensure_ascii=False, default=str))
+            return response
+        status = 422 if e.error_code in ('unsupported_document', 'extraction_timeout') else \
+            400 if e.error_code == 'company_not_found' else 500
+        return jsonify(_pipeline_error_payload(e)), status
+    except Exception as e:
+        current_app.logger.error(f"流水线执行失败: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"流水线执行失败: {str(e)}"
+        }), 500
+    finally:
+        FileUploadService.cleanup_temp_file(temp_file_path)
+
+
+@mvp_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询后台任务状态与结果"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({
+            "success": False,
+            "error": "任务不存在或已过期"
+        }), 404
+    return jsonify({
+        "success": True,
+        "data": job.to_dict()
+    })
+
+
+@mvp_bp.route('/system-params/refresh', methods=['GET'])
+def system_params_refresh_status():
+    """系统参数批量刷新状态：当前参数指纹、是否有过期的表单/文档、刷新进度"""
+    return jsonify({
+        "success": True,
+        "data": system_params_refresher.status()
+    })
+
+
+@mvp_bp.route('/system-params/refresh', methods=['POST'])
+def system_params_refresh_start():
+    """启动（或从中断处继续）系统参数批量刷新
+    
+    请求参数（JSON，可选）：
+    - rerender: 是否重新渲染已生成过的文档包，默认 true
+    """
+    data = request.get_json(silent=True) or {}
+    rerender = data.get('rerender', True) not in (False, 'false', '0', 0)
+    status = system_params_refresher.start(current_app._get_current_object(), rerender=rerender)
+    return jsonify({
+        "success": True,
+        "message": "系统参数刷新已启动",
+        "data": status
+    }), 202
+
+
+@mvp_bp.route('/system-params/refresh/pause', methods=['POST'])
+def system_params_refresh_pause():
+    """暂停系统参数批量刷新（当前会话处理完后停止，可再次启动继续）"""
+    was_running = system_params_refresher.pause()
+    return jsonify({
+        "success": True,
+        "message": "已请求暂停" if was_running else "当前没有正在进行的刷新",
+        "data": system_params_refresher.status()
+    })
+
+
+@mvp_bp.route('/retention', methods=['GET'])
+def retention_status():
+    """生成文件保留策略：配置、当前占用与累计清理指标"""
+    units = retention_manager.scan()
+    usage = {"total_bytes": sum(u.size for u in units), "units": len(units),
+             "protected": sum(1 for u in units if u.protected), "by_kind": {}}
+    for unit in units:
+        kind = usage["by_kind"].setdefault(unit.kind, {"units": 0, "bytes": 0})
+        kind["units"] += 1
+        kind["bytes"] += unit.size
+    return jsonify({
+        "success": True,
+        "data": {
+            "policy": retention_manager.policy(),
+            "usage": usage,
+            "metrics": retention_manager.metrics()
+        }
+    })
+
+
+@mvp_bp.route('/retention/sweep', methods=['POST'])
+def retention_sweep():
+    """立即清理生成文件（dry_run 为 true 时只返回将删除的文件）"""
+    data = request.get_json(silent=True) or {}
+    dry_run = data.get('dry_run') in (True, 'true', '1', 1)
+    report = retention_manager.sweep(dry_run=dry_run, trigger='api')
+    return jsonify({"success": True, "data": report})
+
+
+@mvp_bp.route('/upload-gc', methods=['GET'])
+def upload_gc_status():
+    """公司图片孤儿回收：配置、隔离区占用与累计回收指标"""
+    return jsonify({
+        "success": True,
+        "data": {
+            "policy": upload_gc.policy(),
+            "quarantine": upload_gc.quarantine_usage(),
+            "metrics": upload_gc.metrics()
+        }
+    })
+
+
+@mvp_bp.route('/upload-gc/sweep', methods=['POST'])
+def upload_gc_sweep():
+    """立即回收未被引用的公司图片（dry_run 为 true 时只返回将隔离、恢复、删除的文件）"""
+    data = request.get_json(silent=True) or {}
+    dry_run = data.get('dry_run') in (True, 'true', '1', 1)
+    report = upload_gc.sweep(dry_run=dry_run, trigger='api')
+    return jsonify({"success": True, "data": report})
@@ -0,0 +1,6 @@
+"""
+命令行工具包
+
+脱离 HTTP 请求运行的批处理与基准工具，使用方式（在 backend 目录下）：
+    python -m app.cli.<工具名> --help
+"""
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+规则引擎提取基准测试
+
+对一批真实信息文件夹（.docx/.pdf/.txt），先各提取一次文本，再分别用旧实现与新实现
+重复执行字段提取，校验两者输出完全一致，并输出吞吐量（文档/秒、MB/秒）。
+
+用法（在 backend 目录下）：
+    python -m app.cli.benchmark_extraction <文件或目录> [...] [--iterations 20]
+    python -m app.cli.benchmark_extraction <目录> --suite vehicles --synthetic-vehicles 60
+"""
+import os
+import re
+import sys
+import time
+import argparse
+from typing import Callable, Dict, Any, List, Tuple
+
+SUPPORTED_EXTENSIONS = {'.docx', '.pdf', '.txt'}
+
+
+def _collect_files(paths: List[str]) -> List[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if os.path.splitext(name.lower())[1] in SUPPORTED_EXTENSIONS and '.clean.' not in name:
+                        files.append(os.path.join(root, name))
+        elif os.path.isfile(path):
+            files.append(path)
+    return files
+
+
+def _legacy_fields(strategy, text: str) -> Dict[str, str]:
+    """旧实现：逐字段全文 re.findall"""
+    return {name: strategy._extract_field_value(text, config) for name, config in strategy.field_patterns.items()}
+
+
+def _scanner_fields(strategy, text: str) -> Dict[str, str]:
+    """新实现：预编译单遍扫描器"""
+    return strategy._scan_fields(text)
+
+
+def _legacy_vehicles(strategy, text: str) -> list:
+    """旧实现：按 Vehicle manufacturer 拆分区块，再逐字段 re.search（含惰性跨度）"""
+    vehicles = []
+    blocks = re.split(r'(?=Vehicle\s+manufacturer\s*:)', text, flags=re.IGNORECASE)
+    for block in blocks:
+        if not block.strip() or not re.search(r'Vehicle\s+manufacturer\s*:', block, re.IGNORECASE):
+            continue
+
+        def get_val(pattern):
+            match = re.search(pattern, block, re.IGNORECASE)
+            return match.group(1).strip() if match else ""
+
+        vehicle = {
+            'veh_mfr': get_val(r'Vehicle\s+manufacturer\s*:\s*([^\n]+)'),
+            'veh_type': get_val(r'Type\s+of\s+vehicle\s*:\s*([^\n]+)'),
+            'veh_cat': get_val(r'Vehicle\s+category\s*:\s*([^\n]+)'),
+            'dev_area': get_val(r'Developed\s+area\s*\(F\)[\s\S]*?([0-9.]+)\s*m[2²]'),
+            'seg_height': get_val(r'Height\s+of\s+segment\s*\(h\)[\s\S]*?([0-9.]+)\s*mm'),
+            'curv_radius': get_val(r'Curvature\s*\(r\)[\s\S]*?([0-9.]+)\s*mm'),
+            'inst_angle': get_val(r'Installation\s+angle\s*\([^)]+\)[\s\S]*?([0-9.]+)\s*°?'),
+            'seat_angle': get_val(r'Seat-back\s+angle\s*\([^)]+\)[\s\S]*?([0-9.]+)\s*°?'),
+            'rpoint_coords': {
+                'A': get_val(r'R-point\s+coordinates[\s\S]*?A:\s*([-+±]?\s*[0-9.]+)\s*mm'),
+                'B': get_val(r'R-point\s+coordinates[\s\S]*?B:\s*([-+±]?\s*[0-9.]+)\s*mm'),
+                'C': get_val(r'R-point\s+coordinates[\s\S]*?C:\s*([-+±]?\s*[0-9.]+)\s*mm')
+            },
+            'dev_desc': get_val(r'Description\s+of\s+the\s+commercially\s+available[^:]*:\s*([^\n]*)')
+        }
+        if vehicle['veh_mfr'] or vehicle['veh_type']:
+            vehicles.append(vehicle)
+    return vehicles
+
+
+def _tokenizer_vehicles(strategy, text: str) -> list:
+    """新实现：单遍车辆区块分词器"""
+    return strategy._extract_vehicles(text)
+
+
+SUITES: Dict[str, Tuple[Callable, Callable]] = {
+    'fields': (_legacy_fields, _scanner_fields),
+    'vehicles': (_legacy_vehicles, _tokenizer_vehicles),
+}
+
+
+def _with_synthetic_vehicles(text: str, count: int) -> str:
+    """复制文档自身的车辆条目，直到车辆数不少于 count（用于长车辆列表的压力测试）"""
+    starts = [m.start() for m in re.finditer(r'Vehicle\s+manufacturer\s*:', text, re.IGNORECASE)]
+    if not starts or len(starts) >= count:
+        return text
+    section = text[starts[0]:]
+    copies = -(-(count - len(starts)) // len(starts))
+    return text + ('\n' + section) * copies
+
+
+def _time_runs(func: Callable, strategy, texts: List[str], iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts:
+            func(strategy, text)
+    return time.perf_counter() - start
+
+
+def run_benchmark(files: List[str], suites: List[str], iterations: int, synthetic_vehicles: int = 0) -> int:
+    from ..services.document_extract import OrdinaryLaminatedGlassWindscreenTemplate
+
+    strategy = OrdinaryLaminatedGlassWindscreenTemplate()
+    texts = []
+    for file_path in files:
+        try:
+            text = strategy._extract_text_from_file(file_path)
+        except Exception as e:
+            print(f"⚠️ 跳过 {file_path}: {e}")
+            continue
+        if text:
+            texts.append(_with_synthetic_vehicles(text, synthetic_vehicles) if synthetic_vehicles else text)
+
+    if not texts:
+        print("❌ 没有可用的文档文本")
+        return 1
+
+    total_bytes = sum(len(t.encode('utf-8')) for t in texts)
+    print(f"文档数: {len(texts)}，文本总量: {total_bytes / 1024:.1f} KB，迭代次数: {iterations}")
+
+    exit_code = 0
+    for suite in suites:
+        legacy, current = SUITES[suite]
+        mismatches = [i for i, t in enumerate(texts) if legacy(strategy, t) != current(strategy, t)]
+        if mismatches:
+            exit_code = 1
+            print(f"❌ [{suite}] 输出不一致的文档序号: {mismatches}")
+
+        legacy_elapsed = _time_runs(legacy, strategy, texts, iterations)
+        current_elapsed = _time_runs(current, strategy, texts, iterations)
+        docs = len(texts) * iterations
+        megabytes = total_bytes * iterations / (1024 * 1024)
+        print(f"[{suite}] 旧实现: {docs / legacy_elapsed:.1f} 文档/秒, {megabytes / legacy_elapsed:.2f} MB/秒")
+        print(f"[{suite}] 新实现: {docs / current_elapsed:.1f} 文档/秒, {megabytes / current_elapsed:.2f} MB/秒")
+        print(f"[{suite}] 加速比: {legacy_elapsed / current_elapsed:.2f}x，输出一致: {'是' if not mismatches else '否'}")
+    return exit_code
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='规则引擎提取基准测试')
+    parser.add_argument('paths', nargs='+', help='信息文件夹文件或目录')
+    parser.add_argument('--iterations', type=int, default=20, help='每个实现的重复次数')
+    parser.add_argument('--suite', choices=sorted(SUITES), action='append', help='要运行的基准（默认全部）')
+    parser.add_argument('--synthetic-vehicles', type=int, default=0,
+                        help='复制文档自身的车辆条目，使每个文档至少包含 N 个车辆')
+    args = parser.parse_args(argv)
+
+    files = _collect_files(args.paths)
+    if not files:
+        print("❌ 未找到支持的文档")
+        return 1
+    return run_benchmark(files, args.suite or sorted(SUITES), args.iterations, args.synthetic_vehicles)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+离线批量提取
+
+不经过 HTTP、不需要 Flask 应用上下文，直接用 DocumentExtractionService 对目录树或通配符匹配到的
+信息文件夹做多进程提取，每个文档一行写入 JSONL 结果文件，并输出吞吐量。
+
+- 每个文档先复制到独立的临时目录再提取（预处理会在文档旁生成 .clean.docx，归档目录可能只读）；
+- 结果文件即检查点：重新运行时跳过结果文件中已成功的文档（--retry-failed 时同时重跑失败的），
+  中断时写了一半的最后一行会被截掉；同一文档有多条记录时以最后一条为准；
+- 预处理的文本日志默认不输出（--verbose 时保留）。
+
+用法（在 backend 目录下）：
+    python -m app.cli.extract_bulk <目录或通配符> [...] -o results.jsonl [--workers 4]
+"""
+import io
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from typing import Dict, Any, List, Set, Tuple
+
+SUPPORTED_EXTENSIONS = {'.doc', '.docx', '.pdf'}
+
+# 工作进程内的提取服务（每个进程创建一次）
+_service = None
+_options: Dict[str, Any] = {}
+
+
+def _collect_files(patterns: List[str]) -> List[str]:
+    files = []
+    seen = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            candidates = []
+            if os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    candidates.extend(os.path.join(root, name) for name in sorted(names))
+            elif os.path.isfile(path):
+                candidates.append(path)
+            for candidate in candidates:
+                name = os.path.basename(candidate)
+                if (os.path.splitext(name.lower())[1] not in SUPPORTED_EXTENSIONS
+                        or '.clean.' in name or name.startswith('~$')):
+                    continue
+                absolute = os.path.abspath(candidate)
+                if absolute not in seen:
+                    seen.add(absolute)
+                    files.append(absolute)
+    return files
+
+
+def _load_checkpoint(output_path: str, retry_failed: bool) -> Set[str]:
+    """读取已有结果文件，返回无需重跑的文档路径；截掉中断时写了一半的最后一行"""
+    done: Set[str] = set()
+    if not os.path.exists(output_path):
+        return done
+
+    valid_size = 0
+    with open(output_path, 'rb') as f:
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                break
+            valid_size += len(raw)
+            if record.get('success') or not retry_failed:
+                done.add(record.get('path'))
+
+    if valid_size != os.path.getsize(output_path):
+        with open(output_path, 'r+b') as f:
+            f.truncate(valid_size)
+    return done
+
+
+def _init_worker(use_cache: bool, verbose: bool) -> None:
+    global _service
+    from ..services.document_extract import DocumentExtractionService
+
+    _service = DocumentExtractionService()
+    _options.update(use_cache=use_cache, verbose=verbose)
+
+
+def _extract_one(path: str) -> Dict[str, Any]:
+    """在工作进程中提取单个文档（复制到临时目录后处理）"""
+    started = time.perf_counter()
+    workdir = tempfile.mkdtemp(prefix='extract_bulk_')
+    try:
+        local_path = os.path.join(workdir, os.path.basename(path))
+        shutil.copyfile(path, local_path)
+        sink = contextlib.nullcontext() if _options.get('verbose') else contextlib.redirect_stdout(io.StringIO())
+        with sink:
+            result = _service.extract_from_document(local_path, use_cache=_options.get('use_cache', True))
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    record = {
+        "path": path,
+        "size": os.path.getsize(path) if os.path.exists(path) else 0,
+        "success": bool(result.get("success")),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        "classification": result.get("classification", {}),
+    }
+    if record["success"]:
+        record["cache_hit"] = result.get("cache_hit", False)
+        record["data"] = result.get("data", {})
+    else:
+        record["error"] = result.get("error", "提取失败")
+        record["error_code"] = result.get("error_code")
+    return record
+
+
+def run_bulk(files: List[str], output_path: str, workers: int, use_cache: bool, verbose: bool,
+             progress_every: int) -> Tuple[int, int]:
+    """执行批量提取，返回 (成功数, 失败数)"""
+    total_bytes = sum(os.path.getsize(p) for p in files)
+    succeeded = failed = 0
+    started = time.perf_counter()
+
+    with open(output_path, 'a', encoding='utf-8') as out, multiprocessing.Pool(
+            processes=workers, initializer=_init_worker, initargs=(use_cache, verbose)) as pool:
+        for done, record in enumerate(pool.imap_unordered(_extract_one, files), start=1):
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            out.flush()
+            if record['success']:
+                succeeded += 1
+            else:
+                failed += 1
+                print(f"❌ {record['path']}: {record.get('error')}")
+            if progress_every and done % progress_every == 0:
+                elapsed = time.perf_counter() - started
+                print(f"进度: {done}/{len(files)}，{done / elapsed:.1f} 文档/秒")
+
+    elapsed = time.perf_counter() - started
+    print(f"完成: 成功 {succeeded}，失败 {failed}，耗时 {elapsed:.1f}s")
+    if elapsed > 0 and files:
+        print(f"吞吐量: {len(files) / elapsed:.2f} 文档/秒, {total_bytes / (1024 * 1024) / elapsed:.2f} MB/秒")
+    return succeeded, failed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='离线批量提取信息文件夹')
+    parser.add_argument('paths', nargs='+', help='文件、目录或通配符（支持 **）')
+    parser.add_argument('-o', '--output', required=True, help='JSONL 结果文件（同时作为检查点）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='工作进程数')
+    parser.add_argument('--no-cache', action='store_true', help='不读取提取缓存，强制重新提取')
+    parser.add_argument('--retry-failed', action='store_true', help='重跑结果文件中失败的文档')
+    parser.add_argument('--progress-every', type=int, default=50, help='每完成 N 个文档输出一次进度')
+    parser.add_argument('--verbose', action='store_true', help='输出预处理日志')
+    args = parser.parse_args(argv)
+
+    files = _collect_files(args.paths)
+    if not files:
+        print("❌ 未找到支持的文档")
+        return 1
+
+    done = _load_checkpoint(args.output, args.retry_failed)
+    pending = [p for p in files if p not in done]
+    print(f"文档数: {len(files)}，已完成: {len(files) - len(pending)}，待处理: {len(pending)}")
+    if not pending:
+        return 0
+
+    _, failed = run_bulk(pending, args.output, max(1, args.workers), not args.no_cache, args.verbose,
+                         args.progress_every)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+生成文件清理（命令行）
+
+按保留策略（GENERATED_FILES_TTL_SECONDS、GENERATED_FILES_MAX_BYTES 等，见 app.config）清理
+uploads/generated_files，与 Web 服务的后台清理共用同一份记录与累计指标。
+
+用法（在 backend 目录下）：
+    python -m app.cli.gc_generated_files --status
+    python -m app.cli.gc_generated_files --dry-run
+    python -m app.cli.gc_generated_files
+"""
+import sys
+import json
+import argparse
+
+
+def _format_bytes(value: int) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(value) < 1024 or unit == 'GB':
+            return f"{value:.1f} {unit}" if unit != 'B' else f"{value} B"
+        value /= 1024
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='按保留时间与总大小配额清理生成文件')
+    parser.add_argument('--status', action='store_true', help='只显示策略、当前占用与累计指标')
+    parser.add_argument('--dry-run', action='store_true', help='只列出将删除的文件，不删除')
+    args = parser.parse_args(argv)
+
+    from ..main import app
+    from ..services.retention import retention_manager
+
+    with app.app_context():
+        if args.status:
+            units = retention_manager.scan()
+            print(json.dumps({
+                "policy": retention_manager.policy(),
+                "usage": {"total_bytes": sum(u.size for u in units), "units": len(units),
+                          "protected": sum(1 for u in units if u.protected)},
+                "metrics": retention_manager.metrics()
+            }, ensure_ascii=False, indent=2))
+            return 0
+
+        report = retention_manager.sweep(dry_run=args.dry_run, trigger='cli')
+        for item in report['deleted']:
+            print(f"{'将删除' if args.dry_run else '已删除'} [{item['reason']}] {item['path']} "
+                  f"({_format_bytes(item['bytes'])}, {item['idle_seconds'] / 3600:.1f} 小时未使用)")
+        for error in report['errors']:
+            print(f"❌ {error['path']}: {error['error']}")
+        print(f"扫描 {report['units_scanned']} 项（受保护 {report['protected']}），"
+              f"{'将删除' if args.dry_run else '删除'} {len(report['deleted'])} 项，"
+              f"回收 {_format_bytes(report['bytes_reclaimed'])}，"
+              f"占用 {_format_bytes(report['bytes_before'])} → {_format_bytes(report['bytes_after'])}")
+        return 0 if not report['errors'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
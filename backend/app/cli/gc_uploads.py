@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+公司图片孤儿回收（命令行）
+
+扫描 uploads/company/marks、picture、signature，未被任何公司或表单引用的文件先隔离、
+隔离期满后删除（UPLOAD_GC_MIN_AGE_SECONDS、UPLOAD_GC_QUARANTINE_SECONDS，见 app.config），
+与 Web 服务的后台回收共用同一份记录与累计指标。
+
+用法（在 backend 目录下）：
+    python -m app.cli.gc_uploads --status
+    python -m app.cli.gc_uploads --dry-run
+    python -m app.cli.gc_uploads
+"""
+import sys
+import json
+import argparse
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='回收未被引用的公司图片（商标、公司图片、签名）')
+    parser.add_argument('--status', action='store_true', help='只显示策略、隔离区占用与累计指标')
+    parser.add_argument('--dry-run', action='store_true', help='只列出将隔离、恢复、删除的文件，不做修改')
+    args = parser.parse_args(argv)
+
+    from ..main import app
+    from ..services.upload_gc import upload_gc
+
+    with app.app_context():
+        if args.status:
+            print(json.dumps({
+                "policy": upload_gc.policy(),
+                "quarantine": upload_gc.quarantine_usage(),
+                "metrics": upload_gc.metrics()
+            }, ensure_ascii=False, indent=2))
+            return 0
+
+        report = upload_gc.sweep(dry_run=args.dry_run, trigger='cli')
+        for action, label in (('quarantined', '隔离'), ('restored', '恢复'), ('deleted', '删除')):
+            for item in report[action]:
+                print(f"{'将' if args.dry_run else '已'}{label} {item['path']} "
+                      f"({item['bytes']} B, {item['idle_seconds'] / 3600:.1f} 小时未修改)")
+        for error in report['errors']:
+            print(f"❌ {error['path']}: {error['error']}")
+        print(f"扫描 {report['files_scanned']} 个文件（被引用 {report['referenced']}，未到回收时间 {report['protected']}），"
+              f"{'将' if args.dry_run else ''}隔离 {len(report['quarantined'])} 个，恢复 {len(report['restored'])} 个，"
+              f"删除 {len(report['deleted'])} 个，回收 {report['bytes_reclaimed']} 字节")
+        return 0 if not report['errors'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
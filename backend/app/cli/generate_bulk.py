@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+离线批量生成
+
+对一批已保存的 FormData 会话重新生成文档（例如修复模板之后），不经过 HTTP：
+按会话列表或查询条件选出会话，与 /generate-documents 相同的方式准备生成数据，
+在进程池中并行渲染（每个工作进程启动时预热模板缓存），输出到目标目录，
+并写出 manifest.json（每个会话、每个文档的结果与耗时）。
+
+输出目录结构：
+    <output-dir>/<session_id>/<文档文件名>
+    <output-dir>/manifest.json
+
+用法（在 backend 目录下）：
+    python -m app.cli.generate_bulk -o out --session-id S1 --session-id S2
+    python -m app.cli.generate_bulk -o out --all --format docx --types if,tr --workers 4
+    python -m app.cli.generate_bulk -o out --company-id 3 --updated-since 2025-01-01
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+from datetime import datetime
+from typing import Dict, Any, List
+
+from werkzeug.utils import secure_filename
+
+# 工作进程内的应用与输出配置（每个进程初始化一次）
+_app = None
+_options: Dict[str, Any] = {}
+
+
+def _select_sessions(args) -> List[str]:
+    """按命令行条件选出会话ID（保持给定顺序，去重）"""
+    from ..models import FormData
+
+    session_ids: List[str] = list(args.session_id or [])
+    if args.session_file:
+        with open(args.session_file, 'r', encoding='utf-8') as f:
+            session_ids.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+
+    if args.all or args.company_id is not None or args.updated_since or args.approval_like:
+        query = FormData.query.filter(FormData.is_active.is_(True))
+        if args.company_id is not None:
+            query = query.filter(FormData.company_id == args.company_id)
+        if args.updated_since:
+            query = query.filter(FormData.updated_at >= datetime.strptime(args.updated_since, '%Y-%m-%d'))
+        if args.approval_like:
+            query = query.filter(FormData.approval_no.like(args.approval_like.replace('*', '%')))
+        session_ids.extend(row.session_id for row in query.order_by(FormData.id).all())
+
+    return list(dict.fromkeys(session_ids))
+
+
+def _init_worker(output_dir: str, output_format: str, doc_types: List[str]) -> None:
+    global _app
+    from ..main import app, db
+    from ..services.generation_service import warm_template_cache
+
+    _app = app
+    _app.app_context().push()
+    # fork 继承的数据库连接不能跨进程复用
+    db.engine.dispose()
+    warm_template_cache()
+    _options.update(output_dir=output_dir, output_format=output_format, doc_types=doc_types)
+
+
+def _generate_session(session_id: str) -> Dict[str, Any]:
+    """在工作进程中生成单个会话的文档"""
+    from ..models import FormData
+    from ..services.generation_service import prepare_generation_data, make_safe_approval_no, generate_bundle
+
+    started = time.perf_counter()
+    record: Dict[str, Any] = {"session_id": session_id}
+    try:
+        form_data = FormData.query.filter_by(session_id=session_id).first()
+        if not form_data:
+            raise LookupError("未找到表单数据")
+
+        generation_data = prepare_generation_data(form_data)
+        safe_approval_no = make_safe_approval_no(form_data)
+        session_dir = os.path.join(_options['output_dir'], secure_filename(session_id) or 'session')
+        os.makedirs(session_dir, exist_ok=True)
+
+        generated, failed = generate_bundle(
+            generation_data, session_dir, safe_approval_no, _options['output_format'], _options['doc_types']
+        )
+        for item in generated:
+            item['file_path'] = os.path.relpath(item['file_path'], _options['output_dir'])
+            item.pop('download_url', None)
+        record.update(success=not failed and bool(generated), approval_no=form_data.approval_no,
+                      documents=generated, failed_documents=failed)
+    except Exception as e:
+        record.update(success=False, error=str(e), documents=[], failed_documents=[])
+    finally:
+        # 每个任务结束后归还数据库连接
+        from ..main import db
+        db.session.remove()
+
+    record["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return record
+
+
+def _write_manifest(output_dir: str, manifest: Dict[str, Any]) -> str:
+    path = os.path.join(output_dir, 'manifest.json')
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp_path, path)
+    return path
+
+
+def run_bulk(session_ids: List[str], output_dir: str, output_format: str, doc_types: List[str], workers: int) -> Dict[str, Any]:
+    started_at = datetime.now()
+    started = time.perf_counter()
+    records = []
+
+    with multiprocessing.Pool(processes=workers, initializer=_init_worker,
+                              initargs=(output_dir, output_format, doc_types)) as pool:
+        for record in pool.imap_unordered(_generate_session, session_ids):
+            records.append(record)
+            if record['success']:
+                print(f"✅ {record['session_id']}: {len(record['documents'])} 个文档, {record['elapsed_ms']:.0f}ms")
+            else:
+                errors = [record.get('error')] if record.get('error') else [
+                    f"{d['type']}: {d['error']}" for d in record['failed_documents']]
+                print(f"❌ {record['session_id']}: {'; '.join(e for e in errors if e) or '未生成任何文档'}")
+
+    elapsed = time.perf_counter() - started
+    documents = [d for r in records for d in r['documents']]
+    failed_documents = sum(len(r['failed_documents']) for r in records)
+    manifest = {
+        "started_at": started_at.isoformat(),
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "output_format": output_format,
+        "document_types": doc_types or 'all',
+        "total_sessions": len(records),
+        "succeeded_sessions": sum(1 for r in records if r['success']),
+        "total_documents": len(documents),
+        "failed_documents": failed_documents,
+        "sessions": sorted(records, key=lambda r: session_ids.index(r['session_id']))
+    }
+    manifest_path = _write_manifest(output_dir, manifest)
+
+    print(f"完成: 会话 {manifest['succeeded_sessions']}/{len(records)}，文档 {len(documents)} 个成功、"
+          f"{failed_documents} 个失败，耗时 {elapsed:.1f}s")
+    if documents:
+        by_type: Dict[str, List[float]] = {}
+        for d in documents:
+            by_type.setdefault(d['type'], []).append(d['elapsed_ms'])
+        for doc_type, timings in sorted(by_type.items()):
+            print(f"  {doc_type}: 平均 {sum(timings) / len(timings):.0f}ms，最长 {max(timings):.0f}ms")
+    print(f"清单: {manifest_path}")
+    return manifest
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='按已保存的会话批量生成文档')
+    parser.add_argument('-o', '--output-dir', required=True, help='输出目录')
+    parser.add_argument('--session-id', action='append', help='会话ID（可重复）')
+    parser.add_argument('--session-file', help='会话ID列表文件（每行一个）')
+    parser.add_argument('--all', action='store_true', help='全部有效会话')
+    parser.add_argument('--company-id', type=int, help='只选该公司的会话')
+    parser.add_argument('--updated-since', help='只选该日期（YYYY-MM-DD）之后更新的会话')
+    parser.add_argument('--approval-like', help='按批准号匹配（* 为通配符）')
+    parser.add_argument('--format', choices=['docx', 'pdf'], default='docx', help='输出格式')
+    parser.add_argument('--types', help='只生成这些文档类型（逗号分隔，如 if,tr），默认全部')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='工作进程数')
+    args = parser.parse_args(argv)
+
+    from ..main import app
+    from ..services.generation_service import DocumentGeneratorFactory
+
+    doc_types = [t.strip().lower() for t in (args.types or '').split(',') if t.strip()]
+    unknown = [t for t in doc_types if not DocumentGeneratorFactory().get_generator(t)]
+    if unknown:
+        print(f"❌ 未知的文档类型: {', '.join(unknown)}")
+        return 1
+
+    with app.app_context():
+        session_ids = _select_sessions(args)
+    if not session_ids:
+        print("❌ 没有匹配的会话")
+        return 1
+
+    output_dir = os.path.abspath(args.output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"会话数: {len(session_ids)}，格式: {args.format}，工作进程: {args.workers}")
+
+    manifest = run_bulk(session_ids, output_dir, args.format, doc_types, max(1, args.workers))
+    return 0 if manifest['succeeded_sessions'] == manifest['total_sessions'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
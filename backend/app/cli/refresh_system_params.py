@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+系统参数批量刷新（命令行）
+
+修改 config/system_params.json 后，更新全部有效表单中的系统参数，并重新渲染已生成过的文档包。
+与 POST /api/mvp/system-params/refresh 共用进度文件：中断后再次运行从中断处继续。
+命令行在独立进程中运行，不与 Web 服务的交互请求协调，默认不限速（--throttle 开启限速）；
+Web 服务（或另一个命令行）正在刷新时直接退出。
+
+用法（在 backend 目录下）：
+    python -m app.cli.refresh_system_params --status
+    python -m app.cli.refresh_system_params
+    python -m app.cli.refresh_system_params --no-render --throttle
+"""
+import sys
+import json
+import argparse
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='系统参数变更后批量刷新表单与文档')
+    parser.add_argument('--status', action='store_true', help='只显示当前指纹与刷新进度')
+    parser.add_argument('--no-render', action='store_true', help='只更新表单，不重新渲染文档包')
+    parser.add_argument('--throttle', action='store_true', help='按 SYSTEM_REFRESH_MIN_INTERVAL 限速渲染')
+    args = parser.parse_args(argv)
+
+    from ..main import app
+    from ..services.system_params_refresh import system_params_refresher, RefreshInProgressError
+
+    with app.app_context():
+        status = system_params_refresher.status()
+        if args.status:
+            print(json.dumps(status, ensure_ascii=False, indent=2))
+            return 0
+        if not status['stale']:
+            print("✅ 系统参数未变化，无需刷新")
+            return 0
+
+        def report(state):
+            print(f"\r已扫描 {state['scanned']}，已更新 {state['updated']}，"
+                  f"已渲染 {state['rendered']}/{state['render_queued']}，渲染失败 {state['render_failed']}",
+                  end='', flush=True)
+
+        try:
+            state = system_params_refresher.run(rerender=not args.no_render, throttle=args.throttle,
+                                                on_progress=report)
+        except RefreshInProgressError as e:
+            print(f"❌ {str(e)}")
+            return 1
+        print()
+        for error in state['errors']:
+            print(f"❌ {error['session_id']}: {error['error']}")
+        print(f"完成: {state['status']}")
+        return 0 if state['render_failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
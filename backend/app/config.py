@@ -11,6 +11,120 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     
+    # 内部缓存目录（不对外暴露，区别于 uploads）
+    CACHE_FOLDER = os.environ.get('CACHE_FOLDER') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache')
+    
+    # 文档提取结果缓存配置
+    EXTRACTION_CACHE_ENABLED = os.environ.get('EXTRACTION_CACHE_ENABLED', 'true').lower() == 'true'
+    EXTRACTION_CACHE_MAX_ENTRIES = int(os.environ.get('EXTRACTION_CACHE_MAX_ENTRIES', 256))
+    
+    # 提取规则保护：单文档规则执行时间预算（秒，0 表示不限制）、慢规则告警阈值（毫秒）
+    # 超出预算时用 SIGALRM 中断正在执行的正则，只在主线程（gunicorn sync worker 的请求线程）中生效；
+    # 流式提取把规则转交请求线程执行；后台任务、批量提取与多线程 worker 中只在规则之间检查预算
+    EXTRACTION_TIME_BUDGET = float(os.environ.get('EXTRACTION_TIME_BUDGET', 20))
+    EXTRACTION_SLOW_RULE_MS = float(os.environ.get('EXTRACTION_SLOW_RULE_MS', 200))
+    # 风险规则的正则引擎：re（默认）或 re2（需安装 google-re2，线性时间）
+    EXTRACTION_REGEX_ENGINE = os.environ.get('EXTRACTION_REGEX_ENGINE', 're').lower()
+    
+    # PDF 文本提取：达到该页数时用进程池并行提取；页面文本缓存条数
+    PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 40))
+    PDF_MAX_WORKERS = int(os.environ.get('PDF_MAX_WORKERS', min(4, os.cpu_count() or 1)))
+    PDF_PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PDF_PAGE_CACHE_MAX_ENTRIES', 2048))
+    
+    # 文档分类：读取开头可见文本的字符数、识别为已支持类型所需的最低置信度
+    DOCUMENT_CLASSIFIER_HEAD_CHARS = int(os.environ.get('DOCUMENT_CLASSIFIER_HEAD_CHARS', 8192))
+    DOCUMENT_CLASSIFIER_MIN_CONFIDENCE = float(os.environ.get('DOCUMENT_CLASSIFIER_MIN_CONFIDENCE', 0.5))
+    
+    # 批量提取：并发数、单批文档数上限、ZIP 单个条目与解压总大小上限（字节）
+    EXTRACTION_BATCH_WORKERS = int(os.environ.get('EXTRACTION_BATCH_WORKERS', 4))
+    EXTRACTION_BATCH_MAX_FILES = int(os.environ.get('EXTRACTION_BATCH_MAX_FILES', 100))
+    EXTRACTION_BATCH_MAX_ENTRY_BYTES = int(os.environ.get('EXTRACTION_BATCH_MAX_ENTRY_BYTES', 50 * 1024 * 1024))
+    EXTRACTION_BATCH_MAX_UNCOMPRESSED_BYTES = int(os.environ.get('EXTRACTION_BATCH_MAX_UNCOMPRESSED_BYTES', 500 * 1024 * 1024))
+    
+    # 提取图片暂存区：未被保存引用的暂存图片过期时间（秒）、顺带清理的最小间隔（秒）
+    IMAGE_SCRATCH_TTL = int(os.environ.get('IMAGE_SCRATCH_TTL', 24 * 3600))
+    IMAGE_SCRATCH_PURGE_INTERVAL = int(os.environ.get('IMAGE_SCRATCH_PURGE_INTERVAL', 600))
+    
+    # 后台任务（一站式流水线等）：并发数、结束后保留可查询的时间（秒）
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', 3600))
+    
+    # 流式进度接口：长时间无事件时发送心跳的间隔（秒）
+    STREAM_HEARTBEAT_SECONDS = float(os.environ.get('STREAM_HEARTBEAT_SECONDS', 15))
+    
+    # 多会话批量生成：渲染进程数（<=1 时在请求线程内渲染）、单批会话数上限
+    GENERATION_BATCH_WORKERS = int(os.environ.get('GENERATION_BATCH_WORKERS', 2))
+    GENERATION_BATCH_MAX_SESSIONS = int(os.environ.get('GENERATION_BATCH_MAX_SESSIONS', 200))
+    
+    # 保存后预生成：开关（默认关闭）、预生成的输出格式（逗号分隔）、生成时等待进行中预生成的最长时间（秒）、
+    # 预生成结果保留时间（秒）、顺带清理的最小间隔（秒）
+    SPECULATIVE_GENERATION_ENABLED = os.environ.get('SPECULATIVE_GENERATION_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    SPECULATIVE_GENERATION_FORMATS = os.environ.get('SPECULATIVE_GENERATION_FORMATS', 'docx')
+    SPECULATIVE_GENERATION_WAIT_SECONDS = float(os.environ.get('SPECULATIVE_GENERATION_WAIT_SECONDS', 30))
+    SPECULATIVE_GENERATION_TTL = int(os.environ.get('SPECULATIVE_GENERATION_TTL', 3600))
+    SPECULATIVE_GENERATION_PURGE_INTERVAL = int(os.environ.get('SPECULATIVE_GENERATION_PURGE_INTERVAL', 600))
+    
+    # 系统参数变更后的批量刷新：每批更新的表单数、两次重新渲染的最小间隔（秒）、
+    # 渲染前要求交互请求空闲的时间（秒）、执行权租约（秒，执行者心跳超过该时间后可被其它进程接管）
+    SYSTEM_REFRESH_BATCH_SIZE = int(os.environ.get('SYSTEM_REFRESH_BATCH_SIZE', 50))
+    SYSTEM_REFRESH_MIN_INTERVAL = float(os.environ.get('SYSTEM_REFRESH_MIN_INTERVAL', 2))
+    SYSTEM_REFRESH_IDLE_SECONDS = float(os.environ.get('SYSTEM_REFRESH_IDLE_SECONDS', 3))
+    SYSTEM_REFRESH_LEASE_SECONDS = float(os.environ.get('SYSTEM_REFRESH_LEASE_SECONDS', 600))
+    
+    # 准入控制（多个工作进程共享）：开关、生成与提取的并发上限、每个池的排队深度、
+    # 最长排队时间（秒）、名额租约（秒，持有者异常退出时回收；持有超过租约不再续期，应不小于生成截止时间）
+    ADMISSION_CONTROL_ENABLED = os.environ.get('ADMISSION_CONTROL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    ADMISSION_GENERATION_LIMIT = int(os.environ.get('ADMISSION_GENERATION_LIMIT', max(1, (os.cpu_count() or 2) // 2)))
+    ADMISSION_EXTRACTION_LIMIT = int(os.environ.get('ADMISSION_EXTRACTION_LIMIT', os.cpu_count() or 2))
+    ADMISSION_QUEUE_DEPTH = int(os.environ.get('ADMISSION_QUEUE_DEPTH', 8))
+    ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 60))
+    ADMISSION_LEASE_SECONDS = int(os.environ.get('ADMISSION_LEASE_SECONDS', 600))
+    
+    # 生成请求去重：相同进行中请求的结果在完成后保留的时间（秒）、执行者租约（秒，超时后等待者接手）、
+    # Idempotency-Key 结果保留时间（秒）
+    GENERATION_COALESCE_GRACE_SECONDS = float(os.environ.get('GENERATION_COALESCE_GRACE_SECONDS', 5))
+    GENERATION_COALESCE_LEASE_SECONDS = int(os.environ.get('GENERATION_COALESCE_LEASE_SECONDS', 900))
+    IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 3600))
+    
+    # 生成截止时间：每个请求（批量生成为每个会话）的上限（秒，请求可用 timeout_seconds 缩短，0 表示不限制）、
+    # 单次 PDF 转换的上限（秒），超时终止转换进程
+    GENERATION_DEADLINE_SECONDS = float(os.environ.get('GENERATION_DEADLINE_SECONDS', 600))
+    PDF_CONVERT_TIMEOUT_SECONDS = float(os.environ.get('PDF_CONVERT_TIMEOUT_SECONDS', 180))
+    
+    # 生成文件保留策略：未使用（生成或最近下载）超过多久删除（秒，0 不按时间删除）、总大小配额（字节，0 不限制，
+    # 超出时按最近下载从旧到新删除）、最近多久内生成或下载过的不删除（秒）、进行中生成的临时目录视为遗留的时间（秒）、
+    # 后台清理间隔（秒，0 关闭后台清理，仍可用命令行或接口手动清理）
+    GENERATED_FILES_TTL_SECONDS = int(os.environ.get('GENERATED_FILES_TTL_SECONDS', 7 * 24 * 3600))
+    GENERATED_FILES_MAX_BYTES = int(os.environ.get('GENERATED_FILES_MAX_BYTES', 5 * 1024 ** 3))
+    RETENTION_MIN_AGE_SECONDS = int(os.environ.get('RETENTION_MIN_AGE_SECONDS', 600))
+    RETENTION_SCRATCH_STALE_SECONDS = int(os.environ.get('RETENTION_SCRATCH_STALE_SECONDS', 6 * 3600))
+    RETENTION_SWEEP_INTERVAL = int(os.environ.get('RETENTION_SWEEP_INTERVAL', 900))
+    
+    # 公司图片（商标、公司图片、签名）孤儿回收：未被任何记录引用的文件至少存在多久才隔离（秒，覆盖上传后尚未保存的时间）、
+    # 隔离多久后删除（秒）、后台回收间隔（秒，0 关闭后台回收，仍可用命令行或接口手动回收）
+    UPLOAD_GC_MIN_AGE_SECONDS = int(os.environ.get('UPLOAD_GC_MIN_AGE_SECONDS', 24 * 3600))
+    UPLOAD_GC_QUARANTINE_SECONDS = int(os.environ.get('UPLOAD_GC_QUARANTINE_SECONDS', 7 * 24 * 3600))
+    UPLOAD_GC_INTERVAL = int(os.environ.get('UPLOAD_GC_INTERVAL', 6 * 3600))
+    
+    # 分块上传：单个文件的总大小上限（字节，每块仍受 MAX_CONTENT_LENGTH 限制）、建议的块大小（字节）、
+    # 多久没有写入的上传视为放弃并删除（秒）
+    CHUNKED_UPLOAD_MAX_BYTES = int(os.environ.get('CHUNKED_UPLOAD_MAX_BYTES', 100 * 1024 * 1024))
+    CHUNKED_UPLOAD_CHUNK_BYTES = int(os.environ.get('CHUNKED_UPLOAD_CHUNK_BYTES', 4 * 1024 * 1024))
+    CHUNKED_UPLOAD_TTL = int(os.environ.get('CHUNKED_UPLOAD_TTL', 24 * 3600))
+    
+    # 图片缩略图：尺寸分档（最长边像素，逗号分隔）、缓存文件数上限、非内容寻址图片的浏览器缓存时间（秒，
+    # 按内容寻址的图片固定为一年 immutable）
+    THUMBNAIL_SIZES = [int(s) for s in os.environ.get('THUMBNAIL_SIZES', '64,128,256,512').split(',') if s.strip()]
+    THUMBNAIL_CACHE_MAX_ENTRIES = int(os.environ.get('THUMBNAIL_CACHE_MAX_ENTRIES', 20000))
+    THUMBNAIL_MAX_AGE = int(os.environ.get('THUMBNAIL_MAX_AGE', 7 * 24 * 3600))
+    
+    # 文件发送：以「时间戳 + UUID」命名的公司图片的浏览器缓存时间（秒，按内容寻址的图片与已发布的生成结果固定为
+    # 一年 immutable）；SENDFILE_OFFLOAD=nginx 时 /uploads/ 与下载接口返回 X-Accel-Redirect，由 nginx 的
+    # internal location（X_ACCEL_UPLOADS_LOCATION，须指向同一个 UPLOAD_FOLDER，见 nginx/nginx.conf）发送文件
+    UPLOAD_CACHE_MAX_AGE = int(os.environ.get('UPLOAD_CACHE_MAX_AGE', 30 * 24 * 3600))
+    SENDFILE_OFFLOAD = os.environ.get('SENDFILE_OFFLOAD', '')
+    X_ACCEL_UPLOADS_LOCATION = os.environ.get('X_ACCEL_UPLOADS_LOCATION', '/_protected/uploads/')
+    
     # 服务器配置
     SERVER_URL = os.environ.get('SERVER_URL', 'http://localhost')  # 可通过环境变量配置
     
@@ -46,6 +160,14 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
 
+def get_config_value(key, default=None):
+    """读取配置项：优先使用当前 Flask 应用配置，脱离应用上下文（如命令行工具）时回退到 Config 默认值"""
+    try:
+        from flask import current_app
+        return current_app.config.get(key, getattr(Config, key, default))
+    except RuntimeError:
+        return getattr(Config, key, default)
+
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
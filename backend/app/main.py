@@ -64,18 +64,25 @@ def create_app(config_name=None):
     # 添加静态文件服务路由（直接在根级别，不带/api前缀）
     @app.route('/uploads/<path:filename>')
     def serve_uploads(filename):
-        """直接服务uploads文件夹的静态文件"""
-        from flask import send_from_directory
+        """直接服务uploads文件夹的静态文件（强 ETag、Range、按地址区分的缓存头；可交给 nginx 发送）"""
+        from werkzeug.utils import safe_join
+        from .services.file_serving import send_stored_file, upload_cache_control
         import os
         
         uploads_folder = app.config['UPLOAD_FOLDER']
-        file_path = os.path.join(uploads_folder, filename)
+        file_path = safe_join(uploads_folder, filename) or ''
         
-        if not os.path.exists(file_path):
+        # 进行中的生成（generated_files/.scratch）、发布用的临时文件与隔离的图片（.quarantine）不对外提供
+        hidden = any(part.startswith('.') for part in filename.replace('\\', '/').split('/'))
+        if not hidden and not os.path.exists(file_path):
+            # 回收时隔离的公司图片仍被访问：立即恢复
+            from .services.upload_gc import upload_gc
+            upload_gc.restore(filename)
+        if hidden or not os.path.isfile(file_path):
             from flask import jsonify
             return jsonify({"error": f"文件不存在: {filename}"}), 404
         
-        return send_from_directory(uploads_folder, filename)
+        return send_stored_file(file_path, upload_cache_control(filename))
     
     # 创建数据库表
     with app.app_context():
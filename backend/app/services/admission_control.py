@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+准入控制（生成与提取的全局并发限制）
+
+渲染、PDF 转换与文档提取都很耗 CPU，同时运行太多时所有请求一起变慢。按资源池限制同时执行的数量：
+- generation：文档生成（含 PDF 转换），上限 ADMISSION_GENERATION_LIMIT；
+- extraction：文档提取，上限 ADMISSION_EXTRACTION_LIMIT。
+
+计数保存在 CACHE_FOLDER 下的 SQLite 文件中（BEGIN IMMEDIATE 串行化），同一主机上的多个
+gunicorn 工作进程共享同一组名额。超出上限的请求按到达顺序排队，每个池最多 ADMISSION_QUEUE_DEPTH 个；
+队列已满或排队超过 ADMISSION_QUEUE_TIMEOUT 秒时抛出 AdmissionRejected，由接口返回 429、
+Retry-After 与排队位置。Retry-After 按该池近期平均占用时间估算。
+后台任务（预生成、参数变更后的批量刷新）以低优先级等待：不计入队列深度与排队位置，
+只在没有前台排队者时获得名额。
+
+进程异常退出遗留的名额：持有者进程已不存在（POSIX）即回收；持有名额的进程由后台线程定期刷新心跳，
+心跳超过 ADMISSION_LEASE_SECONDS 秒未刷新（进程卡死，或 Windows 下无法探测进程）时也回收。
+持有超过租约的名额不再续期，漏释放的名额最多占用两个租约时间。
+排队者每次轮询刷新心跳，心跳过期即移出队列。
+"""
+import os
+import math
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ..config import get_config_value
+from .cancellation import check_cancelled
+
+logger = logging.getLogger(__name__)
+
+RUNNING = 'running'
+QUEUED = 'queued'
+# 低优先级后台等待者：不计入队列深度，前台排队者优先
+BACKGROUND = 'background'
+
+# 排队者心跳过期时间（秒）
+QUEUE_HEARTBEAT_TTL = 30
+# 平均占用时间的平滑系数
+DURATION_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """请求未获准入（队列已满或排队超时）"""
+
+    def __init__(self, pool: str, message: str, retry_after: int, queue_position: int,
+                 queue_depth: int, running: int, limit: int):
+        super().__init__(message)
+        self.pool = pool
+        self.retry_after = retry_after
+        self.queue_position = queue_position
+        self.queue_depth = queue_depth
+        self.running = running
+        self.limit = limit
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pool": self.pool,
+            "retry_after": self.retry_after,
+            "queue_position": self.queue_position,
+            "queue_depth": self.queue_depth,
+            "running": self.running,
+            "limit": self.limit
+        }
+
+
+def pid_alive(pid: int) -> bool:
+    """同一主机上的进程是否仍在运行"""
+    if os.name == 'nt':
+        # Windows 下 os.kill 会结束目标进程，不能用于探测；只依赖租约过期
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AdmissionController:
+    """基于 SQLite 的跨进程计数信号量"""
+
+    DB_FILENAME = 'admission.sqlite3'
+    POOL_LIMIT_KEYS = {
+        'generation': ('ADMISSION_GENERATION_LIMIT', 2),
+        'extraction': ('ADMISSION_EXTRACTION_LIMIT', 4),
+    }
+
+    def __init__(self):
+        self._initialized_paths = set()
+        # 本进程持有的名额：令牌 -> (数据库路径, 停止续期的时间)（由心跳线程定期刷新）
+        self._held: Dict[str, Tuple[str, float]] = {}
+        self._held_lock = threading.Lock()
+        self._held_pid = os.getpid()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._heartbeat_interval = 60.0
+
+    @staticmethod
+    def enabled() -> bool:
+        return str(get_config_value('ADMISSION_CONTROL_ENABLED', True)).lower() in ('1', 'true', 'yes')
+
+    def limit(self, pool: str) -> int:
+        key, default = self.POOL_LIMIT_KEYS.get(pool, (None, 2))
+        return max(1, int(get_config_value(key, default) if key else default))
+
+    def _db_path(self) -> str:
+        return os.path.join(get_config_value('CACHE_FOLDER'), self.DB_FILENAME)
+
+    def _connect(self, path: Optional[str] = None) -> sqlite3.Connection:
+        path = path or self._db_path()
+        if path not in self._initialized_paths:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        if path not in self._initialized_paths:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS admission_slots ("
+                " token TEXT PRIMARY KEY, pool TEXT NOT NULL, state TEXT NOT NULL, pid INTEGER NOT NULL,"
+                " enqueued_at REAL NOT NULL, acquired_at REAL, heartbeat REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS admission_stats ("
+                " pool TEXT PRIMARY KEY, avg_seconds REAL NOT NULL)"
+            )
+            self._initialized_paths.add(path)
+        return conn
+
+    def _reap(self, conn: sqlite3.Connection, pool: str, now: float) -> None:
+        """回收异常退出的进程遗留的名额与排队项"""
+        lease = float(get_config_value('ADMISSION_LEASE_SECONDS', 600))
+        # 运行中的名额由持有进程的心跳线程续期，只有心跳停止超过租约时间才回收
+        conn.execute("DELETE FROM admission_slots WHERE pool = ? AND state = ? AND heartbeat < ?",
+                     (pool, RUNNING, now - lease))
+        conn.execute("DELETE FROM admission_slots WHERE pool = ? AND state IN (?, ?) AND heartbeat < ?",
+                     (pool, QUEUED, BACKGROUND, now - QUEUE_HEARTBEAT_TTL))
+        for (pid,) in conn.execute("SELECT DISTINCT pid FROM admission_slots WHERE pool = ?", (pool,)).fetchall():
+            if pid != os.getpid() and not pid_alive(pid):
+                conn.execute("DELETE FROM admission_slots WHERE pool = ? AND pid = ?", (pool, pid))
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection, pool: str, state: str) -> int:
+        return conn.execute("SELECT COUNT(*) FROM admission_slots WHERE pool = ? AND state = ?",
+                            (pool, state)).fetchone()[0]
+
+    def _counts(self, conn: sqlite3.Connection, pool: str):
+        """(运行数, 前台排队数)；后台等待者不计入队列深度与排队位置"""
+        return self._count(conn, pool, RUNNING), self._count(conn, pool, QUEUED)
+
+    def _retry_after(self, conn: sqlite3.Connection, pool: str, position: int) -> int:
+        row = conn.execute("SELECT avg_seconds FROM admission_stats WHERE pool = ?", (pool,)).fetchone()
+        avg_seconds = row[0] if row else 5.0
+        return max(1, math.ceil(avg_seconds * position / self.limit(pool)))
+
+    def _try_admit(self, conn: sqlite3.Connection, pool: str, token: str, state: str, now: float) -> Optional[int]:
+        """等待中的请求：轮到且有空闲名额时转为运行并返回 None，否则刷新心跳并返回前面的等待者数 + 1
+
+        后台等待者（BACKGROUND）排在所有前台排队者之后。
+        """
+        row = conn.execute("SELECT enqueued_at, rowid FROM admission_slots WHERE token = ?", (token,)).fetchone()
+        if row is None:
+            # 被当作过期排队项回收：重新排在队尾
+            conn.execute("INSERT INTO admission_slots (token, pool, state, pid, enqueued_at, heartbeat) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (token, pool, state, os.getpid(), now, now))
+            row = (now, conn.execute("SELECT last_insert_rowid()").fetchone()[0])
+        ahead = conn.execute(
+            "SELECT COUNT(*) FROM admission_slots WHERE pool = ? AND state = ? AND "
+            "(enqueued_at < ? OR (enqueued_at = ? AND rowid < ?))",
+            (pool, state, row[0], row[0], row[1])
+        ).fetchone()[0]
+        running, queued = self._counts(conn, pool)
+        if state == BACKGROUND:
+            ahead += queued
+        if ahead == 0 and running < self.limit(pool):
+            conn.execute("UPDATE admission_slots SET state = ?, acquired_at = ?, heartbeat = ? WHERE token = ?",
+                         (RUNNING, now, now, token))
+            return None
+        conn.execute("UPDATE admission_slots SET heartbeat = ? WHERE token = ?", (now, token))
+        return ahead + 1
+
+    def acquire(self, pool: str, queue: bool = True, background: bool = False) -> str:
+        """获取名额，返回令牌（释放时使用）
+
+        queue: 为 False 时不受队列深度与排队超时限制，一直等待（用户提交的异步任务使用）
+        background: 低优先级（预生成、参数变更后的批量刷新等）：不计入队列深度与排队位置、一直等待，
+            只在没有前台排队者时获得名额
+        排队期间当前上下文的取消令牌到期或被取消时移出队列并抛出 OperationCancelled。
+        """
+        token = uuid.uuid4().hex
+        state = BACKGROUND if background else QUEUED
+        bounded = queue and not background
+        queue_depth = int(get_config_value('ADMISSION_QUEUE_DEPTH', 8))
+        timeout = float(get_config_value('ADMISSION_QUEUE_TIMEOUT', 60))
+        started = time.monotonic()
+        path = self._db_path()
+        conn = self._connect(path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._reap(conn, pool, now)
+                running, queued = self._counts(conn, pool)
+                waiting = queued + (self._count(conn, pool, BACKGROUND) if background else 0)
+                if waiting == 0 and running < self.limit(pool):
+                    conn.execute("INSERT INTO admission_slots (token, pool, state, pid, enqueued_at, acquired_at, heartbeat) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?)", (token, pool, RUNNING, os.getpid(), now, now, now))
+                    conn.execute("COMMIT")
+                    self._track(token, path)
+                    return token
+                if bounded and queued >= queue_depth:
+                    position = queued + 1
+                    retry_after = self._retry_after(conn, pool, position)
+                    conn.execute("COMMIT")
+                    raise AdmissionRejected(pool, "服务繁忙，排队已满，请稍后重试", retry_after,
+                                            position, queue_depth, running, self.limit(pool))
+                conn.execute("INSERT INTO admission_slots (token, pool, state, pid, enqueued_at, heartbeat) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", (token, pool, state, os.getpid(), now, now))
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+
+            # 排队等待
+            delay = 0.05
+            while True:
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+                check_cancelled()
+                conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                self._reap(conn, pool, now)
+                position = self._try_admit(conn, pool, token, state, now)
+                if position is None:
+                    conn.execute("COMMIT")
+                    self._track(token, path)
+                    return token
+                if bounded and time.monotonic() - started > timeout:
+                    conn.execute("DELETE FROM admission_slots WHERE token = ?", (token,))
+                    running, _ = self._counts(conn, pool)
+                    retry_after = self._retry_after(conn, pool, position)
+                    conn.execute("COMMIT")
+                    raise AdmissionRejected(pool, "服务繁忙，排队超时，请稍后重试", retry_after,
+                                            position, queue_depth, running, self.limit(pool))
+                conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            # 排队中被中断（如客户端断开）：移出队列
+            try:
+                conn.execute("DELETE FROM admission_slots WHERE token = ? AND state = ?", (token, state))
+            except sqlite3.Error:
+                pass
+            raise
+        finally:
+            conn.close()
+
+    def try_acquire(self, pool: str) -> Optional[str]:
+        """不排队：没有排队者且有空闲名额时立即获取并返回令牌，否则返回 None
+
+        供已持有名额、还想多占名额并行执行的调用方使用（阻塞等待可能与自己持有的名额形成死锁）。
+        """
+        path = self._db_path()
+        conn = self._connect(path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            self._reap(conn, pool, now)
+            running, queued = self._counts(conn, pool)
+            if queued or running >= self.limit(pool):
+                conn.execute("COMMIT")
+                return None
+            token = uuid.uuid4().hex
+            conn.execute("INSERT INTO admission_slots (token, pool, state, pid, enqueued_at, acquired_at, heartbeat) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", (token, pool, RUNNING, os.getpid(), now, now, now))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        self._track(token, path)
+        return token
+
+    # ==================== 持有者心跳 ====================
+
+    def _track(self, token: str, path: str) -> None:
+        """登记本进程持有的名额，确保心跳线程在运行"""
+        lease = float(get_config_value('ADMISSION_LEASE_SECONDS', 600))
+        with self._held_lock:
+            if self._held_pid != os.getpid():
+                # fork 出的子进程：继承的登记属于父进程
+                self._held = {}
+                self._held_pid = os.getpid()
+                self._heartbeat_thread = None
+            self._held[token] = (path, time.monotonic() + lease)
+            self._heartbeat_interval = min(self._heartbeat_interval, max(0.5, lease / 4))
+            if self._heartbeat_thread is None or not self._heartbeat_thread.is_alive():
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop,
+                                                          name='admission-heartbeat', daemon=True)
+                self._heartbeat_thread.start()
+
+    def _untrack(self, token: str) -> None:
+        with self._held_lock:
+            self._held.pop(token, None)
+
+    def _heartbeat_loop(self) -> None:
+        """定期刷新本进程持有名额的心跳（长时间运行的生成不会被当作遗留名额回收）
+
+        持有超过租约的名额不再续期（生成截止时间不超过租约，超过说明持有者卡住或漏释放），
+        由 _reap 在心跳过期后回收
+        """
+        while True:
+            time.sleep(self._heartbeat_interval)
+            now = time.monotonic()
+            by_path: Dict[str, List[str]] = {}
+            with self._held_lock:
+                for token, (path, renew_until) in list(self._held.items()):
+                    if now > renew_until:
+                        del self._held[token]
+                        logger.warning(f"准入名额持有超过租约，停止续期: {token}")
+                        continue
+                    by_path.setdefault(path, []).append(token)
+            for path, tokens in by_path.items():
+                try:
+                    conn = self._connect(path)
+                    try:
+                        conn.execute(
+                            f"UPDATE admission_slots SET heartbeat = ? WHERE state = ? "
+                            f"AND token IN ({', '.join('?' * len(tokens))})",
+                            (time.time(), RUNNING, *tokens)
+                        )
+                    finally:
+                        conn.close()
+                except sqlite3.Error as e:
+                    logger.warning(f"刷新准入名额心跳失败: {str(e)}")
+
+    def release(self, pool: str, token: str) -> None:
+        """释放名额，并更新该池的平均占用时间"""
+        self._untrack(token)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT acquired_at FROM admission_slots WHERE token = ?", (token,)).fetchone()
+            conn.execute("DELETE FROM admission_slots WHERE token = ?", (token,))
+            if row and row[0]:
+                held = max(0.0, time.time() - row[0])
+                conn.execute(
+                    "INSERT INTO admission_stats (pool, avg_seconds) VALUES (?, ?) "
+                    "ON CONFLICT(pool) DO UPDATE SET avg_seconds = avg_seconds * ? + ? * ?",
+                    (pool, held, 1 - DURATION_EWMA_ALPHA, DURATION_EWMA_ALPHA, held)
+                )
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.warning(f"释放准入名额失败 {pool}/{token}: {str(e)}")
+        finally:
+            conn.close()
+
+    def check(self, pool: str) -> None:
+        """不占用名额，只检查队列是否已满（已满时抛出 AdmissionRejected）；供内部再逐项排队的批量请求使用"""
+        if not self.enabled():
+            return
+        queue_depth = int(get_config_value('ADMISSION_QUEUE_DEPTH', 8))
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._reap(conn, pool, time.time())
+            running, queued = self._counts(conn, pool)
+            retry_after = self._retry_after(conn, pool, queued + 1)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if queued >= queue_depth:
+            raise AdmissionRejected(pool, "服务繁忙，排队已满，请稍后重试", retry_after,
+                                    queued + 1, queue_depth, running, self.limit(pool))
+
+    @contextmanager
+    def slot(self, pool: str, queue: bool = True, background: bool = False) -> Iterator[Optional[str]]:
+        """在名额内执行：with admission_controller.slot('generation'): ..."""
+        if not self.enabled():
+            yield None
+            return
+        token = self.acquire(pool, queue=queue, background=background)
+        try:
+            yield token
+        finally:
+            self.release(pool, token)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各池当前运行数、排队数、后台等待数、上限"""
+        conn = self._connect()
+        try:
+            result = {}
+            for pool in self.POOL_LIMIT_KEYS:
+                running, queued = self._counts(conn, pool)
+                result[pool] = {"running": running, "queued": queued,
+                                "background": self._count(conn, pool, BACKGROUND), "limit": self.limit(pool)}
+            return result
+        finally:
+            conn.close()
+
+
+# 全局实例
+admission_controller = AdmissionController()
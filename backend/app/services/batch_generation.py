@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+批量文档生成
+一次为多个会话生成文档包：在当前进程加载表单并准备生成数据（同一公司在批次内只查询一次，
+生成器直接使用生成数据中的公司快照），由常驻进程池并行渲染（工作进程的模板缓存保持预热，
+跨批次复用），最后打包为一个ZIP：每个会话一个文件夹，根目录附 manifest.json 汇总。
+每个会话渲染前各占用一个全局生成名额（admission_control），并行度不超过实际获得的名额数。
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from werkzeug.utils import secure_filename
+
+from ..config import get_config_value
+from .generation_service import (
+    prepare_generation_data,
+    make_safe_approval_no,
+    generate_bundle,
+    warm_template_cache
+)
+from .cancellation import generation_token, cancel_scope
+from .generation_output import OutputJob
+from .admission_control import admission_controller
+
+logger = logging.getLogger(__name__)
+
+# 渲染进程池（进程级共享，首次使用时创建）
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class BatchGenerationError(ValueError):
+    """批量生成请求不合法（会话数量、选择条件等）"""
+
+
+def _init_render_worker() -> None:
+    """渲染进程初始化：推入应用上下文（生成器读取应用配置），预热模板缓存"""
+    from ..main import app, db
+
+    app.app_context().push()
+    # 渲染不访问数据库；丢弃可能继承的连接
+    db.engine.dispose()
+    warm_template_cache()
+
+
+def _render_session(task: Dict[str, Any]) -> Dict[str, Any]:
+    """渲染单个会话的文档包（在渲染进程或当前线程中执行）"""
+    started = time.perf_counter()
+    try:
+        os.makedirs(task['output_dir'], exist_ok=True)
+        # 每个会话单独计算截止时间（GENERATION_DEADLINE_SECONDS），避免一个卡住的转换占住渲染进程
+        with cancel_scope(generation_token()):
+            generated, failed = generate_bundle(
+                task['generation_data'], task['output_dir'], task['safe_approval_no'],
+                task['output_format'], task['doc_types']
+            )
+        result = {"generated": generated, "failed": failed}
+    except Exception as e:
+        result = {"generated": [], "failed": [], "error": str(e)}
+    result.update(session_id=task['session_id'], elapsed_ms=round((time.perf_counter() - started) * 1000, 3))
+    return result
+
+
+def _get_executor(max_workers: int) -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn：不继承 Web 服务的线程与锁状态（Windows 下也只支持 spawn）
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_render_worker
+            )
+        return _executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+class BatchGenerationRunner:
+    """多会话批量生成"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self._max_workers = max_workers
+
+    @property
+    def max_workers(self) -> int:
+        if self._max_workers is not None:
+            return self._max_workers
+        return int(get_config_value('GENERATION_BATCH_WORKERS', 2))
+
+    @staticmethod
+    def select_sessions(session_ids: Optional[List[str]] = None,
+                        company_id: Optional[int] = None,
+                        updated_since: Optional[str] = None,
+                        updated_until: Optional[str] = None) -> List[str]:
+        """按会话ID列表或查询条件（公司、更新日期范围 YYYY-MM-DD）选出会话ID（保持顺序，去重）"""
+        from ..models import FormData
+
+        selected = [sid for sid in (session_ids or []) if isinstance(sid, str) and sid]
+        if company_id is not None or updated_since or updated_until:
+            query = FormData.query.filter(FormData.is_active.is_(True))
+            try:
+                if company_id is not None:
+                    query = query.filter(FormData.company_id == int(company_id))
+                if updated_since:
+                    query = query.filter(FormData.updated_at >= datetime.strptime(updated_since, '%Y-%m-%d'))
+                if updated_until:
+                    # 截止日期当天包含在内
+                    until = datetime.strptime(updated_until, '%Y-%m-%d')
+                    query = query.filter(FormData.updated_at < until.replace(hour=23, minute=59, second=59, microsecond=999999))
+            except (TypeError, ValueError):
+                raise BatchGenerationError("查询条件格式错误：company_id 须为整数，日期须为 YYYY-MM-DD")
+            selected.extend(row.session_id for row in query.order_by(FormData.id).all())
+
+        selected = list(dict.fromkeys(selected))
+        if not selected:
+            raise BatchGenerationError("没有匹配的会话")
+        max_sessions = int(get_config_value('GENERATION_BATCH_MAX_SESSIONS', 200))
+        if len(selected) > max_sessions:
+            raise BatchGenerationError(f"单次批量最多 {max_sessions} 个会话，当前 {len(selected)} 个")
+        return selected
+
+    def run(self, session_ids: List[str], output_format: str = 'docx',
+            doc_types: Optional[List[str]] = None, output_dir: Optional[str] = None,
+            on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """生成并打包，返回 {filename, file_path, download_url, manifest}"""
+        from ..models import FormData
+
+        started = time.perf_counter()
+        batch_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        # 在独立的临时目录中渲染、打包，完成后只发布ZIP
+        job = OutputJob(output_dir, batch_id)
+        workspace = os.path.join(job.scratch_dir, 'sessions')
+        os.makedirs(workspace, exist_ok=True)
+
+        try:
+            # 1. 准备：加载表单、共享公司快照
+            company_snapshots: Dict[int, Any] = {}
+            sessions: Dict[str, Dict[str, Any]] = {}
+            tasks = []
+            used_folders = set()
+            for session_id in session_ids:
+                entry: Dict[str, Any] = {"session_id": session_id, "documents": [], "failed_documents": []}
+                sessions[session_id] = entry
+                try:
+                    form_data = FormData.query.filter_by(session_id=session_id).first()
+                    if not form_data:
+                        entry["error"] = "未找到表单数据"
+                        continue
+                    folder = secure_filename(session_id) or 'session'
+                    while folder in used_folders:
+                        folder += '_'
+                    used_folders.add(folder)
+                    entry.update(approval_no=form_data.approval_no, company_id=form_data.company_id,
+                                 company_name=form_data.company_name, folder=folder)
+                    tasks.append({
+                        "session_id": session_id,
+                        "generation_data": prepare_generation_data(form_data, company_snapshots),
+                        "safe_approval_no": make_safe_approval_no(form_data),
+                        "output_dir": os.path.join(workspace, folder),
+                        "output_format": output_format,
+                        "doc_types": doc_types
+                    })
+                except Exception as e:
+                    logger.error(f"批量生成准备失败 {session_id}: {str(e)}")
+                    entry["error"] = f"准备生成数据失败: {str(e)}"
+            prepare_ms = round((time.perf_counter() - started) * 1000, 3)
+
+            # 2. 并行渲染
+            render_started = time.perf_counter()
+            done = 0
+            for result in self._render(tasks):
+                done += 1
+                entry = sessions[result['session_id']]
+                entry["elapsed_ms"] = result['elapsed_ms']
+                entry["documents"] = [
+                    {"type": d['type'], "filename": d['filename'], "elapsed_ms": d['elapsed_ms']}
+                    for d in result['generated']
+                ]
+                entry["failed_documents"] = result['failed']
+                if result.get('error'):
+                    entry["error"] = result['error']
+                if on_progress:
+                    on_progress(done, len(tasks))
+            render_ms = round((time.perf_counter() - render_started) * 1000, 3)
+
+            # 3. 打包：每个会话一个文件夹 + manifest.json
+            package_started = time.perf_counter()
+            entries = [sessions[sid] for sid in session_ids]
+            for entry in entries:
+                entry["success"] = bool(entry["documents"]) and not entry["failed_documents"] and not entry.get("error")
+            manifest = {
+                "batch_id": batch_id,
+                "generated_at": datetime.now().isoformat(),
+                "output_format": output_format,
+                "document_types": doc_types or 'all',
+                "total_sessions": len(entries),
+                "succeeded_sessions": sum(1 for e in entries if e["success"]),
+                "failed_sessions": sum(1 for e in entries if not e["success"]),
+                "total_documents": sum(len(e["documents"]) for e in entries),
+                "failed_documents": sum(len(e["failed_documents"]) for e in entries),
+                "company_lookups": len(company_snapshots),
+                "sessions": entries
+            }
+            zip_filename = f"{batch_id}_{output_format}.zip"
+            if manifest["total_documents"]:
+                self._package(entries, workspace, job.path(zip_filename), manifest, started, prepare_ms, render_ms,
+                              package_started)
+                shutil.rmtree(workspace, ignore_errors=True)
+                job.publish()
+            return {
+                "filename": zip_filename if manifest["total_documents"] else None,
+                "file_path": job.path(zip_filename) if manifest["total_documents"] else None,
+                "download_url": job.download_url(zip_filename) if manifest["total_documents"] else None,
+                "manifest": manifest
+            }
+        finally:
+            job.discard()
+
+    def _render(self, tasks: List[Dict[str, Any]]):
+        """按完成顺序产出渲染结果；单进程配置或任务很少时在当前线程渲染
+
+        每个会话渲染前占用一个生成名额、完成后释放：没有在途会话时排队等待名额，
+        已有在途会话时只在有空闲名额时多占（不会等待自己持有的名额）。
+        """
+        workers = min(self.max_workers, len(tasks))
+        if workers <= 1:
+            for task in tasks:
+                with admission_controller.slot('generation', queue=False):
+                    result = _render_session(task)
+                yield result
+            return
+
+        remaining = deque(tasks)
+        in_flight: Dict[Any, Tuple[Dict[str, Any], Optional[str]]] = {}
+        try:
+            while remaining or in_flight:
+                while remaining and len(in_flight) < workers:
+                    acquired, token = self._acquire_slot(wait_for_slot=not in_flight)
+                    if not acquired:
+                        break
+                    task = remaining.popleft()
+                    try:
+                        future = self._submit(task)
+                    except BaseException:
+                        self._release_slot(token)
+                        raise
+                    in_flight[future] = (task, token)
+
+                # 还有会话等待名额时定期醒来尝试多占名额
+                done, _ = wait(in_flight, timeout=0.5 if remaining else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task, token = in_flight.pop(future)
+                    self._release_slot(token)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        # 渲染进程异常退出：重建进程池，该会话记为失败
+                        _reset_executor()
+                        result = {"session_id": task['session_id'], "generated": [], "failed": [],
+                                  "error": f"渲染进程异常退出: {str(e)}", "elapsed_ms": 0.0}
+                    yield result
+        finally:
+            for future, (_task, token) in in_flight.items():
+                future.cancel()
+                self._release_slot(token)
+
+    def _submit(self, task: Dict[str, Any]):
+        try:
+            return _get_executor(self.max_workers).submit(_render_session, task)
+        except BrokenProcessPool:
+            _reset_executor()
+            return _get_executor(self.max_workers).submit(_render_session, task)
+
+    @staticmethod
+    def _acquire_slot(wait_for_slot: bool) -> Tuple[bool, Optional[str]]:
+        """返回 (是否获得名额, 令牌)；准入控制关闭时总是获得（令牌为 None）"""
+        if not admission_controller.enabled():
+            return True, None
+        if wait_for_slot:
+            return True, admission_controller.acquire('generation', queue=False)
+        token = admission_controller.try_acquire('generation')
+        return token is not None, token
+
+    @staticmethod
+    def _release_slot(token: Optional[str]) -> None:
+        if token:
+            admission_controller.release('generation', token)
+
+    @staticmethod
+    def _package(entries, workspace, zip_path, manifest, started, prepare_ms, render_ms, package_started) -> None:
+        import zipfile
+
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for entry in entries:
+                for document in entry["documents"]:
+                    file_path = os.path.join(workspace, entry["folder"], document["filename"])
+                    if os.path.exists(file_path):
+                        zipf.write(file_path, f"{entry['folder']}/{document['filename']}")
+            manifest["timings_ms"] = {
+                "prepare": prepare_ms,
+                "render": render_ms,
+                "package": round((time.perf_counter() - package_started) * 1000, 3),
+                "total": round((time.perf_counter() - started) * 1000, 3)
+            }
+            zipf.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2, default=str))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+按内容寻址的上传文件存储
+
+同一个商标、公司图片或签名被反复上传（同一公司或不同公司）时，以前每次都以「时间戳 + UUID」
+命名写入一个新文件。现在公司图片写入 uploads/blobs/<前两位>/<sha256>.<扩展名>：
+
+- 上传内容边读取边计算 SHA-256，先写入 blobs/.tmp/ 下的临时文件，完成后按哈希重命名
+  （同一文件系统内 os.replace 是原子的，并发上传相同内容时读者只会看到完整的文件）；
+- 相同内容只存一份，访问地址 /uploads/blobs/... 稳定不变，下游按地址计算的缓存（生成结果缓存等）因此更容易命中；
+- 已存在的相同内容只刷新修改时间（未被引用的文件由 upload_gc 按修改时间判断能否回收）。
+"""
+import os
+import hashlib
+import tempfile
+from typing import Any, BinaryIO, Dict, Optional
+
+from ..config import get_config_value
+
+BLOBS_DIRNAME = 'blobs'
+TMP_DIRNAME = '.tmp'
+CHUNK_SIZE = 64 * 1024
+
+# 同一种格式的不同写法统一扩展名，避免相同内容存成两份
+_EXTENSION_ALIASES = {'jpeg': 'jpg', 'tiff': 'tif'}
+
+
+def normalize_extension(ext: str) -> str:
+    ext = (ext or '').lower().lstrip('.')
+    return _EXTENSION_ALIASES.get(ext, ext)
+
+
+class BlobStore:
+    """uploads/blobs 下按 SHA-256 命名的文件"""
+
+    def __init__(self, root: Optional[str] = None):
+        self._root = root
+
+    @property
+    def root(self) -> str:
+        return self._root or os.path.join(get_config_value('UPLOAD_FOLDER'), BLOBS_DIRNAME)
+
+    @staticmethod
+    def public_path(digest: str, ext: str) -> str:
+        """uploads 下的相对路径（如 blobs/ab/ab12….png）"""
+        return f"{BLOBS_DIRNAME}/{digest[:2]}/{digest}.{normalize_extension(ext)}"
+
+    def path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}.{normalize_extension(ext)}")
+
+    def put_stream(self, stream: BinaryIO, ext: str) -> Dict[str, Any]:
+        """边读取边计算哈希地写入，返回 {sha256, file_path, public_path, public_url, file_size, deduplicated}"""
+        ext = normalize_extension(ext)
+        tmp_dir = os.path.join(self.root, TMP_DIRNAME)
+        os.makedirs(tmp_dir, exist_ok=True)
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sha256.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            if not size:
+                raise ValueError("文件内容为空")
+            digest = sha256.hexdigest()
+            target = self.path(digest, ext)
+            deduplicated = os.path.isfile(target)
+            if deduplicated:
+                # 相同内容已存在：刷新修改时间，避免在保存到记录前被当作孤儿回收
+                try:
+                    os.utime(target)
+                except FileNotFoundError:
+                    # 检查后恰好被孤儿清理移入隔离区：改为写入自己的副本
+                    deduplicated = False
+            if not deduplicated:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        public_path = self.public_path(digest, ext)
+        return {
+            "sha256": digest,
+            "file_path": target,
+            "public_path": public_path,
+            "public_url": f"/uploads/{public_path}",
+            "file_size": size,
+            "deduplicated": deduplicated
+        }
+
+    def put_file(self, file_path: str, ext: Optional[str] = None) -> Dict[str, Any]:
+        """存入本地文件（扩展名默认取自文件名）"""
+        with open(file_path, 'rb') as f:
+            return self.put_stream(f, ext or os.path.splitext(file_path)[1])
+
+    def exists(self, digest: str, ext: str) -> bool:
+        return os.path.isfile(self.path(digest, ext))
+
+
+# 全局实例
+blob_store = BlobStore()
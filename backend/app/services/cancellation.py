@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+生成与转换的截止时间与取消
+
+每个生成请求创建一个 CancelToken（截止时间 = GENERATION_DEADLINE_SECONDS，请求可以更短），
+通过 cancel_scope 放入上下文变量，上下文准备、逐个文档渲染、PDF 转换、排队等待都从
+current_token() 取得同一个令牌：
+
+- 截止时间已过或被取消（如流式接口的客户端断开）后，剩余文档不再生成，结果逐个标记为
+  timed_out / cancelled；
+- 正在执行的外部转换进程（Word）通过 on_cancel 注册终止回调，取消或到期时立即终止；
+- 每次 PDF 转换另有 PDF_CONVERT_TIMEOUT_SECONDS 的上限（child 令牌）。
+
+上下文变量不会传入新线程，后台线程需在线程内重新进入 cancel_scope。
+"""
+import threading
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+from ..config import get_config_value
+
+# 文档结果（outcome）
+SUCCESS = 'success'
+FAILED = 'failed'
+TIMED_OUT = 'timed_out'
+CANCELLED = 'cancelled'
+
+_current_token: contextvars.ContextVar = contextvars.ContextVar('cancel_token', default=None)
+
+
+class OperationCancelled(Exception):
+    """操作已取消或超过截止时间"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class CancelToken:
+    """截止时间 + 取消标记（线程安全）"""
+
+    def __init__(self, timeout: Optional[float] = None, parent: Optional['CancelToken'] = None):
+        self.parent = parent
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+        if parent and parent.deadline and (self.deadline is None or parent.deadline < self.deadline):
+            self.deadline = parent.deadline
+        self._lock = threading.Lock()
+        self._reason: Optional[str] = None
+        self._message: Optional[str] = None
+        self._callbacks: List[Callable[[], None]] = []
+        self._timer: Optional[threading.Timer] = None
+
+    def child(self, timeout: Optional[float] = None) -> 'CancelToken':
+        """派生令牌：父令牌取消时一并取消，截止时间取两者中较早的"""
+        return CancelToken(timeout, parent=self)
+
+    @property
+    def reason(self) -> Optional[str]:
+        """取消原因（timed_out / cancelled），未取消为 None"""
+        if self._reason is None:
+            if self.parent and self.parent.reason:
+                return self.parent.reason
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.cancel(TIMED_OUT)
+        return self._reason
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    @property
+    def message(self) -> Optional[str]:
+        if self._reason is None and self.parent and self.parent.reason:
+            return self.parent.message
+        return self._message
+
+    def remaining(self) -> Optional[float]:
+        """距截止时间的秒数（无截止时间为 None）"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self, reason: str = CANCELLED, message: Optional[str] = None) -> None:
+        """取消并执行已注册的回调（只生效一次）"""
+        with self._lock:
+            if self._reason is not None:
+                return
+            self._reason = reason
+            if message is None:
+                message = f"超过截止时间（{self.timeout:g} 秒）" if reason == TIMED_OUT and self.timeout else "操作已取消"
+            self._message = message
+            callbacks, self._callbacks = self._callbacks, []
+            if self._timer:
+                self._timer.cancel()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def check(self) -> None:
+        """已取消或到期时抛出 OperationCancelled"""
+        if self.cancelled:
+            raise OperationCancelled(self.reason, self.message)
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """注册取消回调（到期时由定时器触发），返回注销函数；已取消时立即执行（只执行一次）"""
+        if self.parent:
+            fired = []
+            target = callback
+
+            def once() -> None:
+                if not fired:
+                    fired.append(True)
+                    target()
+
+            callback = once
+        unregister_parent = self.parent.on_cancel(callback) if self.parent else None
+        with self._lock:
+            registered = self._reason is None
+            if registered:
+                self._callbacks.append(callback)
+                if self.deadline is not None and self._timer is None:
+                    self._timer = threading.Timer(self.remaining(), self.cancel, (TIMED_OUT,))
+                    self._timer.daemon = True
+                    self._timer.start()
+        if not registered:
+            callback()
+
+        def unregister() -> None:
+            if unregister_parent:
+                unregister_parent()
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+                if not self._callbacks and self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+
+        return unregister
+
+
+def generation_token(timeout: Optional[float] = None) -> CancelToken:
+    """生成请求的令牌：截止时间为 GENERATION_DEADLINE_SECONDS，请求指定的更短时限优先"""
+    deadline = float(get_config_value('GENERATION_DEADLINE_SECONDS', 600))
+    if timeout:
+        deadline = min(deadline, float(timeout)) if deadline else float(timeout)
+    return CancelToken(deadline or None)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+def check_cancelled() -> None:
+    """当前上下文的令牌已取消或到期时抛出 OperationCancelled（没有令牌时什么都不做）"""
+    token = _current_token.get()
+    if token is not None:
+        token.check()
+
+
+@contextmanager
+def cancel_scope(token: Optional[CancelToken]):
+    """在上下文中使用令牌（None 表示不限制）"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+分块、可续传的上传
+
+含图纸的信息文件夹接近 MAX_CONTENT_LENGTH，一次上传失败就要从头再来，multipart 请求体也会被整体缓冲。
+分块上传协议：
+
+1. 创建：声明文件名、总大小、用途（document / image）与可选的整体 SHA-256，得到 upload_id；
+2. 逐块写入：请求体为原始字节，Upload-Offset 指明写入位置（必须等于服务器已接收的字节数），
+   可带 X-Chunk-SHA256 校验本块；校验失败或请求中断时本块作废，已接收的字节数不变；
+3. 查询状态得到已接收的字节数，从该位置续传（换一个工作进程同样可以续传）；
+4. 完成：核对总大小与整体 SHA-256（写入时增量计算，同一进程内无需重新读取文件）。
+
+完成的上传通过 FileUploadService 直接交给提取或图片存储（upload_id 代替 file 字段），
+组装好的文件移动过去，不再复制。分块文件保存在 uploads/.chunked/（不对外提供），
+状态记录在 CACHE_FOLDER/chunked_uploads.sqlite3 中，多个工作进程共享；超过 CHUNKED_UPLOAD_TTL 秒
+没有写入的上传在创建新上传时顺带清理（按间隔节流）。
+"""
+import os
+import re
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+from ..config import get_config_value
+from .admission_control import pid_alive
+
+logger = logging.getLogger(__name__)
+
+CHUNKED_DIRNAME = '.chunked'
+COPY_BUFFER_SIZE = 64 * 1024
+# 写入者进程仍在时，块写入最长占用时间（秒），超过后视为已中断
+WRITE_LEASE_SECONDS = 300
+
+# upload_id 由 create 生成（uuid4().hex），其它形式一律视为不存在（也用于拼接分块文件路径）
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# 用途 -> 允许的扩展名
+PURPOSE_EXTENSIONS = {
+    'document': {'pdf', 'doc', 'docx'},
+    'image': {'png', 'jpg', 'jpeg', 'gif', 'bmp'},
+}
+
+
+class ChunkedUploadError(ValueError):
+    """分块上传请求不合法或状态不允许"""
+
+    def __init__(self, message: str, status: int = 400, error_code: Optional[str] = None,
+                 details: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.status = status
+        self.error_code = error_code
+        self.details = details or {}
+
+
+class ChunkedUploadManager:
+    """分块上传的状态与组装"""
+
+    DB_FILENAME = 'chunked_uploads.sqlite3'
+    COLUMNS = ('upload_id', 'filename', 'purpose', 'total_size', 'expected_sha256', 'received', 'sha256',
+               'writer_pid', 'writer_since', 'created_at', 'updated_at', 'completed_at')
+
+    def __init__(self):
+        self._initialized_paths = set()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        # upload_id -> (已计入的字节数, 整体哈希)：本进程写入的上传增量计算哈希
+        self._hashers: Dict[str, Tuple[int, Any]] = {}
+
+    # ---------- 存储 ----------
+
+    @staticmethod
+    def storage_dir() -> str:
+        return os.path.join(get_config_value('UPLOAD_FOLDER'), CHUNKED_DIRNAME)
+
+    @staticmethod
+    def _valid_id(upload_id: Any) -> bool:
+        return isinstance(upload_id, str) and UPLOAD_ID_PATTERN.match(upload_id) is not None
+
+    def _check_id(self, upload_id: str) -> None:
+        if not self._valid_id(upload_id):
+            raise ChunkedUploadError(f"上传不存在或已过期: {upload_id}", 404, 'upload_not_found')
+
+    def _part_path(self, upload_id: str) -> str:
+        self._check_id(upload_id)
+        return os.path.join(self.storage_dir(), f"{upload_id}.part")
+
+    def _connect(self) -> sqlite3.Connection:
+        path = os.path.join(get_config_value('CACHE_FOLDER'), self.DB_FILENAME)
+        if path not in self._initialized_paths:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        if path not in self._initialized_paths:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunked_uploads ("
+                " upload_id TEXT PRIMARY KEY, filename TEXT NOT NULL, purpose TEXT NOT NULL,"
+                " total_size INTEGER NOT NULL, expected_sha256 TEXT, received INTEGER NOT NULL, sha256 TEXT,"
+                " writer_pid INTEGER, writer_since REAL, created_at REAL NOT NULL, updated_at REAL NOT NULL,"
+                " completed_at REAL)"
+            )
+            self._initialized_paths.add(path)
+        return conn
+
+    def _get(self, conn: sqlite3.Connection, upload_id: str) -> Dict[str, Any]:
+        self._check_id(upload_id)
+        row = conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM chunked_uploads WHERE upload_id = ?",
+                           (upload_id,)).fetchone()
+        if not row:
+            raise ChunkedUploadError(f"上传不存在或已过期: {upload_id}", 404, 'upload_not_found')
+        return dict(zip(self.COLUMNS, row))
+
+    def _transaction(self, upload_id: str, update) -> Dict[str, Any]:
+        """在写事务中读取记录并执行 update(conn, row)，返回 update 的结果"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            result = update(conn, self._get(conn, upload_id))
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_status(row: Dict[str, Any]) -> Dict[str, Any]:
+        ttl = float(get_config_value('CHUNKED_UPLOAD_TTL', 24 * 3600))
+        return {
+            "upload_id": row['upload_id'],
+            "filename": row['filename'],
+            "purpose": row['purpose'],
+            "size": row['total_size'],
+            "offset": row['received'],
+            "complete": row['completed_at'] is not None,
+            "sha256": row['sha256'],
+            "chunk_size": int(get_config_value('CHUNKED_UPLOAD_CHUNK_BYTES', 4 * 1024 * 1024)),
+            "expires_at": datetime.fromtimestamp(row['updated_at'] + ttl).isoformat()
+        }
+
+    # ---------- 协议 ----------
+
+    def create(self, filename: str, size: Any, purpose: str = 'document',
+               sha256: Optional[str] = None) -> Dict[str, Any]:
+        """创建上传，返回状态"""
+        if purpose not in PURPOSE_EXTENSIONS:
+            raise ChunkedUploadError(f"不支持的用途: {purpose}，仅支持: {', '.join(PURPOSE_EXTENSIONS)}")
+        filename = os.path.basename((filename or '').replace('\\', '/'))
+        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        if ext not in PURPOSE_EXTENSIONS[purpose]:
+            raise ChunkedUploadError(
+                f"不支持的文件类型: {ext or filename}，仅支持: {', '.join(sorted(PURPOSE_EXTENSIONS[purpose]))}"
+            )
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise ChunkedUploadError("size 必须为整数")
+        max_bytes = int(get_config_value('CHUNKED_UPLOAD_MAX_BYTES', 100 * 1024 * 1024))
+        if size <= 0 or (max_bytes and size > max_bytes):
+            raise ChunkedUploadError(f"文件大小必须在 1 到 {max_bytes} 字节之间", 413 if size > 0 else 400,
+                                     'upload_too_large' if size > 0 else None)
+        if sha256 is not None:
+            sha256 = str(sha256).strip().lower()
+            if len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+                raise ChunkedUploadError("sha256 必须为 64 位十六进制字符串")
+
+        self.purge_expired()
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self.storage_dir(), exist_ok=True)
+        open(self._part_path(upload_id), 'wb').close()
+        now = time.time()
+        row = dict.fromkeys(self.COLUMNS)
+        row.update(upload_id=upload_id, filename=filename, purpose=purpose, total_size=size,
+                   expected_sha256=sha256, received=0, created_at=now, updated_at=now)
+        conn = self._connect()
+        try:
+            conn.execute(f"INSERT INTO chunked_uploads ({', '.join(self.COLUMNS)}) "
+                         f"VALUES ({', '.join('?' * len(self.COLUMNS))})", tuple(row[c] for c in self.COLUMNS))
+        finally:
+            conn.close()
+        with self._lock:
+            self._hashers[upload_id] = (0, hashlib.sha256())
+        return self._to_status(row)
+
+    def status(self, upload_id: str) -> Dict[str, Any]:
+        conn = self._connect()
+        try:
+            return self._to_status(self._get(conn, upload_id))
+        finally:
+            conn.close()
+
+    def write_chunk(self, upload_id: str, offset: Any, stream: BinaryIO, length: Optional[int],
+                    checksum: Optional[str] = None) -> Dict[str, Any]:
+        """在 offset 处写入一块（offset 必须等于已接收的字节数），返回新的状态"""
+        try:
+            offset = int(offset)
+        except (TypeError, ValueError):
+            raise ChunkedUploadError("缺少或无效的 Upload-Offset")
+        max_chunk = int(get_config_value('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+        if not length or length <= 0:
+            raise ChunkedUploadError("块内容为空（需要 Content-Length）", 411 if length is None else 400)
+        if length > max_chunk:
+            raise ChunkedUploadError(f"单块不能超过 {max_chunk} 字节", 413, 'chunk_too_large')
+        checksum = checksum.strip().lower() if checksum else None
+
+        def claim(conn, row):
+            if row['completed_at'] is not None:
+                raise ChunkedUploadError("上传已完成", 409, 'upload_completed', {"offset": row['received']})
+            now = time.time()
+            if row['writer_pid'] is not None and now - row['writer_since'] < WRITE_LEASE_SECONDS \
+                    and pid_alive(row['writer_pid']):
+                raise ChunkedUploadError("该上传正在写入另一块", 409, 'chunk_in_progress', {"offset": row['received']})
+            if offset != row['received']:
+                raise ChunkedUploadError(f"偏移量不匹配，应从 {row['received']} 继续", 409, 'offset_mismatch',
+                                         {"offset": row['received']})
+            if offset + length > row['total_size']:
+                raise ChunkedUploadError("超出声明的文件大小", 400, 'size_exceeded', {"offset": row['received']})
+            conn.execute("UPDATE chunked_uploads SET writer_pid = ?, writer_since = ? WHERE upload_id = ?",
+                         (os.getpid(), now, upload_id))
+            return row
+
+        row = self._transaction(upload_id, claim)
+        with self._lock:
+            cached = self._hashers.get(upload_id)
+        total_hash = cached[1].copy() if cached and cached[0] == offset else None
+        chunk_hash = hashlib.sha256()
+        written = 0
+        try:
+            with open(self._part_path(upload_id), 'r+b') as f:
+                # 丢弃中断的写入留下的多余字节
+                f.truncate(offset)
+                f.seek(offset)
+                while written < length:
+                    data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                    if not data:
+                        break
+                    f.write(data)
+                    chunk_hash.update(data)
+                    if total_hash is not None:
+                        total_hash.update(data)
+                    written += len(data)
+                if written != length:
+                    f.truncate(offset)
+                    raise ChunkedUploadError(f"块不完整：收到 {written} / {length} 字节", 400, 'chunk_incomplete',
+                                             {"offset": offset})
+                if checksum and chunk_hash.hexdigest() != checksum:
+                    f.truncate(offset)
+                    raise ChunkedUploadError("块校验失败（X-Chunk-SHA256 不匹配）", 422, 'checksum_mismatch',
+                                             {"offset": offset})
+        except BaseException:
+            try:
+                self._release(upload_id, None)
+            except ChunkedUploadError:
+                # 写入期间上传已被放弃
+                pass
+            raise
+
+        row = self._release(upload_id, offset + length)
+        with self._lock:
+            if total_hash is not None:
+                self._hashers[upload_id] = (offset + length, total_hash)
+            else:
+                self._hashers.pop(upload_id, None)
+        return self._to_status(row)
+
+    def _release(self, upload_id: str, received: Optional[int]) -> Dict[str, Any]:
+        def update(conn, row):
+            if row['writer_pid'] == os.getpid():
+                row['writer_pid'] = row['writer_since'] = None
+                if received is not None:
+                    row['received'] = received
+                    row['updated_at'] = time.time()
+                conn.execute("UPDATE chunked_uploads SET writer_pid = NULL, writer_since = NULL, received = ?,"
+                             " updated_at = ? WHERE upload_id = ?", (row['received'], row['updated_at'], upload_id))
+            return row
+
+        return self._transaction(upload_id, update)
+
+    def _file_digest(self, upload_id: str) -> str:
+        with self._lock:
+            cached = self._hashers.pop(upload_id, None)
+        if cached:
+            offset, hasher = cached
+            if offset == os.path.getsize(self._part_path(upload_id)):
+                return hasher.hexdigest()
+        # 其它进程写入的部分：重新读取计算
+        hasher = hashlib.sha256()
+        with open(self._part_path(upload_id), 'rb') as f:
+            for data in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+                hasher.update(data)
+        return hasher.hexdigest()
+
+    def complete(self, upload_id: str) -> Dict[str, Any]:
+        """核对大小与整体哈希并标记完成，返回状态（含 sha256）；重复调用返回同样的结果"""
+        row = self.status(upload_id)
+        if row['complete']:
+            return row
+        if row['offset'] != row['size']:
+            raise ChunkedUploadError(f"上传未完成：已接收 {row['offset']} / {row['size']} 字节", 409,
+                                     'upload_incomplete', {"offset": row['offset']})
+        digest = self._file_digest(upload_id)
+
+        def finish(conn, current):
+            if current['completed_at'] is not None:
+                return current
+            if current['received'] != current['total_size'] or current['writer_pid'] is not None:
+                raise ChunkedUploadError("上传仍在写入", 409, 'chunk_in_progress', {"offset": current['received']})
+            if current['expected_sha256'] and current['expected_sha256'] != digest:
+                raise ChunkedUploadError("文件校验失败（sha256 不匹配），请重新上传", 422, 'checksum_mismatch')
+            current.update(sha256=digest, completed_at=time.time(), updated_at=time.time())
+            conn.execute("UPDATE chunked_uploads SET sha256 = ?, completed_at = ?, updated_at = ? WHERE upload_id = ?",
+                         (digest, current['completed_at'], current['updated_at'], upload_id))
+            return current
+
+        try:
+            return self._to_status(self._transaction(upload_id, finish))
+        except ChunkedUploadError as e:
+            if e.error_code == 'checksum_mismatch':
+                self.abort(upload_id)
+            raise
+
+    def take(self, upload_id: str, purpose: str) -> Tuple[str, Dict[str, Any]]:
+        """取走已完成的上传：返回 (组装好的文件路径, 状态)，文件此后归调用方所有（须移走或删除）"""
+        def remove(conn, row):
+            if row['completed_at'] is None:
+                raise ChunkedUploadError("上传未完成", 409, 'upload_incomplete', {"offset": row['received']})
+            if row['purpose'] != purpose:
+                raise ChunkedUploadError(f"该上传的用途为 {row['purpose']}，不能用于 {purpose}", 400)
+            conn.execute("DELETE FROM chunked_uploads WHERE upload_id = ?", (upload_id,))
+            return row
+
+        row = self._transaction(upload_id, remove)
+        return self._part_path(upload_id), self._to_status(row)
+
+    def abort(self, upload_id: str) -> bool:
+        """放弃上传并删除已接收的数据，返回上传是否存在（不存在时不删除任何文件）"""
+        if not self._valid_id(upload_id):
+            return False
+        conn = self._connect()
+        try:
+            deleted = conn.execute("DELETE FROM chunked_uploads WHERE upload_id = ?", (upload_id,)).rowcount
+        finally:
+            conn.close()
+        if not deleted:
+            return False
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+        try:
+            os.remove(self._part_path(upload_id))
+        except OSError:
+            pass
+        return True
+
+    def purge_expired(self, force: bool = False) -> int:
+        """删除超过 CHUNKED_UPLOAD_TTL 秒没有写入的上传与无记录的分块文件，返回删除数量（非强制时按间隔节流）"""
+        now = time.time()
+        ttl = float(get_config_value('CHUNKED_UPLOAD_TTL', 24 * 3600))
+        with self._lock:
+            if not force and now - self._last_purge < min(ttl, 600):
+                return 0
+            self._last_purge = now
+
+        conn = self._connect()
+        try:
+            expired = [r[0] for r in conn.execute("SELECT upload_id FROM chunked_uploads WHERE updated_at < ?",
+                                                  (now - ttl,))]
+            conn.execute("DELETE FROM chunked_uploads WHERE updated_at < ?", (now - ttl,))
+            live = {r[0] for r in conn.execute("SELECT upload_id FROM chunked_uploads")}
+        finally:
+            conn.close()
+        removed = 0
+        try:
+            entries = list(os.scandir(self.storage_dir()))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            upload_id = entry.name[:-len('.part')] if entry.name.endswith('.part') else None
+            try:
+                # 无记录的分块文件：已取走或已过期；刚创建的（记录尚未写入）按修改时间保留
+                if upload_id in expired or (upload_id not in live and now - entry.stat().st_mtime > ttl):
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                continue
+        with self._lock:
+            for upload_id in expired:
+                self._hashers.pop(upload_id, None)
+        if removed:
+            logger.info(f"清理过期分块上传 {removed} 个")
+        return removed
+
+
+# 全局实例
+chunked_upload_manager = ChunkedUploadManager()
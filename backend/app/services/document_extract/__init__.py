@@ -10,6 +10,11 @@ from .document_extract import (
     BaseExtractionStrategy
 )
 
+from .extraction_cache import ExtractionCache
+from .regex_guard import RuleGuard, ExtractionTimeoutError
+from .pdf_text import PdfTextExtractor, pdf_text_extractor
+from .document_classifier import DocumentClassifier, DocumentFingerprint
+from .strategy_registry import StrategyRegistry
 from .rule_engine_strategy import RuleEngineExtractionStrategy
 from .templates.ordinary_laminated_glass_windscreen_template import OrdinaryLaminatedGlassWindscreenTemplate
 
@@ -19,6 +24,14 @@ __all__ = [
     'rule_engine_service',
     'BasePreprocessor',
     'BaseExtractionStrategy',
+    'ExtractionCache',
+    'RuleGuard',
+    'ExtractionTimeoutError',
+    'PdfTextExtractor',
+    'pdf_text_extractor',
+    'DocumentClassifier',
+    'DocumentFingerprint',
+    'StrategyRegistry',
     'RuleEngineExtractionStrategy',
     'OrdinaryLaminatedGlassWindscreenTemplate'
 ]
@@ -0,0 +1,219 @@
+"""
+批量文档提取
+
+一次请求提交多个信息文件夹（多文件或ZIP）：先把全部输入落到本次批次的临时目录，
+再用有界线程池并发提取，按完成顺序逐个产出结果（由接口以 JSONL 或 SSE 流式返回）。
+单个文件失败只影响该文件的结果。
+
+ZIP 安全：只取条目的文件名部分（忽略目录，防止 zip-slip），跳过不支持的类型与系统文件，
+限制条目数、单个条目与解压总大小，以及压缩比（防止 zip 炸弹）。
+"""
+
+import os
+import time
+import shutil
+import zipfile
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Iterator, Optional
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+
+from ...config import get_config_value
+from ..admission_control import admission_controller
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = {'.doc', '.docx', '.pdf'}
+
+
+class BatchInputError(ValueError):
+    """批量输入不合法（数量、大小、ZIP 内容等）"""
+
+
+class BatchItem:
+    """批次中的单个文档"""
+
+    def __init__(self, index: int, filename: str, file_path: Optional[str] = None, error: Optional[str] = None):
+        self.index = index
+        self.filename = filename
+        self.file_path = file_path
+        # 收集阶段即失败的条目（如类型不支持），直接作为失败结果返回
+        self.error = error
+
+
+class BatchExtractionRunner:
+    """批量提取：收集输入 + 有界并发执行"""
+
+    def __init__(self, service, max_workers: Optional[int] = None):
+        self.service = service
+        self._max_workers = max_workers
+
+    @property
+    def max_workers(self) -> int:
+        if self._max_workers is not None:
+            return self._max_workers
+        return int(get_config_value('EXTRACTION_BATCH_WORKERS', 4))
+
+    @staticmethod
+    def create_workspace() -> str:
+        """本批次的临时目录（预处理生成的 .clean.docx 也落在这里，结束后整体删除）"""
+        base_dir = os.path.join(get_config_value('UPLOAD_FOLDER'), 'temp')
+        os.makedirs(base_dir, exist_ok=True)
+        return tempfile.mkdtemp(prefix='batch_', dir=base_dir)
+
+    @staticmethod
+    def cleanup_workspace(workspace: str) -> None:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    def collect_inputs(self, files: List[FileStorage], workspace: str) -> List[BatchItem]:
+        """保存上传文件并展开ZIP，返回批次条目（保持提交顺序）"""
+        max_files = int(get_config_value('EXTRACTION_BATCH_MAX_FILES', 100))
+        items: List[BatchItem] = []
+
+        def add(filename: str, writer) -> None:
+            index = len(items)
+            if index >= max_files:
+                raise BatchInputError(f"单次批量最多 {max_files} 个文档")
+            ext = os.path.splitext(filename.lower())[1]
+            if ext not in SUPPORTED_EXTENSIONS:
+                items.append(BatchItem(index, filename, error=f"不支持的文件类型: {ext or filename}"))
+                return
+            # 以序号为前缀避免重名，同时保留原扩展名供预处理/分类识别格式
+            safe_name = secure_filename(os.path.basename(filename)) or f"document{ext}"
+            if not safe_name.lower().endswith(ext):
+                safe_name += ext
+            target = os.path.join(workspace, f"{index:04d}_{safe_name}")
+            writer(target)
+            items.append(BatchItem(index, filename, file_path=target))
+
+        for file in files:
+            if not file or not file.filename:
+                continue
+            if file.filename.lower().endswith('.zip'):
+                zip_path = os.path.join(workspace, f"upload_{len(items):04d}.zip")
+                file.save(zip_path)
+                try:
+                    self._expand_zip(zip_path, add)
+                finally:
+                    os.remove(zip_path)
+            else:
+                add(file.filename, file.save)
+
+        if not items:
+            raise BatchInputError("未找到上传的文件")
+        return items
+
+    @staticmethod
+    def _expand_zip(zip_path: str, add) -> None:
+        max_entry = int(get_config_value('EXTRACTION_BATCH_MAX_ENTRY_BYTES', 50 * 1024 * 1024))
+        max_total = int(get_config_value('EXTRACTION_BATCH_MAX_UNCOMPRESSED_BYTES', 500 * 1024 * 1024))
+        max_ratio = 100
+
+        try:
+            zf = zipfile.ZipFile(zip_path)
+        except zipfile.BadZipFile:
+            raise BatchInputError(f"无效的ZIP文件: {os.path.basename(zip_path)}")
+
+        with zf:
+            total = 0
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                name = info.filename.replace('\\', '/')
+                basename = name.rsplit('/', 1)[-1]
+                # 跳过 macOS 资源目录、隐藏文件与 Office 锁文件
+                if not basename or basename.startswith(('.', '~$')) or name.startswith('__MACOSX/'):
+                    continue
+                if info.file_size > max_entry:
+                    raise BatchInputError(f"ZIP条目过大: {basename}")
+                if info.file_size > 1024 * 1024 and info.file_size / max(info.compress_size, 1) > max_ratio:
+                    raise BatchInputError(f"ZIP条目压缩比异常: {basename}")
+                total += info.file_size
+                if total > max_total:
+                    raise BatchInputError("ZIP解压后总大小超出限制")
+
+                def writer(target: str, info=info) -> None:
+                    # 按声明大小限量读取，声明与实际不符时不会写出超限数据
+                    with zf.open(info) as src, open(target, 'wb') as dst:
+                        remaining = info.file_size
+                        while True:
+                            chunk = src.read(min(1024 * 1024, remaining + 1))
+                            if not chunk:
+                                break
+                            remaining -= len(chunk)
+                            if remaining < 0:
+                                raise BatchInputError(f"ZIP条目大小与声明不符: {basename}")
+                            dst.write(chunk)
+
+                add(basename, writer)
+
+    def run(self, app, items: List[BatchItem], use_cache: bool = True) -> Iterator[Dict[str, Any]]:
+        """并发提取，按完成顺序产出各文档结果，最后产出汇总"""
+        started = time.perf_counter()
+        succeeded = failed = 0
+
+        def extract(item: BatchItem) -> Dict[str, Any]:
+            begin = time.perf_counter()
+            try:
+                # 每个文档单独占用提取名额，与交互提取请求按到达顺序共享全局并发上限
+                with app.app_context(), admission_controller.slot('extraction', queue=False):
+                    result = self.service.extract_from_document(item.file_path, use_cache=use_cache)
+            except Exception as e:
+                logger.error(f"批量提取失败 {item.filename}: {str(e)}")
+                result = {"success": False, "error": str(e), "data": {}}
+            return self._format_result(item, result, (time.perf_counter() - begin) * 1000)
+
+        for item in items:
+            if item.error:
+                failed += 1
+                yield self._format_result(item, {"success": False, "error": item.error,
+                                                 "error_code": "unsupported_file_type"}, 0.0)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, self.max_workers), thread_name_prefix='batch-extract')
+        try:
+            futures = [executor.submit(extract, item) for item in items if not item.error]
+            for future in as_completed(futures):
+                result = future.result()
+                if result['success']:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield result
+        finally:
+            # 客户端中途断开时不再启动排队中的文档
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        yield {
+            "type": "summary",
+            "total": len(items),
+            "succeeded": succeeded,
+            "failed": failed,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+
+    @staticmethod
+    def _format_result(item: BatchItem, result: Dict[str, Any], elapsed_ms: float) -> Dict[str, Any]:
+        payload = {
+            "type": "result",
+            "index": item.index,
+            "filename": item.filename,
+            "success": bool(result.get("success")),
+            "elapsed_ms": round(elapsed_ms, 3)
+        }
+        if payload["success"]:
+            payload.update({
+                "data": result.get("data", {}),
+                "cache_hit": result.get("cache_hit", False),
+                "classification": result.get("classification", {}),
+                "rule_timings_ms": result.get("rule_timings_ms", {})
+            })
+        else:
+            payload.update({
+                "error": result.get("error", "提取失败"),
+                "error_code": result.get("error_code"),
+                "classification": result.get("classification", {})
+            })
+        return payload
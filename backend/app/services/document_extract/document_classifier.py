@@ -0,0 +1,172 @@
+"""
+文档分类器
+
+只读取文档开头几 KB 的可见文本（DOCX 用 iterparse 逐段解析，过滤隐藏/删除线文字，读够即停；
+PDF 只读前几页；TXT 只读开头），按各策略登记的指纹（必需关键词、加分关键词、排除关键词）
+打分，选出置信度最高的文档类型。不会对文档执行任何策略的完整规则集。
+"""
+
+import os
+import re
+import time
+import zipfile
+import logging
+import xml.etree.ElementTree as ET
+from typing import Dict, Any, List, Optional, Iterable
+
+from ...config import get_config_value
+
+logger = logging.getLogger(__name__)
+
+_W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+_W_P = f'{{{_W_NS}}}p'
+_W_R = f'{{{_W_NS}}}r'
+_W_T = f'{{{_W_NS}}}t'
+_W_RPR = f'{{{_W_NS}}}rPr'
+_W_VAL = f'{{{_W_NS}}}val'
+
+
+class DocumentFingerprint:
+    """文档类型指纹
+
+    Args:
+        required: 必需关键词（正则，忽略大小写），缺任意一个即不匹配
+        signals: 加分关键词，命中越多置信度越高
+        excluded: 排除关键词，出现任意一个即不匹配（区分相近的玻璃类型）
+    """
+
+    def __init__(self, required: Iterable[str], signals: Iterable[str] = (), excluded: Iterable[str] = ()):
+        self.required = [re.compile(p, re.IGNORECASE) for p in required]
+        self.signals = [re.compile(p, re.IGNORECASE) for p in signals]
+        self.excluded = [re.compile(p, re.IGNORECASE) for p in excluded]
+
+    def score(self, text: str) -> float:
+        """返回 0~1 的置信度"""
+        if any(p.search(text) for p in self.excluded):
+            return 0.0
+        if not all(p.search(text) for p in self.required):
+            return 0.0
+        total = len(self.required) + len(self.signals)
+        if not total:
+            return 0.0
+        matched = len(self.required) + sum(1 for p in self.signals if p.search(text))
+        return matched / total
+
+    def describe(self) -> str:
+        """指纹内容描述（参与策略注册表签名）"""
+        return repr(([p.pattern for p in self.required], [p.pattern for p in self.signals],
+                     [p.pattern for p in self.excluded]))
+
+
+def _is_true(el: Optional[ET.Element]) -> bool:
+    if el is None:
+        return False
+    val = el.get(_W_VAL)
+    return val is None or str(val).lower() not in ('false', '0')
+
+
+def _read_docx_head(file_path: str, limit: int) -> str:
+    """逐段解析 document.xml，过滤隐藏（w:vanish）与删除线（w:strike/w:dstrike）文字，读够 limit 个字符即停"""
+    texts: List[str] = []
+    size = 0
+    with zipfile.ZipFile(file_path, 'r') as zf:
+        with zf.open('word/document.xml') as f:
+            for _, elem in ET.iterparse(f, events=('end',)):
+                if elem.tag != _W_P:
+                    continue
+                parts = []
+                for r in elem.findall(_W_R):
+                    rpr = r.find(_W_RPR)
+                    if rpr is not None and (rpr.find(f'{{{_W_NS}}}vanish') is not None
+                                            or _is_true(rpr.find(f'{{{_W_NS}}}strike'))
+                                            or _is_true(rpr.find(f'{{{_W_NS}}}dstrike'))):
+                        continue
+                    for t in r.findall(_W_T):
+                        parts.append(t.text or '')
+                elem.clear()
+                if parts:
+                    paragraph = ''.join(parts)
+                    texts.append(paragraph)
+                    size += len(paragraph) + 1
+                    if size >= limit:
+                        break
+    return '\n'.join(texts)[:limit]
+
+
+def _read_pdf_head(file_path: str, limit: int) -> str:
+    from .pdf_text import pdf_text_extractor
+
+    texts: List[str] = []
+    size = 0
+    # 串行读取：读够 limit 即停，不为分类启动提取进程池（读过的页进入页面缓存，随后的完整提取直接命中）
+    for text in pdf_text_extractor.iter_pages(file_path, parallel=False):
+        texts.append(text)
+        size += len(text) + 1
+        if size >= limit:
+            break
+    return '\n'.join(texts)[:limit]
+
+
+def read_text_head(file_path: str, limit: int) -> str:
+    """读取文档开头 limit 个字符的可见文本；不支持直接读取的格式（如 .doc）返回空字符串"""
+    _, ext = os.path.splitext(file_path.lower())
+    try:
+        if ext == '.docx':
+            return _read_docx_head(file_path, limit)
+        if ext == '.pdf':
+            return _read_pdf_head(file_path, limit)
+        if ext in ('.txt', '.text'):
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                return f.read(limit)
+    except ImportError:
+        logger.warning("PyPDF2未安装，无法读取PDF文本用于分类")
+    except Exception as e:
+        logger.warning(f"读取文档开头文本失败 {file_path}: {str(e)}")
+    return ''
+
+
+class DocumentClassifier:
+    """基于指纹的文档分类器"""
+
+    def __init__(self, head_chars: Optional[int] = None, min_confidence: Optional[float] = None):
+        self._head_chars = head_chars
+        self._min_confidence = min_confidence
+
+    @property
+    def head_chars(self) -> int:
+        if self._head_chars is not None:
+            return self._head_chars
+        return int(get_config_value('DOCUMENT_CLASSIFIER_HEAD_CHARS', 8192))
+
+    @property
+    def min_confidence(self) -> float:
+        if self._min_confidence is not None:
+            return self._min_confidence
+        return float(get_config_value('DOCUMENT_CLASSIFIER_MIN_CONFIDENCE', 0.5))
+
+    def classify(self, file_path: str, fingerprints: Dict[str, DocumentFingerprint]) -> Dict[str, Any]:
+        """对文档分类
+
+        Returns:
+            {'document_type': 类型或None, 'confidence': 0~1, 'elapsed_ms': 耗时, 'scores': 各类型得分}
+        """
+        start = time.perf_counter()
+        head = read_text_head(file_path, self.head_chars)
+        result = self.classify_text(head, fingerprints)
+        result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        return result
+
+    def classify_text(self, text: str, fingerprints: Dict[str, DocumentFingerprint]) -> Dict[str, Any]:
+        scores = {doc_type: round(fp.score(text), 3) for doc_type, fp in fingerprints.items()}
+        best_type, best_score = None, 0.0
+        for doc_type, score in scores.items():
+            if score > best_score:
+                best_type, best_score = doc_type, score
+        if best_score < self.min_confidence:
+            best_type = None
+        return {
+            'document_type': best_type,
+            'confidence': best_score,
+            'scores': scores,
+            'head_chars': len(text)
+        }
@@ -1,8 +1,10 @@
 import os
 import zipfile
 import platform
+import time
+from datetime import datetime
 import xml.etree.ElementTree as ET
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable
 import logging
 
 
@@ -24,12 +26,28 @@ class BasePreprocessor:
 class BaseExtractionStrategy:
     """提取策略基类。"""
 
+    # 策略版本：修改提取规则或后处理逻辑时递增，使旧的提取结果缓存失效
+    STRATEGY_VERSION = '1'
+    # 文档类型标识与分类指纹（DocumentFingerprint），登记到策略注册表时使用
+    DOCUMENT_TYPE: Optional[str] = None
+    FINGERPRINT = None
+
     def extract(self, file_path: str) -> Dict[str, Any]:
         raise NotImplementedError
 
+    @classmethod
+    def get_signature(cls) -> str:
+        """策略签名（类名 + 版本），参与提取缓存键的计算"""
+        return f"{cls.__name__}:{cls.STRATEGY_VERSION}"
+
 
 # 导入策略实现
 from .templates.ordinary_laminated_glass_windscreen_template import OrdinaryLaminatedGlassWindscreenTemplate
+from .extraction_cache import ExtractionCache
+from .regex_guard import ExtractionTimeoutError
+from .document_classifier import DocumentClassifier
+from .strategy_registry import StrategyRegistry
+from ..image_staging import image_staging_service
 
 logger = logging.getLogger(__name__)
 
@@ -207,46 +225,129 @@ class DefaultPreprocessor(BasePreprocessor):
             return ''
 
 class DocumentExtractionService:
-    """文档信息提取服务（仅规则引擎）"""
+    """文档信息提取服务（仅规则引擎）：先按指纹分类，再交给对应文档类型的策略提取"""
 
-    def __init__(self, preprocessor: Optional[BasePreprocessor] = None):
+    def __init__(self, preprocessor: Optional[BasePreprocessor] = None, cache: Optional[ExtractionCache] = None,
+                 registry: Optional[StrategyRegistry] = None, classifier: Optional[DocumentClassifier] = None):
         # 预处理器
         self.preprocessor = preprocessor or DefaultPreprocessor()
-        # 固定策略：普通层压玻璃挡风玻璃模板
-        self._strategy = OrdinaryLaminatedGlassWindscreenTemplate()
-
-    # 兼容旧接口保留，但内部仅返回规则引擎
+        # 策略注册表（文档类型 -> 策略）
+        if registry is None:
+            registry = StrategyRegistry()
+            registry.register(OrdinaryLaminatedGlassWindscreenTemplate)
+        self.registry = registry
+        # 文档分类器（只读取文档开头的可见文本）
+        self.classifier = classifier or DocumentClassifier()
+        # 提取结果缓存（按文档内容哈希 + 注册表签名）
+        self.cache = cache or ExtractionCache()
+
+    # 兼容旧接口保留：返回默认策略（第一个登记的策略）
     def _get_strategy(self) -> BaseExtractionStrategy:
-        return self._strategy
+        return self.registry.default()
+
+    def classify(self, file_path: str) -> Dict[str, Any]:
+        """判断文档类型，返回 {'document_type', 'confidence', 'elapsed_ms', ...}"""
+        return self.classifier.classify(file_path, self.registry.fingerprints())
 
-    def extract_from_document(self, file_path: str) -> Dict[str, Any]:
+    def extract_from_document(self, file_path: str, use_cache: bool = True,
+                              on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
         """从单个文档中提取结构化信息（包含预处理与策略调用）。
         
         Args:
             file_path: 文档文件路径
-            mode: 提取模式，如果为None则使用默认模式
+            use_cache: 是否读取提取缓存；为False时强制重新提取，并用新结果刷新缓存
+            on_event: 可选，进度回调；每完成一个阶段回调 {"type": "stage", "stage": ..., "elapsed_ms": ...}
+                      （cache_hit / classified / preprocessed / extracted）
             
         Returns:
             包含提取结果的字典
         """
-        try:
-            # 1) 统一预处理
-            processed_path = self.preprocessor.preprocess(file_path)
+        started = time.perf_counter()
+
+        def emit(stage: str, **fields) -> None:
+            if on_event:
+                on_event({"type": "stage", "stage": stage,
+                          "elapsed_ms": round((time.perf_counter() - started) * 1000, 3), **fields})
 
-            # 2) 获取策略并调用提取（仅规则引擎）
-            strategy = self._get_strategy()
+        try:
+            # 0) 按原始上传内容查询缓存（须在预处理之前计算哈希）
+            cache_key = None
+            if self.cache.enabled:
+                cache_key = self.cache.build_key(self.cache.hash_file(file_path), self.registry.get_signature())
+                if use_cache:
+                    cached = self.cache.get(cache_key)
+                    if cached and self._cached_images_available(cached.get('data', {})):
+                        emit('cache_hit')
+                        return {
+                            "success": True,
+                            "data": cached['data'],
+                            "raw_response": {"result": cached['data']},
+                            "mode": "rules",
+                            "cache_hit": True,
+                            "classification": cached.get('classification', {})
+                        }
+
+            # 1) 分类：只读取开头的可见文本；无法直接读取的格式（如 .doc）在预处理后再分类
+            processed_path = None
+            classification = self.classify(file_path)
+            if not classification['head_chars']:
+                processed_path = self.preprocessor.preprocess(file_path)
+                if processed_path != file_path:
+                    classification = self.classify(processed_path)
+
+            strategy = self.registry.get(classification['document_type']) if classification['document_type'] else None
+            if strategy is None:
+                return {
+                    "success": False,
+                    "error": "不支持的文档类型：未能识别为已支持的信息文件夹",
+                    "error_code": "unsupported_document",
+                    "classification": classification,
+                    "data": {}
+                }
+            classification['strategy'] = strategy.get_signature()
+            emit('classified', document_type=classification['document_type'],
+                 confidence=classification.get('confidence'))
+
+            # 2) 统一预处理
+            if processed_path is None:
+                processed_path = self.preprocessor.preprocess(file_path)
+            emit('preprocessed')
+
+            # 3) 调用对应策略提取（仅规则引擎）
             response = strategy.extract(processed_path)
+            emit('extracted')
 
-            # 3) 解析响应
+            # 4) 解析响应
             extracted_data = self._parse_response(response)
 
+            # 5) 写入缓存（仅缓存策略正常返回的结果）
+            if cache_key and isinstance(response, dict) and 'result' in response:
+                self.cache.put(cache_key, {
+                    "data": extracted_data,
+                    "strategy": strategy.get_signature(),
+                    "classification": classification,
+                    "cached_at": datetime.now().isoformat()
+                })
+
             return {
                 "success": True,
                 "data": extracted_data,
                 "raw_response": response,
-                "mode": "rules"
+                "mode": "rules",
+                "cache_hit": False,
+                "classification": classification,
+                "rule_timings_ms": response.get('rule_timings_ms', {}) if isinstance(response, dict) else {}
             }
 
+        except ExtractionTimeoutError as e:
+            # 超出时间预算属于文档本身的问题（畸形/超大文本），与服务内部错误区分
+            logger.warning(f"提取超时: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "error_code": "extraction_timeout",
+                "data": {}
+            }
         except Exception as e:
             logger.error(f"提取失败: {str(e)}")
             return {
@@ -255,6 +356,10 @@ class DocumentExtractionService:
                 "data": {}
             }
     
+    def _cached_images_available(self, data: Dict[str, Any]) -> bool:
+        """缓存命中时校验商标图片仍在磁盘上（暂存图片同时续期），缺失则视为未命中"""
+        return image_staging_service.ensure_available(data.get('trade_marks') or [])
+
     # 解析函数
     def _parse_response(self, response: Dict[str, Any]) -> Dict[str, Any]:
         try:
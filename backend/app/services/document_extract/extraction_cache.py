@@ -0,0 +1,135 @@
+"""
+文档提取结果缓存
+
+同一份信息文件夹经常被重复上传（不同用户、刷新页面、同一制造商的多个申请），
+按“上传内容 SHA-256 + 策略版本”缓存提取结果，命中时跳过预处理、正则提取与图片保存。
+
+存储为 CACHE_FOLDER/extraction 下的 JSON 文件，多个 gunicorn worker 共享；
+条目数超过上限时按最近访问时间（mtime）淘汰。
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Any, Optional
+
+from ...config import get_config_value
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionCache:
+    """提取结果缓存（落盘JSON，按条数做LRU淘汰）"""
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: Optional[int] = None):
+        self._cache_dir = cache_dir
+        self._max_entries = max_entries
+
+    @property
+    def enabled(self) -> bool:
+        return bool(get_config_value('EXTRACTION_CACHE_ENABLED', True))
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is not None:
+            return self._max_entries
+        return int(get_config_value('EXTRACTION_CACHE_MAX_ENTRIES', 256))
+
+    def _get_cache_dir(self) -> str:
+        """缓存目录（延迟解析，服务单例在导入时创建，此时可能尚无应用上下文）"""
+        cache_dir = self._cache_dir or os.path.join(get_config_value('CACHE_FOLDER'), 'extraction')
+        os.makedirs(cache_dir, exist_ok=True)
+        return cache_dir
+
+    @classmethod
+    def hash_file(cls, file_path: str) -> str:
+        """分块计算文件内容的 SHA-256"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(cls.CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def build_key(content_hash: str, strategy_signature: str) -> str:
+        """缓存键：内容哈希 + 策略签名（签名变化即视为新键，旧条目随LRU淘汰）"""
+        signature_hash = hashlib.sha256(strategy_signature.encode('utf-8')).hexdigest()[:16]
+        return f"{content_hash}_{signature_hash}"
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self._get_cache_dir(), f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存条目，未命中返回None；命中时刷新访问时间"""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path, None)
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取提取缓存失败 {key}: {str(e)}")
+            self.invalidate(key)
+            return None
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        """写入缓存条目（先写临时文件再原子替换，避免并发读到半截JSON）"""
+        cache_dir = self._get_cache_dir()
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._entry_path(key))
+        except Exception as e:
+            logger.warning(f"写入提取缓存失败 {key}: {str(e)}")
+            return
+        self._evict(cache_dir)
+
+    def invalidate(self, key: str) -> None:
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def clear(self) -> int:
+        """清空缓存，返回删除的条目数"""
+        removed = 0
+        cache_dir = self._get_cache_dir()
+        for name in os.listdir(cache_dir):
+            if name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(cache_dir, name))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def _evict(self, cache_dir: str) -> None:
+        """条目数超过上限时，按 mtime 从旧到新淘汰"""
+        try:
+            entries = []
+            for name in os.listdir(cache_dir):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(cache_dir, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+            overflow = len(entries) - self.max_entries
+            if overflow <= 0:
+                return
+            entries.sort()
+            for _, path in entries[:overflow]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        except Exception as e:
+            logger.warning(f"提取缓存淘汰失败: {str(e)}")
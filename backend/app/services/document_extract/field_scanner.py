@@ -0,0 +1,177 @@
+"""
+单遍多字段扫描器
+
+旧实现对每个字段都用原始模式串调用 re.findall 扫描全文（约22个字段即22遍全文扫描）。
+本扫描器在构建时一次性编译全部字段模式，并为各字段登记“锚点”（字段标签，如 Approval No、
+Trade name、Number of layers）：先对小写文本按锚点首单词做子串查找定位全部锚点，
+再只在锚点处对字段模式做定点匹配（pattern.match(text, pos)），不再用正则反复扫描全文。
+
+约定：字段配置中的 anchor 必须是该字段每个 pattern 的前缀（同样的大小写/多行语义），
+因此字段的任何匹配都只可能从某个锚点位置开始，定点匹配与全文 findall 结果一致。
+未配置 anchor 的字段回退为全文 findall。
+
+字段配置中 risky 为 True 的规则（存在回溯风险）可提供 linear_patterns（RE2 兼容写法，不含前瞻等），
+engine='re2' 且已安装 google-re2 时改用线性时间引擎执行。
+扫描时若存在当前规则保护（regex_guard.RuleGuard），逐字段检查时间预算并记录耗时。
+"""
+
+import re
+import time
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from .regex_guard import current_guard, compile_linear, linear_engine_available
+
+logger = logging.getLogger(__name__)
+
+# 正则源码开头的字面单词（不含正则元字符）
+_LEADING_WORD = re.compile(r'[A-Za-z][A-Za-z\-]*(?![*+?{])')
+# 忽略大小写时会与 ASCII 字母互相匹配、但 str.lower() 不能还原的字符
+_CASE_FOLD_SPECIALS = ('\u0131', '\u017f')
+
+
+def leading_word(pattern: str) -> Optional[str]:
+    """返回正则源码开头的字面单词（小写），没有则返回None"""
+    m = _LEADING_WORD.match(pattern)
+    return m.group(0).lower() if m else None
+
+
+def lowered_positions_reliable(text: str, lowered: str) -> bool:
+    """小写文本与原文位置一一对应、且不含特殊大小写字符时，才能在小写文本上用 str.find 定位"""
+    return len(lowered) == len(text) and not any(ch in text for ch in _CASE_FOLD_SPECIALS)
+
+
+class FieldScanner:
+    """根据字段配置构建的预编译扫描器（无状态，可在多线程间共享）"""
+
+    FLAGS = re.IGNORECASE | re.MULTILINE
+
+    def __init__(self, field_patterns: Dict[str, Dict[str, Any]], engine: str = 're'):
+        use_linear = engine == 're2'
+        if use_linear and not linear_engine_available():
+            logger.warning("EXTRACTION_REGEX_ENGINE=re2 但未安装 google-re2，风险规则仍使用 re 引擎")
+            use_linear = False
+
+        # 字段 -> (预编译模式列表, 锚点分组名或None)
+        self._fields: List[Tuple[str, List[Any], Optional[str]]] = []
+        # 锚点源码 -> 分组名（相同锚点只登记一次，如公司名称与地址共用一个锚点）
+        anchor_groups: Dict[str, str] = {}
+
+        for field_name, field_config in field_patterns.items():
+            compiled = []
+            for pattern in field_config.get('patterns', []):
+                try:
+                    compiled.append(re.compile(pattern, self.FLAGS))
+                except re.error as e:
+                    logger.warning(f"正则表达式错误 {pattern}: {str(e)}")
+
+            if use_linear and field_config.get('risky') and field_config.get('linear_patterns'):
+                linear = [compile_linear(pattern, self.FLAGS) for pattern in field_config['linear_patterns']]
+                if linear and all(linear):
+                    compiled = linear
+
+            group = None
+            anchor = field_config.get('anchor')
+            if anchor:
+                group = anchor_groups.get(anchor)
+                if group is None:
+                    group = f"a{len(anchor_groups)}"
+                    anchor_groups[anchor] = group
+            self._fields.append((field_name, compiled, group))
+
+        self._anchor_regexes = {group: re.compile(src, self.FLAGS) for src, group in anchor_groups.items()}
+
+        # 按锚点的首个字面单词（小写）归并：同一单词只需在小写文本上 str.find 一遍
+        self._anchor_words: Dict[str, List[str]] = {}
+        self._regex_only_groups: List[str] = []
+        for src, group in anchor_groups.items():
+            word = leading_word(src)
+            if word:
+                self._anchor_words.setdefault(word, []).append(group)
+            else:
+                self._regex_only_groups.append(group)
+
+    def locate_anchors(self, text: str) -> Dict[str, List[int]]:
+        """定位所有锚点，返回 分组名 -> 出现位置列表（升序）
+
+        先在小写文本上按首单词做 C 层面的子串查找得到候选位置，再用锚点正则在原文上定点确认；
+        无法安全使用小写文本时（特殊大小写字符），回退为逐锚点 finditer。
+        """
+        positions: Dict[str, List[int]] = {group: [] for group in self._anchor_regexes}
+        if not self._anchor_regexes:
+            return positions
+
+        lowered = text.lower()
+        if not lowered_positions_reliable(text, lowered):
+            for group, regex in self._anchor_regexes.items():
+                positions[group] = [m.start() for m in regex.finditer(text)]
+            return positions
+
+        for word, groups in self._anchor_words.items():
+            idx = lowered.find(word)
+            while idx != -1:
+                for group in groups:
+                    if self._anchor_regexes[group].match(text, idx):
+                        positions[group].append(idx)
+                idx = lowered.find(word, idx + 1)
+
+        for group in self._regex_only_groups:
+            positions[group] = [m.start() for m in self._anchor_regexes[group].finditer(text)]
+        return positions
+
+    def scan(self, text: str) -> Dict[str, str]:
+        """提取全部字段，返回 字段名 -> 值（未匹配为空字符串）"""
+        guard = current_guard()
+        start = time.perf_counter()
+        anchors = self.locate_anchors(text)
+        if guard:
+            guard.record('_anchors', (time.perf_counter() - start) * 1000)
+
+        result = {}
+        for field_name, compiled, group in self._fields:
+            if guard:
+                guard.check(field_name)
+                start = time.perf_counter()
+            if group is None:
+                result[field_name] = self._findall_first(text, compiled)
+            else:
+                result[field_name] = self._match_at_anchors(text, compiled, anchors[group])
+            if guard:
+                guard.record(field_name, (time.perf_counter() - start) * 1000)
+        return result
+
+    @staticmethod
+    def _first_value(match) -> str:
+        """与 findall 结果的取值规则一致：单分组取分组，多分组取第一个非空分组"""
+        groups = match.groups()
+        if not groups:
+            value = match.group(0)
+        elif len(groups) == 1:
+            value = groups[0]
+        else:
+            value = groups[0] if groups[0] else groups[1]
+        return (value or '').strip()
+
+    def _match_at_anchors(self, text: str, compiled: List[Any], positions: List[int]) -> str:
+        for regex in compiled:
+            last_end = -1
+            for pos in positions:
+                # findall 的匹配互不重叠，跳过落在上一次匹配内部的锚点
+                if pos < last_end:
+                    continue
+                m = regex.match(text, pos)
+                if not m:
+                    continue
+                last_end = m.end()
+                value = self._first_value(m)
+                if value:
+                    return value
+        return ""
+
+    def _findall_first(self, text: str, compiled: List[Any]) -> str:
+        for regex in compiled:
+            for m in regex.finditer(text):
+                value = self._first_value(m)
+                if value:
+                    return value
+        return ""
@@ -0,0 +1,236 @@
+"""
+PDF 文本提取引擎
+
+旧实现用 PyPDF2 读入全部页面后 text += page.extract_text()（二次方字符串拼接、完全串行），
+且总是读完整个文档，而关键字段都在前几页。本模块：
+
+- iter_pages()：按页序逐页产出文本（生成器，调用方可随时停止，内存只与已读页数相关）；
+- 页数达到 PDF_PARALLEL_MIN_PAGES 时，按页区间分发到进程池并行提取，结果仍按页序产出，
+  在途区间数受限，提前停止时取消剩余任务；进程池在进程内共享（首次使用时以 spawn 方式创建，
+  最多 PDF_MAX_WORKERS 个工作进程），并发提取的多个文档排队使用同一个池；
+- stop_when(pages) 回调返回True时提前停止（由提取策略根据已读页面判断后续页面不再影响结果）；
+- 页面文本按“内容流 + 字体资源”的哈希缓存（进程内LRU），相同页面（重复上传、共用附录页）不再重复解析。
+"""
+
+import os
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from ...config import get_config_value
+
+logger = logging.getLogger(__name__)
+
+
+class PageTextCache:
+    """页面文本LRU缓存（键为页面内容哈希，线程安全）"""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+            return text
+
+    def put(self, key: str, text: str) -> None:
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def page_content_key(page) -> Optional[str]:
+    """页面内容哈希：内容流字节 + 字体资源（字体名、编码、ToUnicode 映射）
+
+    文本提取结果只取决于这两部分；无法读取时返回None（该页不缓存）。
+    """
+    try:
+        digest = hashlib.sha256()
+        contents = page.get_contents()
+        digest.update(contents.get_data() if contents is not None else b'')
+
+        resources = page.get('/Resources')
+        resources = resources.get_object() if resources is not None else {}
+        fonts = resources.get('/Font')
+        fonts = fonts.get_object() if fonts is not None else {}
+        for name in sorted(fonts):
+            font = fonts[name].get_object()
+            digest.update(f"|{name}:{font.get('/BaseFont')}:{font.get('/Subtype')}".encode('utf-8', 'replace'))
+            encoding = font.get('/Encoding')
+            if encoding is not None:
+                digest.update(repr(encoding.get_object()).encode('utf-8', 'replace'))
+            to_unicode = font.get('/ToUnicode')
+            if to_unicode is not None:
+                digest.update(to_unicode.get_object().get_data())
+        return digest.hexdigest()
+    except Exception as e:
+        logger.debug(f"无法计算PDF页面哈希: {str(e)}")
+        return None
+
+
+# ==================== 进程池工作函数 ====================
+
+# 工作进程内复用已打开的 PdfReader（同一文件的多个页区间只解析一次 xref）
+_worker_reader: Optional[Tuple[str, float, object]] = None
+
+
+def _open_reader(file_path: str):
+    import PyPDF2
+    return PyPDF2.PdfReader(file_path)
+
+
+def _extract_page_range(file_path: str, indexes: List[int]) -> List[str]:
+    """在工作进程中提取指定页的文本"""
+    global _worker_reader
+    mtime = os.path.getmtime(file_path)
+    if _worker_reader is None or _worker_reader[0] != file_path or _worker_reader[1] != mtime:
+        _worker_reader = (file_path, mtime, _open_reader(file_path))
+    reader = _worker_reader[2]
+    return [reader.pages[i].extract_text() for i in indexes]
+
+
+# 提取进程池（进程级共享，首次出现未命中缓存的页时创建）
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(max_workers: int) -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn：不复制 Web 服务进程（线程、锁与数据库连接）
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+class PdfTextExtractor:
+    """PDF 逐页文本提取（支持进程池并行、提前停止与页面缓存）"""
+
+    def __init__(self, page_cache: Optional[PageTextCache] = None,
+                 parallel_min_pages: Optional[int] = None,
+                 max_workers: Optional[int] = None,
+                 pages_per_task: int = 8):
+        self.page_cache = page_cache or PageTextCache(int(get_config_value('PDF_PAGE_CACHE_MAX_ENTRIES', 2048)))
+        self._parallel_min_pages = parallel_min_pages
+        self._max_workers = max_workers
+        self.pages_per_task = pages_per_task
+
+    @property
+    def parallel_min_pages(self) -> int:
+        if self._parallel_min_pages is not None:
+            return self._parallel_min_pages
+        return int(get_config_value('PDF_PARALLEL_MIN_PAGES', 40))
+
+    @property
+    def max_workers(self) -> int:
+        if self._max_workers is not None:
+            return self._max_workers
+        return int(get_config_value('PDF_MAX_WORKERS', min(4, os.cpu_count() or 1)))
+
+    def extract_text(self, file_path: str, stop_when: Optional[Callable[[List[str]], bool]] = None) -> str:
+        """提取整篇文本（每页后追加换行，与旧实现一致）"""
+        pages: List[str] = []
+        for text in self.iter_pages(file_path):
+            pages.append(text)
+            if stop_when and stop_when(pages):
+                logger.info(f"PDF提前停止读取: {os.path.basename(file_path)}，已读取 {len(pages)} 页")
+                break
+        return ''.join(f"{text}\n" for text in pages)
+
+    def iter_pages(self, file_path: str, parallel: bool = True) -> Iterator[str]:
+        """按页序逐页产出文本
+
+        parallel=False 时始终在当前线程逐页读取（只读开头几页的调用方，如文档分类，不需要进程池与预取）
+        """
+        reader = _open_reader(file_path)
+        page_count = len(reader.pages)
+        if parallel and page_count >= self.parallel_min_pages and self.max_workers > 1:
+            yield from self._iter_pages_parallel(file_path, reader, page_count)
+            return
+
+        for page in reader.pages:
+            key = page_content_key(page)
+            text = self.page_cache.get(key) if key else None
+            if text is None:
+                text = page.extract_text()
+                if key:
+                    self.page_cache.put(key, text)
+            yield text
+
+    def _iter_pages_parallel(self, file_path: str, reader, page_count: int) -> Iterator[str]:
+        """按页区间并行提取：主进程计算页面哈希并命中缓存，未命中的页交给共享进程池"""
+        max_in_flight = self.max_workers * 2
+        # 在途区间：(各页哈希, 各页已缓存文本或None, 未命中页, 未命中页的Future)
+        pending: 'deque' = deque()
+        next_start = 0
+        try:
+            while pending or next_start < page_count:
+                while next_start < page_count and len(pending) < max_in_flight:
+                    end = min(next_start + self.pages_per_task, page_count)
+                    keys = [page_content_key(reader.pages[i]) for i in range(next_start, end)]
+                    cached = [self.page_cache.get(k) if k else None for k in keys]
+                    misses = [next_start + offset for offset, text in enumerate(cached) if text is None]
+                    future = None
+                    if misses:
+                        # 全部命中缓存的文档不产生进程开销
+                        try:
+                            future = _get_executor(self.max_workers).submit(_extract_page_range, file_path, misses)
+                        except BrokenProcessPool:
+                            _reset_executor()
+                    pending.append((keys, cached, misses, future))
+                    next_start = end
+
+                keys, cached, misses, future = pending.popleft()
+                extracted = iter(self._range_result(reader, misses, future))
+                for key, text in zip(keys, cached):
+                    if text is None:
+                        text = next(extracted)
+                        if key:
+                            self.page_cache.put(key, text)
+                    yield text
+        finally:
+            # 正常结束或调用方提前停止：取消本文档尚未开始的区间（进程池继续为其它文档服务）
+            for _keys, _cached, _misses, future in pending:
+                if future is not None:
+                    future.cancel()
+
+    @staticmethod
+    def _range_result(reader, misses: List[int], future) -> List[str]:
+        """取回区间结果；进程池不可用（工作进程异常退出）时在当前进程提取"""
+        if future is not None:
+            try:
+                return future.result()
+            except BrokenProcessPool:
+                logger.warning("PDF提取进程池异常，重建进程池并在当前进程提取该区间")
+                _reset_executor()
+        return [reader.pages[i].extract_text() for i in misses]
+
+
+# 进程内共享的提取器（页面缓存跨文档复用）
+pdf_text_extractor = PdfTextExtractor()
@@ -0,0 +1,167 @@
+"""
+规则执行保护
+
+畸形文档可能让部分规则（如 company_address 的 [\\s\\S]*? 加多行前瞻、Trade name 的惰性多行匹配）
+发生严重回溯，单个异常上传就能长时间占满一个 worker。本模块提供：
+
+- RuleGuard：单个文档的规则执行上下文，记录每条规则的耗时，并在每条规则前检查文档时间预算；
+- RuleGuard.alarm()：在主线程（gunicorn sync worker）中用 SIGALRM 中断正在执行的正则
+  （CPython 的正则引擎会周期性检查信号），其它线程中退化为规则间的协作式检查；
+- run_guarded()：在规则保护下执行规则；当前线程收不到信号、且调用方通过 delegate_rules() 提供了
+  能收到信号的线程（如流式接口的请求线程）时，把规则转交该线程执行；
+- compile_linear()：可选的线性时间正则后端（google-re2），用于标记为 risky 的规则。
+
+当前规则上下文通过 ContextVar 传递，策略实例可在多线程间共享。
+"""
+
+import re
+import time
+import signal
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import re2  # type: ignore
+except ImportError:  # 可选依赖：未安装时所有规则使用标准 re 引擎
+    re2 = None
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionTimeoutError(Exception):
+    """单个文档的规则执行超出时间预算"""
+
+
+_current_guard: contextvars.ContextVar = contextvars.ContextVar('rule_guard', default=None)
+# 规则转交执行函数：runner(func) 在其它线程中执行 func 并返回其结果
+_rule_runner: contextvars.ContextVar = contextvars.ContextVar('rule_runner', default=None)
+
+
+def current_guard() -> Optional['RuleGuard']:
+    """返回当前线程/上下文中生效的规则保护，没有则返回None"""
+    return _current_guard.get()
+
+
+def linear_engine_available() -> bool:
+    return re2 is not None
+
+
+def compile_linear(pattern: str, flags: int):
+    """使用 RE2 编译正则（通过内联标志传递大小写/多行语义），不可用或不兼容时返回None"""
+    if re2 is None:
+        return None
+    inline = ''
+    if flags & re.IGNORECASE:
+        inline += 'i'
+    if flags & re.MULTILINE:
+        inline += 'm'
+    try:
+        return re2.compile(f"(?{inline}){pattern}" if inline else pattern)
+    except Exception as e:
+        logger.warning(f"RE2 无法编译规则，回退到 re 引擎 {pattern}: {str(e)}")
+        return None
+
+
+class RuleGuard:
+    """单个文档的规则执行上下文：时间预算 + 每条规则耗时"""
+
+    def __init__(self, budget_seconds: float, slow_rule_ms: float = 200.0):
+        self.budget_seconds = budget_seconds
+        self.slow_rule_ms = slow_rule_ms
+        self.started_at = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    def can_interrupt(self) -> bool:
+        """当前线程能否用 SIGALRM 强制中断正则"""
+        return bool(
+            self.budget_seconds
+            and hasattr(signal, 'setitimer')
+            and threading.current_thread() is threading.main_thread()
+        )
+
+    def remaining(self) -> float:
+        return self.budget_seconds - (time.perf_counter() - self.started_at)
+
+    def check(self, rule_name: str = '') -> None:
+        """规则之间的协作式预算检查"""
+        if self.budget_seconds and self.remaining() <= 0:
+            raise ExtractionTimeoutError(
+                f"规则执行超出时间预算 {self.budget_seconds:g}s" + (f"（停止于 {rule_name}）" if rule_name else '')
+            )
+
+    def record(self, rule_name: str, elapsed_ms: float) -> None:
+        """累计一条规则的耗时（毫秒），超过慢规则阈值时记录告警"""
+        self.timings[rule_name] = round(self.timings.get(rule_name, 0.0) + elapsed_ms, 3)
+        if elapsed_ms >= self.slow_rule_ms:
+            logger.warning(f"慢规则 {rule_name}: {elapsed_ms:.1f}ms")
+
+    @contextmanager
+    def timed(self, rule_name: str):
+        """执行一条规则：执行前检查预算，执行后累计耗时"""
+        self.check(rule_name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(rule_name, (time.perf_counter() - start) * 1000)
+
+    @contextmanager
+    def activate(self):
+        """将本对象设为当前规则上下文"""
+        token = _current_guard.set(self)
+        try:
+            yield self
+        finally:
+            _current_guard.reset(token)
+
+    @contextmanager
+    def alarm(self):
+        """在主线程中用 SIGALRM 强制中断超出预算的正则匹配；其它线程仅做协作式检查"""
+        if not self.can_interrupt():
+            yield
+            return
+
+        self.check()
+
+        def _on_alarm(signum, frame):
+            raise ExtractionTimeoutError(f"规则执行超出时间预算 {self.budget_seconds:g}s")
+
+        previous_handler = signal.signal(signal.SIGALRM, _on_alarm)
+        previous_timer = signal.setitimer(signal.ITIMER_REAL, max(self.remaining(), 0.001))
+        armed_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+            # 恢复外层已有的定时器（扣除本次设置定时器以来经过的时间）
+            if previous_timer[0] > 0:
+                elapsed = time.perf_counter() - armed_at
+                signal.setitimer(signal.ITIMER_REAL, max(previous_timer[0] - elapsed, 0.001), previous_timer[1])
+
+
+@contextmanager
+def delegate_rules(runner: Callable[[Callable[[], Any]], Any]):
+    """在此上下文中（非主线程），run_guarded 把规则交给 runner 执行（runner 应在主线程中调用 func）"""
+    token = _rule_runner.set(runner)
+    try:
+        yield
+    finally:
+        _rule_runner.reset(token)
+
+
+def run_guarded(guard: RuleGuard, func: Callable[[], Any]) -> Any:
+    """在规则保护下执行 func（activate + alarm）"""
+    def call():
+        with guard.activate(), guard.alarm():
+            return func()
+
+    runner = _rule_runner.get()
+    if runner is not None and not guard.can_interrupt():
+        # 在转交的线程中沿用当前上下文（日志、取消令牌等）
+        context = contextvars.copy_context()
+        return runner(lambda: context.run(call))
+    return call()
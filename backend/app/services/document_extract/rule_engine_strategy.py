@@ -7,17 +7,20 @@
 import os
 import uuid
 from datetime import datetime
-from flask import current_app
-from ..file_upload_service import FileUploadService
+from ..image_staging import image_staging_service
 import re
 import zipfile
 import platform
 import xml.etree.ElementTree as ET
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, List
 from abc import abstractmethod
 import logging
 
 from .document_extract import BaseExtractionStrategy
+from .field_scanner import FieldScanner
+from .pdf_text import pdf_text_extractor
+from .regex_guard import RuleGuard, ExtractionTimeoutError, run_guarded
+from ...config import get_config_value
 
 logger = logging.getLogger(__name__)
 
@@ -36,29 +39,55 @@ class RuleEngineExtractionStrategy(BaseExtractionStrategy):
     - _post_process_data(): 后处理提取的数据
     """
 
+    # 各策略类的预编译扫描器（字段规则按类定义，每个类、每种正则引擎只编译一次）
+    _scanner_cache: Dict[tuple, FieldScanner] = {}
+
     def __init__(self):
         self.field_patterns = self._build_field_patterns()
+        self._scanner = self._get_field_scanner()
+
+    def _get_field_scanner(self) -> FieldScanner:
+        """获取当前策略类的预编译扫描器（按类与正则引擎缓存）"""
+        engine = str(get_config_value('EXTRACTION_REGEX_ENGINE', 're')).lower()
+        key = (type(self), engine)
+        scanner = RuleEngineExtractionStrategy._scanner_cache.get(key)
+        if scanner is None:
+            scanner = FieldScanner(self.field_patterns, engine=engine)
+            RuleEngineExtractionStrategy._scanner_cache[key] = scanner
+        return scanner
+
+    def _create_rule_guard(self) -> RuleGuard:
+        """创建单个文档的规则保护（时间预算从开始提取文本时计起）"""
+        return RuleGuard(
+            budget_seconds=float(get_config_value('EXTRACTION_TIME_BUDGET', 20)),
+            slow_rule_ms=float(get_config_value('EXTRACTION_SLOW_RULE_MS', 200))
+        )
 
     def extract(self, file_path: str) -> Dict[str, Any]:
-        """从文档中提取结构化信息"""
+        """从文档中提取结构化信息
+
+        返回 {'result': 提取结果, 'rule_timings_ms': 各规则耗时}；
+        规则执行超出文档时间预算时抛出 ExtractionTimeoutError。
+        """
+        guard = self._create_rule_guard()
         try:
             # 1. 提取文档文本
             text = self._extract_text_from_file(file_path)
             if not text:
                 raise Exception("无法从文档中提取文本内容")
 
-            # 2. 应用正则规则提取字段
-            extracted_data = self._apply_extraction_rules(text)
+            # 2. 应用正则规则提取字段（在规则保护下执行：逐规则计时，超出预算即中断）
+            extracted_data = run_guarded(guard, lambda: self._apply_extraction_rules(text))
             
             # 2.1 提取第一页图片（仅DOCX，且不包含页眉/页脚）用于商标识别等
             first_page_images = []
             try:
                 if os.path.splitext(file_path.lower())[1] == '.docx':
                     first_page_images = self._extract_first_page_images_from_docx(file_path)
-                    # 保存图片到 uploads/company/marks 并返回路径
-                    saved_paths = self._save_first_page_images(first_page_images)
+                    # 图片先放入暂存区（按内容去重），表单或公司保存时才转存到 uploads/company/marks
+                    staged_paths = image_staging_service.stage(first_page_images)
                     # 暂存到提取结果，供模板后处理使用
-                    extracted_data['_first_page_images'] = saved_paths
+                    extracted_data['_first_page_images'] = staged_paths
             except Exception as _:
                 # 图片提取失败不阻断主流程
                 extracted_data['_first_page_images'] = []
@@ -66,8 +95,11 @@ class RuleEngineExtractionStrategy(BaseExtractionStrategy):
             # 3. 后处理和验证
             processed_data = self._post_process_data(extracted_data)
             
-            return {'result': processed_data}
-            
+            return {'result': processed_data, 'rule_timings_ms': guard.timings}
+
+        except ExtractionTimeoutError as e:
+            logger.warning(f"规则引擎提取超时: {str(e)}，已完成规则耗时: {guard.timings}")
+            raise
         except Exception as e:
             logger.error(f"规则引擎提取失败: {str(e)}")
             raise Exception(f"规则引擎提取失败: {str(e)}")
@@ -140,15 +172,9 @@ class RuleEngineExtractionStrategy(BaseExtractionStrategy):
             raise Exception(f"DOCX文本提取失败: {str(e)}")
 
     def _extract_pdf_text(self, file_path: str) -> str:
-        """从PDF文件中提取文本（需要安装PyPDF2或pdfplumber）"""
+        """从PDF文件中提取文本（需要安装PyPDF2；逐页提取，大文件并行，满足停止条件后不再读取后续页面）"""
         try:
-            import PyPDF2
-            with open(file_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
+            return pdf_text_extractor.extract_text(file_path, stop_when=self._create_pdf_stop_condition())
         except ImportError:
             logger.warning("PyPDF2未安装，无法提取PDF文本")
             return ""
@@ -156,6 +182,14 @@ class RuleEngineExtractionStrategy(BaseExtractionStrategy):
             logger.error(f"PDF文本提取失败: {str(e)}")
             return ""
 
+    def _create_pdf_stop_condition(self) -> Optional[Callable[[List[str]], bool]]:
+        """PDF 提前停止条件（每个文档新建一个，可在内部保存状态）
+
+        返回的回调接收已读取的页面文本列表，返回True表示后续页面不会再影响提取结果；
+        默认返回None，即读完全部页面。
+        """
+        return None
+
     def _convert_doc_to_docx(self, file_path: str) -> str:
         """将DOC文件转换为DOCX（复用现有逻辑）"""
         try:
@@ -185,8 +219,12 @@ class RuleEngineExtractionStrategy(BaseExtractionStrategy):
             logger.error(f"DOC转DOCX失败: {str(e)}")
             return ""
 
+    def _scan_fields(self, text: str) -> Dict[str, str]:
+        """使用预编译扫描器一次性提取全部字段（锚点单遍定位 + 定点匹配）"""
+        return self._scanner.scan(text)
+
     def _extract_field_value(self, text: str, field_config: Dict[str, Any]) -> str:
-        """使用正则表达式提取单个字段值（通用方法）"""
+        """使用正则表达式提取单个字段值（通用方法，逐字段全文扫描）"""
         patterns = field_config.get('patterns', [])
         
         for pattern in patterns:
@@ -289,44 +327,3 @@ class RuleEngineExtractionStrategy(BaseExtractionStrategy):
                         images.append({'filename': media_path.split('/')[-1], 'bytes': imgf.read()})
             return images
 
-    def _save_first_page_images(self, images):
-        """保存第一页图片到 uploads/company/marks 并返回相对路径列表。
-
-        images: [{'filename': str, 'bytes': bytes}]
-        返回: ["/uploads/company/marks/<generated>.ext", ...]
-        """
-        # 基础上传目录：优先使用 Flask 配置 UPLOAD_FOLDER，回退到 backend/uploads
-        try:
-            base_dir = current_app.config.get('UPLOAD_FOLDER')  # type: ignore[attr-defined]
-        except Exception:
-            base_dir = None
-        if not base_dir:
-            backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            base_dir = os.path.join(backend_dir, 'uploads')
-
-        # 使用已有工具创建 company/marks 目录
-        marks_dir = FileUploadService.create_upload_directory(base_dir, 'company', 'marks')
-
-        saved_paths = []
-
-        for index, item in enumerate(images, start=1):
-            original = item.get('filename', 'image')
-            # 使用通用工具生成安全文件名（带时间戳与UUID）
-            filename = FileUploadService.generate_safe_filename(
-                original_filename=original,
-                prefix='company_marks',
-                include_timestamp=True,
-                include_uuid=True
-            )
-            abs_path = os.path.join(marks_dir, filename)
-            try:
-                with open(abs_path, 'wb') as f:
-                    f.write(item.get('bytes', b''))
-                # 提供给前端/调用方的相对路径（以后端为根的静态访问路径约定）
-                rel_path = os.path.join('/uploads', 'company', 'marks', filename).replace('\\', '/')
-                saved_paths.append(rel_path)
-            except Exception:
-                continue
-
-        return saved_paths
-
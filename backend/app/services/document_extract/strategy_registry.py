@@ -0,0 +1,67 @@
+"""
+提取策略注册表
+
+各提取策略类通过 DOCUMENT_TYPE（文档类型标识）与 FINGERPRINT（DocumentFingerprint）登记，
+DocumentExtractionService 先用 DocumentClassifier 判断文档类型，再交给对应策略提取。
+策略实例按需创建并复用。
+"""
+
+import threading
+from typing import Dict, List, Optional, Type
+
+from .document_classifier import DocumentFingerprint
+
+
+class StrategyRegistry:
+    """文档类型 -> 提取策略"""
+
+    def __init__(self):
+        self._classes: Dict[str, type] = {}
+        self._instances: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, strategy_cls: Type) -> Type:
+        """登记策略类（也可作为类装饰器使用）"""
+        doc_type = getattr(strategy_cls, 'DOCUMENT_TYPE', None)
+        if not doc_type:
+            raise ValueError(f"策略 {strategy_cls.__name__} 未定义 DOCUMENT_TYPE")
+        if not isinstance(getattr(strategy_cls, 'FINGERPRINT', None), DocumentFingerprint):
+            raise ValueError(f"策略 {strategy_cls.__name__} 未定义 FINGERPRINT")
+        with self._lock:
+            self._classes[doc_type] = strategy_cls
+            self._instances.pop(doc_type, None)
+        return strategy_cls
+
+    def document_types(self) -> List[str]:
+        return list(self._classes)
+
+    def fingerprints(self) -> Dict[str, DocumentFingerprint]:
+        return {doc_type: cls.FINGERPRINT for doc_type, cls in self._classes.items()}
+
+    def get(self, doc_type: str) -> Optional[object]:
+        """获取文档类型对应的策略实例，未登记返回None"""
+        strategy = self._instances.get(doc_type)
+        if strategy is not None:
+            return strategy
+        cls = self._classes.get(doc_type)
+        if cls is None:
+            return None
+        with self._lock:
+            strategy = self._instances.get(doc_type)
+            if strategy is None:
+                strategy = cls()
+                self._instances[doc_type] = strategy
+        return strategy
+
+    def default(self) -> Optional[object]:
+        """第一个登记的策略（兼容只有单一策略时的旧接口）"""
+        for doc_type in self._classes:
+            return self.get(doc_type)
+        return None
+
+    def get_signature(self) -> str:
+        """注册表签名：各策略签名与指纹，参与提取缓存键的计算（新增策略或调整指纹都会使缓存失效）"""
+        return '|'.join(
+            f"{doc_type}={cls.get_signature()}:{cls.FINGERPRINT.describe()}"
+            for doc_type, cls in sorted(self._classes.items())
+        )
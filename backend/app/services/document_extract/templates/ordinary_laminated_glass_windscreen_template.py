@@ -6,9 +6,11 @@
 
 import re
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Callable, Optional
 
 from ..rule_engine_strategy import RuleEngineExtractionStrategy
+from ..document_classifier import DocumentFingerprint
+from ..vehicle_tokenizer import VehicleBlockTokenizer, VehicleFieldSpec
 
 logger = logging.getLogger(__name__)
 
@@ -24,78 +26,146 @@ class OrdinaryLaminatedGlassWindscreenTemplate(RuleEngineExtractionStrategy):
     - 后处理商标名称、选择字段、夹层颜色等数据
     """
 
+    # 修改字段规则或后处理逻辑时递增，使提取缓存失效
+    STRATEGY_VERSION = '1'
+
+    # 文档类型与分类指纹（在文档开头几KB的可见文本中判断）
+    DOCUMENT_TYPE = 'ordinary_laminated_glass_windscreen'
+    FINGERPRINT = DocumentFingerprint(
+        required=[r'laminated[\s-]+glass\s+windscreen'],
+        signals=[
+            r'Ordinary\s+laminated',
+            r'Class\s+of\s+safety-glass\s+pane',
+            r'Number\s+of\s+layers\s+of\s+interlayer',
+            r'Nominal\s+thickness\s+of\s+the\s+windscreen',
+            r'Name\s+and\s+address\s+of\s+manufacturer',
+        ],
+        # 相近类型：处理过的层压玻璃、玻璃-塑料风窗、钢化玻璃、中空玻璃
+        excluded=[r'treated\s+laminated', r'glass[\s-]+plastics?\s+windscreen', r'toughened', r'double[\s-]+glazed'],
+    )
+
+    # PDF 提前停止：这些表头字段均已提取到、且车辆列表之后出现了不含车辆字段的页面时，不再读取后续页面
+    # （表头各字段都位于车辆列表之前，后续页面只可能是图纸/附录）
+    REQUIRED_FIELDS = ('approval_no', 'information_folder_no', 'safety_class',
+                       'trade_names', 'company_name', 'company_address')
+
+    # 车辆列表分词器：以 "Vehicle manufacturer" 为区块起点，各字段规则与区块内正则逐一对应
+    _vehicle_tokenizer = VehicleBlockTokenizer(r'Vehicle\s+manufacturer\s*:', [
+        VehicleFieldSpec(('veh_mfr',), r'Vehicle\s+manufacturer\s*:\s*([^\n]+)'),
+        VehicleFieldSpec(('veh_type',), r'Type\s+of\s+vehicle\s*:\s*([^\n]+)'),
+        VehicleFieldSpec(('veh_cat',), r'Vehicle\s+category\s*:\s*([^\n]+)'),
+        VehicleFieldSpec(('dev_area',), r'Developed\s+area\s*\(F\)', r'([0-9.]+)\s*m[2²]'),
+        VehicleFieldSpec(('seg_height',), r'Height\s+of\s+segment\s*\(h\)', r'([0-9.]+)\s*mm'),
+        VehicleFieldSpec(('curv_radius',), r'Curvature\s*\(r\)', r'([0-9.]+)\s*mm'),
+        VehicleFieldSpec(('inst_angle',), r'Installation\s+angle\s*\([^)]+\)', r'([0-9.]+)\s*°?'),
+        VehicleFieldSpec(('seat_angle',), r'Seat-back\s+angle\s*\([^)]+\)', r'([0-9.]+)\s*°?'),
+        VehicleFieldSpec(('rpoint_coords', 'A'), r'R-point\s+coordinates', r'A:\s*([-+±]?\s*[0-9.]+)\s*mm'),
+        VehicleFieldSpec(('rpoint_coords', 'B'), r'R-point\s+coordinates', r'B:\s*([-+±]?\s*[0-9.]+)\s*mm'),
+        VehicleFieldSpec(('rpoint_coords', 'C'), r'R-point\s+coordinates', r'C:\s*([-+±]?\s*[0-9.]+)\s*mm'),
+        VehicleFieldSpec(('dev_desc',), r'Description\s+of\s+the\s+commercially\s+available[^:]*:\s*([^\n]*)'),
+    ])
+
     def _build_field_patterns(self) -> Dict[str, Dict[str, Any]]:
         """构建普通层压玻璃挡风玻璃模板的字段提取规则"""
-        # 通用模式创建函数
-        def create_patterns(pattern):
-            return {'patterns': [pattern], 'priority': 1}
+        # 通用模式创建函数（anchor 为字段标签，必须是 pattern 的前缀，供单遍扫描器定位）
+        # linear_pattern：有回溯风险的规则的 RE2 兼容写法（捕获内容相同），提供即标记为 risky
+        def create_patterns(pattern, anchor, linear_pattern=None):
+            config = {'patterns': [pattern], 'priority': 1, 'anchor': anchor}
+            if linear_pattern:
+                config['risky'] = True
+                config['linear_patterns'] = [linear_pattern]
+            return config
         
         return {
             'approval_no': create_patterns(
-                r'Approval\s+No\s*\n\s*([A-Z0-9\*\/\-]+)'  # 匹配英文批准号格式，换行后跟字母数字和特殊字符
+                r'Approval\s+No\s*\n\s*([A-Z0-9\*\/\-]+)',  # 匹配英文批准号格式，换行后跟字母数字和特殊字符
+                r'Approval\s+No'
             ),
             'information_folder_no': create_patterns(
-                r'Information\s+folder\s+number\s*:\s*([0-9]+)'  # 匹配英文信息文件夹号，冒号后跟数字
+                r'Information\s+folder\s+number\s*:\s*([0-9]+)',  # 匹配英文信息文件夹号，冒号后跟数字
+                r'Information\s+folder\s+number'
             ),
             'safety_class': create_patterns(
-                r'Class\s+of\s+safety-glass\s+pane\s*:\s*([^:\n]+)'  # 匹配英文安全等级，冒号后跟非冒号换行字符
+                r'Class\s+of\s+safety-glass\s+pane\s*:\s*([^:\n]+)',  # 匹配英文安全等级，冒号后跟非冒号换行字符
+                r'Class\s+of\s+safety-glass\s+pane'
             ),
             'pane_desc': create_patterns(
-                r'Description\s+of\s+glass\s+pane\s*:\s*([^:\n]+)'  # 匹配英文玻璃板描述，冒号后跟非冒号换行字符
+                r'Description\s+of\s+glass\s+pane\s*:\s*([^:\n]+)',  # 匹配英文玻璃板描述，冒号后跟非冒号换行字符
+                r'Description\s+of\s+glass\s+pane'
             ),
             'trade_names': create_patterns(
-                r'Trade\s+name\s*:\s*([^:\n]+(?:\n[^:\n]+)*?)(?=\nName\s+and\s+address\s+of\s+manufacturer)'  # 匹配Trade name和Name and address of manufacturer之间的内容
+                r'Trade\s+name\s*:\s*([^:\n]+(?:\n[^:\n]+)*?)(?=\nName\s+and\s+address\s+of\s+manufacturer)',  # 匹配Trade name和Name and address of manufacturer之间的内容
+                r'Trade\s+name',
+                r'Trade\s+name\s*:\s*([^:\n]+(?:\n[^:\n]+)*?)\nName\s+and\s+address\s+of\s+manufacturer'
             ),
             'company_name': create_patterns(
-                r'Name\s+and\s+address\s+of\s+manufacturer\s*:?\s*(?:\n\s*[:]*\s*)?([^\n]+)'  # 匹配制造商名称：支持值在下一行且包含逗号
+                r'Name\s+and\s+address\s+of\s+manufacturer\s*:?\s*(?:\n\s*[:]*\s*)?([^\n]+)',  # 匹配制造商名称：支持值在下一行且包含逗号
+                r'Name\s+and\s+address\s+of\s+manufacturer'
             ),
             'company_address': create_patterns(
-                r'Name\s+and\s+address\s+of\s+manufacturer\s*:?\s*(?:\n\s*[:]*\s*)?(?:[^\n]*\n)([\s\S]*?)(?=^(?:Principal\s+characteristics|Secondary\s+characteristics|Number\s+of\s+layers|Remarks)\b|\Z)'  # 跳过首行名称，捕获后续多行地址，直到下一节标题行
+                r'Name\s+and\s+address\s+of\s+manufacturer\s*:?\s*(?:\n\s*[:]*\s*)?(?:[^\n]*\n)([\s\S]*?)(?=^(?:Principal\s+characteristics|Secondary\s+characteristics|Number\s+of\s+layers|Remarks)\b|\Z)',  # 跳过首行名称，捕获后续多行地址，直到下一节标题行
+                r'Name\s+and\s+address\s+of\s+manufacturer',
+                r'Name\s+and\s+address\s+of\s+manufacturer\s*:?\s*(?:\n\s*[:]*\s*)?(?:[^\n]*\n)([\s\S]*?)(?:^(?:Principal\s+characteristics|Secondary\s+characteristics|Number\s+of\s+layers|Remarks)\b|\z)'
             ),
             'glass_layers': create_patterns(
-                r'Number\s+of\s+layers\s+of\s+glass\s*:\s*(\d+)'  # 匹配英文玻璃层数，冒号后跟数字
+                r'Number\s+of\s+layers\s+of\s+glass\s*:\s*(\d+)',  # 匹配英文玻璃层数，冒号后跟数字
+                r'Number\s+of\s+layers\s+of\s+glass'
             ),
             'interlayer_layers': create_patterns(
-                r'Number\s+of\s+layers\s+of\s+interlayer\s*:\s*(\d+)'  # 匹配英文夹层数，冒号后跟数字
+                r'Number\s+of\s+layers\s+of\s+interlayer\s*:\s*(\d+)',  # 匹配英文夹层数，冒号后跟数字
+                r'Number\s+of\s+layers\s+of\s+interlayer'
             ),
             'windscreen_thick': create_patterns(
-                r'Nominal\s+thickness\s+of\s+the\s+windscreen\s*:\s*([0-9.]+)\s*mm'  # 匹配英文风窗厚度，冒号后跟数字加mm
+                r'Nominal\s+thickness\s+of\s+the\s+windscreen\s*:\s*([0-9.]+)\s*mm',  # 匹配英文风窗厚度，冒号后跟数字加mm
+                r'Nominal\s+thickness\s+of\s+the\s+windscreen'
             ),
             'interlayer_thick': create_patterns(
-                r'Nominal\s+thickness\s+of\s+interlayer\(s\)\s*:\s*([0-9.]+)\s*mm'  # 匹配英文夹层厚度，冒号后跟数字加mm
+                r'Nominal\s+thickness\s+of\s+interlayer\(s\)\s*:\s*([0-9.]+)\s*mm',  # 匹配英文夹层厚度，冒号后跟数字加mm
+                r'Nominal\s+thickness\s+of\s+interlayer'
             ),
             'glass_treatment': create_patterns(
-                r'Special\s+treatment\s+of\s+glass\s*:\s*([^:\n]+)'  # 匹配英文玻璃处理，冒号后跟非冒号换行字符
+                r'Special\s+treatment\s+of\s+glass\s*:\s*([^:\n]+)',  # 匹配英文玻璃处理，冒号后跟非冒号换行字符
+                r'Special\s+treatment\s+of\s+glass'
             ),
             'interlayer_type': create_patterns(
-                r'Nature\s+and\s+type\s+of\s+interlayer\(s\)\s*:\s*([^:\n]+)'  # 匹配英文夹层类型，冒号后跟非冒号换行字符
+                r'Nature\s+and\s+type\s+of\s+interlayer\(s\)\s*:\s*([^:\n]+)',  # 匹配英文夹层类型，冒号后跟非冒号换行字符
+                r'Nature\s+and\s+type\s+of\s+interlayer'
             ),
             'coating_type': create_patterns(
-                r'Nature\s+and\s+type\s+of\s+plastics\s+coating\(s\)\s*:\s*([^:\n]+)'  # 匹配英文涂层类型，冒号后跟非冒号换行字符
+                r'Nature\s+and\s+type\s+of\s+plastics\s+coating\(s\)\s*:\s*([^:\n]+)',  # 匹配英文涂层类型，冒号后跟非冒号换行字符
+                r'Nature\s+and\s+type\s+of\s+plastics\s+coating'
             ),
             'coating_thick': create_patterns(
-                r'Nominal\s+thickness\s+of\s+plastic\s+coating\(s\)\s*:\s*([^:\n]+)'  # 匹配英文涂层厚度，冒号后跟非冒号换行字符
+                r'Nominal\s+thickness\s+of\s+plastic\s+coating\(s\)\s*:\s*([^:\n]+)',  # 匹配英文涂层厚度，冒号后跟非冒号换行字符
+                r'Nominal\s+thickness\s+of\s+plastic\s+coating'
             ),
             'material_nature': create_patterns(
-                r'Nature\s+of\s+the\s+material\s*\([^)]+\)\s*:\s*([^:\n]+)'  # 匹配英文材料性质，括号内容后冒号跟非冒号换行字符
+                r'Nature\s+of\s+the\s+material\s*\([^)]+\)\s*:\s*([^:\n]+)',  # 匹配英文材料性质，括号内容后冒号跟非冒号换行字符
+                r'Nature\s+of\s+the\s+material'
             ),
             'glass_color_choice': create_patterns(
-                r'Colouring\s+of\s+glass\s*\([^)]+\)\s*:\s*([^:\n]+)'  # 匹配英文玻璃颜色，括号内容后冒号跟非冒号换行字符
+                r'Colouring\s+of\s+glass\s*\([^)]+\)\s*:\s*([^:\n]+)',  # 匹配英文玻璃颜色，括号内容后冒号跟非冒号换行字符
+                r'Colouring\s+of\s+glass'
             ),
             'coating_color': create_patterns(
-                r'Colouring\s+of\s+plastics\s+coating\(s\)\s*:\s*([^:\n]+)'  # 匹配英文涂层颜色，冒号后跟非冒号换行字符
+                r'Colouring\s+of\s+plastics\s+coating\(s\)\s*:\s*([^:\n]+)',  # 匹配英文涂层颜色，冒号后跟非冒号换行字符
+                r'Colouring\s+of\s+plastics\s+coating'
             ),
             'interlayer_coloring': create_patterns(
-                r'Colouring\s+of\s+interlayer\s*\([^)]+\)\s*:\s*([^:\n]+)'  # 匹配英文夹层颜色，括号内容后冒号跟非冒号换行字符
+                r'Colouring\s+of\s+interlayer\s*\([^)]+\)\s*:\s*([^:\n]+)',  # 匹配英文夹层颜色，括号内容后冒号跟非冒号换行字符
+                r'Colouring\s+of\s+interlayer'
             ),
             'conductors': create_patterns(
-                r'Conductors\s+incorporated\s*\([^)]+\)\s*:\s*([^:\n]+)'  # 匹配英文导体信息，括号内容后冒号跟非冒号换行字符
+                r'Conductors\s+incorporated\s*\([^)]+\)\s*:\s*([^:\n]+)',  # 匹配英文导体信息，括号内容后冒号跟非冒号换行字符
+                r'Conductors\s+incorporated'
             ),
             'opaque_obscuration': create_patterns(
-                r'Opaque\s+obscuration\s+incorporated\s*\([^)]+\)\s*:\s*([^:\n]+)'  # 匹配英文不透明模糊信息，括号内容后冒号跟非冒号换行字符
+                r'Opaque\s+obscuration\s+incorporated\s*\([^)]+\)\s*:\s*([^:\n]+)',  # 匹配英文不透明模糊信息，括号内容后冒号跟非冒号换行字符
+                r'Opaque\s+obscuration\s+incorporated'
             ),
             'remarks': create_patterns(
-                r'Remarks\s*:\s*([^:\n]+)'  # 匹配英文备注，冒号后跟非冒号换行字符
+                r'Remarks\s*:\s*([^:\n]+)',  # 匹配英文备注，冒号后跟非冒号换行字符
+                r'Remarks'
             )
         }
 
@@ -106,9 +176,8 @@ class OrdinaryLaminatedGlassWindscreenTemplate(RuleEngineExtractionStrategy):
         # 保存原始文本供后处理使用
         extracted_data['_original_text'] = text
         
-        # 提取主要字段
-        for field_name, field_config in self.field_patterns.items():
-            extracted_data[field_name] = self._extract_field_value(text, field_config)
+        # 提取主要字段（预编译扫描器：一遍定位各字段锚点，再在锚点处定点匹配）
+        extracted_data.update(self._scan_fields(text))
         
         # 提取车辆信息
         vehicles = self._extract_vehicles(text)
@@ -117,45 +186,36 @@ class OrdinaryLaminatedGlassWindscreenTemplate(RuleEngineExtractionStrategy):
         return extracted_data
 
     def _extract_vehicles(self, text: str) -> list:
-        """提取车辆信息列表 - 独立块和独立字段匹配模式"""
+        """提取车辆信息列表 - 按区块单遍分词，每个区块独立匹配各字段（任意一项匹配不到为空）"""
         vehicles = []
-        
-        # 以 "Vehicle manufacturer" 为界，将文本拆分为多个独立的车辆区块
-        blocks = re.split(r'(?=Vehicle\s+manufacturer\s*:)', text, flags=re.IGNORECASE)
-        
-        for block in blocks:
-            # 过滤掉非车辆内容的无效切片
-            if not block.strip() or not re.search(r'Vehicle\s+manufacturer\s*:', block, re.IGNORECASE):
-                continue
-                
-            # 在块内独立匹配各个属性（任意一项匹配不到为空格即可，互不影响）
-            def get_val(pattern):
-                match = re.search(pattern, block, re.IGNORECASE)
-                return match.group(1).strip() if match else ""
-                
-            vehicle = {
-                'veh_mfr': get_val(r'Vehicle\s+manufacturer\s*:\s*([^\n]+)'),
-                'veh_type': get_val(r'Type\s+of\s+vehicle\s*:\s*([^\n]+)'),
-                'veh_cat': get_val(r'Vehicle\s+category\s*:\s*([^\n]+)'),
-                'dev_area': get_val(r'Developed\s+area\s*\(F\)[\s\S]*?([0-9.]+)\s*m[2²]'),
-                'seg_height': get_val(r'Height\s+of\s+segment\s*\(h\)[\s\S]*?([0-9.]+)\s*mm'),
-                'curv_radius': get_val(r'Curvature\s*\(r\)[\s\S]*?([0-9.]+)\s*mm'),
-                'inst_angle': get_val(r'Installation\s+angle\s*\([^)]+\)[\s\S]*?([0-9.]+)\s*°?'),
-                'seat_angle': get_val(r'Seat-back\s+angle\s*\([^)]+\)[\s\S]*?([0-9.]+)\s*°?'),
-                'rpoint_coords': {
-                    'A': get_val(r'R-point\s+coordinates[\s\S]*?A:\s*([-+±]?\s*[0-9.]+)\s*mm'),
-                    'B': get_val(r'R-point\s+coordinates[\s\S]*?B:\s*([-+±]?\s*[0-9.]+)\s*mm'),
-                    'C': get_val(r'R-point\s+coordinates[\s\S]*?C:\s*([-+±]?\s*[0-9.]+)\s*mm')
-                },
-                'dev_desc': get_val(r'Description\s+of\s+the\s+commercially\s+available[^:]*:\s*([^\n]*)')
-            }
-            
+        for vehicle in self._vehicle_tokenizer.tokenize(text):
             # 只要制造商或车辆类型存在，就认为有效
             if vehicle['veh_mfr'] or vehicle['veh_type']:
                 vehicles.append(vehicle)
-        
         return vehicles
 
+    def _create_pdf_stop_condition(self) -> Optional[Callable[[List[str]], bool]]:
+        """车辆列表结束且必需字段齐全时停止读取PDF后续页面"""
+        state = {'vehicle_page': None, 'header_ready': None}
+
+        def stop_when(pages: List[str]) -> bool:
+            index = len(pages) - 1
+            page = pages[index]
+            if state['vehicle_page'] is None:
+                if self._vehicle_tokenizer.has_block(page):
+                    state['vehicle_page'] = index
+                return False
+            if self._vehicle_tokenizer.mentions_fields(page):
+                return False
+            if state['header_ready'] is None:
+                # 表头位于首个车辆区块之前，只需扫描一次
+                header = ''.join(f"{text}\n" for text in pages[:state['vehicle_page'] + 1])
+                fields = self._scan_fields(header)
+                state['header_ready'] = all(fields.get(name) for name in self.REQUIRED_FIELDS)
+            return state['header_ready']
+
+        return stop_when
+
     def _post_process_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """后处理提取的数据"""
         processed = data.copy()
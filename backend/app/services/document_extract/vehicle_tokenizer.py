@@ -0,0 +1,144 @@
+"""
+车辆区块分词器
+
+旧实现先按 “Vehicle manufacturer” 拆分区块，再对每个区块执行十余次 re.search，
+其中多个规则形如 “标签[\\s\\S]*?数值”（R点坐标同一段文本要扫三遍），
+标签重复出现或数值缺失时，惰性跨度会反复扫到区块末尾，区块越长代价越高。
+
+本分词器的做法：
+- 对整篇文本只做一遍小写化，按各标签首单词用 str.find 一次定位全部候选位置，再按区块分桶；
+- 每个区块内：标签只在候选位置做定点确认（match），数值只从标签结束处向后搜索一次；
+- “标签[\\s\\S]*?数值” 等价于“首个标签之后的第一个数值”，后续标签出现位置不会得到更早的匹配，
+  因此只需处理首个标签，整体为线性时间，输出与旧实现逐字段一致。
+
+存在当前规则保护时，每个区块前检查时间预算，并按 vehicles.<字段> 累计各字段耗时。
+"""
+
+import re
+import time
+from bisect import bisect_left
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+from .field_scanner import leading_word, lowered_positions_reliable
+from .regex_guard import current_guard
+
+
+class VehicleFieldSpec:
+    """单个车辆字段规则
+
+    Args:
+        path: 结果字典中的路径，如 ('veh_mfr',) 或 ('rpoint_coords', 'A')
+        label: 标签正则（必须以字面单词开头）
+        value: 数值正则（含一个捕获分组）；为None时 label 本身就是带捕获分组的完整规则
+    """
+
+    def __init__(self, path: Tuple[str, ...], label: str, value: Optional[str] = None):
+        self.path = path
+        self.label_source = label
+        self.word = leading_word(label)
+        self.label = re.compile(label, re.IGNORECASE)
+        self.value = re.compile(value, re.IGNORECASE) if value else None
+        # 旧实现的等价单条正则，用于无法使用小写定位时的回退
+        self.legacy = re.compile(f"{label}[\\s\\S]*?{value}" if value else label, re.IGNORECASE)
+        self.rule_name = 'vehicles.' + '.'.join(path)
+
+
+class VehicleBlockTokenizer:
+    """按区块起始标签切分车辆列表，并在每个区块内单遍提取各字段"""
+
+    def __init__(self, block_start: str, specs: List[VehicleFieldSpec]):
+        self.block_start = re.compile(block_start, re.IGNORECASE)
+        self.block_word = leading_word(block_start)
+        self.specs = specs
+
+    def has_block(self, text: str) -> bool:
+        """文本中是否出现区块起始标签"""
+        return self.block_start.search(text) is not None
+
+    def mentions_fields(self, text: str) -> bool:
+        """文本中是否出现区块起始标签或任一字段标签（用于判断车辆列表是否已结束）"""
+        return self.has_block(text) or any(spec.label.search(text) for spec in self.specs)
+
+    def tokenize(self, text: str) -> Iterator[Dict[str, Any]]:
+        """逐个产出区块对应的字段字典（字段缺失时为空字符串）"""
+        lowered = text.lower()
+        if not lowered_positions_reliable(text, lowered) or not self.block_word:
+            yield from self._tokenize_with_regex(text)
+            return
+
+        block_starts = [pos for pos in self._find_word(lowered, self.block_word)
+                        if self.block_start.match(text, pos)]
+        if not block_starts:
+            return
+
+        # 各标签首单词在全文中的候选位置（同一单词只查找一遍）
+        candidates: Dict[str, List[int]] = {}
+        for spec in self.specs:
+            if spec.word not in candidates:
+                candidates[spec.word] = list(self._find_word(lowered, spec.word))
+
+        guard = current_guard()
+        bounds = block_starts + [len(text)]
+        for start, end in zip(bounds, bounds[1:]):
+            if guard:
+                guard.check('vehicles')
+            record: Dict[str, Any] = {}
+            for spec in self.specs:
+                positions = candidates[spec.word]
+                index = bisect_left(positions, start)
+                if guard:
+                    began = time.perf_counter()
+                    value = self._extract(text, spec, positions, index, end)
+                    guard.record(spec.rule_name, (time.perf_counter() - began) * 1000)
+                else:
+                    value = self._extract(text, spec, positions, index, end)
+                self._assign(record, spec.path, value)
+            yield record
+
+    @staticmethod
+    def _find_word(lowered: str, word: str) -> Iterator[int]:
+        idx = lowered.find(word)
+        while idx != -1:
+            yield idx
+            idx = lowered.find(word, idx + 1)
+
+    @staticmethod
+    def _extract(text: str, spec: VehicleFieldSpec, positions: List[int], index: int, end: int) -> str:
+        while index < len(positions) and positions[index] < end:
+            pos = positions[index]
+            index += 1
+            if spec.value is None:
+                m = spec.label.match(text, pos, end)
+                if m:
+                    return m.group(1).strip()
+                continue
+            label = spec.label.match(text, pos, end)
+            if label:
+                # 首个标签之后找不到数值时，更靠后的标签同样找不到
+                m = spec.value.search(text, label.end(), end)
+                return m.group(1).strip() if m else ""
+        return ""
+
+    @staticmethod
+    def _assign(record: Dict[str, Any], path: Tuple[str, ...], value: str) -> None:
+        target = record
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = value
+
+    def _tokenize_with_regex(self, text: str) -> Iterator[Dict[str, Any]]:
+        """回退路径：与旧实现相同的逐区块正则搜索"""
+        guard = current_guard()
+        starts = [m.start() for m in self.block_start.finditer(text)]
+        bounds = starts + [len(text)]
+        for start, end in zip(bounds, bounds[1:]):
+            record: Dict[str, Any] = {}
+            for spec in self.specs:
+                if guard:
+                    guard.check(spec.rule_name)
+                    began = time.perf_counter()
+                m = spec.legacy.search(text, start, end)
+                if guard:
+                    guard.record(spec.rule_name, (time.perf_counter() - began) * 1000)
+                self._assign(record, spec.path, m.group(1).strip() if m else "")
+            yield record
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+上传目录与生成文件的发送
+
+以前 /uploads/ 与下载接口的每个字节都经过 Flask/gunicorn，且没有缓存头。现在统一由 send_stored_file 发送：
+
+- 强 ETag：「修改时间（纳秒）-inode-大小」（十六进制；同一秒内原子替换为同样大小的文件也会变化），
+  以 SHA-256 命名的文件取「哈希-大小」（这类文件会被刷新修改时间以免被回收，内容却不变），
+  支持 If-None-Match（304）与 Range / If-Range（206，文档包下载可断点续传）；
+  发送中的文件不应再修改修改时间（生成文件的最近下载时间由 retention 另行记录）；
+- 缓存策略按地址区分（upload_cache_control）：按内容寻址的图片（blobs/ 等以 SHA-256 命名）与发布后不再变化的
+  生成结果（generated_files/jobs/）为 immutable；以「时间戳 + UUID」命名的公司图片长期缓存；
+  其它（会被原子替换的文档包别名等）每次重新验证；
+- SENDFILE_OFFLOAD=nginx 时不再由 Python 发送文件内容，而是返回 X-Accel-Redirect，由 nginx 的 internal
+  location（X_ACCEL_UPLOADS_LOCATION，见 nginx/nginx.conf）直接发送，Range 与条件请求也由 nginx 处理。
+  nginx 使用自己的「修改时间（秒）-大小」ETag：切换发送方式后客户端需重新下载一次，
+  SHA-256 命名的文件被刷新修改时间后 ETag 也会变化（这类文件为 immutable，浏览器很少重新验证）。
+"""
+import os
+import re
+import mimetypes
+from typing import Optional
+from urllib.parse import quote
+
+from flask import Response, current_app, send_file
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+_CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{64}$')
+# FileUploadService.generate_safe_filename：<前缀>_<YYYYmmdd_HHMMSS>_<uuid 前 8 位>_<原文件名>
+_UNIQUE_UPLOAD_NAME = re.compile(r'_\d{8}_\d{6}_[0-9a-f]{8}_')
+
+
+def strong_etag(path: str, st: os.stat_result) -> str:
+    """「修改时间（纳秒）-inode-大小」（不含引号）；以 SHA-256 命名的文件为「哈希-大小」"""
+    digest = os.path.splitext(os.path.basename(path))[0]
+    if _CONTENT_ADDRESSED_NAME.match(digest):
+        return f"{digest}-{st.st_size:x}"
+    return f"{st.st_mtime_ns:x}-{st.st_ino:x}-{st.st_size:x}"
+
+
+def upload_cache_control(relative_path: str) -> str:
+    """uploads 下的相对路径对应的 Cache-Control"""
+    relative_path = relative_path.replace('\\', '/')
+    name = os.path.basename(relative_path)
+    if _CONTENT_ADDRESSED_NAME.match(os.path.splitext(name)[0]) or relative_path.startswith('generated_files/jobs/'):
+        return IMMUTABLE
+    if relative_path.startswith('company/') and _UNIQUE_UPLOAD_NAME.search(name):
+        max_age = int(current_app.config.get('UPLOAD_CACHE_MAX_AGE', 30 * 24 * 3600))
+        return f'public, max-age={max_age}'
+    return REVALIDATE
+
+
+def _content_disposition(download_name: str) -> str:
+    try:
+        download_name.encode('ascii')
+        return f'attachment; filename="{download_name}"'
+    except UnicodeEncodeError:
+        fallback = download_name.encode('ascii', 'ignore').decode('ascii') or 'download'
+        return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(download_name, safe='')}"
+
+
+def _offload_path(path: str) -> Optional[str]:
+    """启用 nginx 发送且文件位于上传目录内时，返回 X-Accel-Redirect 地址"""
+    if (current_app.config.get('SENDFILE_OFFLOAD') or '').lower() != 'nginx':
+        return None
+    root = os.path.realpath(current_app.config['UPLOAD_FOLDER'])
+    real_path = os.path.realpath(path)
+    if not real_path.startswith(root + os.sep):
+        return None
+    location = current_app.config.get('X_ACCEL_UPLOADS_LOCATION', '/_protected/uploads/').rstrip('/')
+    return f"{location}/{quote(os.path.relpath(real_path, root).replace(os.sep, '/'))}"
+
+
+def send_stored_file(path: str, cache_control: str = REVALIDATE, as_attachment: bool = False,
+                     download_name: Optional[str] = None, mimetype: Optional[str] = None) -> Response:
+    """发送磁盘上的文件（调用方负责校验路径），带强 ETag、Range 支持与给定的 Cache-Control"""
+    st = os.stat(path)
+    accel_path = _offload_path(path)
+    if accel_path:
+        response = Response(status=200, mimetype=mimetype or mimetypes.guess_type(path)[0]
+                            or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = accel_path
+        if as_attachment:
+            response.headers['Content-Disposition'] = _content_disposition(download_name or os.path.basename(path))
+        # nginx 生成同样格式的 ETag、处理条件请求与 Range
+        response.set_etag(strong_etag(path, st))
+    else:
+        response = send_file(path, mimetype=mimetype, as_attachment=as_attachment, download_name=download_name,
+                             conditional=True, etag=strong_etag(path, st), last_modified=st.st_mtime)
+        response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = cache_control
+    return response
@@ -84,6 +84,42 @@ class FileUploadService:
         
         return new_name + ext
     
+    @staticmethod
+    def get_upload_folder() -> str:
+        """
+        获取上传根目录
+
+        优先使用 Flask 配置 UPLOAD_FOLDER；脱离应用上下文（命令行工具等）时回退到默认配置
+
+        Returns:
+            上传根目录路径
+        """
+        from ..config import get_config_value
+        return get_config_value('UPLOAD_FOLDER')
+
+    @staticmethod
+    def public_url_to_local_path(public_url: str) -> Optional[str]:
+        """
+        将 /uploads/ 开头的访问路径转换为本地文件路径
+
+        Args:
+            public_url: 访问路径（允许带域名的绝对URL）
+
+        Returns:
+            本地文件路径；无法识别或越界时返回None
+        """
+        if not public_url:
+            return None
+        idx = public_url.find('/uploads/')
+        if idx == -1:
+            return None
+        relative = public_url[idx + len('/uploads/'):]
+        base_dir = os.path.abspath(FileUploadService.get_upload_folder())
+        local_path = os.path.abspath(os.path.join(base_dir, relative))
+        if not local_path.startswith(base_dir + os.sep):
+            return None
+        return local_path
+
     @staticmethod
     def create_upload_directory(base_path: str, *subdirs: str) -> str:
         """
@@ -107,7 +143,8 @@ class FileUploadService:
         subcategory: str = '',
         allowed_extensions: Optional[Set[str]] = None,
         prefix: str = '',
-        base_dir: Optional[str] = None
+        base_dir: Optional[str] = None,
+        content_addressed: bool = False
     ) -> Dict[str, Any]:
         """
         统一文件上传处理
@@ -119,9 +156,11 @@ class FileUploadService:
             allowed_extensions: 允许的文件扩展名
             prefix: 文件名前缀
             base_dir: 基础目录路径
+            content_addressed: 是否按内容存储（写入 blobs/，相同内容只存一份，见 blob_store；
+                此时 category/subcategory/prefix 不影响存储位置）
             
         Returns:
-            上传结果字典
+            上传结果字典（按内容存储时另含 sha256、deduplicated）
             
         Raises:
             ValueError: 文件验证失败时抛出
@@ -137,6 +176,25 @@ class FileUploadService:
         if not FileUploadService.validate_file_type(file.filename, allowed_extensions):
             raise ValueError(f"不支持的文件类型，仅支持: {', '.join(allowed_extensions)}")
         
+        # 确定保存目录
+        if base_dir is None:
+            base_dir = current_app.config['UPLOAD_FOLDER']
+        
+        if content_addressed:
+            from .blob_store import BlobStore, BLOBS_DIRNAME
+            result = BlobStore(os.path.join(base_dir, BLOBS_DIRNAME)).put_stream(
+                file.stream, file.filename.rsplit('.', 1)[1]
+            )
+            filename = os.path.basename(result['file_path'])
+            file_ext = filename.rsplit('.', 1)[1]
+            return dict(
+                result,
+                success=True,
+                filename=filename,
+                file_ext=file_ext,
+                mime_type=FileUploadService._image_mime_type(file_ext)
+            )
+        
         # 生成安全文件名
         filename = FileUploadService.generate_safe_filename(
             file.filename, 
@@ -145,10 +203,6 @@ class FileUploadService:
             include_uuid=True
         )
         
-        # 确定保存目录
-        if base_dir is None:
-            base_dir = current_app.config['UPLOAD_FOLDER']
-        
         # 创建保存目录
         if subcategory:
             save_dir = FileUploadService.create_upload_directory(base_dir, category, subcategory)
@@ -179,9 +233,93 @@ class FileUploadService:
             "public_url": f"/uploads/{public_path}",
             "file_size": file_size,
             "file_ext": file_ext,
-            "mime_type": f"image/{file_ext}" if file_ext in FileUploadService.DEFAULT_ALLOWED_EXTENSIONS else "application/octet-stream"
+            "mime_type": FileUploadService._image_mime_type(file_ext)
+        }
+    
+    @staticmethod
+    def upload_chunked_file(
+        upload_id: str,
+        purpose: str,
+        category: str,
+        subcategory: str = '',
+        prefix: str = '',
+        base_dir: Optional[str] = None,
+        content_addressed: bool = False
+    ) -> Dict[str, Any]:
+        """
+        使用分块上传（见 chunked_upload）组装好的文件，代替 upload_file 的 file 参数
+        
+        组装好的文件直接移动到目标位置（按内容存储时写入 blobs/ 后删除），不再复制一份。
+        
+        Args:
+            upload_id: 已完成的分块上传ID
+            purpose: 分块上传创建时声明的用途（document/image）
+            其余参数同 upload_file
+            
+        Returns:
+            上传结果字典（与 upload_file 相同，另含 original_name、sha256）
+            
+        Raises:
+            ChunkedUploadError: 上传不存在、未完成或用途不符时抛出
+        """
+        from .chunked_upload import chunked_upload_manager
+        
+        assembled_path, status = chunked_upload_manager.take(upload_id, purpose)
+        original_name = status['filename']
+        if base_dir is None:
+            base_dir = current_app.config['UPLOAD_FOLDER']
+        
+        try:
+            if content_addressed:
+                from .blob_store import BlobStore, BLOBS_DIRNAME
+                result = BlobStore(os.path.join(base_dir, BLOBS_DIRNAME)).put_file(
+                    assembled_path, original_name.rsplit('.', 1)[1]
+                )
+                filename = os.path.basename(result['file_path'])
+                file_ext = filename.rsplit('.', 1)[1]
+                return dict(
+                    result,
+                    success=True,
+                    filename=filename,
+                    original_name=original_name,
+                    file_ext=file_ext,
+                    mime_type=FileUploadService._image_mime_type(file_ext)
+                )
+            
+            filename = FileUploadService.generate_safe_filename(
+                original_name,
+                prefix=prefix or subcategory,
+                include_timestamp=True,
+                include_uuid=True
+            )
+            save_dir = FileUploadService.create_upload_directory(base_dir, *[d for d in (category, subcategory) if d])
+            file_path = os.path.join(save_dir, filename)
+            os.replace(assembled_path, file_path)
+        finally:
+            if os.path.exists(assembled_path):
+                os.remove(assembled_path)
+        
+        file_ext = filename.rsplit('.', 1)[1].lower()
+        public_path = '/'.join(d for d in (category, subcategory, filename) if d)
+        return {
+            "success": True,
+            "filename": filename,
+            "original_name": original_name,
+            "file_path": file_path,
+            "public_path": public_path,
+            "public_url": f"/uploads/{public_path}",
+            "file_size": status['size'],
+            "file_ext": file_ext,
+            "sha256": status['sha256'],
+            "mime_type": FileUploadService._image_mime_type(file_ext)
         }
     
+    @staticmethod
+    def _image_mime_type(file_ext: str) -> str:
+        if file_ext in ('jpg', 'jpeg'):
+            return "image/jpeg"
+        return f"image/{file_ext}" if file_ext in FileUploadService.DEFAULT_ALLOWED_EXTENSIONS else "application/octet-stream"
+    
     @staticmethod
     def upload_company_file(
         file: FileStorage,
@@ -189,7 +327,7 @@ class FileUploadService:
         prefix: str = ''
     ) -> Dict[str, Any]:
         """
-        上传公司相关文件（图片、签名、商标）
+        上传公司相关文件（图片、签名、商标），按内容存储：相同图片只存一份，地址稳定
         
         Args:
             file: 上传的文件对象
@@ -207,7 +345,8 @@ class FileUploadService:
             category='company',
             subcategory=subcategory,
             allowed_extensions=FileUploadService.DEFAULT_ALLOWED_EXTENSIONS,
-            prefix=prefix or f"company_{subcategory}"
+            prefix=prefix or f"company_{subcategory}",
+            content_addressed=True
         )
     
     @staticmethod
@@ -234,6 +373,34 @@ class FileUploadService:
             prefix='document'
         )
     
+    @staticmethod
+    def upload_chunked_document(upload_id: str, temp_dir: bool = False) -> Dict[str, Any]:
+        """
+        使用分块上传组装好的文档（用于规则引擎提取），参数与返回值同 upload_document_file
+        """
+        return FileUploadService.upload_chunked_file(
+            upload_id,
+            purpose='document',
+            category='temp' if temp_dir else 'documents',
+            prefix='document'
+        )
+    
+    @staticmethod
+    def upload_chunked_company_file(upload_id: str, subcategory: str) -> Dict[str, Any]:
+        """
+        使用分块上传组装好的公司图片，参数与返回值同 upload_company_file
+        """
+        if subcategory not in {'marks', 'picture', 'signature'}:
+            raise ValueError("无效的子分类，仅支持: marks, picture, signature")
+        
+        return FileUploadService.upload_chunked_file(
+            upload_id,
+            purpose='image',
+            category='company',
+            subcategory=subcategory,
+            content_addressed=True
+        )
+    
     @staticmethod
     def cleanup_temp_file(file_path: str) -> bool:
         """
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+表单数据服务
+保存表单数据（按 session_id 新建或更新 FormData），供 /save-form-data 与一站式流水线共用
+"""
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from ..main import db
+from ..models import FormData
+from .system_config import system_config
+from .image_staging import image_staging_service
+
+
+def apply_system_params(form: FormData) -> bool:
+    """将当前系统参数写入表单记录（不提交事务），返回是否有变化"""
+    changed = False
+    for key, value in system_config.get_form_params().items():
+        if getattr(form, key) != value:
+            setattr(form, key, value)
+            changed = True
+    return changed
+
+
+def upsert_form_data(session_id: Optional[str], form_data: Dict[str, Any]) -> Tuple[FormData, str]:
+    """按 session_id 新建或更新表单记录（不提交事务），返回 (记录, session_id)
+
+    session_id 为空时自动生成正式的 session_id；日期字段接受 YYYY-MM-DD 字符串，系统参数每次保存时刷新。
+    """
+    # 提取时暂存的商标图片在表单保存时才转存到正式目录
+    if form_data.get('trade_marks'):
+        form_data['trade_marks'] = image_staging_service.promote(form_data['trade_marks'])
+
+    # 如果session_id为空，自动生成一个正式的session_id
+    if not session_id:
+        import uuid
+        import time
+        # 生成格式：session_时间戳_随机UUID
+        timestamp = int(time.time())
+        random_uuid = uuid.uuid4().hex[:8]
+        session_id = f"session_{timestamp}_{random_uuid}"
+        print(f"🆔 自动生成session_id: {session_id}")
+
+    # 使用FormData.query查询
+    existing_form = FormData.query.filter_by(session_id=session_id).first()
+
+    if existing_form:
+        # 更新现有记录
+        print("📝 更新现有记录")
+        for key, value in form_data.items():
+            # 禁止客户端覆盖创建/更新时间等受控字段
+            if key in ['created_at', 'updated_at']:
+                continue
+            if hasattr(existing_form, key):
+                # 特殊处理日期字段
+                if key in ['approval_date', 'test_date', 'report_date']:
+                    if isinstance(value, str) and value:
+                        try:
+                            value = datetime.strptime(value, '%Y-%m-%d').date()
+                        except ValueError:
+                            continue  # 跳过无效日期
+                    elif not value:
+                        continue  # 跳过空值，保持原有值
+                setattr(existing_form, key, value)
+
+        # 更新系统参数
+        apply_system_params(existing_form)
+
+        existing_form.updated_at = datetime.utcnow()
+    else:
+        # 创建新记录
+        print("📝 创建新记录")
+        # 处理日期字段
+        approval_date = form_data.get('approval_date')
+        test_date = form_data.get('test_date')
+        report_date = form_data.get('report_date')
+
+        # 如果前端传递的是字符串，转换为date对象
+        if isinstance(approval_date, str) and approval_date:
+            try:
+                approval_date = datetime.strptime(approval_date, '%Y-%m-%d').date()
+            except ValueError:
+                approval_date = None
+        else:
+            approval_date = None
+
+        if isinstance(test_date, str) and test_date:
+            try:
+                test_date = datetime.strptime(test_date, '%Y-%m-%d').date()
+            except ValueError:
+                test_date = None
+        else:
+            test_date = None
+
+        if isinstance(report_date, str) and report_date:
+            try:
+                report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
+            except ValueError:
+                report_date = None
+        else:
+            report_date = None
+
+        # 获取系统参数
+        system_params = system_config.get_form_params()
+
+        new_form = FormData(
+            session_id=session_id,
+            # IF_Template.docx 相关字段
+            approval_no=form_data.get('approval_no', ''),
+            information_folder_no=form_data.get('information_folder_no', ''),
+            safety_class=form_data.get('safety_class', ''),
+            pane_desc=form_data.get('pane_desc', ''),
+            glass_layers=form_data.get('glass_layers', ''),
+            interlayer_layers=form_data.get('interlayer_layers', ''),
+            windscreen_thick=form_data.get('windscreen_thick', ''),
+            interlayer_thick=form_data.get('interlayer_thick', ''),
+            glass_treatment=form_data.get('glass_treatment', ''),
+            interlayer_type=form_data.get('interlayer_type', ''),
+            coating_type=form_data.get('coating_type', ''),
+            coating_thick=form_data.get('coating_thick', ''),
+            material_nature=form_data.get('material_nature', ''),
+            coating_color=form_data.get('coating_color', ''),
+            # 新增字段 - 玻璃颜色和夹层相关
+            glass_color_choice=form_data.get('glass_color_choice', 'tinted_struck'),
+            interlayer_total=form_data.get('interlayer_total', False),
+            interlayer_partial=form_data.get('interlayer_partial', False),
+            interlayer_colourless=form_data.get('interlayer_colourless', False),
+            # 新增字段 - 导体和不透明相关
+            conductors_choice=form_data.get('conductors_choice', 'yes_struck'),
+            opaque_obscure_choice=form_data.get('opaque_obscure_choice', 'yes_struck'),
+            remarks=form_data.get('remarks', ''),
+            report_no=form_data.get('report_no', ''),
+            company_id=form_data.get('company_id'),
+            company_name=form_data.get('company_name', ''),
+            company_address=form_data.get('company_address', ''),
+            trade_names=form_data.get('trade_names', ''),
+            trade_marks=form_data.get('trade_marks', []),
+            equipment=form_data.get('equipment', []),
+            vehicles=form_data.get('vehicles', []),
+            # 新增日期字段
+            approval_date=approval_date,
+            test_date=test_date,
+            report_date=report_date,
+            # 系统参数 - 版本号（字符串）、实验室环境参数、法规更新日期
+            **system_params,
+            # 玻璃类型（来自前端，若没填则为空字符串）
+            glass_type=form_data.get('glass_type', '')
+        )
+        db.session.add(new_form)
+        return new_form, session_id
+
+    return existing_form, session_id
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+生成结果的隔离输出与原子发布
+
+文件名由批准号决定，以前所有渲染都直接写入 generated_files/，同一批准号的并发生成会互相覆盖，
+下载也可能读到写了一半的文件。现在每次生成（一个 OutputJob）：
+
+1. 在 generated_files/.scratch/<job_id>/ 中渲染、打包；
+2. 完成后整体重命名为 generated_files/jobs/<job_id>/（同一文件系统内 os.replace 是原子的），
+   下载地址为 /api/mvp/download/<job_id>/<文件名>，发布后内容不再变化；
+3. 会话文档包另以「先写临时文件再重命名」的方式更新 generated_files/<文件名> 别名
+   （旧的按文件名下载地址与系统参数刷新使用），读者只会看到旧版本或完整的新版本。
+
+未发布（失败或中止）的临时目录在结束时删除。
+"""
+import os
+import re
+import json
+import uuid
+import shutil
+import logging
+import tempfile
+from typing import Any, Dict, Iterable, Optional, Set
+
+from ..config import get_config_value
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_DIRNAME = '.scratch'
+JOBS_DIRNAME = 'jobs'
+
+_JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+_DOWNLOAD_URL_PATTERN = re.compile(r'/api/mvp/download/([A-Za-z0-9_-]{1,64})/')
+
+
+def generated_files_dir() -> str:
+    return os.path.join(get_config_value('UPLOAD_FOLDER'), 'generated_files')
+
+
+def is_valid_job_id(job_id: str) -> bool:
+    return bool(_JOB_ID_PATTERN.match(job_id or ''))
+
+
+def published_path(job_id: str, filename: str, root: Optional[str] = None) -> Optional[str]:
+    """已发布文件的路径（任务ID或文件名不合法时返回 None）"""
+    if not is_valid_job_id(job_id) or not filename or filename != os.path.basename(filename) \
+            or filename in ('.', '..') or '\\' in filename:
+        return None
+    return os.path.join(root or generated_files_dir(), JOBS_DIRNAME, job_id, filename)
+
+
+def referenced_job_ids(result: Any) -> Set[str]:
+    """结果（响应体、任务结果等可 JSON 序列化的对象）中的下载地址引用的任务ID"""
+    if result is None:
+        return set()
+    text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+    return set(_DOWNLOAD_URL_PATTERN.findall(text))
+
+
+class OutputJob:
+    """一次生成的输出目录：在临时目录中写入，完成后整体发布"""
+
+    def __init__(self, root: Optional[str] = None, job_id: Optional[str] = None):
+        self.root = root or generated_files_dir()
+        self.job_id = job_id or uuid.uuid4().hex
+        if not is_valid_job_id(self.job_id):
+            raise ValueError(f"无效的任务ID: {self.job_id}")
+        self.scratch_dir = os.path.join(self.root, SCRATCH_DIRNAME, self.job_id)
+        self.published_dir = os.path.join(self.root, JOBS_DIRNAME, self.job_id)
+        self.published = False
+        os.makedirs(self.scratch_dir, exist_ok=True)
+
+    def __enter__(self) -> 'OutputJob':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.discard()
+
+    @property
+    def output_dir(self) -> str:
+        """当前写入位置（发布前为临时目录）"""
+        return self.published_dir if self.published else self.scratch_dir
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.output_dir, filename)
+
+    def download_url(self, filename: str) -> str:
+        return f"/api/mvp/download/{self.job_id}/{filename}"
+
+    def publish(self, items: Iterable[Dict[str, Any]] = ()) -> str:
+        """原子发布整个目录，并将 items 中各项的 file_path / download_url 改为发布后的位置，返回发布目录"""
+        if not self.published:
+            os.makedirs(os.path.dirname(self.published_dir), exist_ok=True)
+            os.replace(self.scratch_dir, self.published_dir)
+            self.published = True
+        for item in items:
+            item['file_path'] = os.path.join(self.published_dir, item['filename'])
+            item['download_url'] = self.download_url(item['filename'])
+        return self.published_dir
+
+    def publish_alias(self, filename: str) -> str:
+        """以原子替换的方式更新 generated_files/<filename> 别名（优先硬链接，不支持时复制），返回别名下载地址"""
+        source = self.path(filename)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.publish-', suffix='.tmp')
+        os.close(fd)
+        try:
+            try:
+                os.remove(tmp_path)
+                os.link(source, tmp_path)
+            except OSError:
+                shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, os.path.join(self.root, filename))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return f"/api/mvp/download/{filename}"
+
+    def discard(self) -> None:
+        """删除未发布的临时目录"""
+        if not self.published:
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
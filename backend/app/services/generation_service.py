@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+文档生成服务
+从表单数据准备生成数据、按文档类型构建文件名、调用各文档生成器，
+供 HTTP 接口（mvp_routes）与离线命令行工具（app.cli.generate_bulk）共用
+"""
+import os
+import json
+import time
+import hashlib
+import zipfile
+from datetime import date
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from .system_config import system_config
+from .cancellation import current_token, SUCCESS, FAILED
+from .generators import generate_cert_document
+from .generators.if_generator import IfGenerator
+from .generators.rcs_generator import RcsGenerator
+from .generators.other_generator import OtherGenerator
+from .generators.tr_generator import TrGenerator
+from .generators.tm_generator import TmGenerator
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'templates')
+
+
+# 统一的文件命名构建器：根据文档类型走不同分支
+def build_filename(doc_type: str,
+                    doc_name: str,
+                    safe_approval_no: str,
+                    generation_data: dict,
+                    output_format: str) -> str:
+    """根据 doc_type 构建文件名。默认回落到 {doc_name}-{safe_approval_no}.{ext}
+    后续可按需在各 case 中使用 generation_data 的字段自定义命名。
+    """
+    ext = '.pdf' if output_format == 'pdf' else '.docx'
+    # 默认基础名
+    base = f"{doc_name}_{safe_approval_no}"
+
+    # 使用 Python 3.10+ 的结构化匹配模拟 switch/case
+    match (doc_type or '').lower():
+        case 'if':
+            if output_format == 'docx':
+                wt = (generation_data.get('windscreen_thick') or '').strip()
+                ilt = (generation_data.get('interlayer_type') or '').strip()
+                suffix = safe_approval_no[-2:] if safe_approval_no else ''
+                parts = [p for p in [wt, ilt, f"ext.{suffix}"] if p]
+                filename_stem = ' '.join(parts) if parts else base
+            else:
+                filename_stem = base
+        case 'cert':
+            filename_stem = base
+        case 'rcs':
+            filename_stem = f"Review Control Sheet V7 {safe_approval_no}"
+        case 'other':
+            if output_format == 'docx':
+                filename_stem = f"Statement for application for EC and UNECE Type-approval v2.00 {safe_approval_no}"
+            else:
+                filename_stem = base
+        case 'tr':
+            if output_format == 'docx':
+                filename_stem = generation_data.get('report_no') or base
+            else:
+                filename_stem = base
+        case 'tm':
+            rep = (generation_data.get('report_no') or '').strip()
+            parts = [p for p in rep.split('-') if p]
+            if len(parts) >= 2:
+                tail = '-'.join(parts[-2:])
+                filename_stem = f"TM-{tail}"
+            else:
+                filename_stem = base
+        case _:
+            filename_stem = base
+
+    return f"{filename_stem}{ext}"
+
+def make_safe_approval_no(form_data_obj, fallback: str = "TEST") -> str:
+    """Return a filesystem-safe approval_no string for filenames."""
+    import re
+    if form_data_obj and getattr(form_data_obj, 'approval_no', None):
+        approval_no = form_data_obj.approval_no or fallback
+    else:
+        approval_no = fallback
+    safe = re.sub(r'[^a-zA-Z0-9]', '-', approval_no)
+    safe = re.sub(r'-+', '-', safe).strip('-')
+    return safe or fallback
+
+class DocumentGeneratorFactory:
+    """文档生成器工厂类"""
+    
+    def __init__(self):
+        self.generators = {
+            'if': {
+                'type': 'if',
+                'name': 'IF',
+                'generator': IfGenerator(),
+                'template': None,
+                'use_class': True
+            },
+            'cert': {
+                'type': 'cert',
+                'name': 'CERT',
+                'generator': generate_cert_document,
+                'template': None,
+                'use_class': False
+            },
+            'rcs': {
+                'type': 'rcs',
+                'name': 'RCS',
+                'generator': RcsGenerator(),
+                'template': None,
+                'use_class': True
+            },
+            'other': {
+                'type': 'other',
+                'name': 'OTHER',
+                'generator': OtherGenerator(),
+                'template': None,
+                'use_class': True
+            },
+            'tr': {
+                'type': 'tr',
+                'name': 'TR',
+                'generator': TrGenerator(),
+                'template': None,
+                'use_class': True
+            },
+            'tm': {
+                'type': 'tm',
+                'name': 'TM',
+                'generator': TmGenerator(),
+                'template': None,
+                'use_class': True
+            },
+        }
+    
+    def get_all_document_types(self):
+        """获取所有文档类型配置"""
+        return list(self.generators.values())
+    
+    def get_generator(self, doc_type):
+        """获取指定类型的生成器配置"""
+        return self.generators.get(doc_type)
+    
+    # 移除 IF 特殊处理器，统一走类式生成器通道
+
+def get_company_snapshot(company_id, snapshots: Optional[Dict[int, Optional[Dict[str, Any]]]] = None):
+    """获取公司信息快照（to_dict 结果，公司不存在时为 None）
+
+    snapshots: 可选，公司ID -> 快照的共享缓存；批量生成时同一公司只查询一次
+    """
+    if snapshots is not None and company_id in snapshots:
+        return snapshots[company_id]
+    from ..models.company import Company
+    company = Company.query.get(company_id)
+    snapshot = company.to_dict() if company else None
+    if snapshots is not None:
+        snapshots[company_id] = snapshot
+    return snapshot
+
+
+def prepare_generation_data(form_data, company_snapshots: Optional[Dict[int, Optional[Dict[str, Any]]]] = None):
+    """准备文档生成所需的数据（以表单数据为准，不覆盖）
+
+    company_snapshots: 可选，公司快照的共享缓存（见 get_company_snapshot）
+    """
+    # 获取公司信息（简洁方式：使用 to_dict 统一解析字段）
+    company_contraction = ''
+    company_equipment = []
+    signature_name = ''
+    place = ''
+    email_address = ''
+    country = ''
+    c = None
+    if form_data.company_id:
+        c = get_company_snapshot(form_data.company_id, company_snapshots)
+        if c:
+            company_contraction = c.get('company_contraction', '') or ''
+            company_equipment = c.get('equipment', []) or []
+            signature_name = c.get('signature_name', '') or ''
+            place = c.get('place', '') or ''
+            email_address = c.get('email_address', '') or ''
+            country = c.get('country', '') or ''
+    
+    return {
+        # 基本信息字段
+        "approval_no": form_data.approval_no,
+        "information_folder_no": form_data.information_folder_no,
+        "safety_class": form_data.safety_class,
+        "pane_desc": form_data.pane_desc,
+        "glass_layers": form_data.glass_layers,
+        "interlayer_layers": form_data.interlayer_layers,
+        "windscreen_thick": form_data.windscreen_thick,
+        "interlayer_thick": form_data.interlayer_thick,
+        "glass_treatment": form_data.glass_treatment,
+        "interlayer_type": form_data.interlayer_type,
+        "coating_type": form_data.coating_type,
+        "coating_thick": form_data.coating_thick,
+        "material_nature": form_data.material_nature,
+        "coating_color": form_data.coating_color,
+        # 新增字段 - 玻璃颜色和夹层相关
+        "glass_color_choice": form_data.glass_color_choice,
+        "interlayer_total": form_data.interlayer_total,
+        "interlayer_partial": form_data.interlayer_partial,
+        "interlayer_colourless": form_data.interlayer_colourless,
+        # 新增字段 - 导体和不透明相关
+        "conductors_choice": form_data.conductors_choice,
+        "opaque_obscure_choice": form_data.opaque_obscure_choice,
+        "remarks": form_data.remarks,
+        # 报告号
+        "report_no": form_data.report_no,
+        # 新增日期字段
+        "approval_date": form_data.approval_date,
+        "test_date": form_data.test_date,
+        "report_date": form_data.report_date,
+        # 法规更新日期（直接从系统配置读取为已格式化字符串）
+        "regulation_update_date": system_config.get_regulation_update_date(),
+        # 公司信息（从Company表获取最新信息）
+        "company_id": form_data.company_id,
+        "company_name": form_data.company_name or '',
+        "company_address": form_data.company_address or '',
+        "company_contraction": company_contraction,  # 从Company表获取公司简称
+        "signature_name": signature_name,  # 公司签名人名称
+        "place": place,  # 公司位置
+        "email_address": email_address,  # 联系邮箱
+        "country": country,  # 国家/地区
+        "trade_names": form_data.trade_names or '',
+        "trade_marks": form_data.trade_marks or [],
+        "vehicles": form_data.vehicles or [],
+        # 新增：玻璃类型
+        "glass_type": getattr(form_data, 'glass_type', ''),
+        # 设备信息（从Company表获取最新信息）
+        "equipment": company_equipment,  # 使用从Company表获取的最新设备信息
+        # 公司快照：生成器据此取公司图片与签名，不再重复查询
+        "company_snapshot": c,
+        # 系统参数 - 版本号（字符串）
+        "version_1": getattr(form_data, 'version_1', '4'),
+        "version_2": getattr(form_data, 'version_2', '8'),
+        "version_3": getattr(form_data, 'version_3', '12'),
+        "version_4": getattr(form_data, 'version_4', '01'),
+        # 系统参数 - 实验室环境参数
+        "temperature": getattr(form_data, 'temperature', '22°C'),
+        "ambient_pressure": getattr(form_data, 'ambient_pressure', '1020 mbar'),
+        "relative_humidity": getattr(form_data, 'relative_humidity', '50 %')
+    }
+
+def generation_data_hash(generation_data: Dict[str, Any], output_format: str) -> str:
+    """生成结果的内容键：生成数据 + 输出格式 + 当天日期（部分模板写入生成日期）+ 模板修改时间 的哈希"""
+    templates = []
+    try:
+        templates = sorted((e.name, e.stat().st_mtime_ns) for e in os.scandir(TEMPLATES_DIR) if e.is_file())
+    except OSError:
+        pass
+    payload = json.dumps(
+        {"data": generation_data, "format": output_format, "date": date.today().isoformat(), "templates": templates},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def generate_single_document(doc_info, generation_data, output_dir, safe_approval_no, output_format):
+    """生成单个文档"""
+    doc_type = doc_info.get('type', 'unknown')
+    doc_name = doc_info['name']
+    generator = doc_info['generator']
+    template_name = doc_info['template']
+    use_class = doc_info['use_class']
+    # 统一逻辑：不再使用 special_handler
+    
+    try:
+        # 统一处理所有文档类型 - 使用命名策略函数
+        filename = build_filename(doc_type, doc_name, safe_approval_no, generation_data, output_format)
+        file_path = os.path.join(output_dir, filename)
+
+        if use_class:
+            # 使用生成器类（IF/TR/TM等均支持）
+            result = generator.generate_document(generation_data, file_path, output_format)
+            if result.get('success'):
+                return {
+                    "success": True,
+                    "filename": filename,
+                    "file_path": file_path,
+                    "download_url": f"/api/mvp/download/{filename}"
+                }
+            else:
+                return result
+        else:
+            # 使用生成器函数（CERT/OTHER/RCS等函数式保持兼容）
+            result = generator(generation_data, file_path, output_format)
+            if result.get('success'):
+                return {
+                    "success": True,
+                    "filename": filename,
+                    "file_path": file_path,
+                    "download_url": f"/api/mvp/download/{filename}"
+                }
+            else:
+                return result
+            
+            # 处理生成器返回的结果已经在上面处理了，这里不需要额外处理
+                
+    except Exception as e:
+        print(f"生成异常: {str(e)}")
+        import traceback
+        print(f"错误堆栈: {traceback.format_exc()}")
+        return {"success": False, "error": f"生成失败: {str(e)}"}
+
+
+def generate_bundle(generation_data: Dict[str, Any],
+                    output_dir: str,
+                    safe_approval_no: str,
+                    output_format: str,
+                    doc_types: Optional[List[str]] = None,
+                    on_event: Optional[Callable[[Dict[str, Any]], None]] = None
+                    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """按顺序生成一组文档（默认全部类型），返回 (成功列表, 失败列表)，每项附带耗时 elapsed_ms 与结果 outcome
+
+    outcome: success / failed / timed_out / cancelled。当前上下文的取消令牌（cancellation.cancel_scope）
+             到期或被取消后，剩余文档不再生成，记为 timed_out / cancelled 放入失败列表。
+    on_event: 可选，进度回调；每个文档开始时回调 {"type": "document_started", ...}，
+              完成时回调 {"type": "document", "success", "outcome", "stage": rendered/converted, ...}
+    """
+    token = current_token()
+    factory = DocumentGeneratorFactory()
+    if doc_types:
+        doc_infos = [factory.get_generator(t) for t in doc_types if factory.get_generator(t)]
+    else:
+        doc_infos = factory.get_all_document_types()
+
+    generated_files = []
+    failed_documents = []
+    for index, doc_info in enumerate(doc_infos, start=1):
+        progress = {"doc_type": doc_info['name'], "index": index, "total": len(doc_infos)}
+        if token is not None and token.cancelled:
+            item = {"type": doc_info['name'], "error": token.message, "outcome": token.reason, "elapsed_ms": 0.0}
+            failed_documents.append(item)
+            if on_event:
+                on_event({"type": "document", "success": False, "outcome": item['outcome'],
+                          "error": item['error'], "elapsed_ms": 0.0, **progress})
+            continue
+        if on_event:
+            on_event({"type": "document_started", **progress})
+        started = time.perf_counter()
+        result = generate_single_document(
+            doc_info, generation_data, output_dir, safe_approval_no, output_format
+        )
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+
+        if result['success']:
+            item = {
+                "type": doc_info['name'],
+                "filename": result['filename'],
+                "file_path": result['file_path'],
+                "download_url": result['download_url'],
+                "elapsed_ms": elapsed_ms,
+                "outcome": SUCCESS
+            }
+            generated_files.append(item)
+            if on_event:
+                on_event({"type": "document", "success": True, "outcome": SUCCESS,
+                          "stage": 'converted' if output_format == 'pdf' else 'rendered',
+                          "filename": item['filename'], "elapsed_ms": elapsed_ms, **progress})
+        else:
+            # 生成过程中到期或被取消（如 PDF 转换被终止）时按取消原因记录
+            cancelled = token is not None and token.cancelled
+            item = {
+                "type": doc_info['name'],
+                "error": token.message if cancelled else (result.get('error') or result.get('message', '生成失败')),
+                "elapsed_ms": elapsed_ms,
+                "outcome": token.reason if cancelled else FAILED
+            }
+            failed_documents.append(item)
+            if on_event:
+                on_event({"type": "document", "success": False, "outcome": item['outcome'],
+                          "error": item['error'], "elapsed_ms": elapsed_ms, **progress})
+    return generated_files, failed_documents
+
+
+def package_bundle(generated_files: List[Dict[str, Any]], zip_path: str) -> str:
+    """将已生成的文档打包为ZIP（ZIP内使用原始文件名），返回ZIP路径"""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for file_info in generated_files:
+            if os.path.exists(file_info['file_path']):
+                zipf.write(file_info['file_path'], file_info['filename'])
+    return zip_path
+
+def warm_template_cache() -> List[str]:
+    """预先加载全部文档类型的模板文件，返回成功加载的文档类型"""
+    warmed = []
+    for doc_info in DocumentGeneratorFactory().get_all_document_types():
+        generator = doc_info['generator']
+        if doc_info['use_class'] and generator.warm_template_cache():
+            warmed.append(doc_info['type'])
+    # 函数式生成器（CERT）内部每次新建生成器实例，模板缓存为类级共享
+    from .generators.cert_generator import CertGenerator
+    if CertGenerator().warm_template_cache():
+        warmed.append('cert')
+    return warmed
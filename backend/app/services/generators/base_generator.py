@@ -3,6 +3,7 @@
 基础文档生成器
 提供通用的文档生成功能，包括Word和PDF格式支持
 """
+import io
 import os
 from datetime import datetime, date
 from docxtpl import DocxTemplate, InlineImage
@@ -10,14 +11,47 @@ import subprocess
 import platform
 import threading
 import time
-from typing import Dict, Any, List, Union
+import uuid
+import signal
+from typing import Dict, Any, List, Optional, Union
 from docx.shared import Cm
 from flask import current_app
 
+from ...config import get_config_value
+from ..cancellation import CancelToken, OperationCancelled, current_token
+
+
+def _word_process_id(word) -> Optional[int]:
+    """DispatchEx 启动的 Word 进程号：设置唯一窗口标题后按标题查找窗口"""
+    try:
+        import win32gui
+        import win32process
+        caption = f"cert-autofill-{uuid.uuid4().hex}"
+        word.Caption = caption
+        hwnd = win32gui.FindWindow('OpusApp', caption)
+        if hwnd:
+            return win32process.GetWindowThreadProcessId(hwnd)[1]
+    except Exception:
+        pass
+    return None
+
+
+def _terminate_process(pid: int) -> None:
+    try:
+        # Windows 下 os.kill 调用 TerminateProcess
+        os.kill(pid, signal.SIGTERM)
+        print(f"⏹️ 已终止转换进程: {pid}")
+    except OSError:
+        pass
+
 
 class BaseGenerator:
     """基础文档生成器"""
     
+    # 模板文件内容缓存：模板路径 -> (修改时间, 文件字节)，进程内所有生成器共享
+    _template_bytes_cache: Dict[str, tuple] = {}
+    _template_cache_lock = threading.Lock()
+    
     def __init__(self, template_name: str):
         self.template_name = template_name
         self.template_filename = template_name  # 添加这个属性，保持兼容性
@@ -35,6 +69,38 @@ class BaseGenerator:
         """生成DOCX文档"""
         raise NotImplementedError("子类必须实现此方法")
     
+    @classmethod
+    def _load_template(cls, template_path: str) -> DocxTemplate:
+        """
+        加载模板文档（模板文件字节按修改时间缓存，避免每次生成都从磁盘读取）
+        
+        DocxTemplate 渲染时会修改文档对象，因此每次都基于缓存字节新建对象。
+        
+        Args:
+            template_path: 模板文件路径
+            
+        Returns:
+            DocxTemplate: 新的模板文档对象
+        """
+        mtime = os.path.getmtime(template_path)
+        cached = cls._template_bytes_cache.get(template_path)
+        if cached is None or cached[0] != mtime:
+            with open(template_path, 'rb') as f:
+                content = f.read()
+            with cls._template_cache_lock:
+                cls._template_bytes_cache[template_path] = (mtime, content)
+        else:
+            content = cached[1]
+        return DocxTemplate(io.BytesIO(content))
+    
+    def warm_template_cache(self) -> bool:
+        """预先加载本生成器的模板文件到缓存，返回模板是否存在"""
+        template_path = os.path.join(self.template_dir, self.template_filename)
+        if not os.path.exists(template_path):
+            return False
+        self._load_template(template_path)
+        return True
+    
     def generate_pdf(self, fields: Dict[str, Any], output_path: str) -> Dict[str, Any]:
         """生成PDF文档"""
         raise NotImplementedError("子类必须实现此方法")
@@ -180,15 +246,20 @@ class BaseGenerator:
             if not company_id:
                 return placeholder
             
-            # 动态导入避免循环依赖
-            from ...models.company import Company
-            
-            company = Company.query.get(company_id)
-            if not company or not company.picture:
+            # 生成数据带有公司快照时直接使用，不再查询数据库
+            if 'company_snapshot' in fields:
+                picture = (fields.get('company_snapshot') or {}).get('picture')
+            else:
+                # 动态导入避免循环依赖
+                from ...models.company import Company
+                
+                company = Company.query.get(company_id)
+                picture = company.picture if company else None
+            if not picture:
                 return placeholder
             
             # 转换为本地路径
-            local_path = self._convert_url_to_local_path(company.picture)
+            local_path = self._convert_url_to_local_path(picture)
             return local_path if local_path else placeholder
             
         except Exception as e:
@@ -210,15 +281,20 @@ class BaseGenerator:
             if not company_id:
                 return placeholder
             
-            # 动态导入避免循环依赖
-            from ...models.company import Company
-            
-            company = Company.query.get(company_id)
-            if not company or not company.signature:
+            # 生成数据带有公司快照时直接使用，不再查询数据库
+            if 'company_snapshot' in fields:
+                signature = (fields.get('company_snapshot') or {}).get('signature')
+            else:
+                # 动态导入避免循环依赖
+                from ...models.company import Company
+                
+                company = Company.query.get(company_id)
+                signature = company.signature if company else None
+            if not signature:
                 return placeholder
             
             # 转换为本地路径
-            local_path = self._convert_url_to_local_path(company.signature)
+            local_path = self._convert_url_to_local_path(signature)
             return local_path if local_path else placeholder
             
         except Exception as e:
@@ -513,8 +589,15 @@ class BaseGenerator:
             
         Returns:
             bool: 转换是否成功
+            
+        单次转换最长 PDF_CONVERT_TIMEOUT_SECONDS 秒，并受当前请求的截止时间限制；
+        超时或请求被取消时终止 Word 进程并返回 False。
         """
+        parent = current_token()
+        convert_timeout = float(get_config_value('PDF_CONVERT_TIMEOUT_SECONDS', 180)) or None
+        token = parent.child(convert_timeout) if parent else CancelToken(convert_timeout)
         try:
+            token.check()
             # 检查输入文件是否存在
             if not os.path.exists(docx_path):
                 print(f"❌ DOCX文件不存在: {docx_path}")
@@ -538,11 +621,17 @@ class BaseGenerator:
 
                 def _export_once() -> bool:
                     word = None
+                    unregister = None
                     try:
                         pythoncom.CoInitialize()
                         # DispatchEx 更适合多线程场景
                         word = win32.DispatchEx('Word.Application')
                         word.Visible = False
+                        # 超时或取消时直接终止该 Word 进程（COM 调用无法从其它线程中断）
+                        pid = _word_process_id(word)
+                        if pid:
+                            unregister = token.on_cancel(lambda: _terminate_process(pid))
+                        token.check()
                         doc = word.Documents.Open(os.path.abspath(docx_path))
                         # 可选：更新全部域（正文与页眉/页脚）
                         if update_fields:
@@ -565,9 +654,12 @@ class BaseGenerator:
                         wdExportFormatPDF = 17
                         doc.ExportAsFixedFormat(os.path.abspath(pdf_path), wdExportFormatPDF)
                         doc.Close(False)
+                        token.check()
                         print(f"✅ Word 导出 PDF 成功: {pdf_path}")
                         return True
                     finally:
+                        if unregister:
+                            unregister()
                         try:
                             if word is not None:
                                 word.Quit()
@@ -578,27 +670,37 @@ class BaseGenerator:
                         except Exception:
                             pass
 
-                with self.__class__._word_export_lock:
+                remaining = token.remaining()
+                if not self.__class__._word_export_lock.acquire(timeout=-1 if remaining is None else remaining):
+                    token.check()
+                    return False
+                try:
                     # 首次尝试
                     try:
                         return _export_once()
                     except Exception as e:
+                        if token.cancelled:
+                            raise OperationCancelled(token.reason, token.message)
                         # 典型错误：-2147417848 对象已断开、-2147023174 RPC 不可用 → 重试一次
                         print(f"⚠️ Word 导出异常，准备重试：{e}")
                         time.sleep(0.5)
                         try:
                             return _export_once()
                         except Exception as e2:
+                            if token.cancelled:
+                                raise OperationCancelled(token.reason, token.message)
                             print(f"❌ 使用 Word 导出 PDF 失败（重试后）：{e2}")
                             return False
+                finally:
+                    self.__class__._word_export_lock.release()
             
             elif system in ("darwin", "linux"):
                 # 仅支持 Microsoft Word（Windows）
                 print("❌ 当前配置仅支持在 Windows 上使用 Microsoft Word 导出 PDF。请在 Windows 环境运行后端服务。")
                 return False
                     
-        except subprocess.TimeoutExpired:
-            print("❌ PDF转换超时")
+        except (subprocess.TimeoutExpired, OperationCancelled) as e:
+            print(f"❌ PDF转换中止: {e}")
             return False
         except Exception as e:
             print(f"❌ PDF转换失败: {e}")
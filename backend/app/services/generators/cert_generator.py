@@ -174,7 +174,7 @@ class CertGenerator(BaseGenerator):
             context = self.prepare_context(fields)
             
             # 创建模板文档
-            doc = DocxTemplate(template_path)
+            doc = self._load_template(template_path)
             
             # 处理内联图片
             context = self._process_inline_images(context, doc)
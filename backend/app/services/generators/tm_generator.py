@@ -124,7 +124,7 @@ class TmGenerator(BaseGenerator):
                     "error": "Template file not found"
                 }
             
-            doc = DocxTemplate(template_path)
+            doc = self._load_template(template_path)
             
             # 处理内联图片
             context = self._process_inline_images(context, doc)
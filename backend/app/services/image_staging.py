@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+提取图片暂存服务
+
+文档提取得到的第一页图片（商标等）不再直接写入正式目录，而是先放在
+uploads/scratch/marks 暂存区，只有引用它们的表单或公司真正保存时才转存到正式目录。
+
+- 文件名为内容的 SHA-256，相同图片只存一份（重复提取同一文档不再产生新文件）；
+- 暂存文件超过 IMAGE_SCRATCH_TTL 秒未被使用即过期，清理在暂存新图片时顺带进行（按间隔节流）；
+- 转存到按内容寻址的存储（blob_store）：/uploads/blobs/<前两位>/<sha256>.<ext>，与上传的相同图片共用一份；
+  旧版本转存的 /uploads/company/marks/<sha256>.<ext> 继续有效。
+"""
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+from .file_upload_service import FileUploadService
+from .blob_store import blob_store
+from ..config import get_config_value
+
+logger = logging.getLogger(__name__)
+
+
+class ImageStagingService:
+    """提取图片暂存与转存"""
+
+    SCRATCH_SUBDIRS = ('scratch', 'marks')
+    MARKS_SUBDIRS = ('company', 'marks')
+    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tif', 'tiff', 'emf', 'wmf'}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    @staticmethod
+    def _public_url(subdirs, filename: str) -> str:
+        return '/' + '/'.join(('uploads',) + tuple(subdirs) + (filename,))
+
+    @staticmethod
+    def _content_filename(content: bytes, original_filename: str) -> str:
+        ext = os.path.splitext(original_filename or '')[1].lower().lstrip('.')
+        if ext not in ImageStagingService.ALLOWED_EXTENSIONS:
+            ext = 'png'
+        return f"{hashlib.sha256(content).hexdigest()}.{ext}"
+
+    @staticmethod
+    def _write_atomic(path: str, content: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def stage(self, images: List[Dict]) -> List[str]:
+        """暂存提取到的图片，返回访问路径列表（已转存过的相同图片直接返回正式路径）
+
+        images: [{'filename': str, 'bytes': bytes}]
+        """
+        base_dir = FileUploadService.get_upload_folder()
+        scratch_dir = FileUploadService.create_upload_directory(base_dir, *self.SCRATCH_SUBDIRS)
+        marks_dir = os.path.join(base_dir, *self.MARKS_SUBDIRS)
+
+        urls = []
+        for item in images:
+            content = item.get('bytes') or b''
+            if not content:
+                continue
+            filename = self._content_filename(content, item.get('filename', 'image'))
+            try:
+                digest, ext = os.path.splitext(filename)
+                promoted_path = blob_store.path(digest, ext)
+                legacy_path = os.path.join(marks_dir, filename)
+                if os.path.isfile(promoted_path) or os.path.isfile(legacy_path):
+                    # 已转存过：刷新修改时间，避免在新的表单保存前被当作孤儿回收（见 upload_gc）
+                    if os.path.isfile(promoted_path):
+                        os.utime(promoted_path)
+                        url = f"/uploads/{blob_store.public_path(digest, ext)}"
+                    else:
+                        os.utime(legacy_path)
+                        url = self._public_url(self.MARKS_SUBDIRS, filename)
+                else:
+                    scratch_path = os.path.join(scratch_dir, filename)
+                    if os.path.isfile(scratch_path):
+                        # 相同图片已在暂存区：只刷新过期时间
+                        os.utime(scratch_path)
+                    else:
+                        self._write_atomic(scratch_path, content)
+                    url = self._public_url(self.SCRATCH_SUBDIRS, filename)
+            except OSError as e:
+                logger.warning(f"暂存提取图片失败 {filename}: {str(e)}")
+                continue
+            if url not in urls:
+                urls.append(url)
+
+        self.purge_expired()
+        return urls
+
+    def is_staged(self, url: Optional[str]) -> bool:
+        return bool(url) and self._public_url(self.SCRATCH_SUBDIRS, '') in url
+
+    def ensure_available(self, urls: List[str]) -> bool:
+        """检查图片仍在磁盘上；暂存区中的图片同时刷新过期时间（供提取缓存命中时使用）"""
+        for url in urls or []:
+            local_path = FileUploadService.public_url_to_local_path(url)
+            if not local_path or not os.path.isfile(local_path):
+                return False
+            if self.is_staged(url):
+                try:
+                    os.utime(local_path)
+                except OSError:
+                    return False
+        return True
+
+    def promote(self, urls: Optional[List[str]]) -> Optional[List[str]]:
+        """将列表中的暂存图片转存到正式目录，返回替换为正式路径后的列表（其它路径原样保留）"""
+        if not urls or not isinstance(urls, list):
+            return urls
+
+        promoted = []
+        for url in urls:
+            if not isinstance(url, str) or not self.is_staged(url):
+                promoted.append(url)
+                continue
+
+            filename = os.path.basename(url.split('?', 1)[0])
+            digest, ext = os.path.splitext(filename)
+            scratch_path = FileUploadService.public_url_to_local_path(url)
+            with self._lock:
+                try:
+                    if scratch_path and os.path.isfile(scratch_path):
+                        # 暂存文件可能同时被其它会话引用，复制而不是移动，由过期清理回收
+                        blob_store.put_file(scratch_path)
+                    elif blob_store.exists(digest, ext):
+                        os.utime(blob_store.path(digest, ext))
+                    else:
+                        # 暂存已过期且从未转存：保留原路径，由前端提示重新提取
+                        logger.warning(f"暂存图片已过期，无法转存: {url}")
+                        promoted.append(url)
+                        continue
+                except (OSError, ValueError) as e:
+                    logger.warning(f"转存图片失败 {url}: {str(e)}")
+                    promoted.append(url)
+                    continue
+            promoted.append(f"/uploads/{blob_store.public_path(digest, ext)}")
+        return promoted
+
+    def purge_expired(self, force: bool = False) -> int:
+        """删除过期的暂存图片，返回删除数量（非强制时按 IMAGE_SCRATCH_PURGE_INTERVAL 节流）"""
+        now = time.time()
+        interval = float(get_config_value('IMAGE_SCRATCH_PURGE_INTERVAL', 600))
+        with self._lock:
+            if not force and now - self._last_purge < interval:
+                return 0
+            self._last_purge = now
+
+        ttl = float(get_config_value('IMAGE_SCRATCH_TTL', 24 * 3600))
+        scratch_dir = os.path.join(FileUploadService.get_upload_folder(), *self.SCRATCH_SUBDIRS)
+        removed = 0
+        try:
+            entries = list(os.scandir(scratch_dir))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.is_file() and now - entry.stat().st_mtime > ttl:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            logger.info(f"清理过期暂存图片 {removed} 个")
+        return removed
+
+
+# 全局实例
+image_staging_service = ImageStagingService()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+后台任务管理
+进程内的轻量任务队列：耗时操作（如一站式提取→保存→生成）提交为任务后立即返回任务ID，
+由有界线程池在应用上下文中执行，调用方通过 GET /api/mvp/jobs/<job_id> 查询状态与结果。
+
+任务只保存在当前进程内存中（多进程部署时需由同一进程查询），结束超过
+JOB_RETENTION_SECONDS 的任务在提交新任务时清理。
+"""
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from ..config import get_config_value
+from .retention import retention_manager
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """单个后台任务"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    def __init__(self, job_type: str):
+        self.id = uuid.uuid4().hex
+        self.type = job_type
+        self.status = Job.QUEUED
+        self.stage: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self._finished_monotonic: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (Job.SUCCEEDED, Job.FAILED)
+
+    def set_stage(self, stage: str, *_args, **_kwargs) -> None:
+        """记录当前阶段（可直接作为流水线的阶段回调）"""
+        self.stage = stage
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'type': self.type,
+            'status': self.status,
+            'stage': self.stage,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'result': self.result,
+            'error': self.error
+        }
+
+
+class JobManager:
+    """任务提交、执行与查询"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                workers = self._max_workers or int(get_config_value('JOB_WORKERS', 2))
+                self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='job')
+            return self._executor
+
+    def submit(self, app, job_type: str, func: Callable[..., Any], *args, **kwargs) -> Job:
+        """提交任务：func(job, *args, **kwargs) 在应用上下文中执行，返回值作为任务结果"""
+        self._prune()
+        job = Job(job_type)
+        with self._lock:
+            self._jobs[job.id] = job
+
+        def run() -> None:
+            job.status = Job.RUNNING
+            job.started_at = datetime.utcnow()
+            try:
+                with app.app_context():
+                    job.result = func(job, *args, **kwargs)
+                    # 结果中的下载地址在任务保留期内可用（不被生成文件清理删除）
+                    retention_manager.pin_referenced_jobs(job.result,
+                                                          float(get_config_value('JOB_RETENTION_SECONDS', 3600)))
+                job.status = Job.SUCCEEDED
+            except Exception as e:
+                logger.error(f"任务执行失败 {job.type}/{job.id}: {str(e)}")
+                job.error = str(e)
+                job.status = Job.FAILED
+            finally:
+                job.finished_at = datetime.utcnow()
+                job._finished_monotonic = time.monotonic()
+
+        self._get_executor().submit(run)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def _prune(self) -> None:
+        retention = float(get_config_value('JOB_RETENTION_SECONDS', 3600))
+        now = time.monotonic()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job._finished_monotonic is not None and now - job._finished_monotonic > retention]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+# 全局实例
+job_manager = JobManager()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+一站式流水线服务
+在服务端一次完成「提取 → 保存表单 → 生成文档」，代替前端依次调用
+/document-extract、/save-form-data、/generate-documents 三次往返；提取结果直接映射为表单字段，
+不经过前端与 JSON 往返。各阶段耗时记录在返回结果的 timings_ms 中。
+"""
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from ..main import db
+from ..models.company import Company
+from .document_extract import document_extraction_service
+from .form_data_service import upsert_form_data
+from .admission_control import admission_controller, AdmissionRejected
+from .generation_service import (
+    DocumentGeneratorFactory,
+    prepare_generation_data,
+    make_safe_approval_no,
+    generate_bundle,
+    package_bundle
+)
+from .generation_output import OutputJob
+
+# 提取结果中直接写入表单的字段（与前端 applyExtractionResult 的映射一致）
+EXTRACTED_FORM_FIELDS = (
+    'approval_no', 'information_folder_no', 'safety_class', 'pane_desc',
+    'trade_names', 'trade_marks',
+    'glass_layers', 'interlayer_layers', 'windscreen_thick', 'interlayer_thick',
+    'glass_treatment', 'interlayer_type', 'coating_type', 'coating_thick',
+    'material_nature', 'coating_color', 'remarks',
+    'conductors_choice', 'opaque_obscure_choice', 'glass_color_choice',
+    'interlayer_total', 'interlayer_partial', 'interlayer_colourless',
+    'vehicles', 'company_name', 'company_address'
+)
+
+
+class PipelineError(Exception):
+    """流水线某一阶段失败"""
+
+    def __init__(self, stage: str, message: str, error_code: Optional[str] = None,
+                 details: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.stage = stage
+        self.error_code = error_code
+        self.details = details or {}
+
+
+def _with_unit(value: Any, unit: str) -> Any:
+    if value and isinstance(value, str) and not value.endswith(unit.strip()):
+        return value + unit
+    return value
+
+
+def _vehicle_with_units(vehicle: Dict[str, Any]) -> Dict[str, Any]:
+    vehicle = dict(vehicle)
+    for key, unit in (('dev_area', ' m²'), ('seg_height', ' mm'), ('curv_radius', ' mm'),
+                      ('inst_angle', ' °'), ('seat_angle', ' °')):
+        if key in vehicle:
+            vehicle[key] = _with_unit(vehicle[key], unit)
+    coords = vehicle.get('rpoint_coords')
+    if isinstance(coords, dict):
+        vehicle['rpoint_coords'] = ' '.join(
+            f"{axis}: {_with_unit(coords[axis], ' mm')}" for axis in ('A', 'B', 'C') if coords.get(axis)
+        )
+    return vehicle
+
+
+def extraction_to_form_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    """将提取结果映射为待保存的表单字段（与前端应用提取结果、保存表单时的转换一致）"""
+    form_data = {key: data[key] for key in EXTRACTED_FORM_FIELDS if key in data}
+    for key in ('glass_layers', 'interlayer_layers'):
+        if key in form_data:
+            form_data[key] = str(form_data[key] or '')
+    for key in ('interlayer_total', 'interlayer_partial', 'interlayer_colourless'):
+        if key in form_data:
+            form_data[key] = form_data[key] is True or form_data[key] == 'true'
+    # 多选项：两项都选为 both_visible，只选一项取该项，未选则使用表单默认值
+    for key in ('conductors_choice', 'opaque_obscure_choice', 'glass_color_choice'):
+        choices = form_data.pop(key, None)
+        if isinstance(choices, list) and choices:
+            form_data[key] = 'both_visible' if len(choices) == 2 else choices[0]
+    for key in ('windscreen_thick', 'interlayer_thick'):
+        if key in form_data:
+            form_data[key] = _with_unit(form_data[key], ' mm')
+    if not isinstance(form_data.get('trade_marks', []), list):
+        form_data['trade_marks'] = []
+    if 'vehicles' in form_data:
+        vehicles = form_data['vehicles'] if isinstance(form_data['vehicles'], list) else []
+        form_data['vehicles'] = [_vehicle_with_units(v) for v in vehicles if isinstance(v, dict)]
+    return form_data
+
+
+def match_company(company_name: Optional[str]) -> Optional[Company]:
+    """按名称匹配已有公司（互相包含即视为匹配，忽略大小写；与前端自动匹配规则一致）"""
+    name = (company_name or '').strip().lower()
+    if not name:
+        return None
+    for company in Company.query.order_by(Company.id).all():
+        candidate = (company.name or '').lower()
+        if candidate and (name in candidate or candidate in name):
+            return company
+    return None
+
+
+def run_document_pipeline(file_path: str,
+                          session_id: Optional[str] = None,
+                          overrides: Optional[Dict[str, Any]] = None,
+                          output_format: str = 'docx',
+                          doc_types: Optional[List[str]] = None,
+                          output_dir: Optional[str] = None,
+                          use_cache: bool = True,
+                          on_stage: Optional[Callable[[str], None]] = None,
+                          admission_queue: bool = True) -> Dict[str, Any]:
+    """执行 提取 → 保存 → 生成
+
+    Args:
+        file_path: 已落盘的申请书文档（.doc/.docx/.pdf）
+        session_id: 会话ID；为空时新建会话，已存在时更新该会话
+        overrides: 覆盖提取结果的表单字段（如 company_id、approval_date 等），优先级最高
+        output_format: docx 或 pdf
+        doc_types: 只生成这些文档类型，默认全部
+        output_dir: 文档输出根目录，默认 UPLOAD_FOLDER/generated_files（发布到其下 jobs/<任务ID>/）
+        use_cache: 是否读取提取缓存
+        on_stage: 进入各阶段时的回调（extract/save/generate/package）
+        admission_queue: 提取与生成阶段占用全局并发名额时是否受队列深度与超时限制（后台任务传 False 一直等待）
+
+    Returns:
+        结果字典；任一阶段失败时抛出 PipelineError
+    """
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    def enter(stage: str) -> float:
+        if on_stage:
+            on_stage(stage)
+        return time.perf_counter()
+
+    def leave(stage: str, begin: float) -> None:
+        timings[stage] = round((time.perf_counter() - begin) * 1000, 3)
+
+    # 1. 提取
+    begin = enter('extract')
+    try:
+        with admission_controller.slot('extraction', queue=admission_queue):
+            extraction = document_extraction_service.extract_from_document(file_path, use_cache=use_cache)
+    except AdmissionRejected as e:
+        raise PipelineError('extract', str(e), 'server_busy', e.to_dict()) from e
+    finally:
+        # 预处理可能在文档旁生成 .clean.docx
+        cleaned = f"{os.path.splitext(file_path)[0]}.clean.docx"
+        if file_path.lower().endswith('.docx') and os.path.exists(cleaned):
+            os.remove(cleaned)
+    leave('extract', begin)
+    if not extraction.get('success'):
+        raise PipelineError('extract', extraction.get('error', '提取失败'), extraction.get('error_code'),
+                            {'classification': extraction.get('classification', {}), 'timings_ms': timings})
+    extracted = extraction.get('data', {})
+
+    # 2. 保存表单（提取结果 → 匹配公司 → 覆盖字段）
+    begin = enter('save')
+    form_fields = extraction_to_form_data(extracted)
+    overrides = dict(overrides or {})
+    company = Company.query.get(overrides['company_id']) if overrides.get('company_id') else \
+        match_company(form_fields.get('company_name'))
+    if overrides.get('company_id') and not company:
+        raise PipelineError('save', f"公司不存在: {overrides['company_id']}", 'company_not_found',
+                            {'timings_ms': timings})
+    if company:
+        form_fields['company_id'] = company.id
+        form_fields['company_name'] = company.name
+        form_fields['company_address'] = company.address or form_fields.get('company_address', '')
+    form_fields.update(overrides)
+    try:
+        form_record, session_id = upsert_form_data(session_id, form_fields)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise PipelineError('save', f"保存表单数据失败: {str(e)}", details={'timings_ms': timings})
+    leave('save', begin)
+
+    # 3. 生成
+    begin = enter('generate')
+    generation_data = prepare_generation_data(form_record)
+    safe_approval_no = make_safe_approval_no(form_record)
+    # 在独立的临时目录中生成，打包后整体发布
+    job = OutputJob(output_dir)
+    try:
+        with admission_controller.slot('generation', queue=admission_queue):
+            generated_files, failed_documents = generate_bundle(
+                generation_data, job.scratch_dir, safe_approval_no, output_format, doc_types
+            )
+    except AdmissionRejected as e:
+        job.discard()
+        raise PipelineError('generate', str(e), 'server_busy', dict(e.to_dict(), session_id=session_id)) from e
+    except BaseException:
+        job.discard()
+        raise
+    leave('generate', begin)
+
+    result: Dict[str, Any] = {
+        "session_id": session_id,
+        "form_data": form_fields,
+        "cache_hit": extraction.get('cache_hit', False),
+        "classification": extraction.get('classification', {}),
+        "generated_files": generated_files,
+        "failed_documents": failed_documents,
+        "total_requested": len(doc_types) if doc_types else len(DocumentGeneratorFactory().get_all_document_types()),
+        "total_success": len(generated_files),
+        "total_failed": len(failed_documents),
+        "timings_ms": timings
+    }
+    if not generated_files:
+        job.discard()
+        timings['total'] = round((time.perf_counter() - started) * 1000, 3)
+        raise PipelineError('generate', "所有文档生成失败", details=result)
+
+    # 4. 打包并发布
+    begin = enter('package')
+    zip_filename = f"documents_{safe_approval_no}_{output_format}.zip"
+    with job:
+        package_bundle(generated_files, job.path(zip_filename))
+        job.publish(generated_files)
+        job.publish_alias(zip_filename)
+    leave('package', begin)
+
+    result.update({
+        "filename": zip_filename,
+        "download_url": job.download_url(zip_filename)
+    })
+    timings['total'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
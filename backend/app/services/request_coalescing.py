@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+幂等键与进行中请求合并（生成文档包）
+
+双击与前端重试会为同一会话同时启动多次相同的生成，写入相同的文件名并浪费 CPU。两种机制：
+
+- 自动合并：键为 (会话, 生成数据哈希, 输出格式)。相同的请求正在执行时，后到的请求不再启动新的渲染，
+  而是等待并直接得到它的结果；结果在完成后保留 GENERATION_COALESCE_GRACE_SECONDS 秒；
+- Idempotency-Key 请求头：同一个键在 IDEMPOTENCY_KEY_TTL 秒内重复提交时返回第一次的结果（执行中则等待），
+  键被用于不同的请求（会话或格式不同）时拒绝。
+
+记录保存在 CACHE_FOLDER 下的 SQLite 文件中，多个 gunicorn 工作进程之间同样生效。执行者进程退出
+（POSIX 下按进程检测）或超过 GENERATION_COALESCE_LEASE_SECONDS 秒未完成时，等待者接手重新执行；
+执行抛出异常时删除记录，等待者同样接手。
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+from typing import Any, Callable, List, Optional, Tuple
+
+from ..config import get_config_value
+from .admission_control import pid_alive
+from .cancellation import check_cancelled
+
+logger = logging.getLogger(__name__)
+
+RUNNING = 'running'
+DONE = 'done'
+
+# 执行结果的来源
+EXECUTED = 'executed'
+COALESCED = 'coalesced'
+REPLAYED = 'replayed'
+
+
+class IdempotencyConflict(ValueError):
+    """幂等键已用于不同的请求"""
+
+
+class RequestCoalescer:
+    """基于 SQLite 的跨进程请求合并"""
+
+    DB_FILENAME = 'coalescing.sqlite3'
+
+    def __init__(self):
+        self._initialized_paths = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        path = os.path.join(get_config_value('CACHE_FOLDER'), self.DB_FILENAME)
+        if path not in self._initialized_paths:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        if path not in self._initialized_paths:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS coalesced_requests ("
+                " key TEXT PRIMARY KEY, fingerprint TEXT, state TEXT NOT NULL, pid INTEGER NOT NULL,"
+                " started_at REAL NOT NULL, expires_at REAL, result TEXT)"
+            )
+            self._initialized_paths.add(path)
+        return conn
+
+    def in_flight(self, key: str) -> bool:
+        """该键是否有正在执行的请求（用于决定后到的请求是否需要占用并发名额）"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT state, pid, started_at FROM coalesced_requests WHERE key = ?",
+                               (key,)).fetchone()
+        finally:
+            conn.close()
+        return bool(row) and row[0] == RUNNING and self._owner_alive(row[1], row[2], time.time())
+
+    def live_results(self) -> List[Any]:
+        """仍在保留期内的已完成结果（JSON 文本；生成文件清理据此保护其中下载地址引用的任务目录）"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT result FROM coalesced_requests WHERE state = ? AND expires_at >= ?",
+                                (DONE, time.time())).fetchall()
+        finally:
+            conn.close()
+        return [row[0] for row in rows if row[0]]
+
+    @staticmethod
+    def _owner_alive(pid: int, started_at: float, now: float) -> bool:
+        lease = float(get_config_value('GENERATION_COALESCE_LEASE_SECONDS', 900))
+        return now - started_at < lease and (pid == os.getpid() or pid_alive(pid))
+
+    def run(self, key: str, func: Callable[[], Any], ttl: float, fingerprint: Optional[str] = None,
+            on_attach: Optional[Callable[[str], None]] = None,
+            keep_result: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, str]:
+        """执行 func 或取得相同请求的结果，返回 (结果, 来源: executed/coalesced/replayed)
+
+        func 的返回值须可 JSON 序列化；ttl 为完成后结果保留的秒数。
+        fingerprint: 可选，请求内容指纹；键相同而指纹不同时抛出 IdempotencyConflict。
+        on_attach: 可选，确定合并到已有请求（等待或重放）时回调一次来源。
+        keep_result: 可选，返回 False 的结果不保留（之后相同的请求重新执行）。
+        等待期间当前上下文的取消令牌到期或被取消时抛出 OperationCancelled。
+        """
+        attached = False
+        delay = 0.05
+        while True:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                conn.execute("DELETE FROM coalesced_requests WHERE state = ? AND expires_at < ?", (DONE, now))
+                row = conn.execute(
+                    "SELECT fingerprint, state, pid, started_at, result FROM coalesced_requests WHERE key = ?", (key,)
+                ).fetchone()
+                if row and fingerprint is not None and row[0] != fingerprint:
+                    conn.execute("COMMIT")
+                    raise IdempotencyConflict("Idempotency-Key 已用于不同的请求")
+                if row and row[1] == DONE:
+                    conn.execute("COMMIT")
+                    outcome = COALESCED if attached else REPLAYED
+                    if on_attach and not attached:
+                        on_attach(outcome)
+                    return json.loads(row[4]), outcome
+                if row and self._owner_alive(row[2], row[3], now):
+                    conn.execute("COMMIT")
+                    if on_attach and not attached:
+                        on_attach(COALESCED)
+                    attached = True
+                    check_cancelled()
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.5)
+                    continue
+                # 没有记录，或执行者已退出：由本请求执行
+                conn.execute("INSERT OR REPLACE INTO coalesced_requests (key, fingerprint, state, pid, started_at) "
+                             "VALUES (?, ?, ?, ?, ?)", (key, fingerprint, RUNNING, os.getpid(), now))
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+            try:
+                result = func()
+            except BaseException:
+                self._forget(key)
+                raise
+            if keep_result and not keep_result(result):
+                self._forget(key)
+            else:
+                self._complete(key, result, ttl)
+            return result, EXECUTED
+
+    def _complete(self, key: str, result: Any, ttl: float) -> None:
+        conn = self._connect()
+        try:
+            # 至少保留到等待者（轮询间隔最长 0.5 秒）取到结果
+            conn.execute("UPDATE coalesced_requests SET state = ?, result = ?, expires_at = ? WHERE key = ?",
+                         (DONE, json.dumps(result, ensure_ascii=False, default=str), time.time() + max(ttl, 2.0), key))
+        except sqlite3.Error as e:
+            logger.warning(f"保存合并请求结果失败 {key}: {str(e)}")
+        finally:
+            conn.close()
+
+    def _forget(self, key: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM coalesced_requests WHERE key = ? AND pid = ?", (key, os.getpid()))
+        except sqlite3.Error as e:
+            logger.warning(f"删除合并请求记录失败 {key}: {str(e)}")
+        finally:
+            conn.close()
+
+
+# 全局实例
+request_coalescer = RequestCoalescer()
@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+"""
+生成文件的保留策略与清理
+
+uploads/generated_files 中的文档、文档包只增不减。清理以「单元」为单位：
+
+- jobs/<job_id>/：一次生成发布的全部文件（generation_output.OutputJob）；
+- 根目录下的文件：按批准号命名的文档包别名、旧版本直接写入的文档；
+- .scratch/<job_id>/：进行中的生成，视为在用，超过 RETENTION_SCRATCH_STALE_SECONDS 秒
+  （进程在生成中退出留下的）才删除；发布时的 .publish-*.tmp 临时文件同理。
+
+最近使用时间取修改时间（生成时间）与最近下载时间中较晚的一个，因此按最近下载做 LRU。下载时间由
+touch_last_used 记录在 retention.sqlite3 中（同一单元 LAST_USED_RECORD_INTERVAL 秒内只写一次），
+不修改文件本身：修改时间参与下载的 ETag，且文档包别名与 jobs 中的 ZIP 是同一个文件的硬链接。
+
+
+1. 超过 GENERATED_FILES_TTL_SECONDS 秒未使用的单元删除；
+2. 剩余总大小超过 GENERATED_FILES_MAX_BYTES 时，按最近使用时间从旧到新删除，直到不超过配额；
+3. 最近 RETENTION_MIN_AGE_SECONDS 秒内生成或下载过的单元、进行中的生成，任何情况下都不删除；
+   仍被引用的 jobs/<job_id>/ 同样不删除：后台任务的结果（任务完成时登记，保留 JOB_RETENTION_SECONDS 秒）
+   与合并请求/幂等键保留的结果中的下载地址所指向的任务目录。
+
+硬链接（文档包别名与 jobs 中的同一个 ZIP）只计算一次大小，回收字节数只计算真正释放的部分。
+预生成目录（speculative/）由预生成服务自行按 TTL 清理，这里不处理。
+
+每次清理的结果记录在 CACHE_FOLDER/retention.sqlite3 中（累计回收字节数等指标）；
+多个工作进程的后台清理通过同一个数据库协调，间隔内只有一个进程执行。
+"""
+import os
+import time
+import shutil
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from ..config import get_config_value
+from .admission_control import pid_alive
+from .generation_output import SCRATCH_DIRNAME, JOBS_DIRNAME, generated_files_dir, referenced_job_ids
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_DIRNAME = 'speculative'
+PUBLISH_TMP_PREFIX = '.publish-'
+MAX_RUN_HISTORY = 200
+# 同一单元的下载时间最多每隔多少秒写入一次
+LAST_USED_RECORD_INTERVAL = 60
+
+
+def touch_last_used(path: str) -> None:
+    """记录 generated_files 下的文件或目录的最近使用时间（下载时调用）"""
+    retention_manager.record_use(path)
+
+
+class _Unit:
+    """一个清理单元（目录或文件）"""
+
+    def __init__(self, path: str, kind: str, last_used: float):
+        self.path = path
+        self.kind = kind
+        self.last_used = last_used
+        self.size = 0
+        # (st_dev, st_ino, st_size)
+        self.files: List[tuple] = []
+        self.protected = False
+        self.referenced = False
+
+    def to_dict(self, root: str, now: float) -> Dict[str, Any]:
+        return {
+            "path": os.path.relpath(self.path, root),
+            "kind": self.kind,
+            "bytes": self.size,
+            "idle_seconds": round(now - self.last_used, 1)
+        }
+
+
+class RetentionManager:
+    """按保留时间与总大小配额清理生成文件"""
+
+    DB_FILENAME = 'retention.sqlite3'
+
+    def __init__(self):
+        self._initialized_paths = set()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # 本进程最近写入的下载时间：单元 -> 时间（节流）
+        self._recorded_uses: Dict[str, float] = {}
+        self._uses_lock = threading.Lock()
+
+    # ---------- 配置 ----------
+
+    @staticmethod
+    def policy() -> Dict[str, float]:
+        return {
+            "ttl_seconds": float(get_config_value('GENERATED_FILES_TTL_SECONDS', 7 * 24 * 3600)),
+            "max_bytes": int(get_config_value('GENERATED_FILES_MAX_BYTES', 5 * 1024 ** 3)),
+            "min_age_seconds": float(get_config_value('RETENTION_MIN_AGE_SECONDS', 600)),
+            "scratch_stale_seconds": float(get_config_value('RETENTION_SCRATCH_STALE_SECONDS', 6 * 3600)),
+            "sweep_interval_seconds": float(get_config_value('RETENTION_SWEEP_INTERVAL', 900))
+        }
+
+    # ---------- 记录 ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        path = os.path.join(get_config_value('CACHE_FOLDER'), self.DB_FILENAME)
+        if path not in self._initialized_paths:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        if path not in self._initialized_paths:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS retention_runs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER NOT NULL, trigger TEXT NOT NULL,"
+                " dry_run INTEGER NOT NULL, started_at REAL NOT NULL, finished_at REAL,"
+                " units_scanned INTEGER, units_deleted INTEGER, bytes_before INTEGER, bytes_after INTEGER,"
+                " bytes_reclaimed INTEGER, expired INTEGER, evicted INTEGER, stale INTEGER, errors INTEGER)"
+            )
+            # 累计指标（清理记录只保留最近 MAX_RUN_HISTORY 条）
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS retention_totals ("
+                " id INTEGER PRIMARY KEY CHECK (id = 1), runs INTEGER NOT NULL, units_deleted INTEGER NOT NULL,"
+                " bytes_reclaimed INTEGER NOT NULL, errors INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO retention_totals VALUES (1, 0, 0, 0, 0)")
+            # 仍被后台任务结果引用的任务目录（各工作进程的任务只在本进程内存中，登记在这里供清理进程读取）
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS retention_pins ("
+                " job_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+            # 各单元的最近下载时间（键为相对 generated_files 的单元路径：jobs/<job_id> 或文件名）
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS retention_last_used ("
+                " unit TEXT PRIMARY KEY, used_at REAL NOT NULL)"
+            )
+            self._initialized_paths.add(path)
+        return conn
+
+    def _claim_run(self, trigger: str, dry_run: bool, force: bool) -> Optional[int]:
+        """登记一次清理；非强制时，间隔内已有其它进程执行（或正在执行）则返回 None"""
+        interval = self.policy()['sweep_interval_seconds']
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            if not force and not dry_run:
+                row = conn.execute(
+                    "SELECT pid, started_at, finished_at FROM retention_runs WHERE dry_run = 0 "
+                    "ORDER BY id DESC LIMIT 1"
+                ).fetchone()
+                if row and now - row[1] < interval and (row[2] is not None or pid_alive(row[0])):
+                    conn.execute("COMMIT")
+                    return None
+            run_id = conn.execute(
+                "INSERT INTO retention_runs (pid, trigger, dry_run, started_at) VALUES (?, ?, ?, ?)",
+                (os.getpid(), trigger, int(dry_run), now)
+            ).lastrowid
+            conn.execute("DELETE FROM retention_runs WHERE id <= ?", (run_id - MAX_RUN_HISTORY,))
+            conn.execute("COMMIT")
+            return run_id
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _finish_run(self, run_id: int, report: Dict[str, Any]) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if not report['dry_run']:
+                conn.execute(
+                    "UPDATE retention_totals SET runs = runs + 1, units_deleted = units_deleted + ?,"
+                    " bytes_reclaimed = bytes_reclaimed + ?, errors = errors + ? WHERE id = 1",
+                    (len(report['deleted']), report['bytes_reclaimed'], len(report['errors']))
+                )
+            conn.execute(
+                "UPDATE retention_runs SET finished_at = ?, units_scanned = ?, units_deleted = ?, bytes_before = ?,"
+                " bytes_after = ?, bytes_reclaimed = ?, expired = ?, evicted = ?, stale = ?, errors = ? WHERE id = ?",
+                (time.time(), report['units_scanned'], len(report['deleted']), report['bytes_before'],
+                 report['bytes_after'], report['bytes_reclaimed'], report['expired'], report['evicted'],
+                 report['stale'], len(report['errors']), run_id)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        """累计指标与最近一次清理（不含试运行）"""
+        conn = self._connect()
+        try:
+            totals = conn.execute(
+                "SELECT runs, units_deleted, bytes_reclaimed, errors FROM retention_totals WHERE id = 1"
+            ).fetchone()
+            columns = ('trigger', 'started_at', 'finished_at', 'units_scanned', 'units_deleted', 'bytes_before',
+                       'bytes_after', 'bytes_reclaimed', 'expired', 'evicted', 'stale', 'errors')
+            last = conn.execute(
+                f"SELECT {', '.join(columns)} FROM retention_runs WHERE dry_run = 0 AND finished_at IS NOT NULL "
+                "ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        finally:
+            conn.close()
+        last_run = dict(zip(columns, last)) if last else None
+        if last_run:
+            for key in ('started_at', 'finished_at'):
+                last_run[key] = datetime.fromtimestamp(last_run[key]).isoformat()
+        return {
+            "runs": totals[0],
+            "units_deleted": totals[1],
+            "bytes_reclaimed": totals[2],
+            "errors": totals[3],
+            "last_run": last_run
+        }
+
+    # ---------- 引用 ----------
+
+    def pin_referenced_jobs(self, result: Any, ttl: float) -> None:
+        """登记结果中下载地址引用的任务目录，ttl 秒内不被清理（后台任务完成时调用）"""
+        job_ids = referenced_job_ids(result)
+        if not job_ids:
+            return
+        expires_at = time.time() + ttl
+        try:
+            conn = self._connect()
+            try:
+                conn.executemany(
+                    "INSERT INTO retention_pins (job_id, expires_at) VALUES (?, ?) "
+                    "ON CONFLICT(job_id) DO UPDATE SET expires_at = MAX(expires_at, excluded.expires_at)",
+                    [(job_id, expires_at) for job_id in job_ids]
+                )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"登记生成文件引用失败: {str(e)}")
+
+    def referenced_jobs(self) -> Set[str]:
+        """仍被引用的任务ID：已登记的后台任务结果 + 合并请求/幂等键保留的结果"""
+        from .request_coalescing import request_coalescer
+
+        conn = self._connect()
+        try:
+            job_ids = {row[0] for row in conn.execute("SELECT job_id FROM retention_pins WHERE expires_at >= ?",
+                                                      (time.time(),))}
+        finally:
+            conn.close()
+        for result in request_coalescer.live_results():
+            job_ids |= referenced_job_ids(result)
+        return job_ids
+
+    # ---------- 最近使用 ----------
+
+    @staticmethod
+    def _unit_key(path: str, root: str) -> Optional[str]:
+        """路径所属的清理单元（相对 root）；不在 root 下时返回 None"""
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(root)).replace(os.sep, '/')
+        if rel == '.' or rel.startswith('../'):
+            return None
+        parts = rel.split('/')
+        if parts[0] in (JOBS_DIRNAME, SCRATCH_DIRNAME) and len(parts) > 1:
+            return f"{parts[0]}/{parts[1]}"
+        return parts[0]
+
+    def record_use(self, path: str) -> None:
+        """记录最近下载时间（不修改文件）"""
+        unit = self._unit_key(path, generated_files_dir())
+        if not unit:
+            return
+        now = time.time()
+        with self._uses_lock:
+            last = self._recorded_uses.get(unit)
+            if last is not None and now - last < LAST_USED_RECORD_INTERVAL:
+                return
+            if len(self._recorded_uses) > 10000:
+                self._recorded_uses.clear()
+            self._recorded_uses[unit] = now
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT INTO retention_last_used (unit, used_at) VALUES (?, ?) "
+                    "ON CONFLICT(unit) DO UPDATE SET used_at = MAX(used_at, excluded.used_at)",
+                    (unit, now)
+                )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"记录生成文件下载时间失败 {unit}: {str(e)}")
+
+    def _last_uses(self) -> Dict[str, float]:
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT unit, used_at FROM retention_last_used").fetchall())
+        finally:
+            conn.close()
+
+    def _forget_uses(self, units: Iterable[str], before: float) -> None:
+        """删除已不存在的单元的下载记录（只删除 before 之前写入的，避免与刚发布的单元竞争）"""
+        units = list(units)
+        if not units:
+            return
+        conn = self._connect()
+        try:
+            conn.executemany("DELETE FROM retention_last_used WHERE unit = ? AND used_at < ?",
+                             [(unit, before) for unit in units])
+        finally:
+            conn.close()
+
+    def _forget_pins(self, now: float) -> None:
+        """删除已过期的任务引用登记"""
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM retention_pins WHERE expires_at < ?", (now,))
+        finally:
+            conn.close()
+
+    # ---------- 扫描 ----------
+
+    @staticmethod
+    def _scan_unit(unit: _Unit) -> None:
+        """统计单元内的文件（目录的最近使用时间取目录与其中文件修改时间的最大值）"""
+        paths = [unit.path]
+        if os.path.isdir(unit.path):
+            paths = []
+            for dirpath, _dirnames, filenames in os.walk(unit.path):
+                paths.extend(os.path.join(dirpath, name) for name in filenames)
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            unit.files.append((st.st_dev, st.st_ino, st.st_size))
+            unit.last_used = max(unit.last_used, st.st_mtime)
+
+    def scan(self, root: Optional[str] = None, referenced: Optional[Iterable[str]] = None,
+             prune: bool = False) -> List[_Unit]:
+        """列出清理单元并标记受保护的单元（默认只读）
+
+        referenced: 仍被引用的任务ID（默认读取 referenced_jobs()）
+        prune: 同时删除过期的引用登记与已不存在单元的使用记录（由 sweep 执行清理时使用）
+        """
+        root = root or generated_files_dir()
+        policy = self.policy()
+        referenced = set(self.referenced_jobs() if referenced is None else referenced)
+        now = time.time()
+        units: List[_Unit] = []
+        try:
+            entries = list(os.scandir(root))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            try:
+                mtime = entry.stat().st_mtime
+                if entry.name == SPECULATIVE_DIRNAME:
+                    continue
+                if entry.name in (SCRATCH_DIRNAME, JOBS_DIRNAME) and entry.is_dir():
+                    kind = 'scratch' if entry.name == SCRATCH_DIRNAME else 'job'
+                    units.extend(_Unit(sub.path, kind, sub.stat().st_mtime) for sub in os.scandir(entry.path))
+                elif entry.name.startswith(PUBLISH_TMP_PREFIX):
+                    units.append(_Unit(entry.path, 'scratch', mtime))
+                else:
+                    units.append(_Unit(entry.path, 'dir' if entry.is_dir() else 'file', mtime))
+            except OSError:
+                continue
+
+        uses = self._last_uses()
+        keys = set()
+        seen = set()
+        # 硬链接的大小计入 jobs 中的单元，根目录下的别名只计算独有的部分
+        units.sort(key=lambda u: u.kind != 'job')
+        for unit in units:
+            self._scan_unit(unit)
+            key = self._unit_key(unit.path, root)
+            keys.add(key)
+            unit.last_used = max(unit.last_used, uses.get(key, 0.0))
+            # 硬链接只计算一次
+            for dev, ino, size in unit.files:
+                if (dev, ino) not in seen:
+                    seen.add((dev, ino))
+                    unit.size += size
+            idle = now - unit.last_used
+            if unit.kind == 'scratch':
+                unit.protected = idle < max(policy['scratch_stale_seconds'], policy['min_age_seconds'])
+            elif unit.kind == 'job' and os.path.basename(unit.path) in referenced:
+                unit.protected = True
+                unit.referenced = True
+            else:
+                unit.protected = idle < policy['min_age_seconds']
+        if prune:
+            self._forget_uses(set(uses) - keys, now - policy['min_age_seconds'])
+            self._forget_pins(now)
+        return units
+
+    # ---------- 清理 ----------
+
+    @staticmethod
+    def _delete(unit: _Unit) -> int:
+        """删除单元，返回实际释放的字节数（仍有其它硬链接的文件不计）"""
+        reclaimed = 0
+        if os.path.isdir(unit.path):
+            for dirpath, _dirnames, filenames in os.walk(unit.path):
+                for name in filenames:
+                    try:
+                        st = os.stat(os.path.join(dirpath, name))
+                        if st.st_nlink <= 1:
+                            reclaimed += st.st_size
+                    except OSError:
+                        pass
+            shutil.rmtree(unit.path)
+        else:
+            st = os.stat(unit.path)
+            os.remove(unit.path)
+            if st.st_nlink <= 1:
+                reclaimed = st.st_size
+        return reclaimed
+
+    def sweep(self, dry_run: bool = False, trigger: str = 'manual', force: bool = True,
+              root: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """执行一次清理，返回报告；非强制且间隔内已有其它进程清理时返回 None
+
+        dry_run: 只列出将删除的单元，不删除（不计入累计指标）
+        """
+        run_id = self._claim_run(trigger, dry_run, force)
+        if run_id is None:
+            return None
+        root = root or generated_files_dir()
+        policy = self.policy()
+        now = time.time()
+        units = self.scan(root, prune=not dry_run)
+        bytes_before = sum(u.size for u in units)
+        report: Dict[str, Any] = {
+            "dry_run": dry_run,
+            "policy": policy,
+            "units_scanned": len(units),
+            "protected": sum(1 for u in units if u.protected),
+            "referenced": sum(1 for u in units if u.referenced),
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_before,
+            "bytes_reclaimed": 0,
+            "expired": 0,
+            "evicted": 0,
+            "stale": 0,
+            "deleted": [],
+            "errors": []
+        }
+
+        def remove(unit: _Unit, reason: str) -> None:
+            try:
+                reclaimed = unit.size if dry_run else self._delete(unit)
+            except OSError as e:
+                # 例如 Windows 下文件正在被下载
+                report['errors'].append({"path": os.path.relpath(unit.path, root), "error": str(e)})
+                return
+            report[reason] += 1
+            report['bytes_after'] -= unit.size
+            report['bytes_reclaimed'] += reclaimed
+            report['deleted'].append(dict(unit.to_dict(root, now), reason=reason, reclaimed=reclaimed))
+
+        candidates = []
+        for unit in sorted(units, key=lambda u: u.last_used):
+            if unit.protected:
+                continue
+            if unit.kind == 'scratch':
+                remove(unit, 'stale')
+            elif policy['ttl_seconds'] and now - unit.last_used > policy['ttl_seconds']:
+                remove(unit, 'expired')
+            else:
+                candidates.append(unit)
+        # 超出配额：按最近使用时间从旧到新淘汰
+        if policy['max_bytes']:
+            for unit in candidates:
+                if report['bytes_after'] <= policy['max_bytes']:
+                    break
+                # 只是其它单元的硬链接（如仍存在的文档包别名），删除不能减少占用
+                if unit.size:
+                    remove(unit, 'evicted')
+
+        self._finish_run(run_id, report)
+        if report['deleted'] and not dry_run:
+            logger.info(f"生成文件清理：删除 {len(report['deleted'])} 项，回收 {report['bytes_reclaimed']} 字节，"
+                        f"剩余 {report['bytes_after']} 字节")
+        return report
+
+    # ---------- 后台清理 ----------
+
+    def start(self, app) -> bool:
+        """启动后台定期清理（RETENTION_SWEEP_INTERVAL 为 0 时不启动），已启动时直接返回"""
+        interval = float(app.config.get('RETENTION_SWEEP_INTERVAL', 900))
+        if interval <= 0:
+            return False
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._loop, args=(app, interval),
+                                                name='retention-sweeper', daemon=True)
+                self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self, app, interval: float) -> None:
+        # 启动后稍等再执行第一次，避免与启动时的请求争抢磁盘
+        wait = min(60.0, interval)
+        while not self._stop.wait(wait):
+            try:
+                with app.app_context():
+                    self.sweep(trigger='background', force=False)
+            except Exception as e:
+                logger.warning(f"生成文件清理失败: {str(e)}")
+            wait = interval
+
+
+# 全局实例
+retention_manager = RetentionManager()
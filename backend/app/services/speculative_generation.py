@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+保存后预生成（可选，SPECULATIVE_GENERATION_ENABLED 开启）
+
+/save-form-data 提交成功后，在后台低优先级（独立的单线程执行器，不占用任务与请求线程）
+预先渲染该会话的文档包；随后的 /generate-documents 若生成数据未变，直接使用预生成结果。
+
+- 预生成结果按「生成数据哈希」存放：generated_files/speculative/<session>/<format>_<hash>/，
+  完成后写入 bundle.json 作为就绪标记，因此多进程部署时任一进程都能命中；
+- 生成数据包含公司快照，哈希同时纳入当天日期（部分模板写入生成日期）与模板文件修改时间；
+- 同一会话的新保存会取代旧的预生成：尚未开始的直接取消，进行中的在下一个文档前中止（进行中的 PDF 转换
+  直接终止），旧结果删除；
+- 超过 SPECULATIVE_GENERATION_TTL 秒的预生成结果在调度新任务时顺带清理（按间隔节流）。
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from werkzeug.utils import secure_filename
+
+from ..config import get_config_value
+from .generation_service import (
+    prepare_generation_data,
+    make_safe_approval_no,
+    generate_bundle,
+    generation_data_hash
+)
+from .admission_control import admission_controller
+from .cancellation import CancelToken, OperationCancelled, cancel_scope, current_token
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculationCancelled(Exception):
+    """预生成已被新的保存取代"""
+
+
+class _Speculation:
+    """一次进行中的预生成"""
+
+    def __init__(self, session_id: str, output_format: str, data_hash: str, bundle_dir: str):
+        self.session_id = session_id
+        self.output_format = output_format
+        self.data_hash = data_hash
+        self.bundle_dir = bundle_dir
+        self.cancelled = False
+        # 已获得生成名额并开始渲染
+        self.started = False
+        self.done = threading.Event()
+        self.token = CancelToken()
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        self.token.cancel(message="预生成已被新的保存取代")
+
+
+class SpeculativeGenerationService:
+    """保存后预生成文档包"""
+
+    BUNDLE_MANIFEST = 'bundle.json'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._inflight: Dict[Tuple[str, str], _Speculation] = {}
+        self._last_purge = 0.0
+
+    @staticmethod
+    def enabled() -> bool:
+        return str(get_config_value('SPECULATIVE_GENERATION_ENABLED', False)).lower() in ('1', 'true', 'yes')
+
+    @staticmethod
+    def formats() -> List[str]:
+        value = get_config_value('SPECULATIVE_GENERATION_FORMATS', 'docx')
+        return [f.strip().lower() for f in str(value).split(',') if f.strip().lower() in ('docx', 'pdf')]
+
+    @staticmethod
+    def _root_dir() -> str:
+        return os.path.join(get_config_value('UPLOAD_FOLDER'), 'generated_files', 'speculative')
+
+    def _session_dir(self, session_id: str) -> str:
+        return os.path.join(self._root_dir(), secure_filename(session_id) or 'session')
+
+    def _bundle_dir(self, session_id: str, output_format: str, data_hash: str) -> str:
+        return os.path.join(self._session_dir(session_id), f"{output_format}_{data_hash[:32]}")
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='speculative')
+            return self._executor
+
+    def schedule(self, app, form_data) -> List[str]:
+        """表单保存成功后调用：为变化了的生成数据排队预生成，返回排队的输出格式"""
+        if not self.enabled():
+            return []
+        self.purge_expired()
+
+        session_id = form_data.session_id
+        generation_data = prepare_generation_data(form_data)
+        safe_approval_no = make_safe_approval_no(form_data)
+        scheduled = []
+        for output_format in self.formats():
+            data_hash = generation_data_hash(generation_data, output_format)
+            bundle_dir = self._bundle_dir(session_id, output_format, data_hash)
+            with self._lock:
+                current = self._inflight.get((session_id, output_format))
+                if current and current.data_hash == data_hash and not current.cancelled:
+                    continue
+                if current:
+                    current.cancel()
+                self._discard_bundles(session_id, output_format, keep=bundle_dir)
+                if os.path.isfile(os.path.join(bundle_dir, self.BUNDLE_MANIFEST)):
+                    # 数据未变且已预生成
+                    continue
+                speculation = _Speculation(session_id, output_format, data_hash, bundle_dir)
+                self._inflight[(session_id, output_format)] = speculation
+            self._get_executor().submit(self._run, app, speculation, generation_data, safe_approval_no)
+            scheduled.append(output_format)
+        return scheduled
+
+    def _discard_bundles(self, session_id: str, output_format: str, keep: Optional[str] = None) -> None:
+        session_dir = self._session_dir(session_id)
+        try:
+            entries = list(os.scandir(session_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.is_dir() and entry.name.startswith(f"{output_format}_") and entry.path != keep:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _run(self, app, speculation: _Speculation, generation_data: Dict[str, Any], safe_approval_no: str) -> None:
+        def check_cancelled(event: Dict[str, Any]) -> None:
+            if speculation.cancelled:
+                raise SpeculationCancelled()
+
+        try:
+            if speculation.cancelled:
+                return
+            started = time.perf_counter()
+            work_dir = f"{speculation.bundle_dir}.tmp"
+            shutil.rmtree(work_dir, ignore_errors=True)
+            os.makedirs(work_dir, exist_ok=True)
+            try:
+                with app.app_context(), cancel_scope(speculation.token), \
+                        admission_controller.slot('generation', background=True):
+                    check_cancelled({})
+                    speculation.started = True
+                    generated, failed = generate_bundle(
+                        generation_data, work_dir, safe_approval_no, speculation.output_format,
+                        on_event=check_cancelled
+                    )
+                if speculation.cancelled or failed or not generated:
+                    # 存在失败的文档时不保留，交给正式生成重试并返回错误
+                    raise SpeculationCancelled()
+                bundle = {
+                    "session_id": speculation.session_id,
+                    "output_format": speculation.output_format,
+                    "data_hash": speculation.data_hash,
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+                    "documents": [
+                        {"type": g['type'], "filename": g['filename'], "elapsed_ms": g['elapsed_ms']}
+                        for g in generated
+                    ]
+                }
+                with open(os.path.join(work_dir, self.BUNDLE_MANIFEST), 'w', encoding='utf-8') as f:
+                    json.dump(bundle, f, ensure_ascii=False)
+                shutil.rmtree(speculation.bundle_dir, ignore_errors=True)
+                os.replace(work_dir, speculation.bundle_dir)
+                logger.info(f"预生成完成 {speculation.session_id}/{speculation.output_format}: "
+                            f"{len(generated)} 个文档, {bundle['elapsed_ms']} ms")
+            except (SpeculationCancelled, OperationCancelled):
+                # 被新的保存取代（包括排队等待生成名额时被取消）
+                shutil.rmtree(work_dir, ignore_errors=True)
+        except Exception as e:
+            logger.warning(f"预生成失败 {speculation.session_id}/{speculation.output_format}: {str(e)}")
+        finally:
+            speculation.done.set()
+            with self._lock:
+                if self._inflight.get((speculation.session_id, speculation.output_format)) is speculation:
+                    del self._inflight[(speculation.session_id, speculation.output_format)]
+
+    def take(self, session_id: str, generation_data: Dict[str, Any], output_format: str,
+             output_dir: str) -> Optional[List[Dict[str, Any]]]:
+        """生成数据与预生成一致时，将预生成的文档复制到 output_dir 并返回与 generate_bundle 相同格式的成功列表
+
+        进行中的相同预生成最多等待 SPECULATIVE_GENERATION_WAIT_SECONDS 秒（不超过当前请求的截止时间）；
+        未命中返回 None。
+        """
+        if not self.enabled():
+            return None
+        data_hash = generation_data_hash(generation_data, output_format)
+        with self._lock:
+            speculation = self._inflight.get((session_id, output_format))
+            if speculation and (speculation.data_hash != data_hash or not speculation.started):
+                # 数据已变化（如公司信息被修改）则旧的预生成不再有用；尚在等待生成名额的
+                # 由本次请求直接生成（本次请求已占用名额，等待它反而更慢）
+                speculation.cancel()
+                speculation = None
+        if speculation:
+            wait = float(get_config_value('SPECULATIVE_GENERATION_WAIT_SECONDS', 30))
+            token = current_token()
+            if token is not None and token.remaining() is not None:
+                wait = min(wait, token.remaining())
+            speculation.done.wait(wait)
+
+        bundle_dir = self._bundle_dir(session_id, output_format, data_hash)
+        try:
+            with open(os.path.join(bundle_dir, self.BUNDLE_MANIFEST), 'r', encoding='utf-8') as f:
+                bundle = json.load(f)
+            generated = []
+            for document in bundle['documents']:
+                target = os.path.join(output_dir, document['filename'])
+                fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
+                os.close(fd)
+                try:
+                    shutil.copyfile(os.path.join(bundle_dir, document['filename']), tmp_path)
+                    os.replace(tmp_path, target)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                generated.append({
+                    "type": document['type'],
+                    "filename": document['filename'],
+                    "file_path": target,
+                    "download_url": f"/api/mvp/download/{document['filename']}",
+                    "elapsed_ms": 0.0,
+                    "pregenerated": True
+                })
+            os.utime(bundle_dir)
+            return generated
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def purge_expired(self, force: bool = False) -> int:
+        """删除过期的预生成结果，返回删除数量（非强制时按 SPECULATIVE_GENERATION_PURGE_INTERVAL 节流）"""
+        now = time.time()
+        interval = float(get_config_value('SPECULATIVE_GENERATION_PURGE_INTERVAL', 600))
+        with self._lock:
+            if not force and now - self._last_purge < interval:
+                return 0
+            self._last_purge = now
+
+        ttl = float(get_config_value('SPECULATIVE_GENERATION_TTL', 3600))
+        removed = 0
+        try:
+            session_dirs = [e for e in os.scandir(self._root_dir()) if e.is_dir()]
+        except FileNotFoundError:
+            return 0
+        for session_dir in session_dirs:
+            try:
+                for entry in os.scandir(session_dir.path):
+                    if entry.is_dir() and now - entry.stat().st_mtime > ttl:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        removed += 1
+                if not os.listdir(session_dir.path):
+                    os.rmdir(session_dir.path)
+            except OSError:
+                continue
+        if removed:
+            logger.info(f"清理过期预生成结果 {removed} 个")
+        return removed
+
+
+# 全局实例
+speculative_generation_service = SpeculativeGenerationService()
@@ -4,6 +4,7 @@
 """
 import json
 import os
+import hashlib
 from typing import Dict, Any, Optional
 from flask import current_app
 
@@ -14,6 +15,7 @@ class SystemConfigService:
     def __init__(self):
         self._config_cache = None
         self._config_file_path = None
+        self._config_mtime = None
     
     def _get_config_file_path(self) -> str:
         """获取配置文件路径"""
@@ -25,15 +27,19 @@ class SystemConfigService:
         return self._config_file_path
     
     def _load_config(self) -> Dict[str, Any]:
-        """加载配置文件"""
-        if self._config_cache is not None:
-            return self._config_cache
-        
+        """加载配置文件（文件修改后自动重新加载）"""
         config_path = self._get_config_file_path()
+        try:
+            mtime = os.path.getmtime(config_path)
+        except OSError:
+            mtime = None
+        if self._config_cache is not None and mtime == self._config_mtime:
+            return self._config_cache
         
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
                 self._config_cache = json.load(f)
+            self._config_mtime = mtime
             return self._config_cache
         except FileNotFoundError:
             print(f"❌ 配置文件不存在: {config_path}")
@@ -123,9 +129,30 @@ class SystemConfigService:
         config = self._load_config()
         return config.get('glass_type_options', [])
     
+    def get_form_params(self) -> Dict[str, str]:
+        """获取写入表单记录的系统参数（版本号、实验室参数、法规更新日期）"""
+        version_params = self.get_version_params()
+        lab_params = self.get_laboratory_params()
+        return {
+            "version_1": version_params.get('version_1', '4'),
+            "version_2": version_params.get('version_2', '8'),
+            "version_3": version_params.get('version_3', '12'),
+            "version_4": version_params.get('version_4', '01'),
+            "temperature": lab_params.get('temperature', '22°C'),
+            "ambient_pressure": lab_params.get('ambient_pressure', '1020 mbar'),
+            "relative_humidity": lab_params.get('relative_humidity', '50 %'),
+            "regulation_update_date": self.get_regulation_update_date() or "12 June 2025"
+        }
+
+    def get_params_fingerprint(self) -> str:
+        """表单系统参数的指纹，参数变化即指纹变化（用于判断已保存的表单是否过期）"""
+        payload = json.dumps(self.get_form_params(), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
     def reload_config(self):
         """重新加载配置文件（清除缓存）"""
         self._config_cache = None
+        self._config_mtime = None
         return self._load_config()
 
 
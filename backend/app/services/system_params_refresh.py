@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+系统参数变更后的批量刷新
+
+config/system_params.json（法规更新日期、版本号、实验室参数）修改后，已保存的表单与已生成的文档
+都会过期，而表单中的系统参数只在下一次手动保存时刷新。本服务负责受控的批量刷新：
+
+1. 通过 SystemConfigService 的参数指纹判断是否有变化（与上次完成刷新时的指纹比较）；
+2. 按 id 顺序分批更新有效 FormData 的系统参数（每批提交一次）；
+3. 对参数有变化、且已经生成过文档包（generated_files 中存在对应ZIP）的会话重新渲染文档包。
+
+渲染在后台单线程中进行并限速（两次渲染至少间隔 SYSTEM_REFRESH_MIN_INTERVAL 秒），
+有交互请求进行中或刚结束不足 SYSTEM_REFRESH_IDLE_SECONDS 秒时暂缓，避免占用交互请求的资源。
+进度（游标、待渲染队列、计数）保存在 CACHE_FOLDER/system_params_refresh.json 中，
+暂停或进程重启后再次启动即从中断处继续；参数再次变化则重新开始。
+同一时刻只允许一个进程执行刷新：执行者在 CACHE_FOLDER/system_params_refresh.sqlite3 中登记
+（进程号 + 心跳），持有者退出或心跳超过 SYSTEM_REFRESH_LEASE_SECONDS 后才可由其它进程接管。
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from ..config import get_config_value
+from .system_config import system_config
+from .admission_control import admission_controller, pid_alive
+from .cancellation import generation_token, cancel_scope
+from .generation_output import OutputJob
+
+logger = logging.getLogger(__name__)
+
+RUNNING = 'running'
+PAUSED = 'paused'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+class RefreshInProgressError(RuntimeError):
+    """已有其它进程（或线程）在执行刷新"""
+
+
+class InteractiveActivity:
+    """交互请求活动跟踪（进程内），供后台任务判断是否需要让路"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self._last_finished = 0.0
+
+    def begin(self) -> None:
+        with self._lock:
+            self._active += 1
+
+    def end(self) -> None:
+        with self._lock:
+            self._active = max(0, self._active - 1)
+            self._last_finished = time.monotonic()
+
+    def idle_seconds(self) -> float:
+        """距最近一次交互请求结束的秒数；有请求进行中时为 0"""
+        with self._lock:
+            if self._active:
+                return 0.0
+            return time.monotonic() - self._last_finished
+
+
+class SystemParamsRefresher:
+    """系统参数批量刷新（更新表单 + 限速重新渲染）"""
+
+    STATE_FILENAME = 'system_params_refresh.json'
+    DB_FILENAME = 'system_params_refresh.sqlite3'
+    MAX_ERRORS = 20
+
+    def __init__(self, activity: Optional[InteractiveActivity] = None):
+        self.activity = activity or InteractiveActivity()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pause = threading.Event()
+        self._initialized_paths = set()
+
+    # ---------- 执行权 ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        path = os.path.join(get_config_value('CACHE_FOLDER'), self.DB_FILENAME)
+        if path not in self._initialized_paths:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        if path not in self._initialized_paths:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS refresh_claim ("
+                " id INTEGER PRIMARY KEY CHECK (id = 1), token TEXT NOT NULL, pid INTEGER NOT NULL,"
+                " heartbeat_at REAL NOT NULL, pause_requested INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._initialized_paths.add(path)
+        return conn
+
+    @staticmethod
+    def _claim_alive(row, now: float) -> bool:
+        lease = float(get_config_value('SYSTEM_REFRESH_LEASE_SECONDS', 600))
+        return row is not None and now - row[1] < lease and pid_alive(row[0])
+
+    def _claim(self) -> Optional[str]:
+        """登记为刷新执行者，已有存活的执行者时返回 None"""
+        token = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute("SELECT pid, heartbeat_at FROM refresh_claim WHERE id = 1").fetchone()
+            if self._claim_alive(row, now):
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "INSERT OR REPLACE INTO refresh_claim (id, token, pid, heartbeat_at, pause_requested)"
+                " VALUES (1, ?, ?, ?, 0)", (token, os.getpid(), now)
+            )
+            conn.execute("COMMIT")
+            return token
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _renew(self, token: str) -> None:
+        """刷新心跳并读取跨进程的暂停请求；执行权已被接管时抛出 RefreshInProgressError"""
+        conn = self._connect()
+        try:
+            updated = conn.execute(
+                "UPDATE refresh_claim SET heartbeat_at = ? WHERE id = 1 AND token = ?", (time.time(), token)
+            ).rowcount
+            if not updated:
+                raise RefreshInProgressError("刷新执行权已被其它进程接管")
+            row = conn.execute("SELECT pause_requested FROM refresh_claim WHERE id = 1").fetchone()
+            if row and row[0]:
+                self._pause.set()
+        finally:
+            conn.close()
+
+    def _release(self, token: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM refresh_claim WHERE id = 1 AND token = ?", (token,))
+        finally:
+            conn.close()
+
+    def _active_elsewhere(self) -> bool:
+        """是否有存活的执行者（含其它进程）"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT pid, heartbeat_at FROM refresh_claim WHERE id = 1").fetchone()
+        finally:
+            conn.close()
+        return self._claim_alive(row, time.time())
+
+    # ---------- 状态 ----------
+
+    @staticmethod
+    def _state_path() -> str:
+        return os.path.join(get_config_value('CACHE_FOLDER'), SystemParamsRefresher.STATE_FILENAME)
+
+    def load_state(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._state_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        state['updated_at'] = datetime.utcnow().isoformat()
+        path = self._state_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @property
+    def running(self) -> bool:
+        """本进程或其它进程是否正在执行刷新"""
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        return self._active_elsewhere()
+
+    def status(self) -> Dict[str, Any]:
+        """当前参数指纹、是否需要刷新、刷新进度"""
+        fingerprint = system_config.get_params_fingerprint()
+        state = self.load_state()
+        running = self.running
+        if state and state.get('status') == RUNNING and not running:
+            # 执行者在刷新过程中退出
+            state['status'] = 'interrupted'
+        return {
+            "fingerprint": fingerprint,
+            "stale": not state or state.get('fingerprint') != fingerprint or state.get('status') != COMPLETED,
+            "running": running,
+            "state": state
+        }
+
+    # ---------- 控制 ----------
+
+    def start(self, app, rerender: bool = True) -> Dict[str, Any]:
+        """在后台线程启动（或继续）刷新，已在运行时直接返回状态"""
+        with self._lock:
+            # 其它进程正在执行时不启动线程（run 中的登记仍是最终判断）
+            if not self.running:
+                self._pause.clear()
+                self._thread = threading.Thread(
+                    target=self._run_in_context, args=(app, rerender), name='system-params-refresh', daemon=True
+                )
+                self._thread.start()
+        return self.status()
+
+    def pause(self) -> bool:
+        """请求暂停（当前会话处理完后停止，执行者在其它进程时同样生效），返回是否有正在运行的刷新"""
+        self._pause.set()
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE refresh_claim SET pause_requested = 1 WHERE id = 1")
+        finally:
+            conn.close()
+        return self.running
+
+    def _run_in_context(self, app, rerender: bool) -> None:
+        with app.app_context():
+            try:
+                self.run(rerender=rerender)
+            except RefreshInProgressError as e:
+                logger.info(f"系统参数刷新未启动: {str(e)}")
+            except Exception as e:
+                logger.error(f"系统参数刷新失败: {str(e)}")
+
+    # ---------- 执行 ----------
+
+    def _initial_state(self, fingerprint: str, rerender: bool) -> Dict[str, Any]:
+        return {
+            "fingerprint": fingerprint,
+            "status": RUNNING,
+            "rerender": rerender,
+            "cursor": 0,
+            "pending": [],
+            "scanned": 0,
+            "updated": 0,
+            "render_queued": 0,
+            "rendered": 0,
+            "render_failed": 0,
+            "errors": [],
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None
+        }
+
+    def run(self, rerender: bool = True, throttle: bool = True,
+            on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """在当前线程执行刷新（需应用上下文），返回最终状态
+
+        throttle: 为 False 时不限速也不等待交互空闲（离线命令行使用）
+        已有其它执行者时抛出 RefreshInProgressError
+        """
+        token = self._claim()
+        if token is None:
+            raise RefreshInProgressError("已有其它进程在执行系统参数刷新")
+        try:
+            return self._run_claimed(token, rerender, throttle, on_progress)
+        finally:
+            self._release(token)
+
+    def _run_claimed(self, token: str, rerender: bool, throttle: bool,
+                     on_progress: Optional[Callable[[Dict[str, Any]], None]]) -> Dict[str, Any]:
+        fingerprint = system_config.get_params_fingerprint()
+        state = self.load_state()
+        if not state or state.get('fingerprint') != fingerprint:
+            state = self._initial_state(fingerprint, rerender)
+        elif state.get('status') == COMPLETED:
+            return state
+        state['status'] = RUNNING
+        state['rerender'] = rerender
+        self._save_state(state)
+
+        batch_size = max(1, int(get_config_value('SYSTEM_REFRESH_BATCH_SIZE', 50)))
+        last_render = 0.0
+        owned = True
+        try:
+            while True:
+                self._renew(token)
+                if self._pause.is_set():
+                    state['status'] = PAUSED
+                    break
+                if system_config.get_params_fingerprint() != fingerprint:
+                    # 刷新过程中参数再次变化：从头开始
+                    fingerprint = system_config.get_params_fingerprint()
+                    state = self._initial_state(fingerprint, rerender)
+                elif state['pending']:
+                    if throttle:
+                        last_render = self._wait_for_turn(last_render, token)
+                        if last_render is None:
+                            continue
+                    self._render_pending(state, state['pending'][0])
+                    state['pending'].pop(0)
+                elif not self._update_batch(state, batch_size):
+                    state['status'] = COMPLETED
+                    state['finished_at'] = datetime.utcnow().isoformat()
+                    break
+                self._save_state(state)
+                if on_progress:
+                    on_progress(state)
+        except RefreshInProgressError:
+            # 执行权已被接管：进度由新的执行者维护，不再写入
+            owned = False
+            raise
+        except Exception as e:
+            state['status'] = FAILED
+            self._record_error(state, None, str(e))
+            raise
+        finally:
+            if owned:
+                self._save_state(state)
+                if on_progress:
+                    on_progress(state)
+        return state
+
+    def _wait_for_turn(self, last_render: float, token: str) -> Optional[float]:
+        """等待限速间隔与交互空闲（等待期间保持心跳）；被暂停时返回 None"""
+        min_interval = float(get_config_value('SYSTEM_REFRESH_MIN_INTERVAL', 2))
+        idle_required = float(get_config_value('SYSTEM_REFRESH_IDLE_SECONDS', 3))
+        while not self._pause.is_set():
+            wait = max(min_interval - (time.monotonic() - last_render),
+                       idle_required - self.activity.idle_seconds())
+            if wait <= 0:
+                return time.monotonic()
+            self._pause.wait(min(wait, 1.0))
+            self._renew(token)
+        return None
+
+    def _update_batch(self, state: Dict[str, Any], batch_size: int) -> bool:
+        """更新下一批表单的系统参数并提交，返回是否还有表单"""
+        from ..main import db
+        from ..models import FormData
+        from .form_data_service import apply_system_params
+
+        rows = FormData.query.filter(FormData.is_active.is_(True), FormData.id > state['cursor']) \
+            .order_by(FormData.id).limit(batch_size).all()
+        if not rows:
+            return False
+        changed = [row for row in rows if apply_system_params(row)]
+        if state.get('rerender') and changed:
+            queued = {(item['session_id'], item['output_format']) for item in state['pending']}
+            for row in changed:
+                for output_format in self._existing_bundle_formats(row):
+                    if (row.session_id, output_format) in queued:
+                        continue
+                    queued.add((row.session_id, output_format))
+                    state['pending'].append({"session_id": row.session_id, "output_format": output_format})
+                    state['render_queued'] += 1
+            # 先保存待渲染项再提交表单：提交后进程退出也不会丢失重新渲染。
+            # 游标在提交后才前移，提交前退出时这一批会重新扫描（已排队的会话不会重复排队）
+            self._save_state(state)
+        db.session.commit()
+
+        state['cursor'] = rows[-1].id
+        state['scanned'] += len(rows)
+        state['updated'] += len(changed)
+        return True
+
+    @staticmethod
+    def _bundle_path(form_data, output_format: str) -> str:
+        from .generation_service import make_safe_approval_no
+        return os.path.join(get_config_value('UPLOAD_FOLDER'), 'generated_files',
+                            f"documents_{make_safe_approval_no(form_data)}_{output_format}.zip")
+
+    def _existing_bundle_formats(self, form_data) -> List[str]:
+        return [f for f in ('docx', 'pdf') if os.path.isfile(self._bundle_path(form_data, f))]
+
+    def _render_pending(self, state: Dict[str, Any], item: Dict[str, str]) -> None:
+        """重新渲染一个会话的文档包（与 /generate-documents 输出相同的文件）"""
+        from ..models import FormData
+        from .generation_service import prepare_generation_data, make_safe_approval_no, generate_bundle, package_bundle
+
+        session_id, output_format = item['session_id'], item['output_format']
+        try:
+            form_data = FormData.query.filter_by(session_id=session_id).first()
+            if not form_data:
+                raise ValueError("未找到表单数据")
+            token = generation_token()
+            bundle_filename = os.path.basename(self._bundle_path(form_data, output_format))
+            # 在独立的临时目录中渲染，完成后发布并原子替换按批准号命名的文档包
+            with OutputJob() as job:
+                with admission_controller.slot('generation', background=True), cancel_scope(token):
+                    generated, failed = generate_bundle(
+                        prepare_generation_data(form_data), job.scratch_dir, make_safe_approval_no(form_data),
+                        output_format
+                    )
+                # 超时中止时保留原有文档包，不用不完整的结果覆盖
+                token.check()
+                if not generated:
+                    raise RuntimeError("所有文档生成失败")
+                package_bundle(generated, job.path(bundle_filename))
+                job.publish(generated)
+                job.publish_alias(bundle_filename)
+            state['rendered'] += 1
+            if failed:
+                self._record_error(state, session_id, f"{len(failed)} 个文档生成失败: "
+                                   + '; '.join(f"{d['type']}: {d['error']}" for d in failed))
+        except Exception as e:
+            state['render_failed'] += 1
+            self._record_error(state, session_id, str(e))
+            logger.warning(f"系统参数刷新：重新渲染失败 {session_id}/{output_format}: {str(e)}")
+
+    def _record_error(self, state: Dict[str, Any], session_id: Optional[str], error: str) -> None:
+        state['errors'].append({"session_id": session_id, "error": error, "at": datetime.utcnow().isoformat()})
+        del state['errors'][:-self.MAX_ERRORS]
+
+
+# 全局实例
+interactive_activity = InteractiveActivity()
+system_params_refresher = SystemParamsRefresher(interactive_activity)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+图片缩略图（商标、公司图片、签名的预览）
+
+公司列表与商标预览只需要几十像素的小图，以前却加载原图。缩略图：
+
+- 尺寸按 THUMBNAIL_SIZES 分档（请求的尺寸向上取最近的一档），同一张图每档只生成一次；
+- 首次请求时生成，缓存在 CACHE_FOLDER/thumbnails/<前两位>/<源文件 SHA-256>_<尺寸>.<格式>，
+  以内容哈希为键：相同内容的不同上传共用缓存，源文件变化后自然对应新的缓存；
+  按内容寻址的文件（blobs/ 等以 SHA-256 命名）直接取文件名，不需要重新计算哈希；
+- 缓存文件数超过 THUMBNAIL_CACHE_MAX_ENTRIES 时按修改时间从旧到新淘汰（生成新缩略图时顺带进行，按间隔节流）。
+
+依赖 Pillow（可选）：未安装或源图片无法解码（如 EMF/WMF）时返回原图。
+"""
+import os
+import re
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from ..config import get_config_value
+
+try:
+    from PIL import Image, ImageOps  # type: ignore
+except ImportError:  # 可选依赖：未安装时直接返回原图
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_DIRNAME = 'thumbnails'
+_CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{64}$')
+# 源文件哈希的内存缓存条数（按路径、修改时间与大小）
+_HASH_CACHE_SIZE = 2048
+
+
+class ThumbnailService:
+    """按尺寸分档生成并缓存缩略图"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hashes: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._last_evict = 0.0
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    @staticmethod
+    def sizes() -> List[int]:
+        sizes = get_config_value('THUMBNAIL_SIZES', (64, 128, 256, 512))
+        if isinstance(sizes, str):
+            sizes = [s for s in sizes.split(',') if s.strip()]
+        return sorted(int(s) for s in sizes)
+
+    def bucket(self, size: int) -> int:
+        """请求的尺寸向上取最近的一档（超过最大档时取最大档）"""
+        sizes = self.sizes()
+        for bucket in sizes:
+            if size <= bucket:
+                return bucket
+        return sizes[-1]
+
+    @staticmethod
+    def cache_dir() -> str:
+        return os.path.join(get_config_value('CACHE_FOLDER'), THUMBNAILS_DIRNAME)
+
+    @staticmethod
+    def is_content_addressed(path: str) -> bool:
+        """文件名即内容的 SHA-256（内容不会在同一地址下变化）"""
+        return bool(_CONTENT_ADDRESSED_NAME.match(os.path.splitext(os.path.basename(path))[0]))
+
+    def source_hash(self, path: str) -> str:
+        """源文件内容的 SHA-256"""
+        if self.is_content_addressed(path):
+            return os.path.splitext(os.path.basename(path))[0]
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            digest = self._hashes.get(key)
+            if digest:
+                self._hashes.move_to_end(key)
+                return digest
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(64 * 1024), b''):
+                hasher.update(data)
+        digest = hasher.hexdigest()
+        with self._lock:
+            self._hashes[key] = digest
+            while len(self._hashes) > _HASH_CACHE_SIZE:
+                self._hashes.popitem(last=False)
+        return digest
+
+    def get(self, source_path: str, size: int) -> Tuple[str, str]:
+        """返回 (缩略图路径, ETag)；无法生成时返回 (源文件路径, ETag)
+
+        source_path: 源图片的本地路径（调用方负责校验）
+        """
+        bucket = self.bucket(size)
+        digest = self.source_hash(source_path)
+        if Image is None:
+            return source_path, digest
+
+        cache_dir = os.path.join(self.cache_dir(), digest[:2])
+        for ext in ('png', 'jpg'):
+            cached = os.path.join(cache_dir, f"{digest}_{bucket}.{ext}")
+            if os.path.isfile(cached):
+                return cached, f"{digest}-{bucket}"
+        try:
+            return self._render(source_path, cache_dir, digest, bucket), f"{digest}-{bucket}"
+        except Exception as e:
+            # 例如 EMF/WMF 或损坏的图片
+            logger.warning(f"生成缩略图失败 {source_path}: {str(e)}")
+            return source_path, digest
+
+    def _render(self, source_path: str, cache_dir: str, digest: str, bucket: int) -> str:
+        with Image.open(source_path) as img:
+            # JPEG 按目标尺寸解码，避免为大图分配完整的像素缓冲
+            img.draft('RGB', (bucket, bucket))
+            img = ImageOps.exif_transpose(img)
+            has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+            img.thumbnail((bucket, bucket), Image.LANCZOS)
+            ext, fmt, options = ('png', 'PNG', {'optimize': True}) if has_alpha else \
+                ('jpg', 'JPEG', {'quality': 85, 'optimize': True})
+
+            os.makedirs(cache_dir, exist_ok=True)
+            target = os.path.join(cache_dir, f"{digest}_{bucket}.{ext}")
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    img.save(f, fmt, **options)
+                os.replace(tmp_path, target)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        self._evict()
+        return target
+
+    def _evict(self) -> None:
+        """缓存文件数超过上限时，按修改时间从旧到新淘汰（按间隔节流）"""
+        max_entries = int(get_config_value('THUMBNAIL_CACHE_MAX_ENTRIES', 20000))
+        now = time.time()
+        with self._lock:
+            if not max_entries or now - self._last_evict < 300:
+                return
+            self._last_evict = now
+        try:
+            entries = []
+            for dirpath, _dirnames, filenames in os.walk(self.cache_dir()):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        entries.append((os.path.getmtime(path), path))
+                    except OSError:
+                        continue
+            overflow = len(entries) - max_entries
+            if overflow <= 0:
+                return
+            entries.sort()
+            for _, path in entries[:overflow]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        except Exception as e:
+            logger.warning(f"缩略图缓存淘汰失败: {str(e)}")
+
+
+# 全局实例
+thumbnail_service = ThumbnailService()
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+公司图片（商标、公司图片、签名）的孤儿文件回收
+
+uploads/company/marks、picture、signature 与按内容存储的 uploads/blobs/（见 blob_store）中的文件只增不减：
+提取时转存的商标、被替换的上传都不再有任何记录引用。回收按「引用扫描」进行：
+
+1. 一次查询数据库中全部引用（Company.trade_marks / picture / signature、FormData.trade_marks），
+   规范化为 uploads 下的相对路径，与磁盘上的文件比较；
+2. 没有被引用、且修改时间早于 UPLOAD_GC_MIN_AGE_SECONDS 秒的文件为孤儿。移动前再查询一次引用
+   并重新检查修改时间（刚上传、尚未保存到表单或公司的文件，以及提取时重新命中的内容寻址商标，
+   都会刷新修改时间），然后移入 uploads/.quarantine/ 下的相同相对路径（不再对外提供）；
+3. 隔离超过 UPLOAD_GC_QUARANTINE_SECONDS 秒的文件再次核对引用：仍无引用则删除，已被重新引用则恢复；
+   访问 /uploads/ 下已被隔离的文件时也会立即恢复（restore），隔离期内误判的文件不会丢失。
+
+隔离时间记录在隔离文件的修改时间上；每次回收的结果记录在 CACHE_FOLDER/upload_gc.sqlite3 中，
+多个工作进程的后台回收通过同一个数据库协调，间隔内只有一个进程执行。
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import posixpath
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from ..config import get_config_value
+from .admission_control import pid_alive
+from .blob_store import BLOBS_DIRNAME
+
+logger = logging.getLogger(__name__)
+
+SCAN_SUBDIRS = ('company/marks', 'company/picture', 'company/signature')
+QUARANTINE_DIRNAME = '.quarantine'
+# 代码中直接引用（示例数据），没有数据库记录
+KEEP_FILES = {'company/marks/defaut_mark.png'}
+MAX_RUN_HISTORY = 200
+
+
+def reference_path(url: Any) -> Optional[str]:
+    """将记录中的图片地址规范化为 uploads 下的相对路径（如 company/marks/x.png），无法识别时返回 None
+
+    与 Company.to_dict 的规则一致：绝对 URL 与 /uploads/ 开头的路径取 /uploads/ 之后的部分，
+    其它相对路径视为相对于 uploads。
+    """
+    if not isinstance(url, str) or not url.strip():
+        return None
+    url = url.strip().split('?', 1)[0].split('#', 1)[0].replace('\\', '/')
+    idx = url.find('/uploads/')
+    if idx != -1:
+        relative = url[idx + len('/uploads/'):]
+    elif url.startswith('http'):
+        return None
+    else:
+        relative = url.lstrip('/')
+        if relative.startswith('uploads/'):
+            relative = relative[len('uploads/'):]
+    relative = posixpath.normpath(relative)
+    if relative in ('.', '') or relative.startswith('../') or relative == '..':
+        return None
+    return relative
+
+
+def _trade_mark_urls(value: Any) -> Iterable[Any]:
+    """trade_marks 字段（JSON 字符串或列表）中的地址"""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            return [value]
+    return value if isinstance(value, list) else []
+
+
+class UploadGarbageCollector:
+    """按数据库引用回收公司图片"""
+
+    DB_FILENAME = 'upload_gc.sqlite3'
+
+    def __init__(self):
+        self._initialized_paths = set()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    # ---------- 配置 ----------
+
+    @staticmethod
+    def policy() -> Dict[str, float]:
+        return {
+            "min_age_seconds": float(get_config_value('UPLOAD_GC_MIN_AGE_SECONDS', 24 * 3600)),
+            "quarantine_seconds": float(get_config_value('UPLOAD_GC_QUARANTINE_SECONDS', 7 * 24 * 3600)),
+            "sweep_interval_seconds": float(get_config_value('UPLOAD_GC_INTERVAL', 6 * 3600))
+        }
+
+    @staticmethod
+    def _upload_root() -> str:
+        return os.path.abspath(get_config_value('UPLOAD_FOLDER'))
+
+    def _quarantine_root(self) -> str:
+        return os.path.join(self._upload_root(), QUARANTINE_DIRNAME)
+
+    # ---------- 记录 ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        path = os.path.join(get_config_value('CACHE_FOLDER'), self.DB_FILENAME)
+        if path not in self._initialized_paths:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        if path not in self._initialized_paths:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS upload_gc_runs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER NOT NULL, trigger TEXT NOT NULL,"
+                " dry_run INTEGER NOT NULL, started_at REAL NOT NULL, finished_at REAL,"
+                " files_scanned INTEGER, quarantined INTEGER, restored INTEGER, deleted INTEGER,"
+                " bytes_reclaimed INTEGER, errors INTEGER)"
+            )
+            # 累计指标（回收记录只保留最近 MAX_RUN_HISTORY 条）
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS upload_gc_totals ("
+                " id INTEGER PRIMARY KEY CHECK (id = 1), runs INTEGER NOT NULL, quarantined INTEGER NOT NULL,"
+                " restored INTEGER NOT NULL, deleted INTEGER NOT NULL, bytes_reclaimed INTEGER NOT NULL,"
+                " errors INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO upload_gc_totals VALUES (1, 0, 0, 0, 0, 0, 0)")
+            self._initialized_paths.add(path)
+        return conn
+
+    def _claim_run(self, trigger: str, dry_run: bool, force: bool) -> Optional[int]:
+        """登记一次回收；非强制时，间隔内已有其它进程执行（或正在执行）则返回 None"""
+        interval = self.policy()['sweep_interval_seconds']
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            if not force and not dry_run:
+                row = conn.execute(
+                    "SELECT pid, started_at, finished_at FROM upload_gc_runs WHERE dry_run = 0 "
+                    "ORDER BY id DESC LIMIT 1"
+                ).fetchone()
+                if row and now - row[1] < interval and (row[2] is not None or pid_alive(row[0])):
+                    conn.execute("COMMIT")
+                    return None
+            run_id = conn.execute(
+                "INSERT INTO upload_gc_runs (pid, trigger, dry_run, started_at) VALUES (?, ?, ?, ?)",
+                (os.getpid(), trigger, int(dry_run), now)
+            ).lastrowid
+            conn.execute("DELETE FROM upload_gc_runs WHERE id <= ?", (run_id - MAX_RUN_HISTORY,))
+            conn.execute("COMMIT")
+            return run_id
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _finish_run(self, run_id: int, report: Dict[str, Any]) -> None:
+        counts = (len(report['quarantined']), len(report['restored']), len(report['deleted']),
+                  report['bytes_reclaimed'], len(report['errors']))
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if not report['dry_run']:
+                conn.execute(
+                    "UPDATE upload_gc_totals SET runs = runs + 1, quarantined = quarantined + ?,"
+                    " restored = restored + ?, deleted = deleted + ?, bytes_reclaimed = bytes_reclaimed + ?,"
+                    " errors = errors + ? WHERE id = 1", counts
+                )
+            conn.execute(
+                "UPDATE upload_gc_runs SET finished_at = ?, files_scanned = ?, quarantined = ?, restored = ?,"
+                " deleted = ?, bytes_reclaimed = ?, errors = ? WHERE id = ?",
+                (time.time(), report['files_scanned']) + counts + (run_id,)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        """累计指标与最近一次回收（不含试运行）"""
+        conn = self._connect()
+        try:
+            totals = conn.execute(
+                "SELECT runs, quarantined, restored, deleted, bytes_reclaimed, errors FROM upload_gc_totals "
+                "WHERE id = 1"
+            ).fetchone()
+            columns = ('trigger', 'started_at', 'finished_at', 'files_scanned', 'quarantined', 'restored',
+                       'deleted', 'bytes_reclaimed', 'errors')
+            last = conn.execute(
+                f"SELECT {', '.join(columns)} FROM upload_gc_runs WHERE dry_run = 0 AND finished_at IS NOT NULL "
+                "ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        finally:
+            conn.close()
+        last_run = dict(zip(columns, last)) if last else None
+        if last_run:
+            for key in ('started_at', 'finished_at'):
+                last_run[key] = datetime.fromtimestamp(last_run[key]).isoformat()
+        return dict(zip(('runs', 'quarantined', 'restored', 'deleted', 'bytes_reclaimed', 'errors'), totals),
+                    last_run=last_run)
+
+    # ---------- 扫描 ----------
+
+    @staticmethod
+    def live_references() -> Set[str]:
+        """数据库中引用的全部图片（uploads 下的相对路径），一次查询两张表的相关列"""
+        from ..main import db
+        from ..models import Company, FormData
+
+        live: Set[str] = set()
+
+        def add(url: Any) -> None:
+            relative = reference_path(url)
+            if relative:
+                live.add(relative)
+
+        for trade_marks, picture, signature in db.session.query(Company.trade_marks, Company.picture,
+                                                                Company.signature):
+            add(picture)
+            add(signature)
+            for url in _trade_mark_urls(trade_marks):
+                add(url)
+        for (trade_marks,) in db.session.query(FormData.trade_marks):
+            for url in _trade_mark_urls(trade_marks):
+                add(url)
+        return live
+
+    @staticmethod
+    def _scan_dirs(root: str) -> List[str]:
+        """要扫描的子目录（相对路径）：公司图片目录与 blobs/ 下的各个分组目录"""
+        subdirs = list(SCAN_SUBDIRS)
+        try:
+            subdirs.extend(f"{BLOBS_DIRNAME}/{entry.name}" for entry in os.scandir(os.path.join(root, BLOBS_DIRNAME))
+                           if entry.is_dir() and not entry.name.startswith('.'))
+        except FileNotFoundError:
+            pass
+        return subdirs
+
+    @staticmethod
+    def _is_managed(relative: str) -> bool:
+        directory = posixpath.dirname(relative)
+        return directory in SCAN_SUBDIRS or (posixpath.dirname(directory) == BLOBS_DIRNAME
+                                             and not posixpath.basename(directory).startswith('.'))
+
+    def _list_files(self, root: str) -> Dict[str, os.stat_result]:
+        """root 下各子目录中的文件：相对路径 -> stat（不含临时文件与隐藏文件）"""
+        files = {}
+        for subdir in self._scan_dirs(root):
+            try:
+                entries = list(os.scandir(os.path.join(root, *subdir.split('/'))))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        files[f"{subdir}/{entry.name}"] = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+        return files
+
+    def quarantine_usage(self) -> Dict[str, int]:
+        files = self._list_files(self._quarantine_root())
+        return {"files": len(files), "bytes": sum(st.st_size for st in files.values())}
+
+    # ---------- 隔离与恢复 ----------
+
+    def restore(self, relative_path: str) -> bool:
+        """恢复被隔离的文件（访问或重新引用时），返回原位置上是否已有该文件"""
+        relative = reference_path(relative_path)
+        if not relative or not self._is_managed(relative):
+            return False
+        original = os.path.join(self._upload_root(), *relative.split('/'))
+        quarantined = os.path.join(self._quarantine_root(), *relative.split('/'))
+        with self._lock:
+            if not os.path.isfile(quarantined):
+                return os.path.isfile(original)
+            try:
+                if os.path.exists(original):
+                    # 已重新上传或转存（内容寻址的文件名相同）：丢弃隔离的副本
+                    os.remove(quarantined)
+                else:
+                    os.makedirs(os.path.dirname(original), exist_ok=True)
+                    os.replace(quarantined, original)
+                    # 恢复后重新计算最短保留时间
+                    os.utime(original)
+            except OSError as e:
+                logger.warning(f"恢复隔离文件失败 {relative}: {str(e)}")
+                return os.path.isfile(original)
+        logger.info(f"恢复隔离文件: {relative}")
+        return True
+
+    def _quarantine(self, relative: str, expected: os.stat_result) -> bool:
+        """移入隔离区；文件在检查后被修改（重新上传）或已不存在时放弃，返回是否已隔离"""
+        source = os.path.join(self._upload_root(), *relative.split('/'))
+        target = os.path.join(self._quarantine_root(), *relative.split('/'))
+        with self._lock:
+            try:
+                st = os.stat(source)
+            except FileNotFoundError:
+                return False
+            if st.st_mtime != expected.st_mtime or st.st_ino != expected.st_ino:
+                return False
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source, target)
+            # 隔离时间记录在修改时间上
+            os.utime(target)
+        return True
+
+    # ---------- 回收 ----------
+
+    def sweep(self, dry_run: bool = False, trigger: str = 'manual', force: bool = True) -> Optional[Dict[str, Any]]:
+        """执行一次回收，返回报告；非强制且间隔内已有其它进程回收时返回 None
+
+        dry_run: 只列出将隔离、恢复、删除的文件，不做修改（不计入累计指标）
+        """
+        run_id = self._claim_run(trigger, dry_run, force)
+        if run_id is None:
+            return None
+        policy = self.policy()
+        root = self._upload_root()
+        report: Dict[str, Any] = {
+            "dry_run": dry_run,
+            "policy": policy,
+            "files_scanned": 0,
+            "referenced": 0,
+            "protected": 0,
+            "quarantined": [],
+            "restored": [],
+            "deleted": [],
+            "bytes_reclaimed": 0,
+            "errors": []
+        }
+        try:
+            self._sweep(report, root, policy, dry_run)
+        finally:
+            self._finish_run(run_id, report)
+        if not dry_run and (report['quarantined'] or report['restored'] or report['deleted']):
+            logger.info(f"上传文件回收：隔离 {len(report['quarantined'])} 个，恢复 {len(report['restored'])} 个，"
+                        f"删除 {len(report['deleted'])} 个（回收 {report['bytes_reclaimed']} 字节）")
+        return report
+
+    def _sweep(self, report: Dict[str, Any], root: str, policy: Dict[str, float], dry_run: bool) -> None:
+        # 查询失败时直接抛出：不能把「没有引用」当作全部是孤儿
+        live = self.live_references()
+        now = time.time()
+
+        def entry(relative: str, st: os.stat_result) -> Dict[str, Any]:
+            return {"path": relative, "bytes": st.st_size, "idle_seconds": round(now - st.st_mtime, 1)}
+
+        def error(relative: str, e: Exception) -> None:
+            report['errors'].append({"path": relative, "error": str(e)})
+
+        # 1. 隔离区：重新被引用的恢复，隔离期满的删除
+        for relative, st in sorted(self._list_files(self._quarantine_root()).items()):
+            if relative in live:
+                if dry_run or self.restore(relative):
+                    report['restored'].append(entry(relative, st))
+            elif now - st.st_mtime >= policy['quarantine_seconds']:
+                try:
+                    if not dry_run:
+                        os.remove(os.path.join(self._quarantine_root(), *relative.split('/')))
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    error(relative, e)
+                    continue
+                report['deleted'].append(entry(relative, st))
+                report['bytes_reclaimed'] += st.st_size if st.st_nlink <= 1 else 0
+
+        # 2. 孤儿移入隔离区
+        files = self._list_files(root)
+        report['files_scanned'] = len(files)
+        orphans = []
+        for relative, st in files.items():
+            if relative in live or relative in KEEP_FILES:
+                report['referenced'] += 1
+            elif now - st.st_mtime < policy['min_age_seconds']:
+                report['protected'] += 1
+            else:
+                orphans.append((relative, st))
+        if not orphans:
+            return
+        if not dry_run:
+            # 扫描期间可能有表单或公司保存了对这些文件的引用：移动前再核对一次
+            live = self.live_references()
+        for relative, st in sorted(orphans, key=lambda item: item[1].st_mtime):
+            if relative in live:
+                report['referenced'] += 1
+                continue
+            try:
+                if not dry_run and not self._quarantine(relative, st):
+                    report['protected'] += 1
+                    continue
+            except OSError as e:
+                error(relative, e)
+                continue
+            report['quarantined'].append(entry(relative, st))
+
+    # ---------- 后台回收 ----------
+
+    def start(self, app) -> bool:
+        """启动后台定期回收（UPLOAD_GC_INTERVAL 为 0 时不启动），已启动时直接返回"""
+        interval = float(app.config.get('UPLOAD_GC_INTERVAL', 6 * 3600))
+        if interval <= 0:
+            return False
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._loop, args=(app, interval),
+                                                name='upload-gc', daemon=True)
+                self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self, app, interval: float) -> None:
+        # 启动后稍等再执行第一次，避免与启动时的请求争抢数据库与磁盘
+        wait = min(300.0, interval)
+        while not self._stop.wait(wait):
+            try:
+                with app.app_context():
+                    self.sweep(trigger='background', force=False)
+            except Exception as e:
+                logger.warning(f"上传文件回收失败: {str(e)}")
+            wait = interval
+
+
+# 全局实例
+upload_gc = UploadGarbageCollector()
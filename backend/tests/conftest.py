@@ -0,0 +1,30 @@
+"""
+测试公共夹具：每个测试使用独立的 CACHE_FOLDER 与 UPLOAD_FOLDER（跨进程状态的 SQLite 文件都在其中）
+"""
+import os
+import sys
+
+# 导入 app.main 时会创建模块级应用实例，不要连接开发数据库
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture
+def app(tmp_path):
+    from app.main import create_app
+
+    app = create_app('testing')
+    upload_folder = tmp_path / 'uploads'
+    cache_folder = tmp_path / 'cache'
+    (upload_folder / 'generated_files').mkdir(parents=True)
+    cache_folder.mkdir()
+    app.config.update(UPLOAD_FOLDER=str(upload_folder), CACHE_FOLDER=str(cache_folder))
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
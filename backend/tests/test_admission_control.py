@@ -0,0 +1,157 @@
+"""
+准入控制：队列深度、Retry-After、排队超时与遗留名额回收
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from app.services.admission_control import AdmissionRejected, RUNNING, admission_controller
+
+
+@pytest.fixture
+def limited(app):
+    app.config.update(ADMISSION_CONTROL_ENABLED=True, ADMISSION_EXTRACTION_LIMIT=1, ADMISSION_QUEUE_DEPTH=1,
+                      ADMISSION_QUEUE_TIMEOUT=5, ADMISSION_LEASE_SECONDS=600)
+    return app
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def _queue_in_background(app, pool):
+    """在另一个线程中排队，返回 (线程, 结果列表)"""
+    result = []
+
+    def run():
+        with app.app_context():
+            result.append(admission_controller.acquire(pool))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert _wait_for(lambda: admission_controller.snapshot()[pool]['queued'] == 1)
+    return thread, result
+
+
+def _set_average_hold(pool, seconds):
+    conn = admission_controller._connect()
+    try:
+        conn.execute("INSERT OR REPLACE INTO admission_stats (pool, avg_seconds) VALUES (?, ?)", (pool, seconds))
+    finally:
+        conn.close()
+
+
+def _insert_running(pool, pid, heartbeat):
+    conn = admission_controller._connect()
+    try:
+        conn.execute("INSERT INTO admission_slots (token, pool, state, pid, enqueued_at, acquired_at, heartbeat) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", (f"stale-{pid}", pool, RUNNING, pid, heartbeat, heartbeat,
+                                                      heartbeat))
+    finally:
+        conn.close()
+
+
+def test_queue_full_rejects_with_position_and_retry_after(limited):
+    holder = admission_controller.acquire('extraction')
+    thread, queued = _queue_in_background(limited, 'extraction')
+    _set_average_hold('extraction', 10)
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        admission_controller.acquire('extraction')
+    error = excinfo.value
+    assert (error.queue_position, error.queue_depth, error.running, error.limit) == (2, 1, 1, 1)
+    # 平均占用 10 秒 × 排队位置 2 / 上限 1
+    assert error.retry_after == 20
+
+    admission_controller.release('extraction', holder)
+    thread.join(5)
+    assert queued, "排队者应在名额释放后获得名额"
+    admission_controller.release('extraction', queued[0])
+    assert admission_controller.snapshot()['extraction']['running'] == 0
+
+
+def test_route_returns_429_with_retry_after_header(limited, client):
+    holder = admission_controller.acquire('extraction')
+    thread, queued = _queue_in_background(limited, 'extraction')
+    try:
+        response = client.post('/api/mvp/document-extract')
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+        body = response.get_json()
+        assert body['error_code'] == 'server_busy'
+        assert body['data']['queue_position'] == 2
+    finally:
+        admission_controller.release('extraction', holder)
+        thread.join(5)
+        admission_controller.release('extraction', queued[0])
+
+
+def test_queue_timeout_leaves_the_queue(limited):
+    limited.config['ADMISSION_QUEUE_TIMEOUT'] = 0.3
+    holder = admission_controller.acquire('extraction')
+    try:
+        with pytest.raises(AdmissionRejected) as excinfo:
+            admission_controller.acquire('extraction')
+        assert excinfo.value.queue_position == 1
+        assert admission_controller.snapshot()['extraction']['queued'] == 0
+    finally:
+        admission_controller.release('extraction', holder)
+
+
+def test_background_waiters_do_not_count_toward_queue_depth(limited):
+    holder = admission_controller.acquire('extraction')
+    background = []
+
+    def run():
+        with limited.app_context():
+            background.append(admission_controller.acquire('extraction', background=True))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert _wait_for(lambda: admission_controller.snapshot()['extraction']['background'] == 1)
+    # 后台等待者不占队列深度：前台请求仍可排队
+    thread_fg, foreground = _queue_in_background(limited, 'extraction')
+
+    admission_controller.release('extraction', holder)
+    thread_fg.join(5)
+    assert foreground and not background, "前台排队者应先于后台等待者获得名额"
+    admission_controller.release('extraction', foreground[0])
+    thread.join(5)
+    assert background
+    admission_controller.release('extraction', background[0])
+
+
+def test_slot_of_dead_process_is_reaped(limited):
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    _insert_running('extraction', process.pid, time.time())
+
+    token = admission_controller.try_acquire('extraction')
+    assert token is not None
+    admission_controller.release('extraction', token)
+
+
+def test_slot_with_expired_heartbeat_is_reaped(limited):
+    limited.config['ADMISSION_LEASE_SECONDS'] = 60
+    # 持有者进程仍在（测试进程的父进程），但心跳已超过租约
+    _insert_running('extraction', os.getppid(), time.time() - 61)
+
+    token = admission_controller.try_acquire('extraction')
+    assert token is not None
+    admission_controller.release('extraction', token)
+
+
+def test_live_slot_with_fresh_heartbeat_is_kept(limited):
+    _insert_running('extraction', os.getppid(), time.time())
+
+    assert admission_controller.try_acquire('extraction') is None
+    assert admission_controller.snapshot()['extraction']['running'] == 1
@@ -0,0 +1,137 @@
+"""
+分块上传：偏移量、块校验与整体校验、续传、取走与非法的 upload_id
+"""
+import hashlib
+import os
+
+import pytest
+
+from app.services.chunked_upload import ChunkedUploadError, chunked_upload_manager
+
+CONTENT = b'%PDF-1.4 chunked upload test body'
+
+
+def _create(client, content=CONTENT, sha256=None, filename='report.pdf', purpose='document'):
+    payload = {"filename": filename, "size": len(content), "purpose": purpose}
+    if sha256 is not False:
+        payload["sha256"] = sha256 or hashlib.sha256(content).hexdigest()
+    response = client.post('/api/mvp/chunked-uploads', json=payload)
+    assert response.status_code == 201
+    return response.get_json()['data']['upload_id']
+
+
+def _put(client, upload_id, offset, chunk, checksum=None):
+    headers = {'Upload-Offset': str(offset), 'Content-Type': 'application/octet-stream'}
+    if checksum:
+        headers['X-Chunk-SHA256'] = checksum
+    return client.put(f'/api/mvp/chunked-uploads/{upload_id}', data=chunk, headers=headers)
+
+
+def test_chunks_are_written_at_the_server_offset(client):
+    upload_id = _create(client)
+
+    response = _put(client, upload_id, 0, CONTENT[:10])
+    assert response.status_code == 200
+    assert response.headers['Upload-Offset'] == '10'
+
+    # 重发已接收的块：409 并告知正确的偏移量
+    response = _put(client, upload_id, 0, CONTENT[:10])
+    assert response.status_code == 409
+    assert response.get_json()['error_code'] == 'offset_mismatch'
+    assert response.headers['Upload-Offset'] == '10'
+
+    response = _put(client, upload_id, 10, CONTENT[10:])
+    assert response.get_json()['data']['offset'] == len(CONTENT)
+
+    response = client.post(f'/api/mvp/chunked-uploads/{upload_id}/complete')
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['complete'] is True
+    assert data['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_upload_resumes_from_status_offset_in_another_worker(client):
+    upload_id = _create(client)
+    _put(client, upload_id, 0, CONTENT[:7])
+    # 换一个工作进程续传：没有本进程的增量哈希，完成时重新读取文件
+    chunked_upload_manager._hashers.clear()
+
+    offset = int(client.get(f'/api/mvp/chunked-uploads/{upload_id}').headers['Upload-Offset'])
+    assert offset == 7
+    assert _put(client, upload_id, offset, CONTENT[offset:]).status_code == 200
+    response = client.post(f'/api/mvp/chunked-uploads/{upload_id}/complete')
+    assert response.get_json()['data']['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_chunk_with_wrong_checksum_is_discarded(client, app):
+    upload_id = _create(client)
+
+    response = _put(client, upload_id, 0, CONTENT[:10], checksum='0' * 64)
+    assert response.status_code == 422
+    assert response.get_json()['error_code'] == 'checksum_mismatch'
+    assert response.headers['Upload-Offset'] == '0'
+    part_path = os.path.join(app.config['UPLOAD_FOLDER'], '.chunked', f'{upload_id}.part')
+    assert os.path.getsize(part_path) == 0
+
+    chunk_hash = hashlib.sha256(CONTENT[:10]).hexdigest()
+    assert _put(client, upload_id, 0, CONTENT[:10], checksum=chunk_hash).status_code == 200
+
+
+def test_whole_file_checksum_mismatch_discards_the_upload(client):
+    upload_id = _create(client, sha256='f' * 64)
+    _put(client, upload_id, 0, CONTENT)
+
+    response = client.post(f'/api/mvp/chunked-uploads/{upload_id}/complete')
+    assert response.status_code == 422
+    assert client.get(f'/api/mvp/chunked-uploads/{upload_id}').status_code == 404
+
+
+def test_incomplete_or_oversized_uploads_are_rejected(client):
+    upload_id = _create(client, sha256=False)
+    _put(client, upload_id, 0, CONTENT[:5])
+
+    response = client.post(f'/api/mvp/chunked-uploads/{upload_id}/complete')
+    assert response.status_code == 409
+    assert response.get_json()['error_code'] == 'upload_incomplete'
+    response = _put(client, upload_id, 5, CONTENT[5:] + b'extra')
+    assert response.status_code == 400
+    assert response.get_json()['error_code'] == 'size_exceeded'
+
+
+def test_completed_upload_is_taken_once(client):
+    upload_id = _create(client)
+    _put(client, upload_id, 0, CONTENT)
+    client.post(f'/api/mvp/chunked-uploads/{upload_id}/complete')
+
+    with pytest.raises(ChunkedUploadError) as excinfo:
+        chunked_upload_manager.take(upload_id, 'image')
+    assert excinfo.value.status == 400
+
+    path, status = chunked_upload_manager.take(upload_id, 'document')
+    with open(path, 'rb') as f:
+        assert f.read() == CONTENT
+    assert status['filename'] == 'report.pdf'
+    assert client.get(f'/api/mvp/chunked-uploads/{upload_id}').status_code == 404
+
+
+@pytest.mark.parametrize('upload_id', ['..%2F..%2Fvictim', 'ABCDEF', 'a' * 31 + 'g'])
+def test_malformed_upload_ids_are_not_found(client, app, upload_id):
+    victim = os.path.join(app.config['UPLOAD_FOLDER'], 'victim.part')
+    with open(victim, 'wb') as f:
+        f.write(b'keep')
+
+    assert client.get(f'/api/mvp/chunked-uploads/{upload_id}').status_code == 404
+    assert _put(client, upload_id, 0, b'x').status_code == 404
+    assert client.delete(f'/api/mvp/chunked-uploads/{upload_id}').status_code == 404
+    assert os.path.exists(victim)
+
+
+def test_abort_without_record_deletes_nothing(client, app):
+    upload_id = 'a' * 32
+    storage = os.path.join(app.config['UPLOAD_FOLDER'], '.chunked')
+    os.makedirs(storage, exist_ok=True)
+    part_path = os.path.join(storage, f'{upload_id}.part')
+    open(part_path, 'wb').close()
+
+    assert client.delete(f'/api/mvp/chunked-uploads/{upload_id}').status_code == 404
+    assert os.path.exists(part_path)
@@ -0,0 +1,176 @@
+"""
+请求合并与幂等键：合并进行中的请求、重放已完成的结果、失败与过期后重新执行
+"""
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from app.services.request_coalescing import (
+    COALESCED, EXECUTED, REPLAYED, RUNNING, IdempotencyConflict, request_coalescer
+)
+
+
+class _Counter:
+    """记录执行次数的生成函数"""
+
+    def __init__(self, result=None, delay=0.0):
+        self.calls = 0
+        self.result = result if result is not None else {"filename": "bundle.zip"}
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return self.result
+
+
+def _set_row(key, **columns):
+    conn = request_coalescer._connect()
+    try:
+        assignments = ', '.join(f"{name} = ?" for name in columns)
+        conn.execute(f"UPDATE coalesced_requests SET {assignments} WHERE key = ?", (*columns.values(), key))
+    finally:
+        conn.close()
+
+
+def test_concurrent_identical_requests_render_once(app):
+    func = _Counter(delay=0.3)
+    results = []
+
+    def run():
+        with app.app_context():
+            results.append(request_coalescer.run('session:docx', func, ttl=5))
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join(5)
+
+    assert func.calls == 1
+    assert sorted(outcome for _, outcome in results) == [COALESCED, COALESCED, EXECUTED]
+    assert all(result == func.result for result, _ in results)
+
+
+def test_idempotency_key_replays_the_first_result(app):
+    func = _Counter()
+    attached = []
+
+    first = request_coalescer.run('idempotency:k1', func, ttl=60, fingerprint='session-a')
+    second = request_coalescer.run('idempotency:k1', func, ttl=60, fingerprint='session-a',
+                                   on_attach=attached.append)
+
+    assert first == (func.result, EXECUTED)
+    assert second == (func.result, REPLAYED)
+    assert attached == [REPLAYED]
+    assert func.calls == 1
+
+
+def test_idempotency_key_reused_for_another_request_is_rejected(app):
+    request_coalescer.run('idempotency:k1', _Counter(), ttl=60, fingerprint='session-a')
+
+    with pytest.raises(IdempotencyConflict):
+        request_coalescer.run('idempotency:k1', _Counter(), ttl=60, fingerprint='session-b')
+
+
+def test_expired_result_is_executed_again(app):
+    func = _Counter()
+    request_coalescer.run('idempotency:k1', func, ttl=60, fingerprint='session-a')
+    _set_row('idempotency:k1', expires_at=time.time() - 1)
+
+    assert request_coalescer.run('idempotency:k1', func, ttl=60, fingerprint='session-a')[1] == EXECUTED
+    assert func.calls == 2
+
+
+def test_failed_or_unkept_results_are_executed_again(app):
+    def fail():
+        raise RuntimeError("渲染失败")
+
+    with pytest.raises(RuntimeError):
+        request_coalescer.run('idempotency:k1', fail, ttl=60)
+    func = _Counter(result={"status": 504})
+    assert request_coalescer.run('idempotency:k1', func, ttl=60,
+                                 keep_result=lambda result: result["status"] != 504)[1] == EXECUTED
+    assert request_coalescer.run('idempotency:k1', func, ttl=60)[1] == EXECUTED
+    assert func.calls == 2
+
+
+def test_request_of_dead_executor_is_taken_over(app):
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    conn = request_coalescer._connect()
+    try:
+        conn.execute("INSERT INTO coalesced_requests (key, fingerprint, state, pid, started_at) VALUES (?, ?, ?, ?, ?)",
+                     ('session:docx', None, RUNNING, process.pid, time.time()))
+    finally:
+        conn.close()
+
+    assert not request_coalescer.in_flight('session:docx')
+    func = _Counter()
+    assert request_coalescer.run('session:docx', func, ttl=5) == (func.result, EXECUTED)
+
+
+def test_completed_results_are_listed_until_they_expire(app):
+    request_coalescer.run('session:docx', _Counter(result={"download_url": "/api/mvp/download/job1/a.zip"}), ttl=60)
+
+    assert request_coalescer.live_results() == ['{"download_url": "/api/mvp/download/job1/a.zip"}']
+    _set_row('session:docx', expires_at=time.time() - 1)
+    assert request_coalescer.live_results() == []
+
+
+@pytest.fixture
+def fake_render(app, monkeypatch):
+    """替换会话数据准备与渲染，返回依次使用的 (响应体, 状态码) 列表与调用记录"""
+    from app.api import mvp_routes
+
+    responses = []
+    calls = []
+
+    def render(session_id, output_format, on_event=None, prepared=None):
+        calls.append((session_id, output_format))
+        return responses.pop(0) if responses else ({"success": True, "render": len(calls)}, 200)
+
+    monkeypatch.setattr(mvp_routes, '_prepare_session_generation',
+                        lambda session_id: ({"approval_no": session_id}, session_id))
+    monkeypatch.setattr(mvp_routes, '_generate_documents_for_session', render)
+    return responses, calls
+
+
+def test_route_replays_idempotent_request(client, fake_render):
+    _, calls = fake_render
+    headers = {'Idempotency-Key': 'retry-1'}
+
+    first = client.post('/api/mvp/generate-documents', json={'session_id': 's1'}, headers=headers)
+    second = client.post('/api/mvp/generate-documents', json={'session_id': 's1'}, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert 'Idempotent-Replayed' not in first.headers
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.get_json() == first.get_json()
+    assert len(calls) == 1
+
+
+def test_route_rejects_key_reused_for_another_session(client, fake_render):
+    headers = {'Idempotency-Key': 'retry-1'}
+    client.post('/api/mvp/generate-documents', json={'session_id': 's1'}, headers=headers)
+
+    response = client.post('/api/mvp/generate-documents', json={'session_id': 's2'}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_route_re_executes_after_server_error(client, fake_render):
+    responses, calls = fake_render
+    responses.append(({"success": False, "error": "所有文档生成失败"}, 500))
+    headers = {'Idempotency-Key': 'retry-1'}
+
+    assert client.post('/api/mvp/generate-documents', json={'session_id': 's1'}, headers=headers).status_code == 500
+    retry = client.post('/api/mvp/generate-documents', json={'session_id': 's1'}, headers=headers)
+    assert retry.status_code == 200
+    assert 'Idempotent-Replayed' not in retry.headers
+    assert len(calls) == 2
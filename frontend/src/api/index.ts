@@ -90,6 +90,13 @@ api.interceptors.response.use(
           errorMessage = data?.message || '数据验证失败';
           errorCode = 'VALIDATION_ERROR';
           break;
+        case 429: {
+          // 生成/提取并发已满：后端返回 Retry-After 与排队信息
+          const retryAfter = error.response.headers?.['retry-after'];
+          errorMessage = `${data?.error || '服务繁忙'}${retryAfter ? `，约 ${retryAfter} 秒后重试` : ''}`;
+          errorCode = 'RATE_LIMIT_EXCEEDED';
+          break;
+        }
         case 500:
           errorMessage = '服务器内部错误';
           errorCode = 'SERVER_ERROR';
@@ -158,4 +165,15 @@ export const getServerBaseURL = (): string => {
   return `http://127.0.0.1:${port}`;
 };
 
+// 图片缩略图地址：/uploads/ 下的图片改为按显示尺寸（CSS 像素，按设备像素比放大）取缩略图，
+// 其它地址（本地预览的 blob:、data: 等）原样返回
+export const getThumbnailURL = (path: string | undefined, size: number): string => {
+  if (!path) return '';
+  const idx = path.indexOf('/uploads/');
+  if (idx === -1) return path;
+  const ratio = typeof window !== 'undefined' ? window.devicePixelRatio || 1 : 1;
+  const relative = path.slice(idx + '/uploads/'.length).split('?')[0];
+  return `${getServerBaseURL()}/api/mvp/thumbnails/${Math.ceil(size * ratio)}/${relative}`;
+};
+
 export default api;
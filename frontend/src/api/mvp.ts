@@ -4,8 +4,22 @@ import type {
   extractionResult,
   DocumentGenerationRequest,
   DocumentGenerationResponse,
+  DocumentGenerationProgressEvent,
+  ChunkedUploadStatus,
 } from '../types/api'
 
+// 超过该大小的文档改用分块上传（可续传）
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024
+// 单块失败时的重试次数（每次先查询服务器已接收的位置）
+const CHUNK_RETRIES = 3
+
+// 计算 SHA-256（非安全上下文中没有 crypto.subtle 时返回 undefined，服务器不做块校验）
+const sha256Hex = async (data: ArrayBuffer): Promise<string | undefined> => {
+  if (typeof crypto === 'undefined' || !crypto.subtle) return undefined
+  const digest = await crypto.subtle.digest('SHA-256', data)
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('')
+}
+
 
 // MVP API类
 class MVPAPI {
@@ -27,9 +41,61 @@ class MVPAPI {
 
   /**
    * 生成所有文档
+   * idempotencyKey: 可选，重试同一次操作时传相同的键，后端返回第一次的结果而不重复生成
    */
-  async generateDocuments(data: DocumentGenerationRequest): Promise<DocumentGenerationResponse> {
-    return api.post(`${this.basePath}/generate-documents`, data)
+  async generateDocuments(data: DocumentGenerationRequest, idempotencyKey?: string): Promise<DocumentGenerationResponse> {
+    return api.post(`${this.basePath}/generate-documents`, data, {
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined
+    })
+  }
+
+  /**
+   * 生成所有文档（流式进度）
+   * 逐条回调进度事件，返回最终结果（与 generateDocuments 的响应体相同）
+   */
+  async generateDocumentsStream(
+    data: DocumentGenerationRequest,
+    onEvent: (event: DocumentGenerationProgressEvent) => void,
+    idempotencyKey?: string
+  ): Promise<DocumentGenerationResponse> {
+    const headers: Record<string, string> = { 'Content-Type': 'application/json' }
+    if (idempotencyKey) headers['Idempotency-Key'] = idempotencyKey
+    const response = await fetch(`${api.defaults.baseURL}${this.basePath}/generate-documents/stream`, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify({ ...data, format: 'jsonl' })
+    })
+    if (!response.ok || !response.body) {
+      const body = await response.json().catch(() => ({}))
+      throw new Error(body.error || `生成失败 (${response.status})`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    let result = null as DocumentGenerationProgressEvent | null
+    const handleLine = (line: string) => {
+      if (!line.trim()) return
+      const event = JSON.parse(line) as DocumentGenerationProgressEvent
+      if (event.type === 'result') result = event
+      if (event.type === 'error') throw new Error(event.error || '生成失败')
+      onEvent(event)
+    }
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      const lines = buffer.split('\n')
+      buffer = lines.pop() || ''
+      lines.forEach(handleLine)
+    }
+    handleLine(buffer)
+
+    if (!result) throw new Error('生成中断，未收到结果')
+    const body: any = { ...result }
+    delete body.type
+    delete body.status
+    return { message: body.message || body.error || '', ...body } as DocumentGenerationResponse
   }
 
   /**
@@ -69,19 +135,56 @@ class MVPAPI {
 
 
   /**
-   * 下载生成的文档
+   * 分块上传文件，返回完成后的 upload_id（可交给 document-extract / upload-file）
+   * 单块失败时查询服务器已接收的位置后续传
    */
-  async downloadDocument(filename: string): Promise<Blob> {
-    return api.get(`${this.basePath}/download/${filename}`, {
-      responseType: 'blob',
+  async uploadChunked(
+    file: File,
+    purpose: 'document' | 'image' = 'document',
+    onProgress?: (loaded: number, total: number) => void
+  ): Promise<string> {
+    const created: ApiResponse<ChunkedUploadStatus> = await api.post(`${this.basePath}/chunked-uploads`, {
+      filename: file.name,
+      size: file.size,
+      purpose
     })
+    const { upload_id: uploadId, chunk_size: chunkSize } = created.data!
+    let offset = 0
+    let retries = 0
+    while (offset < file.size) {
+      const chunk = await file.slice(offset, offset + chunkSize).arrayBuffer()
+      const checksum = await sha256Hex(chunk)
+      try {
+        const res: ApiResponse<ChunkedUploadStatus> = await api.put(`${this.basePath}/chunked-uploads/${uploadId}`, chunk, {
+          headers: {
+            'Content-Type': 'application/octet-stream',
+            'Upload-Offset': String(offset),
+            ...(checksum ? { 'X-Chunk-SHA256': checksum } : {})
+          }
+        })
+        offset = res.data!.offset
+        retries = 0
+      } catch (error) {
+        if (++retries > CHUNK_RETRIES) throw error
+        const status: ApiResponse<ChunkedUploadStatus> = await api.get(`${this.basePath}/chunked-uploads/${uploadId}`)
+        offset = status.data!.offset
+      }
+      onProgress?.(offset, file.size)
+    }
+    await api.post(`${this.basePath}/chunked-uploads/${uploadId}/complete`)
+    return uploadId
   }
+
   /**
- * 文档信息提取
+ * 文档信息提取（大文件自动分块上传）
  */
   async documentExtraction(file: File): Promise<ApiResponse<extractionResult>> {
     const formData = new FormData()
-    formData.append('file', file)
+    if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+      formData.append('upload_id', await this.uploadChunked(file, 'document'))
+    } else {
+      formData.append('file', file)
+    }
     
     return api.post(`${this.basePath}/document-extract`, formData, {
       headers: {
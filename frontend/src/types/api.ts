@@ -96,6 +96,19 @@ export interface FileUploadResponse {
   }
 }
 
+// 分块上传状态（/mvp/chunked-uploads）
+export interface ChunkedUploadStatus {
+  upload_id: string
+  filename: string
+  purpose: 'document' | 'image'
+  size: number
+  offset: number          // 服务器已接收的字节数，续传从这里开始
+  complete: boolean
+  sha256: string | null
+  chunk_size: number      // 建议的块大小
+  expires_at: string
+}
+
 // 提取结果
 export interface extractionResult {
   enterprise_info: {
@@ -132,6 +145,8 @@ export interface DocumentGenerationRequest {
   session_id: string
   output_format?: 'docx' | 'pdf' | 'xlsx'
   template_name?: string
+  // 本次请求的截止时间（秒），不超过服务端 GENERATION_DEADLINE_SECONDS
+  timeout_seconds?: number
 }
 
 // 文档生成响应
@@ -146,6 +161,26 @@ export interface DocumentGenerationResponse {
   }
 }
 
+// 文档生成进度事件（/generate-documents/stream 逐行推送）
+export interface DocumentGenerationProgressEvent {
+  type: 'stage' | 'document_started' | 'document' | 'result' | 'error' | 'heartbeat'
+  stage?: 'context_prepared' | 'zip_ready' | 'rendered' | 'converted' | 'pregenerated' | 'coalesced' | 'replayed'
+  doc_type?: string
+  index?: number
+  total?: number
+  success?: boolean
+  // 文档结果：超过截止时间为 timed_out，客户端断开等取消为 cancelled
+  outcome?: 'success' | 'failed' | 'timed_out' | 'cancelled'
+  error?: string
+  error_code?: string
+  elapsed_ms?: number
+  filename?: string
+  download_url?: string
+  status?: number
+  message?: string
+  data?: any
+}
+
 // 会话管理
 export interface SessionInfo {
   session_id: string